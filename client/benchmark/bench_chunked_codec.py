@@ -0,0 +1,59 @@
+"""Microbenchmark for the chunked transfer codec.
+
+Run from the client directory:
+    python -m benchmark.bench_chunked_codec
+"""
+
+import argparse
+import os
+import time
+
+from service.chunked_codec import ChunkedDecoder, encode_chunked
+
+CHUNK_SIZES = {"1 KiB": 1024, "64 KiB": 65536, "1 MiB": 1048576}
+RECV_SIZE = 65536  # decoder input slices, like socket reads
+
+
+def measure_throughput(function, payload_size: int, repeat: int) -> float:
+    """Return the best throughput of the function in MB/s."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return payload_size / best / 1e6
+
+
+def bench_chunk_size(payload: bytes, chunk_size: int, repeat: int) -> tuple[float, float]:
+    """Measure encode and incremental decode throughput for one chunk size."""
+    encoded = encode_chunked(payload, chunk_size)
+
+    def decode_incrementally():
+        decoder = ChunkedDecoder()
+        parts = [decoder.feed(encoded[offset:offset + RECV_SIZE])
+                 for offset in range(0, len(encoded), RECV_SIZE)]
+        assert decoder.complete
+        return b"".join(parts)
+
+    assert decode_incrementally() == payload
+    encode_speed = measure_throughput(lambda: encode_chunked(payload, chunk_size), len(payload), repeat)
+    decode_speed = measure_throughput(decode_incrementally, len(payload), repeat)
+    return encode_speed, decode_speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked codec microbenchmark")
+    parser.add_argument("--payload-mb", type=int, default=64, help="payload size in MB")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload_mb * 1_000_000)
+    print(f"payload: {args.payload_mb} MB, decoder fed in {RECV_SIZE} byte slices")
+    print(f"{'chunk size':>10} | {'encode MB/s':>12} | {'decode MB/s':>12}")
+    for label, chunk_size in CHUNK_SIZES.items():
+        encode_speed, decode_speed = bench_chunk_size(payload, chunk_size, args.repeat)
+        print(f"{label:>10} | {encode_speed:>12.1f} | {decode_speed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
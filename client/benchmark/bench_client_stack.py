@@ -0,0 +1,401 @@
+"""Latency and throughput of the client stack against a local stand-in server.
+
+Measures `HttpClientSocket.handle_request` on:
+- small GETs, one by one and pipelined with `handle_requests`
+- large Content-Length bodies
+- chunked bodies
+- gzip bodies
+- redirect chains
+
+It also measures the `FileService` list, first page, change listing,
+download and upload paths, at several file sizes and counts. Everything
+runs over loopback against `benchmark.loopback_server`, so the numbers
+show the client's CPU cost rather than the network. Results can be
+written as JSON and compared with an earlier run.
+
+Run from the client directory:
+    python -m benchmark.bench_client_stack --output results.json
+    python -m benchmark.bench_client_stack --quick --compare results.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Callable
+
+from benchmark.loopback_server import LoopbackFileServer, synthetic_body
+from domain.authentication_model import Session
+from domain.file_model import (FetchServerFileChangesInterface, FetchServerFileInterface,
+                               FetchServerFilePageInterface, FileDownloadInterface, FileUploadInterface)
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE, FileTransferMode, Setting
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+MIB = 1024 * 1024
+
+
+@dataclass
+class BenchResult:
+    """One measured number, keyed by name and params across runs."""
+    name: str
+    params: dict
+    unit: str
+    value: float
+    higher_is_better: bool
+    details: dict = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        return self.name + "".join(f" {name}={value}" for name, value in sorted(self.params.items()))
+
+
+def time_runs(function: Callable[[], None], repeat: int, setup: Callable[[], None] = None) -> list[float]:
+    """Run the function `repeat` times and return the durations in seconds, setup excluded."""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def latency_result(name: str, params: dict, durations: list[float]) -> BenchResult:
+    """Median latency in ms, with the tail and the request rate as details."""
+    durations = sorted(durations)
+    return BenchResult(
+        name=name, params=params, unit="ms", value=statistics.median(durations) * 1000, higher_is_better=False,
+        details={
+            "p95_ms": durations[int(len(durations) * 0.95) - 1] * 1000,
+            "mean_ms": statistics.fmean(durations) * 1000,
+            "requests_per_second": len(durations) / sum(durations),
+        },
+    )
+
+
+def throughput_result(name: str, params: dict, size: int, durations: list[float]) -> BenchResult:
+    """Best throughput in MB/s over the runs."""
+    return BenchResult(
+        name=name, params=params, unit="MB/s", value=size / min(durations) / 1e6, higher_is_better=True,
+        details={"best_s": min(durations), "median_s": statistics.median(durations)},
+    )
+
+
+def check_response(response, size: int = None) -> None:
+    if not response.vaild_response or response.http_response.status_code != 200:
+        raise RuntimeError(f"Benchmark request failed: {response.error_message}")
+    if size is not None and len(response.http_response.payload_bytes) != size:
+        raise RuntimeError("Benchmark response has the wrong size")
+
+
+class ClientStackBenchmark:
+    """The benchmark cases, sharing one server and one client."""
+
+    def __init__(self, server: LoopbackFileServer, repeat: int, request_count: int, work_dir: str):
+        self.server = server
+        self.repeat = repeat
+        self.request_count = request_count
+        self.work_dir = work_dir
+        self.server_address = HTTPServerAddress(host_ip=server.host, port=server.port)
+        self.http_client = HttpClientSocket()
+        self.results: list[BenchResult] = []
+
+    def close(self) -> None:
+        self.http_client.close()
+
+    def build_request(self, url: str):
+        request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+        request.url = url
+        request.server_connection = self.server_address
+        # large bodies take longer than the interactive default over a slow machine
+        request.timeout = 120
+        return request
+
+    def add(self, result: BenchResult) -> None:
+        self.results.append(result)
+        detail_text = ", ".join(f"{name} {value:.2f}" for name, value in result.details.items())
+        print(f"{result.key:<58} {result.value:>10.2f} {result.unit:<5} ({detail_text})", flush=True)
+
+    # HTTP client
+
+    def bench_small_get(self) -> None:
+        request = self.build_request("/bench/small")
+        check_response(self.http_client.handle_request(request))
+        durations = time_runs(lambda: self.http_client.handle_request(request), self.request_count)
+        self.add(latency_result("http_small_get", {}, durations))
+
+    def bench_pipelined_small_get(self, batch_size: int) -> None:
+        request_list = [self.build_request("/bench/small") for _ in range(batch_size)]
+        for response in self.http_client.handle_requests(request_list):
+            check_response(response)
+        durations = time_runs(lambda: self.http_client.handle_requests(request_list),
+                              max(self.request_count // batch_size, 3))
+        self.add(latency_result("http_pipelined_small_get", {"batch": batch_size}, durations))
+
+    def bench_body(self, name: str, url: str, size: int, params: dict) -> None:
+        request = self.build_request(url)
+        check_response(self.http_client.handle_request(request), size)
+        durations = time_runs(lambda: self.http_client.handle_request(request), self.repeat)
+        self.add(throughput_result(name, params, size, durations))
+
+    def bench_redirect_chain(self, hop_count: int) -> None:
+        request = self.build_request(f"/bench/redirect/{hop_count}")
+        request.allow_redirects = True
+        request.max_redirects = hop_count + 1
+
+        def send():
+            # the redirect loop rewrites the url of the request it is given
+            self.http_client.handle_request(replace(request))
+
+        check_response(self.http_client.handle_request(replace(request)))
+        durations = time_runs(send, max(self.request_count // hop_count, 1))
+        self.add(latency_result("http_redirect_chain", {"hops": hop_count}, durations))
+
+    # file service
+
+    def build_setting(self, transfer_mode: FileTransferMode, local_file_dir: str) -> Setting:
+        setting = Setting()
+        setting.http_request_template = replace(DEFAULT_HTTP_REQUEST_TEMPLATE, timeout=120)
+        setting.file_service_url = self.server.file_service_url
+        setting.file_transfer_mode = transfer_mode
+        setting.local_file_dir = local_file_dir
+        return setting
+
+    def build_file_service(self) -> FileService:
+        return FileService(self.http_client, LocalFileBackend(local_file_dir=self.work_dir))
+
+    def get_session(self) -> Session:
+        return Session(session_token=None, session_server_info=self.server_address)
+
+    def bench_file_list(self, file_count: int) -> None:
+        self.server.reset()
+        # listing only needs the index, not the files
+        for index in range(file_count):
+            self.server.index_file(f"file_{index:06d}.bin", f"{index:032x}")
+        file_service = self.build_file_service()
+        fetch_interface = FetchServerFileInterface(
+            current_session=self.get_session(),
+            setting=self.build_setting(FileTransferMode.BINARY, self.work_dir),
+        )
+
+        def fetch():
+            if len(file_service.fetch_server_file_list(fetch_interface).file_list) != file_count:
+                raise RuntimeError("Benchmark file list is incomplete")
+
+        durations = time_runs(fetch, max(self.request_count // 10, 3))
+        self.server.reset()
+        self.add(latency_result("file_service_list", {"files": file_count}, durations))
+
+    def bench_file_list_page(self, file_count: int) -> None:
+        """Time to the first page of a large list, what the dashboard waits for before it shows files."""
+        self.server.reset()
+        for index in range(file_count):
+            self.server.index_file(f"file_{index:06d}.bin", f"{index:032x}")
+        file_service = self.build_file_service()
+        page_interface = FetchServerFilePageInterface(
+            current_session=self.get_session(),
+            setting=self.build_setting(FileTransferMode.BINARY, self.work_dir),
+        )
+
+        def fetch_first_page():
+            first_page = file_service.fetch_server_file_page(page_interface)
+            if first_page.total_count != file_count or len(first_page.file_list) != page_interface.page_size:
+                raise RuntimeError(f"Benchmark file list page failed: {first_page.error_message}")
+
+        durations = time_runs(fetch_first_page, max(self.request_count // 10, 3))
+        self.server.reset()
+        self.add(latency_result("file_service_list_first_page", {"files": file_count}, durations))
+
+    def bench_file_list_changes(self, file_count: int, change_count: int) -> None:
+        """Refresh a cached list after `change_count` files were added, modified and removed."""
+        self.server.reset()
+        for index in range(file_count):
+            self.server.index_file(f"file_{index:06d}.bin", f"{index:032x}")
+        file_service = self.build_file_service()
+        changes_interface = FetchServerFileChangesInterface(
+            current_session=self.get_session(),
+            setting=self.build_setting(FileTransferMode.BINARY, self.work_dir),
+        )
+        changes_interface.cached_file_list = file_service.fetch_server_file_changes(changes_interface).server_file_list
+        next_index = file_count
+
+        def change_files():
+            nonlocal next_index
+            for _ in range(change_count // 3):
+                self.server.index_file(f"file_{next_index:06d}.bin", f"{next_index:032x}")
+                self.server.index_file(f"file_{next_index - file_count // 2:06d}.bin", f"{next_index:032x}")
+                self.server.remove_file(f"file_{next_index - file_count:06d}.bin")
+                next_index += 1
+
+        def fetch_changes():
+            delta = file_service.fetch_server_file_changes(changes_interface)
+            if not delta.valid_delta or delta.full_list or len(delta.server_file_list.file_list) != file_count:
+                raise RuntimeError(f"Benchmark change listing failed: {delta.error_message}")
+            changes_interface.cached_file_list = delta.server_file_list
+
+        durations = time_runs(fetch_changes, max(self.request_count // 10, 3), change_files)
+        self.server.reset()
+        self.add(latency_result("file_service_list_changes", {"files": file_count, "changes": change_count}, durations))
+
+    def bench_file_download(self, transfer_mode: FileTransferMode, file_count: int, file_size: int) -> None:
+        self.server.reset()
+        file_name_list = [f"download_{index:04d}.bin" for index in range(file_count)]
+        for file_name in file_name_list:
+            self.server.add_file(file_name, synthetic_body(file_size))
+        local_file_dir = os.path.join(self.work_dir, "download") + os.sep
+        file_service = self.build_file_service()
+        download_interface = FileDownloadInterface(
+            file_name_list=file_name_list,
+            current_session=self.get_session(),
+            setting=self.build_setting(transfer_mode, local_file_dir),
+        )
+
+        def clear_local_files():
+            shutil.rmtree(local_file_dir, ignore_errors=True)
+            os.makedirs(local_file_dir)
+
+        def download():
+            result = file_service.download_file_batch(download_interface)
+            if not result.download_success:
+                raise RuntimeError(f"Benchmark download failed: {result.error_message}")
+
+        durations = time_runs(download, self.repeat, clear_local_files)
+        params = {"mode": str(transfer_mode), "files": file_count, "file_size": file_size}
+        self.add(throughput_result("file_service_download", params, file_count * file_size, durations))
+
+    def bench_file_upload(self, transfer_mode: FileTransferMode, file_count: int, file_size: int) -> None:
+        upload_dir = os.path.join(self.work_dir, "upload")
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        os.makedirs(upload_dir)
+        for index in range(file_count):
+            with open(os.path.join(upload_dir, f"upload_{index:04d}.bin"), "wb") as f:
+                f.write(synthetic_body(file_size))
+        file_service = self.build_file_service()
+        upload_interface = FileUploadInterface(
+            file_path_or_file_dir_path=upload_dir,
+            current_session=self.get_session(),
+            setting=self.build_setting(transfer_mode, self.work_dir),
+        )
+
+        def upload():
+            result = file_service.upload_file_batch(upload_interface)
+            if not result.upload_success or len(self.server.file_hash_dict) != file_count:
+                raise RuntimeError(f"Benchmark upload failed: {result.error_message}")
+
+        # files the server already has are skipped, so it starts empty every time
+        durations = time_runs(upload, self.repeat, self.server.reset)
+        params = {"mode": str(transfer_mode), "files": file_count, "file_size": file_size}
+        self.add(throughput_result("file_service_upload", params, file_count * file_size, durations))
+
+
+def run_benchmarks(benchmark: ClientStackBenchmark, quick: bool) -> None:
+    body_size_list = [1 * MIB, 16 * MIB] if quick else [1 * MIB, 16 * MIB, 64 * MIB]
+    streamed_size = 4 * MIB if quick else 16 * MIB
+    transfer_list = (
+        [(1, 16 * MIB), (16, 256 * 1024), (100, 4096)] if quick
+        else [(1, 64 * MIB), (16, 1 * MIB), (200, 16 * 1024)]
+    )
+
+    benchmark.bench_small_get()
+    benchmark.bench_pipelined_small_get(32)
+    for size in body_size_list:
+        benchmark.bench_body("http_content_length_body", f"/bench/large?size={size}", size, {"size": size})
+    for chunk_size in (4096, 65536):
+        benchmark.bench_body("http_chunked_body", f"/bench/chunked?size={streamed_size}&chunk={chunk_size}",
+                             streamed_size, {"size": streamed_size, "chunk_size": chunk_size})
+    benchmark.bench_body("http_gzip_body", f"/bench/gzip?size={streamed_size}", streamed_size,
+                         {"size": streamed_size})
+    benchmark.bench_redirect_chain(3)
+
+    for file_count in ([10, 1000] if quick else [10, 1000, 10000]):
+        benchmark.bench_file_list(file_count)
+    for file_count in ([1000] if quick else [1000, 10000, 50000]):
+        benchmark.bench_file_list_changes(file_count, 30)
+    for file_count in ([10000] if quick else [10000, 100000]):
+        benchmark.bench_file_list_page(file_count)
+    for transfer_mode in (FileTransferMode.BINARY, FileTransferMode.JSON):
+        for file_count, file_size in transfer_list:
+            benchmark.bench_file_download(transfer_mode, file_count, file_size)
+        for file_count, file_size in transfer_list:
+            benchmark.bench_file_upload(transfer_mode, file_count, file_size)
+
+
+def get_metadata(quick: bool) -> dict:
+    """Where and on what the numbers were taken."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+    }
+
+
+def compare_results(result_list: list[BenchResult], baseline_path: str, max_regression: float) -> bool:
+    """Print the change against an earlier run. Returns False if anything regressed beyond the limit."""
+    with open(baseline_path) as f:
+        baseline_dict = {BenchResult(**result).key: BenchResult(**result) for result in json.load(f)["results"]}
+    passed = True
+    print(f"\n{'compared with ' + baseline_path:<58} {'before':>10} {'after':>10} {'change':>8}")
+    for result in result_list:
+        baseline = baseline_dict.get(result.key)
+        if baseline is None or baseline.value == 0:
+            continue
+        change = result.value / baseline.value - 1
+        regression = -change if result.higher_is_better else change
+        flag = ""
+        if regression > max_regression:
+            flag = "  REGRESSION"
+            passed = False
+        print(f"{result.key:<58} {baseline.value:>10.2f} {result.value:>10.2f} {change:>+7.1%}{flag}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client stack benchmark against a loopback server")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer requests")
+    parser.add_argument("--repeat", type=int, default=None, help="runs per throughput measurement, best is reported")
+    parser.add_argument("--requests", type=int, default=None, help="requests per latency measurement")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="with --compare, exit with status 1 if a result is this much worse (0.1 = 10%%)")
+    args = parser.parse_args()
+    repeat = args.repeat or (3 if args.quick else 5)
+    request_count = args.requests or (200 if args.quick else 1000)
+
+    with LoopbackFileServer() as server, tempfile.TemporaryDirectory() as work_dir:
+        benchmark = ClientStackBenchmark(server, repeat, request_count, work_dir)
+        try:
+            run_benchmarks(benchmark, args.quick)
+        finally:
+            benchmark.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(args.quick),
+                       "results": [asdict(result) for result in benchmark.results]}, f, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.compare and not compare_results(benchmark.results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Microbenchmark for preparing files for a JSON upload.
+
+Compares reading the file alone (`cat file > /dev/null`), the old separate
+passes (load, hash, base64, JSON dump) and the fused single-pass ingestion.
+
+Run from the client directory:
+    python -m benchmark.bench_upload_ingest
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from service.file_service import LocalFileBackend
+
+
+def measure_throughput(function, payload_size: int, repeat: int) -> float:
+    """Return the best throughput of the function in MB/s."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return payload_size / best / 1e6
+
+
+def prepare_separately(file_path: str) -> bytes:
+    """The old upload preparation: one read to hash, one to load, then two encoded copies."""
+    md5_hash = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            md5_hash.update(byte_block)
+    with open(file_path, "rb") as f:
+        file_bytes = f.read()
+    file_data = base64.b64encode(file_bytes).decode("ascii")
+    return json.dumps({"file_hash": md5_hash.hexdigest(), "file_data": file_data}).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload preparation microbenchmark")
+    parser.add_argument("--payload-mb", type=int, default=256, help="file size in MB")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "payload.bin")
+        with open(file_path, "wb") as f:
+            f.write(os.urandom(args.payload_mb * 1_000_000))
+        file_size = os.path.getsize(file_path)
+        backend = LocalFileBackend(os.path.join(temp_dir, "hash_cache.sqlite3"))
+
+        def ingest():
+            payload = bytearray()
+            backend.ingest_file(file_path, payload)
+
+        cat_speed = measure_throughput(
+            lambda: subprocess.run(["cat", file_path], stdout=subprocess.DEVNULL, check=True),
+            file_size, args.repeat,
+        )
+        separate_speed = measure_throughput(lambda: prepare_separately(file_path), file_size, args.repeat)
+        ingest_speed = measure_throughput(ingest, file_size, args.repeat)
+        backend.hash_cache.close()
+
+    print(f"file: {args.payload_mb} MB, page cache warm")
+    print(f"{'stage':>16} | {'MB/s':>8} | {'vs cat':>6}")
+    for label, speed in (("cat > /dev/null", cat_speed), ("separate passes", separate_speed),
+                         ("fused ingestion", ingest_speed)):
+        print(f"{label:>16} | {speed:>8.1f} | {cat_speed / speed:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""Local stand-in for the Apache file service, for benchmarks.
+
+A threaded stdlib HTTP/1.1 server with keep-alive that speaks the same
+protocol as server/doc_root/wsgi-bin/file_service_app.py under
+`file_service_url`:
+- the JSON API (list, paged list by name, list changes, download and
+  upload in base64)
+- raw GET with Range, If-Range, ETag and If-None-Match
+- GET or HEAD of a file's metadata, in headers only
+- raw PUT with chunked, gzip or deflate request bodies
+
+Files live in a temporary directory. No login is needed. The /bench/
+routes answer with synthetic bodies:
+- /bench/small
+- /bench/large?size=N
+- /bench/chunked?size=N&chunk=M
+- /bench/gzip?size=N
+- /bench/redirect/N, which redirects N times
+"""
+
+import base64
+import bisect
+import email.utils
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import urllib.parse
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+FILE_BLOCK_SIZE = 1024 * 1024  # same block size as the file service
+# synthetic bodies are slices of this, generated once
+_RANDOM_BLOCK = os.urandom(FILE_BLOCK_SIZE)
+_TEXT_BLOCK = b"".join(b"%08d,benchmark row,%d\n" % (index, index * 7) for index in range(40000))[:FILE_BLOCK_SIZE]
+
+
+def synthetic_body(size: int, compressible: bool = False) -> bytes:
+    """`size` bytes of random or text-like data."""
+    block = _TEXT_BLOCK if compressible else _RANDOM_BLOCK
+    return (block * (size // len(block) + 1))[:size]
+
+
+class LoopbackFileServer:
+    """The stand-in server, running on a background thread until `close`."""
+
+    def __init__(self, file_service_url: str = "/file_service", host: str = "127.0.0.1"):
+        self.file_service_url = file_service_url
+        self.file_dir = tempfile.mkdtemp(prefix="loopback_files_")
+        # file name -> md5, the ETag of the file
+        self.file_hash_dict: dict[str, str] = {}
+        # change journal for list_file_changes, like the hash index of the real server
+        self.journal_id = uuid.uuid4().hex
+        self.generation = 0
+        self.file_generation_dict: dict[str, int] = {}
+        self.removed_generation_dict: dict[str, int] = {}
+        # file names in order for paged lists, sorted again after names came or went
+        self.sorted_file_names: Optional[list[str]] = None
+        self.lock = threading.Lock()
+        # (method, path, Range header) of every request, for tests
+        self.request_log: list[tuple[str, str, Optional[str]]] = []
+        self._gzip_cache: dict[int, bytes] = {}
+
+        server = self
+
+        class Handler(LoopbackRequestHandler):
+            file_server = server
+
+        self.httpd = ThreadingHTTPServer((host, 0), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.file_dir, ignore_errors=True)
+
+    def __enter__(self) -> "LoopbackFileServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def reset(self) -> None:
+        """Remove every stored file, starting a new change journal."""
+        with self.lock:
+            for file_name in os.listdir(self.file_dir):
+                os.remove(os.path.join(self.file_dir, file_name))
+            self.file_hash_dict.clear()
+            self.journal_id = uuid.uuid4().hex
+            self.generation = 0
+            self.file_generation_dict.clear()
+            self.removed_generation_dict.clear()
+            self.sorted_file_names = None
+            self.request_log.clear()
+
+    def add_file(self, file_name: str, data: bytes) -> str:
+        """Store a file as if it was uploaded, returning its hash."""
+        with open(os.path.join(self.file_dir, file_name), "wb") as f:
+            f.write(data)
+        file_hash = hashlib.md5(data).hexdigest()
+        self.index_file(file_name, file_hash)
+        return file_hash
+
+    def index_file(self, file_name: str, file_hash: str) -> None:
+        """Record a file in the index and the journal without storing it, enough for listings."""
+        with self.lock:
+            if self.file_hash_dict.get(file_name) == file_hash:
+                return
+            self.generation += 1
+            if file_name not in self.file_hash_dict:
+                self.sorted_file_names = None
+            self.file_hash_dict[file_name] = file_hash
+            self.file_generation_dict[file_name] = self.generation
+            self.removed_generation_dict.pop(file_name, None)
+
+    def remove_file(self, file_name: str) -> None:
+        """Remove a file from the index, journaling the removal."""
+        with self.lock:
+            if self.file_hash_dict.pop(file_name, None) is None:
+                return
+            self.generation += 1
+            self.sorted_file_names = None
+            del self.file_generation_dict[file_name]
+            self.removed_generation_dict[file_name] = self.generation
+            file_path = os.path.join(self.file_dir, file_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def get_gzip_body(self, size: int) -> bytes:
+        """Compressible body of `size` bytes, gzipped once and cached."""
+        with self.lock:
+            if size not in self._gzip_cache:
+                self._gzip_cache[size] = gzip.compress(synthetic_body(size, compressible=True), 6)
+            return self._gzip_cache[size]
+
+
+class LoopbackRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the header and the body are written separately, with Nagle the body
+    # waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    file_server: LoopbackFileServer = None
+
+    def log_message(self, format, *args):
+        # one line per request would dominate small request timings
+        pass
+
+    # routing
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_HEAD(self):
+        self._route("HEAD")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def _route(self, method: str) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        service_url = self.file_server.file_service_url
+        with self.file_server.lock:
+            self.file_server.request_log.append((method, url.path, self.headers.get("Range")))
+        if url.path.startswith("/bench/") and method in ("GET", "HEAD"):
+            self._handle_bench(url.path, query)
+        elif url.path in (service_url, service_url + "/") and method == "POST":
+            self._handle_json_api()
+        elif url.path.startswith(service_url + "/metadata/") and method in ("GET", "HEAD"):
+            self._handle_metadata(urllib.parse.unquote(url.path[len(service_url + "/metadata/"):]))
+        elif url.path.startswith(service_url + "/files/"):
+            file_name = urllib.parse.unquote(url.path[len(service_url + "/files/"):])
+            if "/" in file_name or file_name in ("", ".", ".."):
+                self._send(400, b"Invalid file name", "text/plain")
+            elif method in ("GET", "HEAD"):
+                self._handle_raw_download(file_name)
+            elif method == "PUT":
+                self._handle_raw_upload(file_name)
+            else:
+                self._send(405, b"", "text/plain")
+        else:
+            self._read_body()
+            self._send(404, b"Not found", "text/plain")
+
+    # synthetic routes
+
+    def _handle_bench(self, path: str, query: dict) -> None:
+        size = int(query.get("size", 0))
+        if path == "/bench/small":
+            self._send(200, b'{"request_success": true}', "application/json")
+        elif path == "/bench/large":
+            self._send(200, synthetic_body(size), "application/octet-stream")
+        elif path == "/bench/gzip":
+            self._send(200, self.file_server.get_gzip_body(size), "text/csv",
+                       {"Content-Encoding": "gzip"})
+        elif path == "/bench/chunked":
+            self._send_chunked(synthetic_body(size), int(query.get("chunk", 65536)))
+        elif path.startswith("/bench/redirect/"):
+            remaining = int(path.rsplit("/", 1)[1])
+            if remaining > 0:
+                self._send(302, b"", "text/plain", {"Location": f"/bench/redirect/{remaining - 1}"})
+            else:
+                self._send(200, b'{"request_success": true}', "application/json")
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    # file service routes
+
+    def _handle_json_api(self) -> None:
+        request_data = json.loads(self._read_body())
+        request_type = request_data.get("request_type")
+        if request_type == "list_files" and request_data.get("page_size") is not None:
+            self._send_json(self._list_file_page(request_data))
+            return
+        if request_type == "list_files":
+            with self.file_server.lock:
+                request_data_list = [{"file_name": file_name, "file_hash": file_hash}
+                                     for file_name, file_hash in sorted(self.file_server.file_hash_dict.items())]
+        elif request_type == "list_file_changes":
+            self._send_json(self._list_file_changes(request_data.get("cursor")))
+            return
+        elif request_type == "download_file":
+            request_data_list = request_data.get("request_download_file_list", [])
+            for file in request_data_list:
+                file_path = os.path.join(self.file_server.file_dir, file["file_name"])
+                if os.path.isfile(file_path):
+                    with open(file_path, "rb") as f:
+                        file["file_data"] = base64.b64encode(f.read()).decode("ascii")
+        elif request_type == "upload_file":
+            request_data_list = []
+            for file in request_data.get("request_upload_file_list", []):
+                file_hash = self.file_server.add_file(file["file_name"], base64.b64decode(file["file_data"]))
+                request_data_list.append({"file_name": file["file_name"], "file_hash": file_hash})
+        else:
+            self._send_json({"request_success": False, "error_message": f"Request type '{request_type}' is not implemented"})
+            return
+        self._send_json({"request_success": True, "request_data": request_data_list})
+
+    def _list_file_page(self, request_data: dict) -> dict:
+        """A page of the list in name order, the only order and filter the stand-in knows."""
+        if (request_data.get("sort_by") or "name") != "name" or request_data.get("descending") \
+                or request_data.get("name_pattern"):
+            return {"request_success": False, "error_message": "Only pages in name order are supported"}
+        server = self.file_server
+        page_size = request_data["page_size"]
+        page_token = request_data.get("page_token")
+        with server.lock:
+            if server.sorted_file_names is None:
+                server.sorted_file_names = sorted(server.file_hash_dict)
+            file_names = server.sorted_file_names
+            start = 0 if page_token is None else bisect.bisect_right(file_names, json.loads(page_token)[0])
+            page_file_names = file_names[start:start + page_size]
+            response = {
+                "request_success": True,
+                "request_data": [{"file_name": file_name, "file_hash": server.file_hash_dict[file_name]}
+                                 for file_name in page_file_names],
+                "cursor": f"{server.journal_id}.{server.generation}",
+            }
+            if start + page_size < len(file_names):
+                response["next_page_token"] = json.dumps([page_file_names[-1]])
+            if page_token is None:
+                response["total_count"] = len(file_names)
+            return response
+
+    def _list_file_changes(self, cursor: str) -> dict:
+        server = self.file_server
+        with server.lock:
+            journal_id, _, generation = (cursor or "").partition(".")
+            response = {"request_success": True, "cursor": f"{server.journal_id}.{server.generation}"}
+            if journal_id != server.journal_id or not generation.isdigit() or int(generation) > server.generation:
+                response["full_list"] = True
+                response["request_data"] = [{"file_name": file_name, "file_hash": file_hash}
+                                            for file_name, file_hash in server.file_hash_dict.items()]
+                response["removed_file_list"] = []
+                return response
+            since = int(generation)
+            response["full_list"] = False
+            response["request_data"] = [{"file_name": file_name, "file_hash": server.file_hash_dict[file_name]}
+                                        for file_name, file_generation in server.file_generation_dict.items()
+                                        if file_generation > since]
+            response["removed_file_list"] = [file_name for file_name, removed_generation
+                                             in server.removed_generation_dict.items() if removed_generation > since]
+            return response
+
+    def _handle_raw_download(self, file_name: str) -> None:
+        self._read_body()
+        with self.file_server.lock:
+            file_hash = self.file_server.file_hash_dict.get(file_name)
+        if file_hash is None:
+            self._send(404, f"File '{file_name}' not found".encode(), "text/plain")
+            return
+        file_path = os.path.join(self.file_server.file_dir, file_name)
+        file_size = os.path.getsize(file_path)
+        etag = f'"{file_hash}"'
+        headers = {"Accept-Ranges": "bytes", "ETag": etag}
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, None, None, headers)
+            return
+
+        first, last, status = 0, file_size - 1, 200
+        range_match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "").strip())
+        if range_match and self.headers.get("If-Range", etag) == etag:
+            first = int(range_match.group(1))
+            if first >= file_size:
+                headers["Content-Range"] = f"bytes */{file_size}"
+                self._send(416, b"Requested range not satisfiable", "text/plain", headers)
+                return
+            if range_match.group(2):
+                last = min(int(range_match.group(2)), file_size - 1)
+            status = 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{file_size}"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(last - first + 1))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        self.wfile.flush()
+        with open(file_path, "rb") as f:
+            self.connection.sendfile(f, first, last - first + 1)
+
+    def _handle_metadata(self, file_name: str) -> None:
+        self._read_body()
+        with self.file_server.lock:
+            file_hash = self.file_server.file_hash_dict.get(file_name)
+        if file_hash is None:
+            self._send(404, f"File '{file_name}' not found".encode(), "text/plain")
+            return
+        stat_result = os.stat(os.path.join(self.file_server.file_dir, file_name))
+        self._send(204, None, None, {
+            "ETag": f'"{file_hash}"',
+            "Last-Modified": email.utils.formatdate(stat_result.st_mtime, usegmt=True),
+            "X-File-Size": str(stat_result.st_size),
+            "X-File-Mtime": f"{stat_result.st_mtime_ns / 1e9:.6f}",
+        })
+
+    def _handle_raw_upload(self, file_name: str) -> None:
+        body = self._read_body()
+        file_hash = self.file_server.add_file(file_name, body)
+        self._send_json({"request_success": True, "request_data": [{"file_name": file_name, "file_hash": file_hash}]})
+
+    # helpers
+
+    def _read_body(self) -> bytes:
+        """Read the request body, undoing chunked framing and gzip or deflate."""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            part_list = []
+            while True:
+                chunk_size = int(self.rfile.readline().split(b";")[0], 16)
+                if chunk_size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b""):
+                        pass
+                    break
+                part_list.append(self.rfile.read(chunk_size))
+                self.rfile.readline()
+            body = b"".join(part_list)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        for coding in reversed([coding.strip().lower() for coding in
+                                self.headers.get("Content-Encoding", "").split(",") if coding.strip()]):
+            if coding == "gzip":
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            elif coding == "deflate":
+                body = zlib.decompress(body)
+        return body
+
+    def _send_json(self, data: dict) -> None:
+        self._send(200, json.dumps(data).encode(), "application/json")
+
+    def _send(self, status: int, body, content_type, headers: dict = None) -> None:
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_chunked(self, body: bytes, chunk_size: int) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        view = memoryview(body)
+        for offset in range(0, len(view), chunk_size):
+            chunk = view[offset:offset + chunk_size]
+            self.wfile.write(b"%x\r\n" % len(chunk))
+            self.wfile.write(chunk)
+            self.wfile.write(b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
@@ -8,6 +8,7 @@ from frontend.mode_setting import SettingsScreen
 from frontend.mode_user_profile import LoginScreen
 from textual.reactive import reactive
 from service.http_client import HttpClientSocket
+from service.async_http_client import AsyncHttpClient
 from service.authentication import AuthService
 from service.file_service import FileService, LocalFileBackend
 from domain.setting_model import Setting, DEFAULT_HTTP_REQUEST_TEMPLATE
@@ -38,14 +39,17 @@ class ClientApp(App):
 
     def __init__(self):
         super().__init__()
-        self.local_file_backend = LocalFileBackend()
-        self.http_client = HttpClientSocket()
-        self.auth_service = AuthService(self.http_client)
-        self.file_service = FileService(self.http_client, self.local_file_backend)
-
         self.app.current_setting = Setting()
         self.app.current_setting.http_request_template = DEFAULT_HTTP_REQUEST_TEMPLATE
 
+        # the hash cache is kept in the directory the downloads go to
+        self.local_file_backend = LocalFileBackend(local_file_dir=self.app.current_setting.local_file_dir)
+        self.http_client = HttpClientSocket()
+        # login is awaited by the login screen, so it runs on the app's event loop
+        self.async_http_client = AsyncHttpClient()
+        self.auth_service = AuthService(self.async_http_client)
+        self.file_service = FileService(self.http_client, self.local_file_backend)
+
     def on_mount(self) -> None:
         """The default screen is the dashboard."""
         self.theme = "monokai"
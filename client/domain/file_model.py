@@ -1,17 +1,33 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
 from enum import StrEnum
 from .http_model import HTTPServerAddress
 import sys
 import hashlib
+import threading
 from domain.authentication_model import Session
 from domain.setting_model import Setting
 
 class FileServerRequestType(StrEnum):
     """Enumeration for file server request types."""
     LIST_FILES = "list_files"
+    LIST_FILE_CHANGES = "list_file_changes"
     DOWNLOAD_FILE = "download_file"
     UPLOAD_FILE = "upload_file"
+
+class FileListSortKey(StrEnum):
+    """Orders of a paged server file list."""
+    NAME = "name"
+    SIZE = "size"
+    MTIME = "mtime"
+
+class TransferDirection(StrEnum):
+    """Which body of a transfer request carries the file and counts as progress."""
+    UPLOAD = "upload"  # the request body
+    DOWNLOAD = "download"  # the response body
+
+# files per page of a paged server file list
+FILE_LIST_PAGE_SIZE = 200
     
 class DirectViewFileType(StrEnum):
     """Enumeration for direct view file types."""
@@ -26,6 +42,19 @@ class SingleFile:
     file_name: str = None
     file_hash: Optional[str] = None
     file_data: Optional[bytes] | Optional[str] = None
+    # only filled in by paged lists
+    file_size: Optional[int] = None
+    file_mtime: Optional[float] = None
+
+
+@dataclass
+class LocalFileValidator:
+    """Validators of a downloaded file, sent back to the server to revalidate it."""
+    etag: str = None
+    last_modified: Optional[str] = None
+    # local stat when the entry was made, a local change invalidates it
+    file_size: int = None
+    mtime_ns: int = None
 
 
 @dataclass
@@ -34,6 +63,12 @@ class ServerFileList:
     valid_list: bool = False
     file_list: list[SingleFile] = None
     error_message: Optional[str] = None
+    # where the server's change journal stood when the list was made, for fetching only what changed since
+    cursor: Optional[str] = None
+    # paged lists: the token for the next page, None after the last one
+    next_page_token: Optional[str] = None
+    # paged lists: files matching the filter, only sent with the first page
+    total_count: Optional[int] = None
 
 @dataclass
 class FetchServerFileInterface:
@@ -41,12 +76,60 @@ class FetchServerFileInterface:
     current_session: Session = None
     setting: Setting = None
 
+@dataclass
+class FetchServerFilePageInterface:
+    """Request for one page of the server file list."""
+    current_session: Session = None
+    setting: Setting = None
+    page_size: int = FILE_LIST_PAGE_SIZE
+    # next_page_token of the previous page, None for the first page
+    page_token: Optional[str] = None
+    # glob on the file name, i.e. "report_*.csv", "prefix*" for a prefix
+    name_pattern: Optional[str] = None
+    sort_by: FileListSortKey = FileListSortKey.NAME
+    descending: bool = False
+
+@dataclass
+class FetchServerFileChangesInterface:
+    """Request for the changes of the server file list since a list the caller holds."""
+    current_session: Session = None
+    setting: Setting = None
+    # the list from the previous fetch, None to get the whole list
+    cached_file_list: Optional[ServerFileList] = None
+
+@dataclass
+class ServerFileListDelta:
+    """Changes of the server file list relative to the caller's cached list, and the list with them applied."""
+    valid_delta: bool = False
+    # the server could not tell the changes and sent the whole list, the changes below are computed from it
+    full_list: bool = False
+    added_file_list: list[SingleFile] = None
+    modified_file_list: list[SingleFile] = None
+    removed_file_name_list: list[str] = None
+    server_file_list: ServerFileList = None
+    error_message: Optional[str] = None
+
+@dataclass
+class FileTransferProgress:
+    """Progress report sent to upper layers each time a file of a batch finishes."""
+    file_name: str = None
+    transfer_success: bool = False
+    error_message: Optional[str] = None
+    finished_file_count: int = 0
+    total_file_count: int = 0
+
 @dataclass
 class FileDownloadInterface:
     """The download interface the file service provides to upper layers."""
     file_name_list: list[str] = None
     current_session: Session = None
     setting: Setting = None
+    # called from the calling thread each time a file finishes
+    progress_callback: Optional[Callable[[FileTransferProgress], None]] = None
+    # called from transfer threads with the response body bytes received so far and the expected total, None while unknown
+    byte_progress_callback: Optional[Callable[[int, Optional[int]], None]] = None
+    # set to cancel the batch, finished files are kept and partial downloads resume later
+    cancel_event: Optional[threading.Event] = None
 
 @dataclass
 class FileDownloadResult:
@@ -62,6 +145,12 @@ class FileUploadInterface:
     file_path_or_file_dir_path: str = None
     current_session: Session = None
     setting: Setting = None
+    # called from the calling thread each time a file finishes
+    progress_callback: Optional[Callable[[FileTransferProgress], None]] = None
+    # called from transfer threads with the request body bytes sent so far and the expected total, None while unknown
+    byte_progress_callback: Optional[Callable[[int, Optional[int]], None]] = None
+    # set to cancel the batch, files already uploaded are kept
+    cancel_event: Optional[threading.Event] = None
 
 @dataclass
 class FileUploadResult:
@@ -71,12 +160,60 @@ class FileUploadResult:
     uploaded_file_name_list: list[str] = None
     already_uploaded_file_name_list: Optional[list[str]] = None
     
+@dataclass
+class FilePreviewInterface:
+    """Request for the beginning of a server file, to show it before the download completes."""
+    file_name: str = None
+    current_session: Session = None
+    setting: Setting = None
+
+@dataclass
+class FilePreviewResult:
+    """The first bytes of a server file. May end inside a UTF-8 character."""
+    preview_success: bool = False
+    error_message: Optional[str] = None
+    preview_bytes: bytes = None
+    file_size: Optional[int] = None
+
+@dataclass
+class RemoteFileStat:
+    """Metadata of a server file, from its metadata route."""
+    file_name: str = None
+    exists: bool = False
+    file_size: Optional[int] = None
+    file_hash: Optional[str] = None
+    # seconds since the epoch, finer than last_modified
+    mtime: Optional[float] = None
+    last_modified: Optional[str] = None
+
+@dataclass
+class FileStatInterface:
+    """Request for the metadata of some server files, without listing the whole directory."""
+    file_name_list: list[str] = None
+    current_session: Session = None
+    setting: Setting = None
+
+@dataclass
+class FileStatResult:
+    """Metadata of the requested files, in request order. Files the server does not have are not an error."""
+    stat_success: bool = False
+    error_message: Optional[str] = None
+    file_stat_list: list[RemoteFileStat] = None
+
 @dataclass
 class FileServerRequestAPI:
     """Model for file server request API. This is the payload for the file server request."""
     request_type: FileServerRequestType = None
     request_download_file_list: Optional[list[SingleFile]] = None
     request_upload_file_list: Optional[list[SingleFile]] = None
+    # list_file_changes: the cursor of the previous answer, none for a full list
+    cursor: Optional[str] = None
+    # list_files: with a page size the list comes in pages, sorted and filtered
+    page_size: Optional[int] = None
+    page_token: Optional[str] = None
+    name_pattern: Optional[str] = None
+    sort_by: Optional[FileListSortKey] = None
+    descending: Optional[bool] = None
 
 @dataclass
 class FileServerResponseAPI:
@@ -84,3 +221,10 @@ class FileServerResponseAPI:
     request_success: bool = False
     request_data: Optional[list[SingleFile]] = None
     error_message: Optional[str] = None
+    # list_file_changes: request_data holds the added and modified files
+    cursor: Optional[str] = None
+    removed_file_list: Optional[list[str]] = None
+    full_list: Optional[bool] = None
+    # paged list_files: the cursor is for list_file_changes, as above
+    next_page_token: Optional[str] = None
+    total_count: Optional[int] = None
@@ -1,12 +1,13 @@
 """Data models for the client domain."""
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Iterator, Optional, Protocol
 from enum import StrEnum
 
 class HTTPMethod(StrEnum):
     """HTTP methods enumeration."""
     GET = "GET"
+    HEAD = "HEAD"
     POST = "POST"
     PUT = "PUT"
     DELETE = "DELETE"
@@ -20,6 +21,7 @@ class HTTPPayloadType(StrEnum):
     TEXT_PLAIN = "text/plain"
     TEXT_HTML = "text/html"
     MULTIPART_FORM = "multipart/form-data"
+    OCTET_STREAM = "application/octet-stream"
 
 class HTTPTransferEncoding(StrEnum):
     """HTTP transfer encoding types enumeration."""
@@ -35,10 +37,24 @@ class HTTPContentEncoding(StrEnum):
     DEFLATE = "deflate"
     COMPRESS = "compress"
     IDENTITY = "identity"
+    # only available when the zstandard / brotli packages are installed
+    ZSTD = "zstd"
+    BROTLI = "br"
     
-@dataclass
+class HTTPResponseBodySink(Protocol):
+    """Destination of a decoded response body, fed while the response is received."""
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        """Called once the header is in, with the header names in lower case."""
+        ...
+
+    def write(self, data: bytes | memoryview) -> None:
+        """Take the next piece of the body. `data` may be a view of a reused buffer."""
+        ...
+
+@dataclass(frozen=True)
 class HTTPServerAddress:
-    """HTTP server address model."""
+    """HTTP server address model. Frozen so it can key the connection pool."""
     host_ip: str
     port: int = 80
 
@@ -52,12 +68,21 @@ class HTTPResponse:
     content_length: int = None
     set_cookie: str = None
     last_modified: str = None
+    etag: str = None
     connection_keep_alive: bool = None
     transfer_encoding: str = None
     content_encoding: str = None
     location: str = None
+    content_range: str = None
+    # file service metadata headers, X-File-Size and X-File-Mtime
+    file_size: int = None
+    file_mtime: float = None
 
     payload_bytes: bytes = None
+    # set instead of payload_bytes when the body was received into the request's response_body_buffer
+    payload_buffer_size: int = None
+    # set instead of payload_bytes when the body was written to the request's response_body_sink
+    payload_sink_size: int = None
 
 @dataclass
 class HTTPLayerInterfaceRequest:
@@ -82,6 +107,15 @@ class HTTPLayerInterfaceRequest:
     user_agent: str = None
     accept: str = None
     accept_encoding: str = None
+    # partial requests, i.e. "bytes=0-1023" and the validator the parts must match
+    range: str = None
+    if_range: str = None
+    # a 2xx answer to the range other than 206, i.e. the whole file, is left unread whatever its
+    # framing: only its header comes back, the connection is closed
+    partial_response_only: bool = False
+    # conditional requests, the server answers 304 if the copy is still fresh
+    if_none_match: str = None
+    if_modified_since: str = None
     
     # transmission options
     timeout: int = 10
@@ -93,10 +127,27 @@ class HTTPLayerInterfaceRequest:
     # payload options
     content_length_before_encoding: int = None
     content_encoding: HTTPContentEncoding = None
+    # compression level of the content encoding, None for the codec default
+    content_encoding_level: int = None
     transfer_encoding: HTTPTransferEncoding = None
     transfer_encoding_chunk_size: int = 1024
     payload_type: HTTPPayloadType = None
     payload_bytes: bytes = None
+    # if set, the payload is streamed from this file instead of payload_bytes
+    payload_file_path: str = None
+    
+    # called with the byte count each time part of the request body is sent / of the response body
+    # is received, as framed on the wire; headers are not counted
+    # raising from either aborts the request, i.e. to cancel a transfer
+    send_callback: Callable[[int], None] = None
+    receive_callback: Callable[[int], None] = None
+    # a 2xx response body with a Content-Length that fits and no content coding is received
+    # straight into this buffer, i.e. a slice of a memory-mapped file, instead of payload_bytes;
+    # a 2xx body announced larger than the buffer is not read at all (payload_buffer_size 0)
+    response_body_buffer: memoryview = None
+    # a 2xx response body is decoded into this sink while it arrives, i.e. to write it to a file,
+    # instead of being held in payload_bytes
+    response_body_sink: HTTPResponseBodySink = None
 
 @dataclass
 class HTTPLayerEncodingModuleInterface:
@@ -112,29 +163,86 @@ class HTTPLayerEncodingModuleInterface:
     user_agent: str = None
     accept: str = None
     accept_encoding: str = None
+    range: str = None
+    if_range: str = None
+    if_none_match: str = None
+    if_modified_since: str = None
 
     # payload
     content_encoding: HTTPContentEncoding = None
+    content_encoding_level: int = None
     content_length_before_encoding: int = None
     transfer_encoding: HTTPTransferEncoding = None
     transfer_encoding_chunk_size: int = None
     payload_type: HTTPPayloadType = None
     payload_bytes: bytes = None
+    payload_file_path: str = None
+
+@dataclass
+class HTTPFileSegment:
+    """A part of a file to be sent as-is, i.e. with sendfile."""
+    file_path: str
+    offset: int = 0
+    count: int = None
     
 @dataclass
 class HTTPLayerTransmissionModuleInterface:
     """HTTP request model for sending data to the server."""
     encoded_request: bytes
     server: HTTPServerAddress
+    # alternative to encoded_request: a factory for the request as a stream of buffers
+    encoded_request_stream: Callable[[], Iterator[bytes | memoryview | HTTPFileSegment]] = None
     timeout: int = 10
-    # TODO: keep-alive, for now just use stateless connection
+    # reusable connections are handed back to the pool after the response
     keep_alive: bool = False
     max_retries: int = 3
+    # needed to frame the response, i.e. HEAD responses have no body
+    request_method: str = None
+    # bytes of the request line and headers, sent before the body and not reported to send_callback
+    request_head_size: int = 0
+    send_callback: Callable[[int], None] = None
+    receive_callback: Callable[[int], None] = None
+    response_body_buffer: memoryview = None
+    response_body_sink: HTTPResponseBodySink = None
+    partial_response_only: bool = False
 
 @dataclass
 class HTTPLayerDecodingModuleInterface:
     """HTTP response model for receiving data from the server."""
     response_raw_data: bytes
+    # body bytes received into the request's response_body_buffer, not part of response_raw_data
+    body_buffer_size: int = None
+    # decoded body bytes written to the request's response_body_sink
+    body_sink_size: int = None
+    # the body with transfer and content codings already undone while it was received;
+    # when set (or when one of the sizes is), response_raw_data holds only the header
+    decoded_body: bytes = None
+
+class HTTPTracePhase(StrEnum):
+    """Phases of a request reported to the trace hooks."""
+    REQUEST_START = "request_start"
+    CONNECT = "connect"  # a connection was checked out of the pool or opened
+    FIRST_BYTE = "first_byte"  # the first byte of the response arrived
+    BODY_COMPLETE = "body_complete"  # the whole response is in
+    REDIRECT = "redirect"
+    RETRY = "retry"
+    REQUEST_ERROR = "request_error"
+
+@dataclass
+class HTTPTraceEvent:
+    """One phase of a request, with the time and bytes it took so far."""
+    phase: HTTPTracePhase
+    request_id: int  # the same for every phase of a request, redirects included
+    method: str
+    url: str
+    server: HTTPServerAddress
+    elapsed: float  # seconds since request_start
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    status_code: int = None
+    attempt: int = None  # retry: the attempt that failed, from 1
+    location: str = None  # redirect: the new URL
+    error: str = None
 
 @dataclass
 class HTTPConnectionConfigurations:
@@ -143,6 +251,21 @@ class HTTPConnectionConfigurations:
     timeout: int = 10
     keep_alive: bool = True
 
+@dataclass
+class HTTPConnectionPoolConfigurations:
+    """Configurations of the keep-alive connection pool."""
+    max_connections_per_host: int = 4  # idle + in use, per server address
+    idle_timeout: float = 30  # seconds, idle connections older than this are closed
+    acquire_timeout: float = 10  # seconds to wait when a host is at its limit
+
+@dataclass
+class HTTPConnectionPoolStatistics:
+    """Counters describing how well pooled connections are reused."""
+    hits: int = 0
+    misses: int = 0
+    stale_discarded: int = 0
+    idle_expired: int = 0
+
 @dataclass
 class HTTPLayerInterfaceResponse:
     """A unified Interface for the HTTP client to respond to the upper layer handlers."""
@@ -1,6 +1,13 @@
 from dataclasses import dataclass
+from enum import StrEnum
 from . import http_model
 
+
+class FileTransferMode(StrEnum):
+    """How file contents travel between the client and the file service."""
+    JSON = "json"  # base64 inside the JSON API
+    BINARY = "binary"  # raw application/octet-stream per file
+
 DEFAULT_HTTP_REQUEST_TEMPLATE = http_model.HTTPLayerInterfaceRequest(
     url="",
     method="GET",
@@ -9,7 +16,7 @@ DEFAULT_HTTP_REQUEST_TEMPLATE = http_model.HTTPLayerInterfaceRequest(
     cookie=None,
     user_agent="Client by Ruhao Tian",
     accept=None,
-    accept_encoding=None,
+    accept_encoding="gzip, deflate",
     timeout=10,
     max_retries=3,
     allow_redirects=True,
@@ -29,6 +36,24 @@ class Setting:
     
     auth_service_url: str = "/login"
     file_service_url: str = "/file_service"
+    file_transfer_mode: FileTransferMode = FileTransferMode.BINARY
+    # files transferred at the same time, capped by the connection pool's per-host limit
+    download_concurrency: int = 4
+    # binary downloads are fetched in ranges into a .part file and resume after failures
+    download_range_size: int = 8 * 1024 * 1024
+    download_range_concurrency: int = 1  # ranges of one file fetched in parallel
+    download_range_retries: int = 3  # per range
+    upload_concurrency: int = 4
+    # smaller files are packed together into JSON batches of up to upload_batch_size bytes
+    upload_small_file_size: int = 1024 * 1024
+    upload_batch_size: int = 8 * 1024 * 1024
+    # memory all concurrent uploads may hold at once
+    upload_memory_limit: int = 256 * 1024 * 1024
+    # content coding applied to upload bodies, the server decodes it; None sends them as they are
+    upload_content_encoding: http_model.HTTPContentEncoding = None
+    upload_content_encoding_level: int = None  # None for the codec default
+    # the viewer shows this much of a remote file, fetched with a range request, while it downloads
+    view_preview_size: int = 64 * 1024
     
     local_file_dir: str = "./local_files/"
     # upload_file_dir: str = "./non-exist_dir"
\ No newline at end of file
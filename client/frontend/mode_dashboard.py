@@ -1,24 +1,57 @@
 import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
-from domain.file_model import DirectViewFileType, ServerFileList, SingleFile
-from frontend.utils import DynamicText, HeaderBar
-from service.file_service import (FetchServerFileInterface,
-                                  FileDownloadInterface, FileDownloadResult,
+from domain.file_model import (DirectViewFileType,
+                               FetchServerFileChangesInterface,
+                               FetchServerFilePageInterface,
+                               FilePreviewInterface, FilePreviewResult,
+                               FileTransferProgress, ServerFileList,
+                               ServerFileListDelta, SingleFile)
+from domain.setting_model import FileTransferMode
+from frontend.utils import DynamicText, HeaderBar, PagedTextView
+from service.file_pager import MappedTextFile, decode_utf8_prefix
+from service.file_service import (FileDownloadInterface, FileDownloadResult,
                                   FileService, FileUploadInterface,
                                   FileUploadResult, LocalFileBackend)
 from textual.app import App, ComposeResult
 from textual.containers import Container, Grid, Horizontal, Vertical
+from textual.message import Message
 from textual.reactive import reactive
 from textual.screen import ModalScreen, Screen
-from textual.widgets import (Button, Footer, Header, Input, SelectionList,
-                             Static, TextArea)
+from textual.widgets import (Button, Footer, Header, Input, ProgressBar,
+                             SelectionList, Static, TextArea)
 from textual.widgets.selection_list import Selection
+from textual.worker import Worker, WorkerState
+
+# how often the progress bar picks up the byte counts of the running transfer
+TRANSFER_PROGRESS_REFRESH_INTERVAL = 1 / 30  # seconds
+# files up to this size are viewed in the highlighting text area, larger ones are paged
+VIEWER_TEXT_AREA_LIMIT = 256 * 1024
+# how often the paged view picks up lines indexed in the background
+VIEWER_INDEX_REFRESH_INTERVAL = 0.25  # seconds
+# the next page of the file list is fetched once the selector is this close to its last option
+FILE_SELECTOR_LOAD_MARGIN = 50  # options
+
+
+@dataclass
+class QueuedTransfer:
+    """A transfer waiting for, or running on, the dashboard's transfer worker."""
+    description: str
+    # runs on the worker thread, gets the transfer itself to reach its cancel event
+    run: Callable[["QueuedTransfer"], None]
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    # latest byte counts, written by the transfer threads and read by the UI
+    byte_progress: tuple[int, Optional[int]] = (0, None)
 
 
 class FileSelector(Container):
     """A simple file selector widget."""
-    
-    
+
+    class NearEnd(Message):
+        """Posted when the selector is scrolled or moved close to its last option."""
 
     def compose(self) -> ComposeResult:
         """Compose the file selector widget."""
@@ -32,6 +65,25 @@ class FileSelector(Container):
         """Called when the widget is mounted to the screen."""
 
         self.query_one(SelectionList).border_title = "File Selector"
+        self.watch(self.selection_list, "scroll_y", self.check_near_end)
+
+    def on_selection_list_selection_highlighted(self, event: SelectionList.SelectionHighlighted) -> None:
+        self.check_near_end()
+
+    def check_near_end(self, *_) -> None:
+        """Post NearEnd if the last options are in view or about to be."""
+        selection_list = self.selection_list
+        highlighted = selection_list.highlighted
+        if (selection_list.max_scroll_y - selection_list.scroll_y <= FILE_SELECTOR_LOAD_MARGIN
+                or (highlighted is not None
+                    and selection_list.option_count - highlighted <= FILE_SELECTOR_LOAD_MARGIN)):
+            self.post_message(self.NearEnd())
+
+    def show_count(self, loaded_count: int, total_count: Optional[int]) -> None:
+        if total_count is None or loaded_count >= total_count:
+            self.selection_list.border_title = f"File Selector ({loaded_count})"
+        else:
+            self.selection_list.border_title = f"File Selector ({loaded_count} of {total_count})"
 
 class FileViewer(Container):
     """A simple file viewer widget."""
@@ -39,6 +91,11 @@ class FileViewer(Container):
     text_area_content = reactive("Select a single file to view its content.", init=True, always_update=True)
     highlight_language = reactive(None, init=True, always_update=True)
     
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # the file being viewed, kept mapped while it is shown
+        self.mapped_file: Optional[MappedTextFile] = None
+
     def compose(self) -> ComposeResult:
         """Compose the file viewer widget."""
         self.current_file_name = DynamicText(id="current-file-name")
@@ -46,8 +103,63 @@ class FileViewer(Container):
         yield self.current_file_name
         
         self.text_area = TextArea.code_editor(text="Select a single file to view its content.",
-            id="file-viewer-text-area", language=None)
+            id="file-viewer-text-area", language=None, read_only=True)
         yield self.text_area
+
+        # large files are paged from the mapped file instead of loaded into the text area
+        self.paged_view = PagedTextView(id="file-viewer-paged-view")
+        self.paged_view.display = False
+        yield self.paged_view
+
+    def on_mount(self) -> None:
+        self.set_interval(VIEWER_INDEX_REFRESH_INTERVAL, self.refresh_line_index)
+
+    def show_preview(self, file_name: str, preview_text: str, highlight_language: str, file_size: int) -> None:
+        """Show the beginning of a file that is still downloading."""
+        self.close_file()
+        self.paged_view.display = False
+        self.text_area.display = True
+        self.current_file_name.text = f"{file_name} (preview, {len(preview_text)} of {file_size} bytes, downloading...)"
+        self.highlight_language = highlight_language
+        self.text_area_content = preview_text
+
+    def show_local_file(self, file_name: str, file_path: str, highlight_language: str) -> None:
+        """Show a downloaded file, paging it if it is large."""
+        self.close_file()
+        self.mapped_file = MappedTextFile(file_path)
+        self.current_file_name.text = file_name
+        if self.mapped_file.file_size <= VIEWER_TEXT_AREA_LIMIT:
+            # small enough to highlight as a whole, indexing it is instant
+            self.mapped_file.wait_for_index()
+            self.paged_view.display = False
+            self.text_area.display = True
+            self.highlight_language = highlight_language
+            self.text_area_content = "\n".join(self.mapped_file.read_lines(0, self.mapped_file.line_count))
+            return
+        self.text_area.display = False
+        self.paged_view.display = True
+        self.paged_view.show_file(self.mapped_file)
+        self.refresh_line_index()
+
+    def refresh_line_index(self) -> None:
+        """Let the paged view scroll over the lines indexed so far."""
+        if self.mapped_file is None or not self.paged_view.display:
+            return
+        self.paged_view.update_virtual_size()
+        status = "" if self.mapped_file.indexing_complete else ", indexing..."
+        self.current_file_name.text = (
+            f"{os.path.basename(self.mapped_file.file_path)} "
+            f"({self.mapped_file.line_count} lines, {self.mapped_file.file_size} bytes{status})"
+        )
+
+    def close_file(self) -> None:
+        self.paged_view.show_file(None)
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+
+    def on_unmount(self) -> None:
+        self.close_file()
     
     def watch_text_area_content(self, new_value: str) -> None:
         """Watch for changes in the text area content."""
@@ -73,12 +185,16 @@ class OperationPanel(Container):
                 # yield Button("View", id="close-button", classes="operation-button")
                 yield Button("Refresh", id="refresh-button", classes="operation-button")
                 yield Button("View", id="view-button", classes="operation-button")
+                yield Button("Cancel", id="cancel-button", classes="operation-button")
 
             with Vertical(id="operation-panel-input-vertical"):
                 yield Static("New file path or directory path:", id="upload-hint")
                 self.upload_input = Input(placeholder=f"Current directory: {self.app.   local_file_backend.get_working_directory()}", id="upload-input")
                 yield self.upload_input
 
+                self.transfer_progress = ProgressBar(id="transfer-progress", show_eta=True)
+                yield self.transfer_progress
+
                 yield Static("STATUS:", id="status-hint")
                 self.panel_status = DynamicText(id="panel-status")
                 self.panel_status.text = "OK"
@@ -92,6 +208,13 @@ class DashboardScreen(Screen):
         self.dashboard_text = "Dashboard Screen"
         self.file_service: FileService = self.app.file_service
         self.working_directory: str = self.app.local_file_backend.get_working_directory()
+        # transfers run one at a time on a worker thread, the others wait here
+        self.transfer_queue: deque[QueuedTransfer] = deque()
+        self.current_transfer: Optional[QueuedTransfer] = None
+        # the list shown in the file selector, loaded a page at a time while it is scrolled;
+        # once loaded to the end, refreshes only fetch what changed since its first page
+        self.server_file_list: Optional[ServerFileList] = None
+        self.loading_file_page = False
 
     def compose(self) -> ComposeResult:
         """Compose the dashboard screen."""
@@ -119,56 +242,214 @@ class DashboardScreen(Screen):
 
         yield Footer()
     
+    def on_mount(self) -> None:
+        """Start following the progress of transfers."""
+        self.set_interval(TRANSFER_PROGRESS_REFRESH_INTERVAL, self.refresh_transfer_progress)
+
     def action_refresh_file_list(self) -> None:
         """Refresh the file list in the file selector."""
+        # the list is fetched on a worker thread, a newer refresh replaces a running one
+        self.run_worker(self.fetch_file_list_in_worker, thread=True, exclusive=True, group="refresh")
+
+    def fetch_file_list_in_worker(self) -> None:
+        """Fetch the file list from the server. Runs on a worker thread.
+
+        A list loaded to the end is refreshed with what changed since, any
+        other list starts over from its first page.
+        """
+        cached_file_list = self.server_file_list
+        if cached_file_list is None or cached_file_list.next_page_token is not None:
+            page_interface = FetchServerFilePageInterface(
+                current_session=self.app.current_session,
+                setting=self.app.current_setting,
+            )
+            first_page: ServerFileList = self.file_service.fetch_server_file_page(page_interface)
+            self.app.call_from_thread(self.show_first_file_page, cached_file_list, first_page)
+            return
+
+        request_interface = FetchServerFileChangesInterface(
+            current_session=self.app.current_session,
+            setting=self.app.current_setting,
+            cached_file_list=cached_file_list,
+        )
+
+        server_file_list_delta: ServerFileListDelta = self.file_service.fetch_server_file_changes(request_interface)
+        self.app.call_from_thread(self.show_server_file_list_delta, cached_file_list, server_file_list_delta)
+
+    def show_first_file_page(self, cached_file_list: Optional[ServerFileList], first_page: ServerFileList) -> None:
+        """Replace the file selector's options with the first page of the list."""
         file_selector: FileSelector = self.query_one(FileSelector)
-        # Clear the current selection
+
+        if cached_file_list is not self.server_file_list:
+            # the shown list changed while this refresh ran
+            self.action_refresh_file_list()
+            return
+
+        if not first_page.valid_list:
+            self.panel_2.panel_status.text = "Failed to fetch file list: " + first_page.error_message
+            return
+
         file_selector.selection_list.clear_options()
-        
-        # Fetch the file list from the server
-        request_interface = FetchServerFileInterface(
+        self.add_file_options(first_page.file_list)
+        self.server_file_list = first_page
+        file_selector.show_count(len(first_page.file_list), first_page.total_count)
+        # a page that does not fill the selector does not scroll, check for the next one by hand
+        self.call_after_refresh(file_selector.check_near_end)
+
+    def on_file_selector_near_end(self, event: FileSelector.NearEnd) -> None:
+        """Fetch the next page of the file list when the selector gets close to its end."""
+        if self.server_file_list is None or self.server_file_list.next_page_token is None or self.loading_file_page:
+            return
+        self.loading_file_page = True
+        cached_file_list = self.server_file_list
+        self.run_worker(lambda: self.fetch_next_file_page_in_worker(cached_file_list), thread=True, group="page")
+
+    def fetch_next_file_page_in_worker(self, cached_file_list: ServerFileList) -> None:
+        """Fetch the page after the loaded part of the list. Runs on a worker thread."""
+        page_interface = FetchServerFilePageInterface(
             current_session=self.app.current_session,
             setting=self.app.current_setting,
+            page_token=cached_file_list.next_page_token,
         )
-        
-        current_server_file_list: ServerFileList =self.file_service.fetch_server_file_list(request_interface)
-        
-        if not current_server_file_list.valid_list:
+        next_page: ServerFileList = self.file_service.fetch_server_file_page(page_interface)
+        self.app.call_from_thread(self.show_next_file_page, cached_file_list, next_page)
+
+    def show_next_file_page(self, cached_file_list: ServerFileList, next_page: ServerFileList) -> None:
+        """Append a page to the file selector."""
+        file_selector: FileSelector = self.query_one(FileSelector)
+        self.loading_file_page = False
+
+        if cached_file_list is not self.server_file_list:
+            # refreshed meanwhile, the page belongs to the old list
+            return
+
+        if not next_page.valid_list:
+            self.panel_2.panel_status.text = "Failed to fetch file list: " + next_page.error_message
+            return
+
+        self.add_file_options(next_page.file_list)
+        # the pages are kept in one list under the cursor of the first page, so once the
+        # last page is in, the changes since that cursor bring the whole list up to date
+        self.server_file_list.file_list.extend(next_page.file_list)
+        self.server_file_list.next_page_token = next_page.next_page_token
+        file_selector.show_count(len(self.server_file_list.file_list), self.server_file_list.total_count)
+        self.call_after_refresh(file_selector.check_near_end)
+
+    def add_file_options(self, file_list: list[SingleFile]) -> None:
+        file_selector: FileSelector = self.query_one(FileSelector)
+        # file_name is the primary key so it should be unique, it is the option id as well
+        file_selector.selection_list.add_options([
+            Selection(file.file_name, file.file_name, id=file.file_name)
+            for file in file_list
+        ])
+
+    def show_server_file_list_delta(self, cached_file_list: Optional[ServerFileList],
+                                    server_file_list_delta: ServerFileListDelta) -> None:
+        """Patch the file selector with the changes, keeping the selection of the files that stay."""
+        file_selector: FileSelector = self.query_one(FileSelector)
+
+        if cached_file_list is not self.server_file_list:
+            # the shown list changed while this refresh ran, its changes do not fit any more
+            self.action_refresh_file_list()
+            return
+
+        if not server_file_list_delta.valid_delta:
             # Handle invalid file list
-            self.panel_2.panel_status.text = "Failed to fetch file list: " + current_server_file_list.error_message
+            self.panel_2.panel_status.text = "Failed to fetch file list: " + server_file_list_delta.error_message
             return
-        
-        # Update the file selector with the new file list
-        for index, file in enumerate(current_server_file_list.file_list):
-            # file_name is the primary key so it should be unique
-            file_selector.selection_list.add_option(Selection(file.file_name, file.file_name))
-    
+
+        for file_name in server_file_list_delta.removed_file_name_list:
+            file_selector.selection_list.remove_option(file_name)
+        self.add_file_options(server_file_list_delta.added_file_list)
+        # a modified file keeps its name, its option stays as it is
+        self.server_file_list = server_file_list_delta.server_file_list
+        file_selector.show_count(len(self.server_file_list.file_list), None)
+
+    def enqueue_transfer(self, transfer: QueuedTransfer) -> None:
+        """Queue a transfer, it starts once the ones before it are done."""
+        self.transfer_queue.append(transfer)
+        if self.current_transfer is None:
+            self.start_next_transfer()
+        else:
+            self.panel_2.panel_status.text += f"\nQueued: {transfer.description} ({len(self.transfer_queue)} waiting)"
+
+    def start_next_transfer(self) -> None:
+        if not self.transfer_queue:
+            return
+        self.current_transfer = self.transfer_queue.popleft()
+        self.panel_2.transfer_progress.update(total=None, progress=0)
+        self.panel_2.panel_status.text = f"{self.current_transfer.description}..."
+        transfer = self.current_transfer
+        self.run_worker(lambda: transfer.run(transfer), thread=True, group="transfer", name=transfer.description)
+
+    def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
+        """Start the next queued transfer when one ends."""
+        if event.worker.group != "transfer":
+            return
+        if event.state == WorkerState.ERROR:
+            self.panel_2.panel_status.text = f"{event.worker.name} failed: {event.worker.error}"
+        if event.state in (WorkerState.SUCCESS, WorkerState.ERROR, WorkerState.CANCELLED):
+            self.current_transfer = None
+            self.start_next_transfer()
+
+    def refresh_transfer_progress(self) -> None:
+        """Move the progress bar to the byte counts of the running transfer."""
+        if self.current_transfer is None:
+            return
+        transferred_bytes, total_bytes = self.current_transfer.byte_progress
+        if total_bytes is None:
+            # size not known yet, i.e. before the first range of a download arrived
+            return
+        self.panel_2.transfer_progress.update(
+            total=max(total_bytes, 1), progress=min(transferred_bytes, total_bytes)
+        )
+
+    def action_cancel_transfer(self) -> None:
+        """Cancel the running transfer, queued ones still run."""
+        if self.current_transfer is None:
+            self.panel_2.panel_status.text = "No transfer running. Nothing to cancel."
+            return
+        # the transfer threads stop at their next block, finished files are kept
+        self.current_transfer.cancel_event.set()
+        self.panel_2.panel_status.text += "\nCancelling..."
+
     def action_download_file_batch(self, file_names: list[str]) -> None:
-    
+
         if len(file_names) == 0:
             self.panel_2.panel_status.text = "No file selected. Nothing to download."
             return
-        else:
-            self.panel_2.panel_status.text = f"Downloading {len(file_names)} files:"
-            for file_name in file_names:
-                self.panel_2.panel_status.text += f"\n- {file_name}"
-        
+
+        self.enqueue_transfer(QueuedTransfer(
+            description=f"Downloading {len(file_names)} files",
+            run=lambda transfer: self.download_in_worker(transfer, list(file_names)),
+        ))
+
+    def download_in_worker(self, transfer: QueuedTransfer, file_names: list[str]) -> FileDownloadResult:
+        """Download files and report the result. Runs on the transfer worker thread."""
         # Create a file download interface
         download_interface = FileDownloadInterface(
             current_session=self.app.current_session,
             setting=self.app.current_setting,
             file_name_list=file_names,
+            progress_callback=lambda progress: self.app.call_from_thread(self.on_file_transfer_progress, progress),
+            byte_progress_callback=lambda transferred_bytes, total_bytes: setattr(
+                transfer, "byte_progress", (transferred_bytes, total_bytes)),
+            cancel_event=transfer.cancel_event,
         )
-        
+
         # Download the files
         download_result: FileDownloadResult = self.file_service.download_file_batch(download_interface)
-        
+        self.app.call_from_thread(self.show_download_result, file_names, download_result)
+        return download_result
+
+    def show_download_result(self, file_names: list[str], download_result: FileDownloadResult) -> None:
         if not download_result.download_success:
             # Handle download failure
             self.panel_2.panel_status.text = "Download failed: " + download_result.error_message
             return
         else:
             # Handle download success
+            self.panel_2.transfer_progress.update(total=1, progress=1)
             self.panel_2.panel_status.text = "Successfully downloaded files:"
             for file_name in download_result.downloaded_file_name_list:
                 self.panel_2.panel_status.text += f"\n- {file_name}"
@@ -177,30 +458,54 @@ class DashboardScreen(Screen):
                 if file_name not in download_result.downloaded_file_name_list:
                     self.panel_2.panel_status.text += f"\n- {file_name} (cached)"
             return
-    
+
+    def on_file_transfer_progress(self, progress: FileTransferProgress) -> None:
+        """Report a finished file of the current batch in the status panel."""
+        status = "done" if progress.transfer_success else "failed"
+        self.panel_2.panel_status.text += (
+            f"\n[{progress.finished_file_count}/{progress.total_file_count}] {progress.file_name} {status}"
+        )
+
     def action_upload_file(self, file_or_directory_path: str = None) -> None:
         """Upload a file or directory to the server."""
         # check if the path is none
         if file_or_directory_path == None:
             self.panel_2.panel_status.text = "Please select a file or directory to upload."
             return
-        
+
+        self.enqueue_transfer(QueuedTransfer(
+            description=f"Uploading {file_or_directory_path}",
+            run=lambda transfer: self.upload_in_worker(transfer, file_or_directory_path),
+        ))
+
+    def upload_in_worker(self, transfer: QueuedTransfer, file_or_directory_path: str) -> FileUploadResult:
+        """Upload a file or directory and report the result. Runs on the transfer worker thread."""
         # Create a file upload interface
         upload_interface = FileUploadInterface(
             current_session=self.app.current_session,
             setting=self.app.current_setting,
             file_path_or_file_dir_path=file_or_directory_path,
+            progress_callback=lambda progress: self.app.call_from_thread(self.on_file_transfer_progress, progress),
+            byte_progress_callback=lambda transferred_bytes, total_bytes: setattr(
+                transfer, "byte_progress", (transferred_bytes, total_bytes)),
+            cancel_event=transfer.cancel_event,
         )
-        
+
         # Upload the file or directory
         upload_result: FileUploadResult = self.file_service.upload_file_batch(upload_interface)
-        
+        self.app.call_from_thread(self.show_upload_result, upload_result)
+        # the server has new files now
+        self.app.call_from_thread(self.action_refresh_file_list)
+        return upload_result
+
+    def show_upload_result(self, upload_result: FileUploadResult) -> None:
         if not upload_result.upload_success:
             # Handle upload failure
             self.panel_2.panel_status.text = "Upload failed: " + upload_result.error_message
             return
         else:
             # Handle upload success
+            self.panel_2.transfer_progress.update(total=1, progress=1)
             self.panel_2.panel_status.text = "Successfully uploaded files:"
             for file_name in upload_result.uploaded_file_name_list:
                 self.panel_2.panel_status.text += f"\n- {file_name}"
@@ -208,7 +513,7 @@ class DashboardScreen(Screen):
                 for file_name in upload_result.already_uploaded_file_name_list:
                     self.panel_2.panel_status.text += f"\n- {file_name} (already cached)"
             return
-    
+
     def action_view_file(self, select_file_names: list[str]) -> None:
 
         file_viewer: FileViewer = self.query_one(FileViewer)
@@ -219,36 +524,59 @@ class DashboardScreen(Screen):
         elif len(select_file_names) > 1:
             self.panel_2.panel_status.text = "Please select only one file to view."
             return
-            
+
         # check if the file extension is supported
         file_name = select_file_names[0]
         file_extension = file_name.split(".")[-1]
         match file_extension:
             case DirectViewFileType.TXT:
-                file_viewer.highlight_language = None
+                highlight_language = None
             case DirectViewFileType.INI:
-                file_viewer.highlight_language = None
+                highlight_language = None
             case DirectViewFileType.MARKDOWN:
-                file_viewer.highlight_language = "markdown"
+                highlight_language = "markdown"
             case DirectViewFileType.JSON:
-                file_viewer.highlight_language = "json"
+                highlight_language = "json"
             case _:
                 self.panel_2.panel_status.text = "File type not supported for direct view."
                 return
-        
+
         # get the file content from the server
         # make sure the file is downloaded first
-        self.action_download_file_batch([file_name])
-        
-        # fetch file content
-        file_path = os.path.join(self.app.current_setting.local_file_dir, file_name)
-        file_bytes = self.app.local_file_backend.load_file(file_path)
-        
-        # decode the file content and display it in the text area
-        file_viewer.current_file_name.text = file_name
-        file_viewer.text_area_content = file_bytes.decode('utf-8')
-        
-    
+        self.enqueue_transfer(QueuedTransfer(
+            description=f"Fetching {file_name} to view",
+            run=lambda transfer: self.view_in_worker(transfer, file_name, highlight_language),
+        ))
+
+    def view_in_worker(self, transfer: QueuedTransfer, file_name: str, highlight_language: str) -> None:
+        """Download a file if needed and show it in the viewer. Runs on the transfer worker thread."""
+        setting = self.app.current_setting
+        file_path = os.path.join(setting.local_file_dir, file_name)
+        file_viewer: FileViewer = self.query_one(FileViewer)
+        if not os.path.exists(file_path) and setting.file_transfer_mode == FileTransferMode.BINARY:
+            # show the beginning while the whole file downloads
+            preview_result: FilePreviewResult = self.file_service.fetch_file_preview(FilePreviewInterface(
+                file_name=file_name,
+                current_session=self.app.current_session,
+                setting=setting,
+            ))
+            if preview_result.preview_success:
+                self.app.call_from_thread(
+                    file_viewer.show_preview,
+                    file_name,
+                    decode_utf8_prefix(preview_result.preview_bytes),
+                    highlight_language,
+                    preview_result.file_size,
+                )
+
+        download_result = self.download_in_worker(transfer, [file_name])
+        if not download_result.download_success:
+            return
+
+        # the file is mapped and paged in, not read
+        self.app.call_from_thread(file_viewer.show_local_file, file_name, file_path, highlight_language)
+
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """Handle button presses in the dashboard screen."""
         # Retrieve related components
@@ -256,31 +584,35 @@ class DashboardScreen(Screen):
         if self.app.current_session == None or self.app.current_setting == None:
             self.panel_2.panel_status.text = "Please login first."
             file_selector.selection_list.clear_options()
+            self.server_file_list = None
             return
-        
+
         # check if the user is logged in
+        # transfers are queued and run on a worker, so the screen stays responsive
         if event.button.id == "download-button":
             # get the selected file names from the file selector
             select_file_names = file_selector.selection_list.selected
-            
+
             self.action_download_file_batch(select_file_names)
 
-            
+
         elif event.button.id == "upload-button":
-            
+
             # get the file or directory path from the input
             file_or_directory_path = self.panel_2.upload_input.value
-            
-            # Upload the file or directory
+
+            # Upload the file or directory, the file list is refreshed once it is done
             self.action_upload_file(file_or_directory_path)
-            self.action_refresh_file_list()
-            
+
         elif event.button.id == "refresh-button":
             # Refresh the file list
             self.action_refresh_file_list()
-        
+
         elif event.button.id == "view-button":
             # get the selected file names from the file selector
             select_file_names = file_selector.selection_list.selected
-            
+
             self.action_view_file(select_file_names)
+
+        elif event.button.id == "cancel-button":
+            self.action_cancel_transfer()
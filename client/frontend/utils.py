@@ -1,7 +1,15 @@
+from typing import Optional
+
+from rich.cells import cell_len
+from rich.segment import Segment
+from service.file_pager import MappedTextFile
 from textual.app import App, ComposeResult
 from textual.containers import Container, Grid, Horizontal, Vertical
+from textual.geometry import Size
 from textual.reactive import reactive
 from textual.screen import ModalScreen, Screen
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
 from textual.widget import Widget
 from textual.widgets import (Button, Footer, Header, Input, SelectionList,
                              Static)
@@ -27,4 +35,69 @@ class DynamicText(Widget):
     
     def render(self) -> str:
         """Render the dynamic text."""
-        return self.text
\ No newline at end of file
+        return self.text
+
+# control characters would move the terminal cursor, they are shown as replacement characters
+CONTROL_CHARACTER_TABLE = dict.fromkeys([*range(0, 9), *range(10, 32), 127], "�")
+
+
+class PagedTextView(ScrollView):
+    """Scrollable view of a MappedTextFile that only reads the lines on screen.
+
+    Lines are rendered one at a time with the line API, from a window of a few
+    viewports that is re-read from the mapped file when the view scrolls out
+    of it. Nothing else of the file is held in memory.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.mapped_file: Optional[MappedTextFile] = None
+        self._window_first_line = 0
+        self._window_lines: list[str] = []
+        self._max_line_width = 0
+
+    def show_file(self, mapped_file: Optional[MappedTextFile]) -> None:
+        """Show another file, from its top."""
+        self.mapped_file = mapped_file
+        self._window_first_line = 0
+        self._window_lines = []
+        self._max_line_width = 0
+        self.scroll_to(0, 0, animate=False)
+        self.update_virtual_size()
+        self.refresh()
+
+    def update_virtual_size(self) -> None:
+        """Grow the scrollable area to the lines indexed so far."""
+        line_count = 0 if self.mapped_file is None else self.mapped_file.line_count
+        if line_count != self.virtual_size.height:
+            # lines on screen may have been missing from the index so far
+            self.refresh()
+        self.virtual_size = Size(max(self._max_line_width, self.size.width), line_count)
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        line = self._get_line(scroll_y + y)
+        if line is None:
+            return Strip.blank(self.size.width, self.rich_style)
+        strip = Strip([Segment(line, self.rich_style)])
+        return strip.crop(scroll_x, scroll_x + self.size.width)
+
+    def _get_line(self, line_index: int) -> Optional[str]:
+        if self.mapped_file is None:
+            return None
+        window_offset = line_index - self._window_first_line
+        if not 0 <= window_offset < len(self._window_lines):
+            # read a window around the viewport, scrolling a page either way stays inside it
+            viewport_height = max(self.size.height, 1)
+            self._window_first_line = max(0, line_index - viewport_height)
+            self._window_lines = [
+                line.expandtabs(4).translate(CONTROL_CHARACTER_TABLE)
+                for line in self.mapped_file.read_lines(self._window_first_line, viewport_height * 3)
+            ]
+            self._max_line_width = max(
+                [self._max_line_width, *(cell_len(line) for line in self._window_lines)]
+            )
+            window_offset = line_index - self._window_first_line
+            if not 0 <= window_offset < len(self._window_lines):
+                return None
+        return self._window_lines[window_offset]
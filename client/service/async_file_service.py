@@ -0,0 +1,645 @@
+import asyncio
+import os
+
+from domain.authentication_model import Session
+from domain.file_model import (
+    ServerFileList,
+    SingleFile,
+    FetchServerFileInterface,
+    FetchServerFileChangesInterface,
+    FetchServerFilePageInterface,
+    ServerFileListDelta,
+    FileDownloadInterface,
+    FileUploadInterface,
+    FileDownloadResult,
+    FileUploadResult,
+    FileTransferProgress,
+    FilePreviewInterface,
+    FilePreviewResult,
+    FileStatInterface,
+    FileStatResult,
+    TransferDirection,
+)
+from domain.setting_model import Setting, FileTransferMode
+from service.async_http_client import AsyncHttpClient
+from service.file_service import (FileServiceBase, LocalFileBackend, RangeFileSink, TransferMeter,
+                                  METADATA_LOOKUP_MAX_FILES)
+
+
+class AsyncByteBudget:
+    """Byte budget for tasks on one event loop, the asyncio counterpart of `ByteBudget`."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._available = capacity
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int) -> int:
+        """Reserve bytes, waiting until enough are free. Returns the reserved size."""
+        # a single request larger than the whole budget runs alone
+        size = min(size, self.capacity)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._available >= size)
+            self._available -= size
+        return size
+
+    async def release(self, size: int) -> None:
+        """Give reserved bytes back."""
+        async with self._condition:
+            self._available += size
+            self._condition.notify_all()
+
+
+class AsyncFileService(FileServiceBase):
+    """File service on an asyncio HTTP client.
+
+    Same operations and results as `FileService`, but transfers are tasks on
+    the caller's event loop instead of worker threads. Disk reads, writes and
+    hashing still run in threads so they do not stall the loop. Progress
+    callbacks are called on the loop.
+    """
+
+    def __init__(
+        self, http_client: AsyncHttpClient, local_file_backend: LocalFileBackend
+    ):
+        super().__init__(http_client, local_file_backend)
+
+    async def _gather_bounded(self, concurrency: int, coroutine_list: list) -> list:
+        """Run coroutines with at most `concurrency` at a time, returning results or exceptions in order."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(
+            *(run(coroutine) for coroutine in coroutine_list), return_exceptions=True
+        )
+
+    async def _revalidate_local_file(
+        self, file_name: str, setting: Setting, current_session: Session
+    ) -> None:
+        """Check a local copy against the server with a conditional HEAD request."""
+        validator = await asyncio.to_thread(
+            self._get_local_validator, setting.local_file_dir + file_name
+        )
+        response = await self.http_client.handle_request(
+            self._build_revalidation_request(file_name, validator, setting, current_session)
+        )
+        self._check_revalidation_response(file_name, validator, response)
+
+    async def _revalidate_local_files(
+        self, file_name_list: list[str], setting: Setting, current_session: Session
+    ) -> None:
+        """Revalidate local copies concurrently, raising if any of them is outdated."""
+        if not file_name_list:
+            return
+        concurrency = self._get_transfer_concurrency(setting.download_concurrency, len(file_name_list))
+        result_list = await self._gather_bounded(
+            concurrency,
+            [
+                self._revalidate_local_file(file_name, setting, current_session)
+                for file_name in file_name_list
+            ],
+        )
+        error_message_list = [str(result) for result in result_list if isinstance(result, Exception)]
+        if error_message_list:
+            raise RuntimeError("\n".join(error_message_list))
+
+    async def _fetch_range_with_retries(
+        self,
+        file_info: SingleFile,
+        first: int,
+        last: int,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+        body_sink: RangeFileSink = None,
+        partial_only: bool = False,
+    ) -> tuple[int, bytes, int]:
+        """Request a range, retrying transient failures."""
+        for attempt in range(setting.download_range_retries + 1):
+            transfer_meter.check_cancelled()
+            try:
+                response = await self.http_client.handle_request(self._build_range_request(
+                    file_info, first, last, setting, current_session, transfer_meter,
+                    body_sink=body_sink, partial_only=partial_only,
+                ))
+                return self._parse_range_response(first, response)
+            except ConnectionError as e:
+                self._check_range_retry(first, last, attempt, e, setting)
+
+    async def _fetch_range_into_file(
+        self,
+        part_fd: int,
+        file_info: SingleFile,
+        first: int,
+        last: int,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+        failed: asyncio.Event,
+    ) -> bool:
+        """Fetch one range and write it at its offset in the part file while it arrives.
+
+        Returns False if the range was skipped because another one failed.
+        """
+        if failed.is_set():
+            return False
+        try:
+            data_offset, data, _ = await self._fetch_range_with_retries(
+                file_info, first, last, setting, current_session, transfer_meter,
+                body_sink=RangeFileSink(part_fd, first), partial_only=True,
+            )
+            self._check_later_range(first, data_offset, data)
+        except Exception:
+            failed.set()
+            raise
+        return True
+
+    async def _download_single_file_ranged(
+        self, file_info: SingleFile, setting: Setting, current_session: Session, transfer_meter: TransferMeter
+    ) -> None:
+        """Download one file in ranges into a .part file, then verify and rename it.
+
+        Same resume rules as `FileService._download_single_file_ranged`, but
+        every body is written to the part file through a sink.
+        """
+        local_file_path, part_file_path, part_fd = self._open_part_file(file_info, setting)
+        range_size = setting.download_range_size
+        verified_size = 0
+        try:
+            offset = verified_size = os.fstat(part_fd).st_size
+
+            # the first range also tells the file size and whether the part is still valid
+            first_sink = RangeFileSink(part_fd, offset)
+            try:
+                data_offset, _, file_size = await self._fetch_range_with_retries(
+                    file_info, offset, offset + range_size - 1, setting, current_session, transfer_meter,
+                    body_sink=first_sink,
+                )
+                if self._restart_part_file(part_fd, offset, file_size):
+                    first_sink = RangeFileSink(part_fd, 0)
+                    data_offset, _, file_size = await self._fetch_range_with_retries(
+                        file_info, 0, range_size - 1, setting, current_session, transfer_meter,
+                        body_sink=first_sink,
+                    )
+            finally:
+                verified_size = first_sink.end
+            transfer_meter.add_total(file_size - data_offset)
+
+            # fetch the rest, completed ranges are tracked to keep the prefix contiguous
+            range_list = self._plan_file_ranges(verified_size, file_size, range_size)
+            outcome_dict = {}
+            if range_list:
+                concurrency = self._get_transfer_concurrency(
+                    setting.download_range_concurrency, len(range_list)
+                )
+                failed = asyncio.Event()
+                result_list = await self._gather_bounded(
+                    concurrency,
+                    [
+                        self._fetch_range_into_file(
+                            part_fd, file_info, first, last, setting, current_session, transfer_meter, failed
+                        )
+                        for first, last in range_list
+                    ],
+                )
+                for (first, _), result in zip(range_list, result_list):
+                    if isinstance(result, BaseException):
+                        outcome_dict[first] = result
+                    elif result:
+                        outcome_dict[first] = None
+            verified_size, fetch_whole_file = self._settle_later_ranges(
+                range_list, outcome_dict, verified_size, file_size, transfer_meter
+            )
+            if fetch_whole_file:
+                whole_sink = RangeFileSink(part_fd, 0)
+                try:
+                    await self._fetch_range_with_retries(
+                        file_info, 0, file_size - 1, setting, current_session, transfer_meter,
+                        body_sink=whole_sink,
+                    )
+                finally:
+                    verified_size = whole_sink.end
+        finally:
+            os.ftruncate(part_fd, verified_size)
+            os.close(part_fd)
+
+        await asyncio.to_thread(self._finish_part_file, file_info, part_file_path, local_file_path)
+
+    async def _download_single_file(
+        self, file_info: SingleFile, setting: Setting, current_session: Session, transfer_meter: TransferMeter
+    ) -> None:
+        """Download one file, verify it and write it to the local file directory."""
+        transfer_meter.check_cancelled()
+        local_file_path = setting.local_file_dir + file_info.file_name
+        if setting.file_transfer_mode == FileTransferMode.BINARY:
+            await self._download_single_file_ranged(file_info, setting, current_session, transfer_meter)
+        else:
+            response = await self.http_client.handle_request(
+                self._build_json_download_request(file_info, setting, current_session, transfer_meter)
+            )
+            file_bytes = self._parse_json_download_response(file_info, response)
+            await asyncio.to_thread(self._save_downloaded_file, file_info, file_bytes, local_file_path)
+        # the verified hash is the server's ETag, later views revalidate with it
+        self._record_local_validator(local_file_path, file_info.file_hash)
+
+    async def _download_files_concurrent(
+        self,
+        file_info_list: list[SingleFile],
+        layer_request_interface: FileDownloadInterface,
+    ) -> FileDownloadResult:
+        """Download files as concurrent tasks, one request per file, reporting progress as they complete."""
+        setting = layer_request_interface.setting
+        current_session = layer_request_interface.current_session
+        progress_callback = layer_request_interface.progress_callback
+        downloaded_file_name_list = []
+        error_message_list = []
+        if not file_info_list:
+            return FileDownloadResult(download_success=True, downloaded_file_name_list=[])
+
+        transfer_meter = TransferMeter(
+            layer_request_interface.byte_progress_callback, layer_request_interface.cancel_event
+        )
+        semaphore = asyncio.Semaphore(
+            self._get_transfer_concurrency(setting.download_concurrency, len(file_info_list))
+        )
+
+        async def download(file_info: SingleFile) -> tuple[SingleFile, str]:
+            async with semaphore:
+                try:
+                    await self._download_single_file(file_info, setting, current_session, transfer_meter)
+                    return file_info, None
+                except Exception as e:
+                    return file_info, f"Failed to download '{file_info.file_name}': {str(e)}"
+
+        for next_done in asyncio.as_completed([download(file_info) for file_info in file_info_list]):
+            file_info, error_message = await next_done
+            if error_message is None:
+                downloaded_file_name_list.append(file_info.file_name)
+            else:
+                error_message_list.append(error_message)
+
+            if progress_callback is not None:
+                progress_callback(
+                    FileTransferProgress(
+                        file_name=file_info.file_name,
+                        transfer_success=error_message is None,
+                        error_message=error_message,
+                        finished_file_count=len(downloaded_file_name_list) + len(error_message_list),
+                        total_file_count=len(file_info_list),
+                    )
+                )
+
+        return self._make_transfer_result(
+            FileDownloadResult, downloaded_file_name_list, error_message_list
+        )
+
+    async def _run_upload_task(
+        self,
+        task: list[SingleFile],
+        file_path_dict: dict[str, str],
+        file_size_dict: dict[str, int],
+        server_file_hash_dict: dict[str, str],
+        memory_budget: AsyncByteBudget,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+    ) -> list[str]:
+        """Upload one task, holding its share of the memory budget while it runs.
+
+        Returns the names of files that turned out to be on the server already.
+        """
+        transfer_meter.check_cancelled()
+        if self._is_streamed_upload_task(task, file_size_dict, setting):
+            # streamed from disk, only a read block is held in memory
+            response = await self.http_client.handle_request(
+                self._build_binary_upload_request(
+                    task[0], file_path_dict[task[0].file_name], setting, current_session, transfer_meter
+                )
+            )
+            self._check_uploaded_files(response, task)
+            return []
+
+        reserved_size = await memory_budget.acquire(self._get_json_upload_memory_size(task, file_size_dict))
+        try:
+            # reading, hashing and base64 encoding are done off the loop
+            payload, uploaded_file_info_list, already_cached_file_name_list = await asyncio.to_thread(
+                self._build_json_upload_payload, task, file_path_dict, server_file_hash_dict
+            )
+            if uploaded_file_info_list:
+                transfer_meter.check_cancelled()
+                response = await self.http_client.handle_request(
+                    self._build_json_upload_request(payload, setting, current_session, transfer_meter)
+                )
+                self._check_uploaded_files(response, uploaded_file_info_list)
+            return already_cached_file_name_list
+        finally:
+            await memory_budget.release(reserved_size)
+
+    async def _upload_files_concurrent(
+        self,
+        file_info_list: list[SingleFile],
+        file_path_dict: dict[str, str],
+        file_size_dict: dict[str, int],
+        server_file_hash_dict: dict[str, str],
+        layer_request_interface: FileUploadInterface,
+        already_cached_file_name_list: list[str],
+    ) -> FileUploadResult:
+        """Upload files as concurrent tasks, packing small files into batches."""
+        setting = layer_request_interface.setting
+        current_session = layer_request_interface.current_session
+        progress_callback = layer_request_interface.progress_callback
+        uploaded_file_name_list = []
+        error_message_list = []
+        finished_file_count = 0
+
+        task_list = self._plan_upload_tasks(file_info_list, file_size_dict, setting)
+        if not task_list:
+            return FileUploadResult(
+                upload_success=True,
+                uploaded_file_name_list=[],
+                already_uploaded_file_name_list=already_cached_file_name_list,
+            )
+
+        memory_budget = AsyncByteBudget(setting.upload_memory_limit)
+        transfer_meter = TransferMeter(
+            layer_request_interface.byte_progress_callback,
+            layer_request_interface.cancel_event,
+            self._get_upload_transfer_size(file_info_list, file_size_dict, setting),
+            TransferDirection.UPLOAD,
+        )
+        semaphore = asyncio.Semaphore(
+            self._get_transfer_concurrency(setting.upload_concurrency, len(task_list))
+        )
+
+        async def upload(task: list[SingleFile]) -> tuple[list[SingleFile], list[str], str]:
+            async with semaphore:
+                try:
+                    task_cached_file_name_list = await self._run_upload_task(
+                        task,
+                        file_path_dict,
+                        file_size_dict,
+                        server_file_hash_dict,
+                        memory_budget,
+                        setting,
+                        current_session,
+                        transfer_meter,
+                    )
+                    return task, task_cached_file_name_list, None
+                except Exception as e:
+                    file_names = ", ".join(f"'{file_info.file_name}'" for file_info in task)
+                    return task, [], f"Failed to upload {file_names}: {str(e)}"
+
+        for next_done in asyncio.as_completed([upload(task) for task in task_list]):
+            task, task_cached_file_name_list, error_message = await next_done
+            if error_message is None:
+                already_cached_file_name_list.extend(task_cached_file_name_list)
+                uploaded_file_name_list.extend(
+                    file_info.file_name
+                    for file_info in task
+                    if file_info.file_name not in task_cached_file_name_list
+                )
+            else:
+                error_message_list.append(error_message)
+
+            if progress_callback is None:
+                finished_file_count += len(task)
+                continue
+            for file_info in task:
+                finished_file_count += 1
+                progress_callback(
+                    FileTransferProgress(
+                        file_name=file_info.file_name,
+                        transfer_success=error_message is None,
+                        error_message=error_message,
+                        finished_file_count=finished_file_count,
+                        total_file_count=len(file_info_list),
+                    )
+                )
+
+        return self._make_transfer_result(
+            FileUploadResult, uploaded_file_name_list, error_message_list, already_cached_file_name_list
+        )
+
+    async def fetch_server_file_list(
+        self, layer_request_interface: FetchServerFileInterface
+    ) -> ServerFileList:
+        try:
+            request = self._build_file_list_request(
+                layer_request_interface.setting, layer_request_interface.current_session
+            )
+            response = await self.http_client.handle_request(request)
+            return self._parse_file_list_response(response)
+        except Exception as e:
+            return ServerFileList(
+                valid_list=False,
+                error_message=f"Error fetching server file list: {str(e)}",
+            )
+
+    async def fetch_server_file_page(
+        self, layer_request_interface: FetchServerFilePageInterface
+    ) -> ServerFileList:
+        """Fetch one page of the server file list, see `FileService`."""
+        try:
+            request = self._build_file_page_request(
+                layer_request_interface.setting,
+                layer_request_interface.current_session,
+                layer_request_interface,
+            )
+            response = await self.http_client.handle_request(request)
+            return self._parse_file_page_response(response)
+        except Exception as e:
+            return ServerFileList(
+                valid_list=False,
+                error_message=f"Error fetching server file list page: {str(e)}",
+            )
+
+    async def fetch_server_file_changes(
+        self, layer_request_interface: FetchServerFileChangesInterface
+    ) -> ServerFileListDelta:
+        """Fetch what changed on the server since the cached list and apply it, see `FileService`."""
+        cached_file_list = layer_request_interface.cached_file_list
+        if cached_file_list is not None and not cached_file_list.valid_list:
+            cached_file_list = None
+        try:
+            request = self._build_file_changes_request(
+                layer_request_interface.setting,
+                layer_request_interface.current_session,
+                None if cached_file_list is None else cached_file_list.cursor,
+            )
+            response = await self.http_client.handle_request(request)
+            return self._parse_file_changes_response(response, cached_file_list)
+        except Exception as e:
+            return ServerFileListDelta(
+                valid_delta=False,
+                error_message=f"Error fetching server file changes: {str(e)}",
+            )
+
+    async def stat_remote_files(
+        self, layer_request_interface: FileStatInterface
+    ) -> FileStatResult:
+        """Fetch the size, hash and modification time of server files, one concurrent HEAD request each."""
+        try:
+            setting = layer_request_interface.setting
+            current_session = layer_request_interface.current_session
+            if setting is None or current_session is None:
+                raise RuntimeError("Setting or current session is None. Have you logged in?")
+            file_name_list = layer_request_interface.file_name_list or []
+            concurrency = self._get_transfer_concurrency(setting.download_concurrency, len(file_name_list))
+            response_list = await self._gather_bounded(concurrency, [
+                self.http_client.handle_request(self._build_stat_request(file_name, setting, current_session))
+                for file_name in file_name_list
+            ])
+            for response in response_list:
+                if isinstance(response, Exception):
+                    raise response
+            return FileStatResult(
+                stat_success=True,
+                file_stat_list=[
+                    self._parse_stat_response(file_name, response)
+                    for file_name, response in zip(file_name_list, response_list)
+                ],
+            )
+        except Exception as e:
+            return FileStatResult(error_message=f"Error fetching file metadata: {str(e)}")
+
+    async def stat_remote_file(
+        self, file_name: str, current_session: Session, setting: Setting
+    ) -> FileStatResult:
+        """Fetch the metadata of a single server file, see `stat_remote_files`."""
+        return await self.stat_remote_files(FileStatInterface(
+            file_name_list=[file_name], current_session=current_session, setting=setting
+        ))
+
+    async def fetch_file_preview(
+        self, layer_request_interface: FilePreviewInterface
+    ) -> FilePreviewResult:
+        """Fetch the first bytes of a server file with a range request."""
+        try:
+            response = await self.http_client.handle_request(
+                self._build_preview_request(
+                    layer_request_interface.file_name,
+                    layer_request_interface.setting,
+                    layer_request_interface.current_session,
+                )
+            )
+            return self._parse_preview_response(response, layer_request_interface.setting)
+        except Exception as e:
+            return FilePreviewResult(error_message=f"Error fetching file preview: {str(e)}")
+
+    async def download_file_batch(
+        self, layer_request_interface: FileDownloadInterface
+    ) -> FileDownloadResult:
+        """Download single file or multiple files from the server."""
+        try:
+            if not layer_request_interface.file_name_list:
+                return FileDownloadResult(
+                    download_success=False,
+                    error_message="No file selected. Nothing to download.",
+                )
+
+            # 1. revalidate local copies, 2. look up the hashes of the missing ones
+            # 3. match them, 4. download them, as in FileService.download_file_batch
+            setting = layer_request_interface.setting
+            local_file_name_list, missing_file_name_list = self._split_download_files(
+                layer_request_interface.file_name_list, setting
+            )
+            await self._revalidate_local_files(
+                local_file_name_list, setting, layer_request_interface.current_session
+            )
+            if not missing_file_name_list:
+                return FileDownloadResult(download_success=True, downloaded_file_name_list=[])
+
+            if len(missing_file_name_list) <= METADATA_LOOKUP_MAX_FILES:
+                server_file_list = self._file_stat_to_server_list(await self.stat_remote_files(FileStatInterface(
+                    file_name_list=missing_file_name_list,
+                    current_session=layer_request_interface.current_session,
+                    setting=setting,
+                )))
+            else:
+                server_file_list = await self.fetch_server_file_list(FetchServerFileInterface(
+                    current_session=layer_request_interface.current_session,
+                    setting=setting,
+                ))
+            actual_download_file_info_list = self._match_download_files(
+                missing_file_name_list, server_file_list
+            )
+
+            return await self._download_files_concurrent(
+                actual_download_file_info_list, layer_request_interface
+            )
+        except Exception as e:
+            return FileDownloadResult(
+                download_success=False,
+                error_message=f"Error downloading files: {str(e)}",
+            )
+
+    async def upload_file_batch(self, layer_request_interface: FileUploadInterface) -> FileUploadResult:
+        """Upload single file or multiple files to the server."""
+        try:
+            if not layer_request_interface.file_path_or_file_dir_path:
+                return FileUploadResult(
+                    upload_success=False,
+                    error_message="No file selected. Nothing to upload.",
+                )
+
+            # 1. get server file list
+            fetch_file_list_request = FetchServerFileInterface(
+                current_session=layer_request_interface.current_session,
+                setting=layer_request_interface.setting,
+            )
+            current_server_file_list = await self.fetch_server_file_list(
+                fetch_file_list_request
+            )
+            if not current_server_file_list.valid_list:
+                raise RuntimeError(
+                    "Error fetching server file list before upload: "
+                    + current_server_file_list.error_message
+                )
+
+            # 2. collect local files, walking the directory off the loop
+            file_path_dict, file_size_dict = await asyncio.to_thread(
+                self._collect_upload_files, layer_request_interface.file_path_or_file_dir_path
+            )
+
+            # 3. hash streamed files and compare with the server, as in FileService.upload_file_batch
+            setting = layer_request_interface.setting
+            server_file_hash_dict = {
+                file.file_name: file.file_hash for file in current_server_file_list.file_list
+            }
+            streamed_file_name_list = [
+                file_name
+                for file_name in file_path_dict
+                if self._is_streamed_upload(file_size_dict[file_name], setting)
+            ]
+            file_hash_list = await self._gather_bounded(
+                max(1, setting.upload_concurrency),
+                [
+                    asyncio.to_thread(self.local_file_backend.get_file_hash, file_path_dict[file_name])
+                    for file_name in streamed_file_name_list
+                ],
+            )
+            for file_hash in file_hash_list:
+                if isinstance(file_hash, Exception):
+                    raise file_hash
+            actual_upload_file_info_list, already_cached_file_name_list = self._classify_upload_files(
+                file_path_dict,
+                dict(zip(streamed_file_name_list, file_hash_list)),
+                server_file_hash_dict,
+            )
+
+            # 4. upload files: large files one by one, small files packed in batches
+            return await self._upload_files_concurrent(
+                actual_upload_file_info_list,
+                file_path_dict,
+                file_size_dict,
+                server_file_hash_dict,
+                layer_request_interface,
+                already_cached_file_name_list,
+            )
+        except Exception as e:
+            return FileUploadResult(
+                upload_success=False, error_message=f"Error uploading files: {str(e)}"
+            )
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Iterator
+
+from domain.http_model import (HTTPConnectionPoolConfigurations,
+                               HTTPFileSegment,
+                               HTTPLayerDecodingModuleInterface,
+                               HTTPLayerInterfaceRequest,
+                               HTTPLayerInterfaceResponse,
+                               HTTPLayerTransmissionModuleInterface)
+from service.connection_pool import (AsyncHTTPConnectionPool,
+                                     AsyncPooledConnection)
+from service.http_client import (STREAM_SEND_SLICE_SIZE, HTTPClientBase,
+                                 TransferCancelled, skip_request_head)
+from service.http_response_reader import HTTPResponseReader
+from service.http_trace import HTTPRequestTrace, HTTPTraceHooks
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient(HTTPClientBase):
+    """HTTP client on asyncio streams.
+
+    Mirrors `HttpClientSocket.handle_request` (redirects, cookies, chunked
+    and content codings come from the shared `HTTPClientBase`), so several
+    requests can run concurrently on one event loop without threads.
+    """
+
+    def __init__(self, pool_configurations: HTTPConnectionPoolConfigurations = None,
+                 trace_hooks: HTTPTraceHooks = None):
+        # keep-alive connections are pooled per server address
+        self.connection_pool = AsyncHTTPConnectionPool(pool_configurations)
+        self.socket_timeout = 5  # seconds
+        # phases of every request are reported here, None skips tracing altogether
+        self.trace_hooks = trace_hooks
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.connection_pool.close_all()
+
+    async def handle_request(self, layer_request_interface: HTTPLayerInterfaceRequest) -> HTTPLayerInterfaceResponse:
+        """Handle the HTTP request and return the response, including redirection handling."""
+        trace = None if self.trace_hooks is None else HTTPRequestTrace(self.trace_hooks, layer_request_interface)
+        try:
+            redirect_steps = self._redirect_steps(layer_request_interface, trace)
+            request = next(redirect_steps)
+            while True:
+                request = redirect_steps.send(await self.handle_single_request(request, trace))
+        except StopIteration as stop:
+            response = stop.value
+        except Exception as e:
+            logger.debug("Error handling request: %s", e)
+            response = HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Error handling request: " + str(e)
+            )
+        if trace is not None and not response.vaild_response:
+            trace.request_error(response.error_message)
+        return response
+
+    async def handle_single_request(self, layer_request_interface: HTTPLayerInterfaceRequest,
+                                    trace: HTTPRequestTrace = None) -> HTTPLayerInterfaceResponse:
+        """Handle a single HTTP request and return the response without performing redirection."""
+        # Encode the request
+        try:
+            transmission_interface = self._encode_layer_request(layer_request_interface)
+        except ValueError as e:
+            logger.debug("Error encoding request: %s", e)
+            return HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Error encoding request:" + str(e)
+            )
+
+        # Send the request
+        try:
+            response = await self._transmit_request(transmission_interface, trace)
+        except TransferCancelled as e:
+            return HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Transfer cancelled. " + str(e)
+            )
+        except TimeoutError as e:
+            logger.debug("Error sending request: %s", e)
+            return HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Error sending request: " + str(e)
+            )
+        except Exception as e:
+            logger.debug("Unexpected error: %s", e)
+            return HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Unexpected error: " + str(e)
+            )
+
+        # Decode the response
+        return self._decode_layer_response(response)
+
+    async def _send_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface,
+                            trace: HTTPRequestTrace = None) -> AsyncPooledConnection:
+        """Send the HTTP request on a pooled connection and return the connection."""
+        max_retries = transmission_interface.max_retries
+        server = transmission_interface.server
+        current_retry = 0
+        last_error = "Please check max_retries"
+        while current_retry < max_retries:
+            connection = None
+            # every attempt sends the head again, only the body after it is progress
+            transfer_callback = skip_request_head(transmission_interface.send_callback,
+                                                  transmission_interface.request_head_size)
+            if trace is not None:
+                transfer_callback = trace.wrap_send_callback(transfer_callback)
+            try:
+                connection = await self.connection_pool.acquire(server, self.socket_timeout)
+                if trace is not None:
+                    trace.connect()
+
+                # Send the encoded request
+                if transmission_interface.encoded_request_stream is not None:
+                    await self._send_request_stream(
+                        connection, transmission_interface.encoded_request_stream(), transfer_callback)
+                elif transfer_callback is not None:
+                    request_view = memoryview(transmission_interface.encoded_request)
+                    for offset in range(0, len(request_view), STREAM_SEND_SLICE_SIZE):
+                        request_slice = request_view[offset:offset + STREAM_SEND_SLICE_SIZE]
+                        connection.writer.write(request_slice)
+                        await connection.writer.drain()
+                        transfer_callback(len(request_slice))
+                else:
+                    connection.writer.write(transmission_interface.encoded_request)
+                    await connection.writer.drain()
+                return connection
+            except TransferCancelled:
+                # cancelled by the caller, do not retry
+                if connection:
+                    self.connection_pool.discard(server, connection)
+                raise
+            except Exception as e:
+                logger.debug("Error sending request: %s", e)
+                last_error = str(e)
+                current_retry += 1
+                if trace is not None and current_retry < max_retries:
+                    trace.retry(current_retry, last_error)
+                if connection:
+                    # socket policy: once failed, never hand the connection back to the pool
+                    self.connection_pool.discard(server, connection)
+            except BaseException:
+                # cancelled mid-request, the connection is in an unknown state
+                if connection:
+                    self.connection_pool.discard(server, connection)
+                raise
+
+        raise TimeoutError(f"Failed to send after {max_retries} retries, \n last error: {last_error}")
+
+    async def _send_request_stream(self, connection: AsyncPooledConnection, request_stream: Iterator[bytes | memoryview | HTTPFileSegment],
+                                   transfer_callback: Callable[[int], None] = None) -> None:
+        """Write a streamed request, letting the transport apply back pressure."""
+        writer = connection.writer
+        for item in request_stream:
+            if isinstance(item, HTTPFileSegment):
+                await writer.drain()
+                with open(item.file_path, "rb") as file:
+                    await self._send_file_segment(writer, file, item, transfer_callback)
+                continue
+            writer.write(item)
+            await writer.drain()
+            if transfer_callback is not None:
+                transfer_callback(len(item))
+
+    async def _send_file_segment(self, writer: asyncio.StreamWriter, file, segment: HTTPFileSegment,
+                                 transfer_callback: Callable[[int], None] = None) -> None:
+        """Send part of a file, in slices if the caller follows the progress."""
+        loop = asyncio.get_running_loop()
+        if transfer_callback is None:
+            # zero-copy where the transport allows it, read/write otherwise
+            await loop.sendfile(writer.transport, file, offset=segment.offset, count=segment.count)
+            return
+        offset = segment.offset
+        end = os.fstat(file.fileno()).st_size if segment.count is None else segment.offset + segment.count
+        while offset < end:
+            sent = await loop.sendfile(writer.transport, file, offset=offset, count=min(STREAM_SEND_SLICE_SIZE, end - offset))
+            if sent == 0:
+                raise ConnectionError("File ended before the announced length.")
+            offset += sent
+            transfer_callback(sent)
+
+    async def _read_response(self, connection: AsyncPooledConnection, reader: HTTPResponseReader,
+                             transfer_callback: Callable[[int], None] = None,
+                             body_callback: Callable[[int], None] = None) -> bytes:
+        """Receive until the response reader reports the response complete."""
+        while not reader.complete:
+            data = await connection.reader.read(reader.receive_buffer_size)
+            if not data:
+                reader.feed_eof()
+            else:
+                reader.feed(data)
+                if transfer_callback is not None:
+                    transfer_callback(len(data))
+            if body_callback is not None:
+                reader.report_body_progress(body_callback)
+        return reader.get_response_bytes()
+
+    async def _transmit_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface,
+                                trace: HTTPRequestTrace = None) -> HTTPLayerDecodingModuleInterface:
+        """Send the HTTP request and receive the response."""
+        server = transmission_interface.server
+        # the trace counts every received byte, the caller only the body
+        receive_callback = trace.wrap_receive_callback() if trace is not None else None
+        # one extra attempt for a pooled connection that the server closed while idle
+        attempts_left = 2
+        while True:
+            attempts_left -= 1
+
+            # send the request
+            connection = await self._send_request(transmission_interface, trace)
+
+            # receive the response, the reader knows where it ends
+            # stream reads cannot target the body buffer, each block is copied into it once
+            reader = HTTPResponseReader(request_method=transmission_interface.request_method,
+                                        body_buffer=transmission_interface.response_body_buffer,
+                                        body_sink=transmission_interface.response_body_sink,
+                                        decode_body=True,
+                                        partial_only=transmission_interface.partial_response_only)
+            try:
+                data = await asyncio.wait_for(
+                    self._read_response(connection, reader, receive_callback,
+                                        transmission_interface.receive_callback),
+                    transmission_interface.timeout)
+            except ConnectionResetError as e:
+                # a half-read connection can never be reused
+                self.connection_pool.discard(server, connection)
+                # only an idle connection the server closed before answering is safe to send on again:
+                # on a new one the server may have acted on the request, and received bytes cannot be taken back
+                if attempts_left > 0 and connection.reused and reader.nothing_received:
+                    if trace is not None:
+                        trace.retry(1, str(e))
+                    continue
+                raise
+            except asyncio.TimeoutError:
+                self.connection_pool.discard(server, connection)
+                raise TimeoutError("HTTP request reception timed out")
+            except BaseException:
+                self.connection_pool.discard(server, connection)
+                raise
+
+            reusable = transmission_interface.keep_alive and reader.reusable and not reader.leftover
+            self.connection_pool.release(server, connection, reusable)
+            if trace is not None:
+                trace.body_complete(reader.status_code)
+            return HTTPLayerDecodingModuleInterface(
+                response_raw_data=data,
+                body_buffer_size=reader.body_buffer_size if reader.body_in_buffer else None,
+                body_sink_size=reader.body_sink_size if reader.body_in_sink else None,
+                decoded_body=reader.decoded_body,
+            )
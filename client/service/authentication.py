@@ -1,3 +1,4 @@
+import inspect
 from dataclasses import replace
 
 from domain.authentication_model import AuthResult, Credentials, Session
@@ -5,6 +6,7 @@ from domain.http_model import (HTTPLayerInterfaceRequest,
                                HTTPLayerInterfaceResponse, HTTPPayloadType,
                                HTTPResponse, HTTPServerAddress)
 from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE, Setting
+from service.async_http_client import AsyncHttpClient
 from service.http_client import (HttpClientSocket,
                                  handle_common_http_error)
 
@@ -29,7 +31,7 @@ def encode_auth_form(credentials: Credentials) -> tuple[bytes, int]:
 class AuthService:
     """Service for authentication operations."""
     
-    def __init__(self, http_client: HttpClientSocket, session_token: str = None):
+    def __init__(self, http_client: HttpClientSocket | AsyncHttpClient, session_token: str = None):
         self.http_client = http_client
         self.session_token = session_token
 
@@ -55,6 +57,9 @@ class AuthService:
             auth_request.maintain_session_during_redirects = True
             
             response = self.http_client.handle_request(auth_request)
+            if inspect.isawaitable(response):
+                # AsyncHttpClient, login does not block the event loop
+                response = await response
             
             # Check response status
             if response.vaild_response:
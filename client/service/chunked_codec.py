@@ -0,0 +1,188 @@
+from enum import Enum
+
+
+# upper bound of a chunk size line or trailer line, protects against unframed garbage
+MAX_CHUNK_LINE_LENGTH = 65536
+
+
+def parse_chunk_extensions(extension_field: str) -> dict[str, str]:
+    """Parse chunk extensions such as `;name=value;flag` into a dict."""
+    extensions = {}
+    for extension in extension_field.split(';'):
+        if not extension.strip():
+            continue
+        name, _, value = extension.partition('=')
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        extensions[name.strip()] = value if value else None
+    return extensions
+
+
+def format_chunk_extensions(chunk_extensions: dict[str, str]) -> str:
+    """Format chunk extensions for a chunk size line."""
+    if not chunk_extensions:
+        return ""
+    return "".join(f";{name}" if value is None else f";{name}={value}"
+                   for name, value in chunk_extensions.items())
+
+
+class ChunkedEncoder:
+    """Chunked transfer encoder that frames data without copying it.
+
+    `encode` returns the framing and memoryview slices of the input as a list
+    of buffers, so the caller can join them once or hand them to sendmsg.
+    """
+
+    def __init__(self, max_chunk_size: int = 1024, chunk_extensions: dict[str, str] = None):
+        if max_chunk_size <= 0:
+            raise ValueError("Chunk size must be greater than 0")
+        self.max_chunk_size = max_chunk_size
+        self._extension_field = format_chunk_extensions(chunk_extensions)
+        self._full_chunk_header = f"{max_chunk_size:x}{self._extension_field}\r\n".encode()
+
+    def encode(self, data: bytes) -> list[bytes | memoryview]:
+        """Frame data as one or more chunks."""
+        view = memoryview(data)
+        buffers = []
+        for offset in range(0, len(view), self.max_chunk_size):
+            chunk = view[offset:offset + self.max_chunk_size]
+            if len(chunk) == self.max_chunk_size:
+                buffers.append(self._full_chunk_header)
+            else:
+                buffers.append(f"{len(chunk):x}{self._extension_field}\r\n".encode())
+            buffers.append(chunk)
+            buffers.append(b"\r\n")
+        return buffers
+
+    def finish(self, trailers: dict[str, str] = None) -> bytes:
+        """Return the last chunk, the trailers and the final empty line."""
+        trailer_lines = "".join(f"{key}: {value}\r\n" for key, value in (trailers or {}).items())
+        return f"0\r\n{trailer_lines}\r\n".encode()
+
+
+class ChunkedDecoderState(Enum):
+    """States of the chunked decoder."""
+    CHUNK_SIZE = 1
+    CHUNK_DATA = 2
+    CHUNK_DATA_END = 3
+    TRAILERS = 4
+    DONE = 5
+
+
+class ChunkedDecoder:
+    """Incremental chunked transfer decoder.
+
+    Can be fed arbitrary slices of the chunked body, i.e. straight from
+    `recv`. Chunk extensions and trailers are parsed and kept; bytes after
+    the end of the body are kept in `unconsumed`.
+    """
+
+    def __init__(self):
+        self.state = ChunkedDecoderState.CHUNK_SIZE
+        self.chunk_extensions: list[dict[str, str]] = []
+        self.trailers: dict[str, str] = {}
+        self.unconsumed = b''
+        self._chunk_remaining = 0
+        self._pending_line = bytearray()
+
+    @property
+    def complete(self) -> bool:
+        return self.state == ChunkedDecoderState.DONE
+
+    def feed(self, data: bytes) -> bytes:
+        """Decode the next slice of the body and return the payload bytes it contained."""
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        if self.complete:
+            self.unconsumed += data
+            return b''
+
+        view = memoryview(data)
+        decoded_parts = []
+        offset = 0
+        data_length = len(data)
+        while offset < data_length and not self.complete:
+            if self.state == ChunkedDecoderState.CHUNK_DATA:
+                take = min(self._chunk_remaining, data_length - offset)
+                decoded_parts.append(view[offset:offset + take])
+                offset += take
+                self._chunk_remaining -= take
+                if self._chunk_remaining == 0:
+                    self.state = ChunkedDecoderState.CHUNK_DATA_END
+                continue
+
+            line, offset = self._read_line(data, offset)
+            if line is None:
+                break
+            self._handle_line(line)
+
+        if self.complete and offset < data_length:
+            self.unconsumed += data[offset:]
+        return b''.join(decoded_parts)
+
+    def _read_line(self, data: bytes, offset: int) -> tuple[bytes, int]:
+        """Read a CRLF terminated line, buffering it if it is split across slices."""
+        line_end = data.find(b'\n', offset)
+        if line_end == -1:
+            self._pending_line += data[offset:]
+            if len(self._pending_line) > MAX_CHUNK_LINE_LENGTH:
+                raise ValueError("Invalid chunked data: line too long")
+            return None, len(data)
+
+        if self._pending_line:
+            self._pending_line += data[offset:line_end]
+            line = bytes(self._pending_line)
+            self._pending_line.clear()
+        else:
+            line = data[offset:line_end]
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        return line, line_end + 1
+
+    def _handle_line(self, line: bytes) -> None:
+        """Advance the state machine by one complete line."""
+        match self.state:
+            case ChunkedDecoderState.CHUNK_SIZE:
+                size_field, _, extension_field = line.partition(b';')
+                try:
+                    chunk_size = int(size_field, 16)
+                except ValueError:
+                    raise ValueError(f"Invalid chunked data: bad chunk size {size_field!r}")
+                if extension_field:
+                    self.chunk_extensions.append(parse_chunk_extensions(extension_field.decode('latin-1')))
+                if chunk_size == 0:
+                    self.state = ChunkedDecoderState.TRAILERS
+                else:
+                    self._chunk_remaining = chunk_size
+                    self.state = ChunkedDecoderState.CHUNK_DATA
+            case ChunkedDecoderState.CHUNK_DATA_END:
+                if line:
+                    raise ValueError("Invalid chunked data: missing chunk data end")
+                self.state = ChunkedDecoderState.CHUNK_SIZE
+            case ChunkedDecoderState.TRAILERS:
+                if not line:
+                    self.state = ChunkedDecoderState.DONE
+                    return
+                key, _, value = line.decode('latin-1').partition(':')
+                self.trailers[key.strip()] = value.strip()
+
+
+def encode_chunked(data: bytes, max_chunk_size: int = 1024, chunk_extensions: dict[str, str] = None,
+                   trailers: dict[str, str] = None) -> bytes:
+    """Apply chunked transfer encoding to a complete body."""
+    if len(data) == 0:
+        raise ValueError("Data length must be greater than 0")
+    encoder = ChunkedEncoder(max_chunk_size, chunk_extensions)
+    buffers = encoder.encode(data)
+    buffers.append(encoder.finish(trailers))
+    return b''.join(buffers)
+
+
+def decode_chunked(data: bytes) -> bytes:
+    """Decode a complete chunked body."""
+    decoder = ChunkedDecoder()
+    decoded = decoder.feed(data)
+    if not decoder.complete:
+        raise ValueError("Invalid chunked data: missing last chunk")
+    return decoded
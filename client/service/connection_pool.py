@@ -0,0 +1,250 @@
+import asyncio
+import select
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+
+from domain.http_model import (HTTPConnectionPoolConfigurations,
+                               HTTPConnectionPoolStatistics,
+                               HTTPServerAddress)
+
+
+@dataclass
+class PooledConnection:
+    """An idle socket kept in the pool, with the time it was returned."""
+    sock: socket.socket
+    idle_since: float
+
+
+def is_connection_alive(sock: socket.socket) -> bool:
+    """Probe an idle connection without blocking.
+
+    An idle keep-alive socket should have nothing to read. If it is readable,
+    the peer either closed it (recv returns b'') or sent unexpected data, and
+    in both cases the connection must not be reused.
+    """
+    try:
+        if sock.fileno() == -1:
+            return False
+        readable, _, errored = select.select([sock], [], [sock], 0)
+        if errored:
+            return False
+        if not readable:
+            return True
+        sock.setblocking(False)
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            # spurious wakeup, nothing to read after all
+            return True
+        return False
+    except (OSError, ValueError):
+        return False
+
+
+class HTTPConnectionPool:
+    """Keep-alive connection pool keyed by server address.
+
+    Connections are checked out with `acquire` and handed back with `release`.
+    Each server address has its own limit on open connections (idle + in use),
+    so several hosts can be kept warm at the same time.
+    """
+
+    def __init__(self, configurations: HTTPConnectionPoolConfigurations = None):
+        self.configurations = configurations or HTTPConnectionPoolConfigurations()
+        self.statistics = HTTPConnectionPoolStatistics()
+        self._idle_connections: dict[HTTPServerAddress, deque[PooledConnection]] = {}
+        self._open_counts: dict[HTTPServerAddress, int] = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, server: HTTPServerAddress, socket_timeout: float) -> socket.socket:
+        """Check out a live connection to the server, reusing an idle one if possible."""
+        return self.checkout(server, socket_timeout)[0]
+
+    def checkout(self, server: HTTPServerAddress, socket_timeout: float) -> tuple[socket.socket, bool]:
+        """Like `acquire`, also telling whether the connection is an idle one that was reused."""
+        deadline = time.monotonic() + self.configurations.acquire_timeout
+        with self._condition:
+            while True:
+                sock = self._pop_idle_connection(server)
+                if sock is not None:
+                    self.statistics.hits += 1
+                    sock.settimeout(socket_timeout)
+                    return sock, True
+
+                if self._open_counts.get(server, 0) < self.configurations.max_connections_per_host:
+                    # reserve a slot, then connect outside the lock
+                    self._open_counts[server] = self._open_counts.get(server, 0) + 1
+                    self.statistics.misses += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free connection to {server.host_ip}:{server.port} "
+                                       f"after {self.configurations.acquire_timeout} seconds")
+                self._condition.wait(remaining)
+
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # requests may go out in several writes, do not let Nagle delay the last one
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(socket_timeout)
+            sock.connect((server.host_ip, server.port))
+            return sock, False
+        except Exception:
+            if sock is not None:
+                sock.close()
+            self._forget_connection(server)
+            raise
+
+    def release(self, server: HTTPServerAddress, sock: socket.socket, reusable: bool) -> None:
+        """Return a checked out connection. Non-reusable connections are closed."""
+        if not reusable:
+            self.discard(server, sock)
+            return
+        with self._condition:
+            self._idle_connections.setdefault(server, deque()).append(
+                PooledConnection(sock=sock, idle_since=time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, server: HTTPServerAddress, sock: socket.socket) -> None:
+        """Close a checked out connection and free its slot."""
+        try:
+            sock.close()
+        finally:
+            self._forget_connection(server)
+
+    def close_all(self) -> None:
+        """Close every idle connection in the pool."""
+        with self._condition:
+            for server, idle_connections in self._idle_connections.items():
+                while idle_connections:
+                    idle_connections.pop().sock.close()
+                    self._open_counts[server] -= 1
+            self._condition.notify_all()
+
+    def get_statistics(self) -> HTTPConnectionPoolStatistics:
+        """Return a snapshot of the pool counters."""
+        with self._condition:
+            return replace(self.statistics)
+
+    def _pop_idle_connection(self, server: HTTPServerAddress) -> socket.socket:
+        """Pop the most recently used live idle connection, closing dead ones. Caller holds the lock."""
+        idle_connections = self._idle_connections.get(server)
+        now = time.monotonic()
+        while idle_connections:
+            # LIFO: the most recently returned socket is the least likely to be timed out by the server
+            pooled = idle_connections.pop()
+            if now - pooled.idle_since > self.configurations.idle_timeout:
+                self.statistics.idle_expired += 1
+            elif is_connection_alive(pooled.sock):
+                return pooled.sock
+            else:
+                self.statistics.stale_discarded += 1
+            pooled.sock.close()
+            self._open_counts[server] -= 1
+        return None
+
+    def _forget_connection(self, server: HTTPServerAddress) -> None:
+        """Free the slot of a connection that is gone."""
+        with self._condition:
+            self._open_counts[server] = max(0, self._open_counts.get(server, 0) - 1)
+            self._condition.notify()
+
+
+@dataclass
+class AsyncPooledConnection:
+    """An asyncio stream pair kept in the pool, with the time it was returned."""
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    idle_since: float = 0
+    # checked out of the idle connections rather than newly opened
+    reused: bool = False
+
+
+class AsyncHTTPConnectionPool:
+    """Keep-alive pool of asyncio stream connections, keyed by server address.
+
+    Same policy as `HTTPConnectionPool`, but the per-host limit is an
+    `asyncio.Semaphore` so waiting for a slot never blocks the event loop.
+    The pool must only be used from one event loop.
+    """
+
+    def __init__(self, configurations: HTTPConnectionPoolConfigurations = None):
+        self.configurations = configurations or HTTPConnectionPoolConfigurations()
+        self.statistics = HTTPConnectionPoolStatistics()
+        self._idle_connections: dict[HTTPServerAddress, deque[AsyncPooledConnection]] = {}
+        self._slots: dict[HTTPServerAddress, asyncio.Semaphore] = {}
+
+    async def acquire(self, server: HTTPServerAddress, connect_timeout: float) -> AsyncPooledConnection:
+        """Check out a live connection to the server, reusing an idle one if possible."""
+        slots = self._slots.setdefault(server, asyncio.Semaphore(self.configurations.max_connections_per_host))
+        try:
+            await asyncio.wait_for(slots.acquire(), self.configurations.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No free connection to {server.host_ip}:{server.port} "
+                               f"after {self.configurations.acquire_timeout} seconds")
+
+        connection = self._pop_idle_connection(server)
+        if connection is not None:
+            self.statistics.hits += 1
+            return connection
+
+        self.statistics.misses += 1
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(server.host_ip, server.port), connect_timeout)
+        except BaseException:
+            slots.release()
+            raise
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            # requests may go out in several writes, do not let Nagle delay the last one
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return AsyncPooledConnection(reader=reader, writer=writer)
+
+    def release(self, server: HTTPServerAddress, connection: AsyncPooledConnection, reusable: bool) -> None:
+        """Return a checked out connection. Non-reusable connections are closed."""
+        if not reusable:
+            self.discard(server, connection)
+            return
+        connection.idle_since = time.monotonic()
+        self._idle_connections.setdefault(server, deque()).append(connection)
+        self._slots[server].release()
+
+    def discard(self, server: HTTPServerAddress, connection: AsyncPooledConnection) -> None:
+        """Close a checked out connection and free its slot."""
+        try:
+            connection.writer.close()
+        finally:
+            self._slots[server].release()
+
+    def close_all(self) -> None:
+        """Close every idle connection in the pool."""
+        for idle_connections in self._idle_connections.values():
+            while idle_connections:
+                idle_connections.pop().writer.close()
+
+    def get_statistics(self) -> HTTPConnectionPoolStatistics:
+        """Return a snapshot of the pool counters."""
+        return replace(self.statistics)
+
+    def _pop_idle_connection(self, server: HTTPServerAddress) -> AsyncPooledConnection:
+        """Pop the most recently used live idle connection, closing dead ones."""
+        idle_connections = self._idle_connections.get(server)
+        now = time.monotonic()
+        while idle_connections:
+            pooled = idle_connections.pop()
+            if now - pooled.idle_since > self.configurations.idle_timeout:
+                self.statistics.idle_expired += 1
+            elif not pooled.writer.is_closing() and not pooled.reader.at_eof():
+                pooled.reused = True
+                return pooled
+            else:
+                # the server closed it while idle
+                self.statistics.stale_discarded += 1
+            pooled.writer.close()
+        return None
@@ -0,0 +1,223 @@
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Protocol
+
+# optional codecs, registered only when their package is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# compressed bodies are decoded in slices of this size, so one slice of output is produced at a time
+DECODE_SLICE_SIZE = 1024 * 1024
+
+
+class ContentCompressor(Protocol):
+    """Incremental compressor, the interface of zlib.compressobj."""
+
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class ContentDecompressor(Protocol):
+    """Incremental decompressor, the interface of zlib.decompressobj."""
+
+    def decompress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+@dataclass(frozen=True)
+class ContentCodec:
+    """A content coding (RFC 9110, section 8.4.1) and the factories of its stream objects."""
+    name: str
+    default_level: int
+    level_range: tuple[int, int]
+    make_compressor: Callable[[int], ContentCompressor]
+    make_decompressor: Callable[[], ContentDecompressor]
+
+    def compressor(self, level: int = None) -> ContentCompressor:
+        """A fresh compressor at `level`, the codec default if None."""
+        if level is None:
+            level = self.default_level
+        lowest, highest = self.level_range
+        if not lowest <= level <= highest:
+            raise ValueError(f"Compression level {level} out of range {lowest}..{highest} for {self.name}")
+        return self.make_compressor(level)
+
+    def decompressor(self) -> ContentDecompressor:
+        return self.make_decompressor()
+
+
+class BrotliCompressor:
+    """Adapt brotli.Compressor to the zlib compressobj interface."""
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class BrotliDecompressor:
+    """Adapt brotli.Decompressor to the zlib decompressobj interface."""
+
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        if not self._decompressor.is_finished():
+            raise ValueError("Truncated brotli stream")
+        return b""
+
+
+# files stored in these formats do not shrink when compressed again
+COMPRESSED_FILE_EXTENSIONS = frozenset({
+    ".gz", ".tgz", ".zip", ".bz2", ".xz", ".zst", ".7z", ".rar", ".br",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".heic",
+    ".mp3", ".mp4", ".m4a", ".mkv", ".mov", ".webm", ".ogg", ".flac",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".jar", ".whl", ".apk",
+})
+
+
+# content codings by their token, i.e. the value of a Content-Encoding header
+CONTENT_CODEC_REGISTRY: dict[str, ContentCodec] = {}
+
+
+def register_content_codec(codec: ContentCodec) -> None:
+    """Make a content coding available to request encoding and response decoding."""
+    CONTENT_CODEC_REGISTRY[codec.name] = codec
+
+
+def get_content_codec(name: str) -> ContentCodec:
+    """Look up a registered content coding, raising ValueError for unknown or uninstalled ones."""
+    codec = CONTENT_CODEC_REGISTRY.get(name.strip().lower())
+    if codec is None:
+        raise ValueError(f"Unsupported content encoding: {name}")
+    return codec
+
+
+def parse_content_encoding(content_encoding: str) -> list[str]:
+    """Codings of a Content-Encoding header in the order they were applied, without identity."""
+    return [
+        coding.strip().lower()
+        for coding in content_encoding.split(",")
+        if coding.strip() and coding.strip().lower() != "identity"
+    ]
+
+
+def is_compressed_file_name(file_name: str) -> bool:
+    """Whether a file name has the extension of a compressed format."""
+    return os.path.splitext(file_name)[1].lower() in COMPRESSED_FILE_EXTENSIONS
+
+
+def compress_content(data: bytes, content_encoding: str, level: int = None) -> bytes:
+    """Compress a whole body with one coding."""
+    compressor = get_content_codec(content_encoding).compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed_content(blocks: Iterable[bytes], content_encoding: str, level: int = None) -> Iterator[bytes]:
+    """Compress a stream of blocks, skipping the empty outputs of a buffering compressor."""
+    compressor = get_content_codec(content_encoding).compressor(level)
+    for block in blocks:
+        compressed_block = compressor.compress(block)
+        if compressed_block:
+            yield compressed_block
+    yield compressor.flush()
+
+
+class ContentDecoder:
+    """Incremental decoder undoing every coding of a Content-Encoding header.
+
+    The codings are undone in the reverse order of the header, each piece
+    flows through all decompressors before the next one is fed.
+    """
+
+    def __init__(self, content_encoding: str):
+        self._decompressor_list = [
+            get_content_codec(coding).decompressor()
+            for coding in reversed(parse_content_encoding(content_encoding))
+        ]
+
+    def decode(self, data: bytes) -> bytes:
+        """Decode the next piece of the body and return the output it produced."""
+        for decompressor in self._decompressor_list:
+            data = decompressor.decompress(data)
+        return data
+
+    def finish(self) -> bytes:
+        """Flush the decompressors at the end of the body. Raises ValueError if it was cut off."""
+        # each decompressor's remaining output still passes through the ones after it
+        tail = b""
+        for decompressor in self._decompressor_list:
+            tail = decompressor.decompress(tail) + decompressor.flush()
+            # zlib does not complain about a cut off stream by itself
+            if getattr(decompressor, "eof", True) is False:
+                raise ValueError("Compressed body ended before the end of its stream")
+        return tail
+
+
+def iter_decompressed_content(blocks: Iterable[bytes], content_encoding: str) -> Iterator[bytes]:
+    """Undo every coding of a Content-Encoding header over a stream of blocks."""
+    content_decoder = ContentDecoder(content_encoding)
+    for block in blocks:
+        block = content_decoder.decode(block)
+        if block:
+            yield block
+    tail = content_decoder.finish()
+    if tail:
+        yield tail
+
+
+def decompress_content(body: bytes | memoryview, content_encoding: str) -> bytes:
+    """Decode a whole body, reading it in slices instead of copying it first."""
+    view = memoryview(body)
+    slices = (view[offset:offset + DECODE_SLICE_SIZE] for offset in range(0, len(view), DECODE_SLICE_SIZE))
+    return b"".join(iter_decompressed_content(slices, content_encoding))
+
+
+register_content_codec(ContentCodec(
+    name="gzip",
+    default_level=6,
+    level_range=(0, 9),
+    # wbits 16 + MAX_WBITS selects the gzip container
+    make_compressor=lambda level: zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+    make_decompressor=lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+))
+register_content_codec(ContentCodec(
+    name="deflate",
+    default_level=6,
+    level_range=(0, 9),
+    # HTTP "deflate" is the zlib format (RFC 1950), not a raw deflate stream
+    make_compressor=lambda level: zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS),
+    make_decompressor=lambda: zlib.decompressobj(zlib.MAX_WBITS),
+))
+if zstandard is not None:
+    register_content_codec(ContentCodec(
+        name="zstd",
+        default_level=3,
+        level_range=(1, 22),
+        make_compressor=lambda level: zstandard.ZstdCompressor(level=level).compressobj(),
+        make_decompressor=lambda: zstandard.ZstdDecompressor().decompressobj(),
+    ))
+if brotli is not None:
+    register_content_codec(ContentCodec(
+        name="br",
+        default_level=4,
+        level_range=(0, 11),
+        make_compressor=BrotliCompressor,
+        make_decompressor=BrotliDecompressor,
+    ))
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+# the cache lives in the directory it describes, i.e. "./local_files/.hash_cache.sqlite3"
+HASH_CACHE_FILE_NAME = ".hash_cache.sqlite3"
+
+
+@dataclass
+class FileHashCacheEntry:
+    """Cached digest of a file, valid as long as the stat key still matches."""
+    file_size: int
+    mtime_ns: int
+    inode: int
+    file_hash: str
+
+
+class FileHashCache:
+    """Persistent MD5 cache of local files with an LRU in memory in front of it.
+
+    Entries are keyed by absolute path and validated with (size, mtime_ns, inode),
+    so checking an unchanged file costs one stat and no content reads. The
+    on-disk part is a small SQLite database that is opened on first use. A
+    corrupt or unreadable database is replaced, the cache only ever loses
+    entries, never returns wrong ones. Without a `cache_path` only the
+    in-memory part is kept.
+    """
+
+    def __init__(self, cache_path: Optional[str], memory_capacity: int = 4096):
+        self.cache_path = cache_path
+        self.memory_capacity = memory_capacity
+        self._memory_entries: OrderedDict[str, FileHashCacheEntry] = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str, stat_result: os.stat_result) -> Optional[str]:
+        """Return the cached MD5 of a file, or None if unknown or stale."""
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            entry = self._memory_entries.get(file_path)
+            if entry is None:
+                entry = self._load_entry(file_path)
+                if entry is None:
+                    return None
+                self._remember(file_path, entry)
+            else:
+                self._memory_entries.move_to_end(file_path)
+            if not self._matches(entry, stat_result):
+                return None
+            return entry.file_hash
+
+    def put(self, file_path: str, stat_result: os.stat_result, file_hash: str) -> None:
+        """Record the MD5 of a file as of the given stat."""
+        file_path = os.path.abspath(file_path)
+        entry = FileHashCacheEntry(
+            file_size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+            inode=stat_result.st_ino,
+            file_hash=file_hash,
+        )
+        with self._lock:
+            self._remember(file_path, entry)
+            self._execute(
+                "INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?)",
+                (file_path, entry.file_size, entry.mtime_ns, entry.inode, entry.file_hash),
+            )
+
+    def move(self, source_path: str, file_path: str) -> None:
+        """Follow a rename. The stat key survives it, so the entry stays valid."""
+        source_path = os.path.abspath(source_path)
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            entry = self._memory_entries.pop(source_path, None) or self._load_entry(source_path)
+            self._memory_entries.pop(file_path, None)
+            self._execute("DELETE FROM file_hash WHERE path IN (?, ?)", (source_path, file_path))
+            if entry is None:
+                return
+            self._remember(file_path, entry)
+            self._execute(
+                "INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?)",
+                (file_path, entry.file_size, entry.mtime_ns, entry.inode, entry.file_hash),
+            )
+
+    def invalidate(self, file_path: str) -> None:
+        """Forget a file, i.e. because it is about to be rewritten."""
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            self._memory_entries.pop(file_path, None)
+            self._execute("DELETE FROM file_hash WHERE path = ?", (file_path,))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _matches(self, entry: FileHashCacheEntry, stat_result: os.stat_result) -> bool:
+        return (entry.file_size == stat_result.st_size
+                and entry.mtime_ns == stat_result.st_mtime_ns
+                and entry.inode == stat_result.st_ino)
+
+    def _remember(self, file_path: str, entry: FileHashCacheEntry) -> None:
+        """Put an entry in the in-memory LRU. Caller holds the lock."""
+        self._memory_entries[file_path] = entry
+        self._memory_entries.move_to_end(file_path)
+        while len(self._memory_entries) > self.memory_capacity:
+            self._memory_entries.popitem(last=False)
+
+    def _load_entry(self, file_path: str) -> Optional[FileHashCacheEntry]:
+        """Read an entry from the database. Caller holds the lock."""
+        rows = self._execute(
+            "SELECT file_size, mtime_ns, inode, file_hash FROM file_hash WHERE path = ?",
+            (file_path,),
+        )
+        if not rows:
+            return None
+        return FileHashCacheEntry(*rows[0])
+
+    def _execute(self, statement: str, parameters: tuple) -> list[tuple]:
+        """Run a statement on the database, starting over if it is corrupt. Caller holds the lock.
+
+        A database that cannot be used, i.e. locked or not writable, degrades
+        the cache to its in-memory part instead of failing the caller.
+        """
+        if self.cache_path is None:
+            return []
+        for _ in range(2):
+            try:
+                connection = self._get_connection()
+                with connection:
+                    return connection.execute(statement, parameters).fetchall()
+            except (OSError, sqlite3.OperationalError):
+                return []
+            except sqlite3.DatabaseError:
+                self._reset_database()
+        return []
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(cache_dir, exist_ok=True)
+            # the hashing thread pools share one connection, serialized by the lock
+            connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+            # a cache may lose its last writes on power loss, but must not wait on fsync per file
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS file_hash ("
+                "path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, inode INTEGER, file_hash TEXT)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _reset_database(self) -> None:
+        """Drop a corrupt database file. Caller holds the lock."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.cache_path + suffix)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,128 @@
+import codecs
+import mmap
+import os
+import threading
+from array import array
+
+# lines are indexed in steps of this many bytes, so readers see the index grow while it is built
+LINE_INDEX_STEP_SIZE = 4 * 1024 * 1024
+
+
+def decode_utf8_prefix(data: bytes) -> str:
+    """Decode bytes that may end inside a UTF-8 character, i.e. the first N KB of a file."""
+    return codecs.getincrementaldecoder("utf-8")(errors="replace").decode(data, final=False)
+
+
+class MappedTextFile:
+    """Read-only view of a local text file for paging through it.
+
+    The file is memory-mapped instead of read, so only the pages being
+    viewed are brought into memory. Line start offsets are indexed on a
+    background thread; windows of lines can be read while the index is still
+    growing. Line breaks never fall inside a UTF-8 character, so windows cut
+    at line boundaries decode on their own.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        self.file_size = os.fstat(self._file.fileno()).st_size
+        # an empty file cannot be mapped
+        self._data: mmap.mmap | bytes = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.file_size else b""
+        )
+        # byte offset of the start of each line, the first line starts at 0
+        self._line_offsets = array("Q", [0])
+        self._indexed_size = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._index_thread = threading.Thread(target=self._build_line_index, daemon=True)
+        self._index_thread.start()
+
+    @property
+    def indexing_complete(self) -> bool:
+        return self._indexed_size >= self.file_size
+
+    @property
+    def line_count(self) -> int:
+        """Lines indexed so far, the final count once indexing is complete."""
+        with self._lock:
+            line_count = len(self._line_offsets)
+            if self.indexing_complete and line_count > 1 and self._line_offsets[-1] == self.file_size:
+                # a trailing newline does not start another line
+                line_count -= 1
+            return line_count
+
+    def wait_for_index(self, timeout: float = None) -> bool:
+        """Wait until all lines are indexed. Returns whether they are."""
+        self._index_thread.join(timeout)
+        return self.indexing_complete
+
+    def read_lines(self, first_line: int, line_count: int) -> list[str]:
+        """Return lines first_line..first_line + line_count - 1 that are indexed so far."""
+        with self._lock:
+            offset_count = len(self._line_offsets)
+            if first_line >= offset_count:
+                return []
+            start = self._line_offsets[first_line]
+            last_line = first_line + line_count
+            if last_line < offset_count:
+                end = self._line_offsets[last_line]
+            elif self.indexing_complete:
+                end = self.file_size
+            else:
+                # the last indexed line may still be growing, stop before it
+                last_line = offset_count - 1
+                end = self._line_offsets[last_line]
+                if last_line <= first_line:
+                    return []
+        text = self._data[start:end].decode("utf-8", errors="replace")
+        if not text:
+            # past the last line, or an empty file
+            return []
+        # split on the same line breaks as the index, a final "\n" ends the last line
+        lines = text.split("\n")
+        if text.endswith("\n"):
+            lines.pop()
+        return [line.removesuffix("\r") for line in lines]
+
+    def read_window(self, offset: int, size: int) -> str:
+        """Decode `size` bytes from `offset`, moved to the next character boundary.
+
+        For views of a file before its lines are indexed.
+        """
+        offset = max(0, min(offset, self.file_size))
+        # skip UTF-8 continuation bytes, at most 3 belong to a cut character
+        for _ in range(3):
+            if offset < self.file_size and self._data[offset] & 0xC0 == 0x80:
+                offset += 1
+        return decode_utf8_prefix(self._data[offset:offset + size])
+
+    def close(self) -> None:
+        self._closed.set()
+        self._index_thread.join()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def _build_line_index(self) -> None:
+        """Index line starts step by step. Runs on the index thread."""
+        data = self._data
+        position = 0
+        while position < self.file_size and not self._closed.is_set():
+            step_end = min(position + LINE_INDEX_STEP_SIZE, self.file_size)
+            step_offsets = array("Q")
+            newline = data.find(b"\n", position, step_end)
+            while newline != -1:
+                step_offsets.append(newline + 1)
+                newline = data.find(b"\n", newline + 1, step_end)
+            with self._lock:
+                self._line_offsets.extend(step_offsets)
+                self._indexed_size = step_end
+            position = step_end
+
+    def __enter__(self) -> "MappedTextFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
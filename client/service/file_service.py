@@ -6,12 +6,23 @@ from domain.file_model import (
     FileServerRequestType,
     FileServerResponseAPI,
     FetchServerFileInterface,
+    FetchServerFileChangesInterface,
+    FetchServerFilePageInterface,
+    ServerFileListDelta,
     FileDownloadInterface,
     FileUploadInterface,
     FileDownloadResult,
     FileUploadResult,
+    FileTransferProgress,
+    FilePreviewInterface,
+    FilePreviewResult,
+    LocalFileValidator,
+    RemoteFileStat,
+    FileStatInterface,
+    FileStatResult,
+    TransferDirection,
 )
-from domain.setting_model import Setting, DEFAULT_HTTP_REQUEST_TEMPLATE
+from domain.setting_model import Setting, DEFAULT_HTTP_REQUEST_TEMPLATE, FileTransferMode
 from domain.http_model import (
     HTTPLayerInterfaceRequest,
     HTTPResponse,
@@ -19,14 +30,34 @@ from domain.http_model import (
     HTTPServerAddress,
     HTTPLayerInterfaceResponse,
 )
-from service.http_client import HttpClientSocket, handle_common_http_error
+from service.http_client import HttpClientSocket, TransferCancelled, handle_common_http_error, parse_content_range
+from service.file_hash_cache import FileHashCache, HASH_CACHE_FILE_NAME
+from service.content_codec import is_compressed_file_name
+from service.response_body_pipeline import FileBodySink
 import dataclasses
+import errno
 import json
+import mmap
 import os
 import sys
+import binascii
 import hashlib
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import replace
 import base64
+from typing import Callable, Optional
+
+# hashes of up to this many files to download are looked up per file, which
+# goes in one pipelined round trip; more than that, one list request is cheaper
+METADATA_LOOKUP_MAX_FILES = 32
+# suffix of a download in progress, kept on failure so the next attempt resumes
+PART_FILE_SUFFIX = ".part"
+# memory a JSON upload holds per file byte: the base64 payload and the request bytes built from it
+JSON_UPLOAD_MEMORY_FACTOR = 3
+# local files are read in blocks of this size, a multiple of 3 so base64 needs no carry between blocks
+INGEST_BLOCK_SIZE = 3 * 256 * 1024
 
 
 def encode_file_api_to_json(api_request: FileServerRequestAPI) -> tuple[bytes, int]:
@@ -43,11 +74,118 @@ def encode_file_api_to_json(api_request: FileServerRequestAPI) -> tuple[bytes, i
         raise ValueError(f"Error encoding file API request: {str(e)}")
 
 
+class RangeIgnored(RuntimeError):
+    """A range request was answered with the whole file, the server does not honor ranges (any more)."""
+
+
+class ByteBudget:
+    """Blocking byte budget that bounds the memory held by concurrent transfers."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._available = capacity
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        """Reserve bytes, waiting until enough are free. Returns the reserved size."""
+        # a single request larger than the whole budget runs alone
+        size = min(size, self.capacity)
+        with self._condition:
+            self._condition.wait_for(lambda: self._available >= size)
+            self._available -= size
+        return size
+
+    def release(self, size: int) -> None:
+        """Give reserved bytes back."""
+        with self._condition:
+            self._available += size
+            self._condition.notify_all()
+
+
+class TransferMeter:
+    """Byte counter of a transfer batch, fed by the transport from transfer threads.
+
+    Only the body in the batch's direction is counted, the sent request body
+    of an upload or the received response body of a download, so the count
+    ends at the total. It is also where a batch is cancelled: once the cancel
+    event is set, the next check or transport callback raises TransferCancelled.
+    """
+
+    def __init__(
+        self,
+        byte_progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        total_bytes: Optional[int] = None,
+        direction: TransferDirection = TransferDirection.DOWNLOAD,
+    ):
+        self.byte_progress_callback = byte_progress_callback
+        self.cancel_event = cancel_event
+        self.total_bytes = total_bytes
+        self.direction = direction
+        self.transferred_bytes = 0
+        self._lock = threading.Lock()
+
+    def add_total(self, size: int) -> None:
+        """Grow the expected total, i.e. once a download learns the size of its file."""
+        with self._lock:
+            self.total_bytes = (self.total_bytes or 0) + size
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise TransferCancelled("Transfer cancelled by user.")
+
+    def on_bytes(self, size: int) -> None:
+        """Transport callback, called with each body block sent or received."""
+        self.check_cancelled()
+        with self._lock:
+            self.transferred_bytes += size
+            transferred_bytes, total_bytes = self.transferred_bytes, self.total_bytes
+        if self.byte_progress_callback is not None:
+            self.byte_progress_callback(transferred_bytes, total_bytes)
+
+
+class RangeFileSink(FileBodySink):
+    """Write the body of a range response to a part file, at the offset the server answered with.
+
+    A 206 body is written at its range, which must be the requested one; a
+    200 body is the whole file and is written from offset 0.
+    """
+
+    def __init__(self, fd: int, first: int):
+        super().__init__(fd, first)
+        self.first = first  # the requested offset, kept across retries
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        super().begin(status_code, headers)
+        if status_code == 206:
+            range_first, _, _ = parse_content_range(headers.get("content-range"))
+            if range_first != self.first:
+                raise ValueError("Partial response does not match the requested range.")
+            self.offset = self.first
+        else:
+            self.offset = 0
+
+    @property
+    def end(self) -> int:
+        """Offset one past the last byte written."""
+        return self.offset + self.size
+
+
 class LocalFileBackend:
-    """Backend for local file operations."""
+    """Backend for local file operations.
 
-    def __init__(self):
-        pass
+    File digests are kept in a persistent cache keyed by path and stat, so an
+    unchanged file is only read once across runs. The cache is stored at
+    `hash_cache_path`, or else in `local_file_dir`; with neither it is only
+    kept in memory.
+    """
+
+    def __init__(self, hash_cache_path: str = None, local_file_dir: str = None):
+        if hash_cache_path is None and local_file_dir is not None:
+            hash_cache_path = os.path.join(local_file_dir, HASH_CACHE_FILE_NAME)
+        self.hash_cache = FileHashCache(hash_cache_path)
+        # one read buffer per thread, reused for every file that thread reads
+        self._thread_local = threading.local()
 
     def load_file(self, file_path: str) -> bytes:
         """Load a file from the local filesystem."""
@@ -60,11 +198,38 @@ class LocalFileBackend:
     def save_file(self, file_path: str, data: bytes) -> None:
         """Save data to a file on the local filesystem."""
         try:
+            self.hash_cache.invalidate(file_path)
             with open(file_path, "wb") as file:
                 file.write(data)
+            # the data is at hand, so the new digest costs no extra read
+            self.hash_cache.put(file_path, os.stat(file_path), hashlib.md5(data).hexdigest())
         except Exception as e:
             raise RuntimeError(f"Error saving file: {str(e)}")
 
+    def replace_file(self, source_path: str, file_path: str) -> None:
+        """Atomically move a finished file into place, i.e. a completed download."""
+        try:
+            os.replace(source_path, file_path)
+            self.hash_cache.move(source_path, file_path)
+        except Exception as e:
+            raise RuntimeError(f"Error replacing file: {str(e)}")
+
+    def preallocate_file(self, fd: int, size: int) -> None:
+        """Grow an open file to `size` bytes, reserving the disk space up front where supported."""
+        try:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                    return
+                except OSError as e:
+                    # a full disk is an error, a file system without fallocate is not
+                    if e.errno == errno.ENOSPC:
+                        raise
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        except Exception as e:
+            raise RuntimeError(f"Error preallocating file: {str(e)}")
+
     def get_working_directory(self) -> str:
         """Get the current working directory."""
         try:
@@ -72,269 +237,1521 @@ class LocalFileBackend:
         except Exception as e:
             raise RuntimeError(f"Error getting working directory: {str(e)}")
 
+    def get_cached_file_hash(self, file_path: str) -> Optional[str]:
+        """Return the MD5 of a file if the cache knows it, without reading the file."""
+        try:
+            return self.hash_cache.get(file_path, os.stat(file_path))
+        except Exception as e:
+            raise RuntimeError(f"Error calculating file hash: {str(e)}")
+
     def get_file_hash(self, file_path: str) -> str:
-        """Calculate the SHA-256 hash of a file."""
+        """Calculate the MD5 hash of a file, served from the cache if it did not change."""
+        try:
+            file_hash = self.get_cached_file_hash(file_path)
+            if file_hash is not None:
+                return file_hash
+            return self.ingest_file(file_path)
+        except Exception as e:
+            raise RuntimeError(f"Error calculating file hash: {str(e)}")
+
+    def ingest_file(self, file_path: str, base64_output: bytearray = None) -> str:
+        """Read a file once, hashing it and appending its base64 encoding to `base64_output` if given.
+
+        Blocks are read with `readinto` into a buffer reused across calls, and
+        each block feeds the hasher and the encoder before the next one is
+        read. Returns the MD5, which is also stored in the cache.
+        """
         try:
+            read_buffer = getattr(self._thread_local, "read_buffer", None)
+            if read_buffer is None:
+                read_buffer = self._thread_local.read_buffer = bytearray(INGEST_BLOCK_SIZE)
+            read_view = memoryview(read_buffer)
+
             md5_hash = hashlib.md5()
-            with open(file_path, "rb") as f:
-                # Read and update hash string value in blocks of 4K
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    md5_hash.update(byte_block)
+            with open(file_path, "rb", buffering=0) as f:
+                stat_result = os.fstat(f.fileno())
+                while True:
+                    # fill the whole block, so only the last one may not be a multiple of 3
+                    block_size = 0
+                    while block_size < INGEST_BLOCK_SIZE:
+                        read_size = f.readinto(read_view[block_size:])
+                        if not read_size:
+                            break
+                        block_size += read_size
+                    if block_size == 0:
+                        break
+                    md5_hash.update(read_view[:block_size])
+                    if base64_output is not None:
+                        base64_output += binascii.b2a_base64(read_view[:block_size], newline=False)
+                    if block_size < INGEST_BLOCK_SIZE:
+                        break
+            self.hash_cache.put(file_path, stat_result, md5_hash.hexdigest())
             return md5_hash.hexdigest()
         except Exception as e:
-            raise RuntimeError(f"Error calculating file hash: {str(e)}")
+            raise RuntimeError(f"Error reading file: {str(e)}")
 
 
-class FileService:
-    """Service for file operations."""
+class FileServiceBase:
+    """Transport-independent part of the file services.
 
-    def __init__(
-        self, http_client: HttpClientSocket, local_file_backend: LocalFileBackend
-    ):
+    Requests are built and responses are parsed here, without I/O on the
+    network, so the blocking `FileService` and the asyncio `AsyncFileService`
+    share them and only differ in how they wait for the server.
+    """
+
+    def __init__(self, http_client, local_file_backend: LocalFileBackend):
         self.http_client = http_client
         self.local_file_backend = local_file_backend
+        # validators of downloaded files by local path, so a cached copy is revalidated without re-hashing it
+        self._local_validator_dict: dict[str, LocalFileValidator] = {}
+        self._local_validator_lock = threading.Lock()
 
-    def fetch_server_file_list(
-        self, layer_request_interface: FetchServerFileInterface
-    ) -> ServerFileList:
-        try:
-            # get http request template
-            setting = layer_request_interface.setting
-            current_session = layer_request_interface.current_session
+    def _build_http_request(
+        self,
+        setting: Setting,
+        current_session: Session,
+        url: str,
+        method: str,
+        transfer_meter: TransferMeter = None,
+    ) -> HTTPLayerInterfaceRequest:
+        """Build a file service request from the setting template and the session."""
+        http_request = replace(setting.http_request_template)
+        # the meter only follows the body that carries the file
+        if transfer_meter is not None and transfer_meter.direction == TransferDirection.UPLOAD:
+            http_request.send_callback = transfer_meter.on_bytes
+        elif transfer_meter is not None:
+            http_request.receive_callback = transfer_meter.on_bytes
+        http_request.url = url
+        http_request.method = method
+        http_request.server_connection = current_session.session_server_info
+        http_request.cookie = current_session.session_token
+        http_request.allow_redirects = True
+        http_request.maintain_session_during_redirects = True
+        return http_request
 
-            if setting is None or current_session is None:
-                raise RuntimeError(
-                    "Setting or current session is None. Have you logged in?"
+    def _get_raw_file_url(self, setting: Setting, file_name: str) -> str:
+        """URL of a single file on the raw binary transfer route."""
+        return f"{setting.file_service_url}/files/{urllib.parse.quote(file_name)}"
+
+    def _get_metadata_url(self, setting: Setting, file_name: str) -> str:
+        """URL of the metadata of a single file, answered with headers only."""
+        return f"{setting.file_service_url}/metadata/{urllib.parse.quote(file_name)}"
+
+    def _get_http_error_message(self, response: HTTPLayerInterfaceResponse) -> str:
+        """Describe why a response is not a success."""
+        if not response.vaild_response:
+            return "Invalid response from server." + str(response.error_message)
+        error_message = handle_common_http_error(response.http_response.status_code)
+        if error_message is None:
+            error_message = f"Unknown error, status code: {response.http_response.status_code}"
+        return error_message
+
+    def _get_transfer_concurrency(self, requested_concurrency: int, file_count: int) -> int:
+        """Number of transfer workers, bounded by the connections the pool allows per host."""
+        max_connections = self.http_client.connection_pool.configurations.max_connections_per_host
+        return max(1, min(requested_concurrency, max_connections, file_count))
+
+    def _record_local_validator(
+        self, local_file_path: str, file_hash: str, last_modified: str = None
+    ) -> LocalFileValidator:
+        """Remember the validators of a local copy together with its current stat."""
+        stat_result = os.stat(local_file_path)
+        validator = LocalFileValidator(
+            etag=f'"{file_hash}"',
+            last_modified=last_modified,
+            file_size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+        )
+        with self._local_validator_lock:
+            self._local_validator_dict[local_file_path] = validator
+        return validator
+
+    def _get_local_validator(self, local_file_path: str) -> LocalFileValidator:
+        """Validators of a local copy, hashing it only if it is unknown or changed locally."""
+        stat_result = os.stat(local_file_path)
+        with self._local_validator_lock:
+            validator = self._local_validator_dict.get(local_file_path)
+        if (
+            validator is not None
+            and validator.file_size == stat_result.st_size
+            and validator.mtime_ns == stat_result.st_mtime_ns
+        ):
+            return validator
+        return self._record_local_validator(
+            local_file_path, self.local_file_backend.get_file_hash(local_file_path)
+        )
+
+    def _build_revalidation_request(
+        self, file_name: str, validator: LocalFileValidator, setting: Setting, current_session: Session
+    ) -> HTTPLayerInterfaceRequest:
+        """Conditional HEAD request for a file the client holds a copy of."""
+        http_request = self._build_http_request(
+            setting,
+            current_session,
+            self._get_raw_file_url(setting, file_name),
+            "HEAD",
+        )
+        http_request.if_none_match = validator.etag
+        http_request.if_modified_since = validator.last_modified
+        return http_request
+
+    def _check_revalidation_response(
+        self, file_name: str, validator: LocalFileValidator, response: HTTPLayerInterfaceResponse
+    ) -> None:
+        """Accept a revalidation answer.
+
+        304 Not Modified means the copy is current. Any other answer means the
+        server has a different version, or no such file, and raises.
+        """
+        if not response.vaild_response:
+            raise RuntimeError(self._get_http_error_message(response))
+
+        http_response = response.http_response
+        match http_response.status_code:
+            case 304:
+                if http_response.last_modified is not None:
+                    validator.last_modified = http_response.last_modified
+            case 200 if http_response.etag == validator.etag:
+                # the server ignored the condition, but the copy is current
+                validator.last_modified = http_response.last_modified
+            case 200:
+                raise RuntimeError(f"Local file '{file_name}' exists but has hash mismatch.")
+            case 404:
+                raise RuntimeError(f"File '{file_name}' not found on server.")
+            case _:
+                raise RuntimeError(self._get_http_error_message(response))
+
+    def _split_download_files(
+        self, file_name_list: list[str], setting: Setting
+    ) -> tuple[list[str], list[str]]:
+        """Split requested files into those with a local copy and those without."""
+        local_file_name_list = [
+            file_name
+            for file_name in file_name_list
+            if os.path.exists(setting.local_file_dir + file_name)
+        ]
+        local_file_name_set = set(local_file_name_list)
+        missing_file_name_list = [
+            file_name for file_name in file_name_list if file_name not in local_file_name_set
+        ]
+        return local_file_name_list, missing_file_name_list
+
+    def _build_stat_request(
+        self, file_name: str, setting: Setting, current_session: Session
+    ) -> HTTPLayerInterfaceRequest:
+        """HEAD request for the metadata of a file."""
+        return self._build_http_request(
+            setting,
+            current_session,
+            self._get_metadata_url(setting, file_name),
+            "HEAD",
+        )
+
+    def _parse_stat_response(self, file_name: str, response: HTTPLayerInterfaceResponse) -> RemoteFileStat:
+        """Turn the answer to a metadata request into the file's metadata, raising on errors."""
+        if not response.vaild_response:
+            raise RuntimeError(self._get_http_error_message(response))
+        http_response = response.http_response
+        match http_response.status_code:
+            case 200 | 204 if http_response.etag is not None:
+                return RemoteFileStat(
+                    file_name=file_name,
+                    exists=True,
+                    file_size=http_response.file_size,
+                    file_hash=http_response.etag.removeprefix("W/").strip('"'),
+                    mtime=http_response.file_mtime,
+                    last_modified=http_response.last_modified,
                 )
+            case 404:
+                return RemoteFileStat(file_name=file_name, exists=False)
+            case _:
+                raise RuntimeError(f"Metadata of '{file_name}': {self._get_http_error_message(response)}")
+
+    def _file_stat_to_server_list(self, file_stat_result: FileStatResult) -> ServerFileList:
+        """The files of a metadata result that exist, as a server file list."""
+        if not file_stat_result.stat_success:
+            return ServerFileList(valid_list=False, error_message=file_stat_result.error_message)
+        return ServerFileList(
+            valid_list=True,
+            file_list=[
+                SingleFile(file_name=file_stat.file_name, file_hash=file_stat.file_hash)
+                for file_stat in file_stat_result.file_stat_list
+                if file_stat.exists
+            ],
+        )
+
+    def _match_download_files(
+        self, file_name_list: list[str], server_file_list: ServerFileList
+    ) -> list[SingleFile]:
+        """Look up files in the server list, raising for the ones that are not there."""
+        if not server_file_list.valid_list:
+            raise RuntimeError(
+                "Error fetching server file list before download: "
+                + server_file_list.error_message
+            )
+        server_file_dict = {file.file_name: file for file in server_file_list.file_list}
+        download_file_info_list: list[SingleFile] = []
+        for file_name in file_name_list:
+            if file_name not in server_file_dict:
+                raise RuntimeError(f"File '{file_name}' not found on server.")
+            download_file_info_list.append(server_file_dict[file_name])
+        return download_file_info_list
+
+    def _build_range_request(
+        self,
+        file_info: SingleFile,
+        first: int,
+        last: int,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter = None,
+        body_buffer: memoryview = None,
+        body_sink: RangeFileSink = None,
+        partial_only: bool = False,
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for bytes first..last of a file, valid only for the listed version.
+
+        With a `body_buffer` or a `body_sink` the bytes are received straight
+        into it instead of the response. With `partial_only` a whole-file
+        answer is left unread and comes back without a body.
+        """
+        http_request = self._build_http_request(
+            setting,
+            current_session,
+            self._get_raw_file_url(setting, file_info.file_name),
+            "GET",
+            transfer_meter,
+        )
+        http_request.range = f"bytes={first}-{last}"
+        http_request.if_range = f'"{file_info.file_hash}"'
+        # a 206 is never compressed, and an uncompressed 200 can be told apart by its length
+        http_request.accept_encoding = "identity"
+        http_request.partial_response_only = partial_only
+        http_request.response_body_buffer = body_buffer
+        http_request.response_body_sink = body_sink
+        return http_request
+
+    def _build_preview_request(
+        self, file_name: str, setting: Setting, current_session: Session
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for the first bytes of a file, whatever version the server has."""
+        http_request = self._build_http_request(
+            setting,
+            current_session,
+            self._get_raw_file_url(setting, file_name),
+            "GET",
+        )
+        http_request.range = f"bytes=0-{setting.view_preview_size - 1}"
+        return http_request
+
+    def _parse_preview_response(
+        self, response: HTTPLayerInterfaceResponse, setting: Setting
+    ) -> FilePreviewResult:
+        """Turn the answer to a preview request into a preview result."""
+        if not response.vaild_response:
+            return FilePreviewResult(error_message=self._get_http_error_message(response))
+
+        http_response = response.http_response
+        payload_bytes = http_response.payload_bytes or b""
+        match http_response.status_code:
+            case 206:
+                _, _, file_size = parse_content_range(http_response.content_range)
+                return FilePreviewResult(preview_success=True, preview_bytes=payload_bytes, file_size=file_size)
+            case 200:
+                # the server ignored the range and sent the whole file
+                return FilePreviewResult(
+                    preview_success=True,
+                    preview_bytes=payload_bytes[:setting.view_preview_size],
+                    file_size=len(payload_bytes),
+                )
+            case 416:
+                # an empty file has no first byte
+                return FilePreviewResult(preview_success=True, preview_bytes=b"", file_size=0)
+            case _:
+                return FilePreviewResult(error_message=self._get_http_error_message(response))
+
+    def _parse_range_response(
+        self, first: int, response: HTTPLayerInterfaceResponse
+    ) -> tuple[int, Optional[bytes], int]:
+        """Parse the answer to a range request.
+
+        Returns the offset the data belongs at, the data and the file size.
+        The data is None when the body was received into the request's body
+        buffer or sink. A 200 answer carries the whole file (offset 0), i.e. because
+        the file changed and If-Range did not match. Transient failures raise
+        ConnectionError so the caller can retry the range.
+        """
+        if not response.vaild_response:
+            raise ConnectionError(self._get_http_error_message(response))
+
+        http_response = response.http_response
+        if http_response.payload_buffer_size is not None:
+            payload_bytes, payload_size = None, http_response.payload_buffer_size
+        elif http_response.payload_sink_size is not None:
+            payload_bytes, payload_size = None, http_response.payload_sink_size
+        else:
+            payload_bytes = http_response.payload_bytes or b""
+            payload_size = len(payload_bytes)
+        match http_response.status_code:
+            case 206:
+                range_first, range_last, file_size = parse_content_range(http_response.content_range)
+                if range_first != first or range_last - range_first + 1 != payload_size:
+                    raise ConnectionError("Partial response does not match the requested range.")
+                return range_first, payload_bytes, file_size
+            case 200:
+                return 0, payload_bytes, payload_size
+            case 416:
+                # nothing left at or after `first`, the Content-Range carries the size
+                _, _, file_size = parse_content_range(http_response.content_range)
+                if file_size is None:
+                    raise RuntimeError("Server did not report the file size.")
+                return first, b"", file_size
+            case _:
+                raise RuntimeError(self._get_http_error_message(response))
 
-            request = replace(setting.http_request_template)
-            request.url = setting.file_service_url
-            request.method = "POST"
-            request.server_connection = current_session.session_server_info
-            request.cookie = current_session.session_token
-            request.payload_type = HTTPPayloadType.JSON
-            request.payload_bytes, request.content_length_before_encoding = (
-                encode_file_api_to_json(
-                    FileServerRequestAPI(request_type=FileServerRequestType.LIST_FILES)
+    def _plan_file_ranges(self, first: int, file_size: int, range_size: int) -> list[tuple[int, int]]:
+        """Split bytes first..file_size - 1 into ranges of range_size bytes."""
+        return [
+            (range_first, min(range_first + range_size, file_size) - 1)
+            for range_first in range(first, file_size, range_size)
+        ]
+
+    def _get_verified_size(
+        self, range_list: list[tuple[int, int]], completed_first_set: set[int], verified_size: int
+    ) -> int:
+        """Extend the verified prefix over the completed ranges, stopping at the first gap."""
+        for first, last in range_list:
+            if first not in completed_first_set:
+                break
+            verified_size = last + 1
+        return verified_size
+
+    def _open_part_file(self, file_info: SingleFile, setting: Setting) -> tuple[str, str, int]:
+        """Open the .part file of a download, creating it if needed.
+
+        Returns the local file path, the part file path and the descriptor.
+        """
+        local_file_path = setting.local_file_dir + file_info.file_name
+        part_file_path = local_file_path + PART_FILE_SUFFIX
+        return local_file_path, part_file_path, os.open(part_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _check_range_retry(self, first: int, last: int, attempt: int, error: Exception, setting: Setting) -> None:
+        """Give up on a range once its retries are used up."""
+        if attempt == setting.download_range_retries:
+            raise RuntimeError(f"Range {first}-{last} failed after retries: {str(error)}")
+
+    def _restart_part_file(self, part_fd: int, offset: int, file_size: int) -> bool:
+        """Empty a part file that is longer than the file. Returns whether the download starts over."""
+        if offset <= file_size:
+            return False
+        os.ftruncate(part_fd, 0)
+        return True
+
+    def _check_later_range(self, first: int, data_offset: int, data: Optional[bytes]) -> None:
+        """Check the answer to a range after the first one, whose body goes to a buffer or sink."""
+        if data_offset != first:
+            # a 200 answer, the whole file was left unread
+            raise RangeIgnored("Server answered a range request with the whole file.")
+        if data is not None:
+            # a 2xx body always lands in the buffer or sink, i.e. a 416 because the file shrank
+            raise RuntimeError("File changed on server during download.")
+
+    def _settle_later_ranges(
+        self,
+        range_list: list[tuple[int, int]],
+        outcome_dict: dict[int, Optional[BaseException]],
+        verified_size: int,
+        file_size: int,
+        transfer_meter: TransferMeter,
+    ) -> tuple[int, bool]:
+        """Extend the verified prefix over the ranges after the first one and decide how to go on.
+
+        `outcome_dict` maps the first byte of every range that ran to None or
+        its error. Returns the verified size and whether the whole file is to
+        be fetched once instead, because the server ignored a range: retrying
+        ranges would only get the whole file again. Other errors raise.
+        """
+        completed_first_set = {first for first, error in outcome_dict.items() if error is None}
+        verified_size = self._get_verified_size(range_list, completed_first_set, verified_size)
+        error_list = [error for error in outcome_dict.values() if error is not None]
+        if any(isinstance(error, RangeIgnored) for error in error_list):
+            transfer_meter.add_total(file_size)
+            return verified_size, True
+        if error_list:
+            raise RuntimeError(str(error_list[0]))
+        return verified_size, False
+
+    def _finish_part_file(self, file_info: SingleFile, part_file_path: str, local_file_path: str) -> None:
+        """Check a completed part file against the listed hash and move it into place."""
+        if self.local_file_backend.get_file_hash(part_file_path) != file_info.file_hash:
+            # the part is useless for resuming too, start over next time
+            os.remove(part_file_path)
+            raise RuntimeError("Downloaded file has hash mismatch.")
+        self.local_file_backend.replace_file(part_file_path, local_file_path)
+
+    def _build_json_download_request(
+        self,
+        file_info: SingleFile,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter = None,
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for one file through the JSON API."""
+        http_request = self._build_http_request(
+            setting, current_session, setting.file_service_url, "POST", transfer_meter
+        )
+        http_request.payload_type = HTTPPayloadType.JSON
+        http_request.payload_bytes, http_request.content_length_before_encoding = (
+            encode_file_api_to_json(
+                FileServerRequestAPI(
+                    request_type=FileServerRequestType.DOWNLOAD_FILE,
+                    request_download_file_list=[file_info],
                 )
             )
-            request.allow_redirects = True
-            request.maintain_session_during_redirects = True
+        )
+        return http_request
 
-            response = self.http_client.handle_request(request)
+    def _parse_json_download_response(
+        self, file_info: SingleFile, response: HTTPLayerInterfaceResponse
+    ) -> bytes:
+        """Extract the file contents from a JSON API download answer."""
+        if not response.vaild_response or response.http_response.status_code != 200:
+            raise RuntimeError(self._get_http_error_message(response))
+
+        response_data = json.loads(response.http_response.payload_bytes.decode("utf-8"))
+        if not response_data.get("request_success"):
+            raise RuntimeError(response_data.get("error_message", "Unknown error"))
+        downloaded_file = next(
+            (
+                file
+                for file in response_data.get("request_data", [])
+                if file["file_name"] == file_info.file_name
+            ),
+            None,
+        )
+        if downloaded_file is None or "file_data" not in downloaded_file:
+            raise RuntimeError("File not found in response.")
+
+        # because json cannot serialize bytes, here the file is transferred as to base64 code, then ascii string
+        # so need to decode it to bytes
+        return base64.b64decode(downloaded_file["file_data"].encode("ascii"))
+
+    def _save_downloaded_file(self, file_info: SingleFile, file_bytes: bytes, local_file_path: str) -> None:
+        """Verify a file downloaded in one piece and write it."""
+        if hashlib.md5(file_bytes).hexdigest() != file_info.file_hash:
+            raise RuntimeError("Downloaded file has hash mismatch.")
+        self.local_file_backend.save_file(local_file_path, file_bytes)
+
+    def _check_uploaded_files(
+        self, response: HTTPLayerInterfaceResponse, file_info_list: list[SingleFile]
+    ) -> None:
+        """Check an upload response and compare the hashes the server computed."""
+        if not response.vaild_response or response.http_response.status_code != 200:
+            raise RuntimeError(self._get_http_error_message(response))
+        response_data = json.loads(response.http_response.payload_bytes.decode("utf-8"))
+        if not response_data.get("request_success"):
+            raise RuntimeError(response_data.get("error_message", "Unknown error"))
+
+        stored_hash_dict = {
+            file["file_name"]: file.get("file_hash")
+            for file in response_data.get("request_data", [])
+        }
+        for file_info in file_info_list:
+            if stored_hash_dict.get(file_info.file_name) != file_info.file_hash:
+                raise RuntimeError(f"'{file_info.file_name}' has hash mismatch on server.")
+
+    def _build_binary_upload_request(
+        self,
+        file_info: SingleFile,
+        file_path: str,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter = None,
+    ) -> HTTPLayerInterfaceRequest:
+        """Request uploading one file as a raw octet stream read from disk while sending."""
+        http_request = self._build_http_request(
+            setting,
+            current_session,
+            self._get_raw_file_url(setting, file_info.file_name),
+            "PUT",
+            transfer_meter,
+        )
+        http_request.payload_type = HTTPPayloadType.OCTET_STREAM
+        http_request.payload_file_path = file_path
+        # compressing an archive or a picture again only costs CPU time
+        if not is_compressed_file_name(file_info.file_name):
+            http_request.content_encoding = setting.upload_content_encoding
+            http_request.content_encoding_level = setting.upload_content_encoding_level
+        return http_request
+
+    def _build_json_upload_payload(
+        self,
+        file_info_list: list[SingleFile],
+        file_path_dict: dict[str, str],
+        server_file_hash_dict: dict[str, str],
+    ) -> tuple[bytearray, list[SingleFile], list[str]]:
+        """Build the body of a JSON upload batch.
+
+        The body is written straight into one buffer: each file is read once,
+        hashed and base64 encoded into it. A file the server already has is
+        cut out of the buffer again. Returns the body, the files in it and the
+        names of the files the server already has.
+        """
+        already_cached_file_name_list = []
+        uploaded_file_info_list = []
+        # same shape as encode_file_api_to_json(FileServerRequestAPI(...)), without the copies
+        payload = bytearray(
+            f'{{"request_type": "{FileServerRequestType.UPLOAD_FILE}", "request_upload_file_list": ['.encode()
+        )
+        for file_info in file_info_list:
+            file_path = file_path_dict[file_info.file_name]
+            server_file_hash = server_file_hash_dict.get(file_info.file_name)
+            if (
+                server_file_hash is not None
+                and self.local_file_backend.get_cached_file_hash(file_path) == server_file_hash
+            ):
+                # known to be on the server, no need to read it
+                already_cached_file_name_list.append(file_info.file_name)
+                continue
+
+            entry_start = len(payload)
+            if uploaded_file_info_list:
+                payload += b", "
+            payload += f'{{"file_name": {json.dumps(file_info.file_name)}, "file_data": "'.encode()
+            file_hash = self.local_file_backend.ingest_file(file_path, payload)
+            payload += f'", "file_hash": "{file_hash}"}}'.encode()
 
-            # Check response status
-            if response.vaild_response:
-                if response.http_response.status_code == 200:
-                    response_data = json.loads(
-                        response.http_response.payload_bytes.decode("utf-8")
+            if server_file_hash is not None:
+                if server_file_hash != file_hash:
+                    raise RuntimeError(
+                        f"Server file '{file_info.file_name}' exists but has hash mismatch."
                     )
-                    if (
-                        "request_success" in response_data
-                        and response_data["request_success"]
-                    ):
-                        file_list = ServerFileList(
-                            valid_list=True,
-                            file_list=[
-                                SingleFile(
-                                    file_name=file["file_name"],
-                                    file_hash=file["file_hash"],
-                                )
-                                for file in response_data.get("request_data", {})
-                            ],
-                        )
-                        return file_list
-                    else:
-                        return ServerFileList(
-                            valid_list=False,
-                            error_message=f"Failed to fetch file list from server: {response_data.get('error_message', 'Unknown error')}",
-                        )
-                else:
-                    # try to handle common http error
-                    error_message = handle_common_http_error(
-                        response.http_response.status_code
+                del payload[entry_start:]
+                already_cached_file_name_list.append(file_info.file_name)
+                continue
+            uploaded_file_info_list.append(replace(file_info, file_hash=file_hash))
+        payload += b"]}"
+        return payload, uploaded_file_info_list, already_cached_file_name_list
+
+    def _build_json_upload_request(
+        self,
+        payload: bytearray,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter = None,
+    ) -> HTTPLayerInterfaceRequest:
+        """Request uploading a JSON batch built by `_build_json_upload_payload`."""
+        http_request = self._build_http_request(
+            setting, current_session, setting.file_service_url, "POST", transfer_meter
+        )
+        http_request.payload_type = HTTPPayloadType.JSON
+        http_request.payload_bytes = payload
+        http_request.content_length_before_encoding = len(payload)
+        http_request.content_encoding = setting.upload_content_encoding
+        http_request.content_encoding_level = setting.upload_content_encoding_level
+        return http_request
+
+    def _is_streamed_upload(self, file_size: int, setting: Setting) -> bool:
+        """Whether a file is uploaded on its own as a raw stream instead of inside a JSON batch."""
+        return (
+            setting.file_transfer_mode == FileTransferMode.BINARY
+            and file_size >= setting.upload_small_file_size
+        )
+
+    def _is_streamed_upload_task(
+        self, task: list[SingleFile], file_size_dict: dict[str, int], setting: Setting
+    ) -> bool:
+        return len(task) == 1 and self._is_streamed_upload(file_size_dict[task[0].file_name], setting)
+
+    def _get_upload_transfer_size(
+        self, file_info_list: list[SingleFile], file_size_dict: dict[str, int], setting: Setting
+    ) -> int:
+        """Bytes expected on the wire for an upload, JSON batches carry base64 (4/3 of the size)."""
+        return sum(
+            file_size_dict[file_info.file_name]
+            if self._is_streamed_upload(file_size_dict[file_info.file_name], setting)
+            else file_size_dict[file_info.file_name] * 4 // 3
+            for file_info in file_info_list
+        )
+
+    def _get_json_upload_memory_size(
+        self, task: list[SingleFile], file_size_dict: dict[str, int]
+    ) -> int:
+        """Memory a JSON upload task holds: base64 payload + encoded request."""
+        return sum(file_size_dict[file_info.file_name] for file_info in task) * JSON_UPLOAD_MEMORY_FACTOR
+
+    def _plan_upload_tasks(
+        self,
+        file_info_list: list[SingleFile],
+        file_size_dict: dict[str, int],
+        setting: Setting,
+    ) -> list[list[SingleFile]]:
+        """Group files into upload tasks.
+
+        Large files get a task of their own. Small files are packed into
+        batches up to the byte budget so they share one request.
+        """
+        task_list = []
+        current_batch = []
+        current_batch_size = 0
+        for file_info in file_info_list:
+            file_size = file_size_dict[file_info.file_name]
+            if file_size >= setting.upload_small_file_size:
+                task_list.append([file_info])
+                continue
+            if current_batch and current_batch_size + file_size > setting.upload_batch_size:
+                task_list.append(current_batch)
+                current_batch, current_batch_size = [], 0
+            current_batch.append(file_info)
+            current_batch_size += file_size
+        if current_batch:
+            task_list.append(current_batch)
+        return task_list
+
+    def _build_file_list_request(
+        self, setting: Setting, current_session: Session
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for the list of files on the server."""
+        if setting is None or current_session is None:
+            raise RuntimeError(
+                "Setting or current session is None. Have you logged in?"
+            )
+
+        request = self._build_http_request(
+            setting, current_session, setting.file_service_url, "POST"
+        )
+        request.payload_type = HTTPPayloadType.JSON
+        request.payload_bytes, request.content_length_before_encoding = (
+            encode_file_api_to_json(
+                FileServerRequestAPI(request_type=FileServerRequestType.LIST_FILES)
+            )
+        )
+        return request
+
+    def _parse_file_list_response(self, response: HTTPLayerInterfaceResponse) -> ServerFileList:
+        """Turn the answer to a list request into a server file list."""
+        # Check response status
+        if response.vaild_response:
+            if response.http_response.status_code == 200:
+                response_data = json.loads(
+                    response.http_response.payload_bytes.decode("utf-8")
+                )
+                if (
+                    "request_success" in response_data
+                    and response_data["request_success"]
+                ):
+                    file_list = ServerFileList(
+                        valid_list=True,
+                        file_list=[
+                            SingleFile(
+                                file_name=file["file_name"],
+                                file_hash=file["file_hash"],
+                            )
+                            for file in response_data.get("request_data", {})
+                        ],
                     )
-                    if error_message is None:
-                        error_message = "Unknown error"
+                    return file_list
+                else:
                     return ServerFileList(
                         valid_list=False,
-                        error_message="Failed to fetch file list from server."
-                        + error_message,
+                        error_message=f"Failed to fetch file list from server: {response_data.get('error_message', 'Unknown error')}",
                     )
             else:
+                # try to handle common http error
+                error_message = handle_common_http_error(
+                    response.http_response.status_code
+                )
+                if error_message is None:
+                    error_message = "Unknown error"
                 return ServerFileList(
                     valid_list=False,
-                    error_message="Invalid response from server."
-                    + response.error_message,
+                    error_message="Failed to fetch file list from server."
+                    + error_message,
                 )
-        except Exception as e:
+        else:
             return ServerFileList(
                 valid_list=False,
-                error_message=f"Error fetching server file list: {str(e)}",
+                error_message="Invalid response from server."
+                + response.error_message,
             )
 
-    def download_file_batch(
-        self, layer_request_interface: FileDownloadInterface
-    ) -> FileDownloadResult:
-        """Download single file or multiple files from the server."""
-        try:
-            # check if the file name list is empty
-            if not layer_request_interface.file_name_list:
-                return FileDownloadResult(
-                    download_success=False,
-                    error_message="No file selected. Nothing to download.",
+    def _build_file_page_request(
+        self, setting: Setting, current_session: Session, page_interface: FetchServerFilePageInterface
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for one page of the list of files on the server."""
+        if setting is None or current_session is None:
+            raise RuntimeError(
+                "Setting or current session is None. Have you logged in?"
+            )
+
+        request = self._build_http_request(
+            setting, current_session, setting.file_service_url, "POST"
+        )
+        request.payload_type = HTTPPayloadType.JSON
+        request.payload_bytes, request.content_length_before_encoding = (
+            encode_file_api_to_json(
+                FileServerRequestAPI(
+                    request_type=FileServerRequestType.LIST_FILES,
+                    page_size=page_interface.page_size,
+                    page_token=page_interface.page_token,
+                    name_pattern=page_interface.name_pattern,
+                    sort_by=page_interface.sort_by,
+                    descending=page_interface.descending,
                 )
+            )
+        )
+        return request
 
-            # 1. get server file list
-            fetch_file_list_request = FetchServerFileInterface(
-                current_session=layer_request_interface.current_session,
-                setting=layer_request_interface.setting,
+    def _parse_file_page_response(self, response: HTTPLayerInterfaceResponse) -> ServerFileList:
+        """Turn the answer to a page request into a server file list with its next page token, raising on errors."""
+        if not response.vaild_response or response.http_response.status_code != 200:
+            raise RuntimeError(self._get_http_error_message(response))
+        response_data = json.loads(response.http_response.payload_bytes.decode("utf-8"))
+        if not response_data.get("request_success"):
+            raise RuntimeError(response_data.get("error_message", "Unknown error"))
+
+        return ServerFileList(
+            valid_list=True,
+            file_list=[
+                SingleFile(
+                    file_name=file["file_name"],
+                    file_hash=file["file_hash"],
+                    file_size=file.get("file_size"),
+                    file_mtime=file.get("file_mtime"),
+                )
+                for file in response_data.get("request_data", [])
+            ],
+            cursor=response_data.get("cursor"),
+            next_page_token=response_data.get("next_page_token"),
+            total_count=response_data.get("total_count"),
+        )
+
+    def _build_file_changes_request(
+        self, setting: Setting, current_session: Session, cursor: Optional[str]
+    ) -> HTTPLayerInterfaceRequest:
+        """Request for the changes of the server file list since a cursor."""
+        if setting is None or current_session is None:
+            raise RuntimeError(
+                "Setting or current session is None. Have you logged in?"
             )
-            current_server_file_list = self.fetch_server_file_list(
-                fetch_file_list_request
+
+        request = self._build_http_request(
+            setting, current_session, setting.file_service_url, "POST"
+        )
+        request.payload_type = HTTPPayloadType.JSON
+        request.payload_bytes, request.content_length_before_encoding = (
+            encode_file_api_to_json(
+                FileServerRequestAPI(request_type=FileServerRequestType.LIST_FILE_CHANGES, cursor=cursor)
             )
-            if not current_server_file_list.valid_list:
+        )
+        return request
+
+    def _parse_file_changes_response(
+        self, response: HTTPLayerInterfaceResponse, cached_file_list: Optional[ServerFileList]
+    ) -> ServerFileListDelta:
+        """Apply the answer to a changes request to the cached list, raising on errors."""
+        if not response.vaild_response or response.http_response.status_code != 200:
+            raise RuntimeError(self._get_http_error_message(response))
+        response_data = json.loads(response.http_response.payload_bytes.decode("utf-8"))
+        if not response_data.get("request_success"):
+            raise RuntimeError(response_data.get("error_message", "Unknown error"))
+
+        changed_file_list = [
+            SingleFile(file_name=file["file_name"], file_hash=file["file_hash"])
+            for file in response_data.get("request_data", [])
+        ]
+        removed_file_name_list = response_data.get("removed_file_list", [])
+        full_list = response_data.get("full_list", False)
+
+        # the order of the cached list is kept, new files go to the end
+        file_dict = {} if cached_file_list is None else {
+            file.file_name: file for file in cached_file_list.file_list
+        }
+        if full_list:
+            listed_file_name_set = {file.file_name for file in changed_file_list}
+            removed_file_name_list = [file_name for file_name in file_dict if file_name not in listed_file_name_set]
+        removed_file_name_list = [file_name for file_name in removed_file_name_list if file_name in file_dict]
+        for file_name in removed_file_name_list:
+            del file_dict[file_name]
+
+        added_file_list: list[SingleFile] = []
+        modified_file_list: list[SingleFile] = []
+        for file in changed_file_list:
+            cached_file = file_dict.get(file.file_name)
+            if cached_file is None:
+                added_file_list.append(file)
+            elif cached_file.file_hash != file.file_hash:
+                modified_file_list.append(file)
+            file_dict[file.file_name] = file
+
+        return ServerFileListDelta(
+            valid_delta=True,
+            full_list=full_list,
+            added_file_list=added_file_list,
+            modified_file_list=modified_file_list,
+            removed_file_name_list=removed_file_name_list,
+            server_file_list=ServerFileList(
+                valid_list=True, file_list=list(file_dict.values()), cursor=response_data.get("cursor")
+            ),
+        )
+
+    def _collect_upload_files(
+        self, file_path_or_file_dir_path: str
+    ) -> tuple[dict[str, str], dict[str, int]]:
+        """Find the local files to upload. Returns their paths and sizes by file name."""
+        # turn the path to absolute path
+        file_path_or_file_dir_path = os.path.abspath(file_path_or_file_dir_path)
+        # first check if the input is a file or a directory
+        if os.path.isfile(file_path_or_file_dir_path):
+            # if it's a file, just add it to the list
+            file_path_list = [file_path_or_file_dir_path]
+        elif os.path.isdir(file_path_or_file_dir_path):
+            # if it's a directory, get all files in the directory
+            file_path_list = []
+            for root, dirs, files in os.walk(file_path_or_file_dir_path):
+                for file in files:
+                    # the hash cache of a local file directory is not one of its files
+                    if file.startswith(HASH_CACHE_FILE_NAME):
+                        continue
+                    file_path_list.append(os.path.join(root, file))
+            if len(file_path_list) == 0:
                 raise RuntimeError(
-                    "Error fetching server file list before download: "
-                    + current_server_file_list.error_message
+                    f"No files found in directory: {file_path_or_file_dir_path}. Nothing to upload."
                 )
+        else:
+            raise RuntimeError(
+                f"Not a valid file or directory: {file_path_or_file_dir_path}"
+            )
 
-            # 2. match download file from server file list
-            # if not found, raise error
+        file_path_dict: dict[str, str] = {}
+        file_size_dict: dict[str, int] = {}
+        for file_path in file_path_list:
+            if not os.path.exists(file_path):
+                raise RuntimeError(f"File not found on local: {file_path}")
+            # get file name(without path and with extension)
+            file_name = os.path.basename(file_path)
+            file_path_dict[file_name] = file_path
+            file_size_dict[file_name] = os.path.getsize(file_path)
+        return file_path_dict, file_size_dict
 
-            file_name_list = layer_request_interface.file_name_list
-            request_download_file_info_list: list[SingleFile] = []
-            for file_name in file_name_list:
-                if not any(
-                    file.file_name == file_name
-                    for file in current_server_file_list.file_list
-                ):
-                    raise RuntimeError(f"File '{file_name}' not found on server.")
-                else:
-                    request_download_file_info_list.append(
-                        next(
-                            file
-                            for file in current_server_file_list.file_list
-                            if file.file_name == file_name
-                        )
+    def _classify_upload_files(
+        self,
+        file_path_dict: dict[str, str],
+        streamed_file_hash_dict: dict[str, str],
+        server_file_hash_dict: dict[str, str],
+    ) -> tuple[list[SingleFile], list[str]]:
+        """Decide which files to upload.
+
+        Streamed files are compared with the server list by their hash. Files
+        sent in JSON batches are hashed while they are encoded, so they are
+        always planned and skipped later if the server has them.
+        Returns the files to upload and the names of files already on the server.
+        """
+        actual_upload_file_info_list: list[SingleFile] = []
+        already_cached_file_name_list = []
+        for file_name in file_path_dict:
+            if file_name not in streamed_file_hash_dict:
+                actual_upload_file_info_list.append(SingleFile(file_name=file_name))
+                continue
+            file_hash = streamed_file_hash_dict[file_name]
+            if file_name not in server_file_hash_dict:
+                # add to upload list
+                actual_upload_file_info_list.append(
+                    SingleFile(file_name=file_name, file_hash=file_hash)
+                )
+            elif server_file_hash_dict[file_name] == file_hash:
+                # skip upload
+                already_cached_file_name_list.append(file_name)
+            else:
+                raise RuntimeError(
+                    f"Server file '{file_name}' exists but has hash mismatch."
+                )
+        return actual_upload_file_info_list, already_cached_file_name_list
+
+    def _make_transfer_result(
+        self,
+        result_type: type,
+        transferred_file_name_list: list[str],
+        error_message_list: list[str],
+        already_cached_file_name_list: list[str] = None,
+    ) -> FileDownloadResult | FileUploadResult:
+        """Wrap the outcome of a batch into a download or upload result."""
+        error_message = "\n".join(error_message_list) if error_message_list else None
+        if result_type is FileDownloadResult:
+            return FileDownloadResult(
+                download_success=not error_message_list,
+                error_message=error_message,
+                downloaded_file_name_list=transferred_file_name_list,
+            )
+        return FileUploadResult(
+            upload_success=not error_message_list,
+            error_message=error_message,
+            uploaded_file_name_list=transferred_file_name_list,
+            already_uploaded_file_name_list=already_cached_file_name_list,
+        )
+
+
+class FileService(FileServiceBase):
+    """Service for file operations."""
+
+    def __init__(
+        self, http_client: HttpClientSocket, local_file_backend: LocalFileBackend
+    ):
+        super().__init__(http_client, local_file_backend)
+
+    def _revalidate_local_file(
+        self, file_name: str, setting: Setting, current_session: Session
+    ) -> None:
+        """Check a local copy against the server with a conditional HEAD request."""
+        validator = self._get_local_validator(setting.local_file_dir + file_name)
+        response = self.http_client.handle_request(
+            self._build_revalidation_request(file_name, validator, setting, current_session)
+        )
+        self._check_revalidation_response(file_name, validator, response)
+
+    def _revalidate_local_files(
+        self, file_name_list: list[str], setting: Setting, current_session: Session
+    ) -> None:
+        """Revalidate local copies in parallel, raising if any of them is outdated."""
+        if not file_name_list:
+            return
+        error_message_list = []
+        concurrency = self._get_transfer_concurrency(setting.download_concurrency, len(file_name_list))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            future_dict = {
+                executor.submit(
+                    self._revalidate_local_file, file_name, setting, current_session
+                ): file_name
+                for file_name in file_name_list
+            }
+            for future in as_completed(future_dict):
+                try:
+                    future.result()
+                except Exception as e:
+                    error_message_list.append(str(e))
+        if error_message_list:
+            raise RuntimeError("\n".join(error_message_list))
+
+    def _fetch_range_with_retries(
+        self,
+        file_info: SingleFile,
+        first: int,
+        last: int,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+        body_buffer: memoryview = None,
+        body_sink: RangeFileSink = None,
+        partial_only: bool = False,
+    ) -> tuple[int, Optional[bytes], int]:
+        """Request a range, retrying transient failures."""
+        for attempt in range(setting.download_range_retries + 1):
+            transfer_meter.check_cancelled()
+            try:
+                response = self.http_client.handle_request(self._build_range_request(
+                    file_info, first, last, setting, current_session, transfer_meter, body_buffer, body_sink,
+                    partial_only,
+                ))
+                return self._parse_range_response(first, response)
+            except ConnectionError as e:
+                self._check_range_retry(first, last, attempt, e, setting)
+
+    def _download_single_file_ranged(
+        self, file_info: SingleFile, setting: Setting, current_session: Session, transfer_meter: TransferMeter
+    ) -> None:
+        """Download one file in ranges into a .part file, then verify and rename it.
+
+        The part file only ever holds a verified prefix of the file, so a failed
+        download resumes from its size on the next attempt instead of from zero.
+        Ranges after the first one may be fetched in parallel. If one of them is
+        answered with the whole file, the whole file is fetched once instead.
+        """
+        local_file_path, part_file_path, part_fd = self._open_part_file(file_info, setting)
+        range_size = setting.download_range_size
+        verified_size = 0
+        try:
+            offset = verified_size = os.fstat(part_fd).st_size
+
+            # the first range also tells the file size and whether the part is still valid,
+            # its body is decoded into the part file while it arrives
+            first_sink = RangeFileSink(part_fd, offset)
+            try:
+                data_offset, _, file_size = self._fetch_range_with_retries(
+                    file_info, offset, offset + range_size - 1, setting, current_session, transfer_meter,
+                    body_sink=first_sink,
+                )
+                if self._restart_part_file(part_fd, offset, file_size):
+                    first_sink = RangeFileSink(part_fd, 0)
+                    data_offset, _, file_size = self._fetch_range_with_retries(
+                        file_info, 0, range_size - 1, setting, current_session, transfer_meter,
+                        body_sink=first_sink,
                     )
+            finally:
+                # what was written is a valid prefix even if the body was cut off;
+                # a 200 answer, the whole file, rewrote the part from offset 0
+                verified_size = first_sink.end
+            # only what is not on disk yet travels, the first range is already counted
+            transfer_meter.add_total(file_size - data_offset)
 
-            # 3. cache mechanism: check local file & hash
-            # if local file exists and hash matches, skip download
-            # if local file exists but hash doesn't match, raise error
-            # TODO: more ways to handle file conflict
-            actual_download_file_info_list: list[SingleFile] = []
-            for file_info in request_download_file_info_list:
-                local_file_path = (
-                    layer_request_interface.setting.local_file_dir + file_info.file_name
+            # fetch the rest, completed ranges are tracked to keep the prefix contiguous
+            range_list = self._plan_file_ranges(verified_size, file_size, range_size)
+            outcome_dict = {}
+            if range_list:
+                concurrency = self._get_transfer_concurrency(
+                    setting.download_range_concurrency, len(range_list)
                 )
-                if os.path.exists(local_file_path):
-                    local_file_hash = self.local_file_backend.get_file_hash(
-                        local_file_path
+                # the rest of the file is received straight into a mapping of the part file
+                self.local_file_backend.preallocate_file(part_fd, file_size)
+                with mmap.mmap(part_fd, file_size) as part_map, memoryview(part_map) as part_view:
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        future_dict = {
+                            executor.submit(
+                                self._fetch_range_into_file,
+                                part_view,
+                                file_info,
+                                first,
+                                last,
+                                setting,
+                                current_session,
+                                transfer_meter,
+                            ): first
+                            for first, last in range_list
+                        }
+                        for future in as_completed(future_dict):
+                            if future.cancelled():
+                                continue
+                            try:
+                                future.result()
+                                outcome_dict[future_dict[future]] = None
+                            except Exception as e:
+                                outcome_dict[future_dict[future]] = e
+                                # stop queued ranges, running ones still finish
+                                for pending_future in future_dict:
+                                    pending_future.cancel()
+            verified_size, fetch_whole_file = self._settle_later_ranges(
+                range_list, outcome_dict, verified_size, file_size, transfer_meter
+            )
+            if fetch_whole_file:
+                whole_sink = RangeFileSink(part_fd, 0)
+                try:
+                    self._fetch_range_with_retries(
+                        file_info, 0, file_size - 1, setting, current_session, transfer_meter,
+                        body_sink=whole_sink,
                     )
-                    if local_file_hash == file_info.file_hash:
-                        # skip download
-                        continue
-                    else:
-                        raise RuntimeError(
-                            f"Local file '{file_info.file_name}' exists but has hash mismatch."
+                finally:
+                    verified_size = whole_sink.end
+        finally:
+            os.ftruncate(part_fd, verified_size)
+            os.close(part_fd)
+
+        self._finish_part_file(file_info, part_file_path, local_file_path)
+
+    def _fetch_range_into_file(
+        self,
+        part_view: memoryview,
+        file_info: SingleFile,
+        first: int,
+        last: int,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+    ) -> None:
+        """Fetch one range into its place in the memory-mapped part file.
+
+        The body is received with recv_into right into the mapping, the data
+        is never copied in user space. A chunked or compressed body is
+        decoded into the mapping as it arrives.
+        """
+        # released on return, the mapping cannot be closed while views of it are alive
+        with part_view[first:last + 1] as range_view:
+            data_offset, data, _ = self._fetch_range_with_retries(
+                file_info, first, last, setting, current_session, transfer_meter, range_view,
+                partial_only=True,
+            )
+            self._check_later_range(first, data_offset, data)
+
+    def _download_single_file(
+        self, file_info: SingleFile, setting: Setting, current_session: Session, transfer_meter: TransferMeter
+    ) -> None:
+        """Download one file, verify it and write it to the local file directory."""
+        transfer_meter.check_cancelled()
+        local_file_path = setting.local_file_dir + file_info.file_name
+        if setting.file_transfer_mode == FileTransferMode.BINARY:
+            self._download_single_file_ranged(file_info, setting, current_session, transfer_meter)
+        else:
+            response = self.http_client.handle_request(
+                self._build_json_download_request(file_info, setting, current_session, transfer_meter)
+            )
+            file_bytes = self._parse_json_download_response(file_info, response)
+            self._save_downloaded_file(file_info, file_bytes, local_file_path)
+        # the verified hash is the server's ETag, later views revalidate with it
+        self._record_local_validator(local_file_path, file_info.file_hash)
+
+    def _download_files_parallel(
+        self,
+        file_info_list: list[SingleFile],
+        layer_request_interface: FileDownloadInterface,
+    ) -> FileDownloadResult:
+        """Download files with a bounded pool of workers, one request per file.
+
+        Each worker writes its file as soon as it arrives. Progress is reported
+        from the calling thread as files complete.
+        """
+        setting = layer_request_interface.setting
+        current_session = layer_request_interface.current_session
+        progress_callback = layer_request_interface.progress_callback
+        downloaded_file_name_list = []
+        error_message_list = []
+        if not file_info_list:
+            return FileDownloadResult(download_success=True, downloaded_file_name_list=[])
+
+        # the total grows as ranged downloads learn the file sizes
+        transfer_meter = TransferMeter(
+            layer_request_interface.byte_progress_callback, layer_request_interface.cancel_event
+        )
+        concurrency = self._get_transfer_concurrency(setting.download_concurrency, len(file_info_list))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            future_dict = {
+                executor.submit(
+                    self._download_single_file, file_info, setting, current_session, transfer_meter
+                ): file_info
+                for file_info in file_info_list
+            }
+            for future in as_completed(future_dict):
+                file_info = future_dict[future]
+                error_message = None
+                try:
+                    future.result()
+                    downloaded_file_name_list.append(file_info.file_name)
+                except Exception as e:
+                    error_message = f"Failed to download '{file_info.file_name}': {str(e)}"
+                    error_message_list.append(error_message)
+
+                if progress_callback is not None:
+                    progress_callback(
+                        FileTransferProgress(
+                            file_name=file_info.file_name,
+                            transfer_success=error_message is None,
+                            error_message=error_message,
+                            finished_file_count=len(downloaded_file_name_list) + len(error_message_list),
+                            total_file_count=len(file_info_list),
                         )
-                else:
-                    # add to download list
-                    actual_download_file_info_list.append(file_info)
+                    )
+
+        return self._make_transfer_result(
+            FileDownloadResult, downloaded_file_name_list, error_message_list
+        )
 
-            # 4. download files
-            download_request_body = FileServerRequestAPI(
-                request_type=FileServerRequestType.DOWNLOAD_FILE,
-                request_download_file_list=actual_download_file_info_list,
+    def _upload_file_batch_json(
+        self,
+        file_info_list: list[SingleFile],
+        file_path_dict: dict[str, str],
+        server_file_hash_dict: dict[str, str],
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+    ) -> list[str]:
+        """Upload several files in one JSON request, base64 encoded.
+
+        Returns the names of files that turned out to be on the server already.
+        """
+        payload, uploaded_file_info_list, already_cached_file_name_list = (
+            self._build_json_upload_payload(file_info_list, file_path_dict, server_file_hash_dict)
+        )
+        if uploaded_file_info_list:
+            transfer_meter.check_cancelled()
+            response = self.http_client.handle_request(
+                self._build_json_upload_request(payload, setting, current_session, transfer_meter)
             )
+            self._check_uploaded_files(response, uploaded_file_info_list)
+        return already_cached_file_name_list
 
-            # fetch http request template
-            setting = layer_request_interface.setting
-            current_session = replace(layer_request_interface.current_session)
-            http_request = replace(setting.http_request_template)
-            http_request.url = setting.file_service_url
-            http_request.method = "POST"
-            http_request.server_connection = current_session.session_server_info
-            http_request.cookie = current_session.session_token
-            http_request.payload_type = HTTPPayloadType.JSON
-            http_request.payload_bytes, http_request.content_length_before_encoding = (
-                encode_file_api_to_json(download_request_body)
-            )
-            http_request.allow_redirects = True
-            http_request.maintain_session_during_redirects = True
-            # handle request
-            response = self.http_client.handle_request(http_request)
-            # Check response status
-            if response.vaild_response:
-                if response.http_response.status_code == 200:
-                    response_data = json.loads(
-                        response.http_response.payload_bytes.decode("utf-8")
+    def _run_upload_task(
+        self,
+        task: list[SingleFile],
+        file_path_dict: dict[str, str],
+        file_size_dict: dict[str, int],
+        server_file_hash_dict: dict[str, str],
+        memory_budget: ByteBudget,
+        setting: Setting,
+        current_session: Session,
+        transfer_meter: TransferMeter,
+    ) -> list[str]:
+        """Upload one task, holding its share of the memory budget while it runs.
+
+        Returns the names of files that turned out to be on the server already.
+        """
+        transfer_meter.check_cancelled()
+        if self._is_streamed_upload_task(task, file_size_dict, setting):
+            # streamed from disk, only a read block is held in memory
+            response = self.http_client.handle_request(
+                self._build_binary_upload_request(
+                    task[0], file_path_dict[task[0].file_name], setting, current_session, transfer_meter
+                )
+            )
+            self._check_uploaded_files(response, task)
+            return []
+
+        reserved_size = memory_budget.acquire(self._get_json_upload_memory_size(task, file_size_dict))
+        try:
+            return self._upload_file_batch_json(
+                task, file_path_dict, server_file_hash_dict, setting, current_session, transfer_meter
+            )
+        finally:
+            memory_budget.release(reserved_size)
+
+    def _upload_files_parallel(
+        self,
+        file_info_list: list[SingleFile],
+        file_path_dict: dict[str, str],
+        file_size_dict: dict[str, int],
+        server_file_hash_dict: dict[str, str],
+        layer_request_interface: FileUploadInterface,
+        already_cached_file_name_list: list[str],
+    ) -> FileUploadResult:
+        """Upload files with a bounded pool of workers, packing small files into batches.
+
+        Files in JSON batches are only hashed while they are encoded, so the
+        tasks report back which of them the server already had.
+        """
+        setting = layer_request_interface.setting
+        current_session = layer_request_interface.current_session
+        progress_callback = layer_request_interface.progress_callback
+        uploaded_file_name_list = []
+        error_message_list = []
+        finished_file_count = 0
+
+        task_list = self._plan_upload_tasks(file_info_list, file_size_dict, setting)
+        if not task_list:
+            return FileUploadResult(
+                upload_success=True,
+                uploaded_file_name_list=[],
+                already_uploaded_file_name_list=already_cached_file_name_list,
+            )
+
+        memory_budget = ByteBudget(setting.upload_memory_limit)
+        transfer_meter = TransferMeter(
+            layer_request_interface.byte_progress_callback,
+            layer_request_interface.cancel_event,
+            self._get_upload_transfer_size(file_info_list, file_size_dict, setting),
+            TransferDirection.UPLOAD,
+        )
+        concurrency = self._get_transfer_concurrency(setting.upload_concurrency, len(task_list))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            future_dict = {
+                executor.submit(
+                    self._run_upload_task,
+                    task,
+                    file_path_dict,
+                    file_size_dict,
+                    server_file_hash_dict,
+                    memory_budget,
+                    setting,
+                    current_session,
+                    transfer_meter,
+                ): task
+                for task in task_list
+            }
+            for future in as_completed(future_dict):
+                task = future_dict[future]
+                error_message = None
+                try:
+                    task_cached_file_name_list = future.result()
+                    already_cached_file_name_list.extend(task_cached_file_name_list)
+                    uploaded_file_name_list.extend(
+                        file_info.file_name
+                        for file_info in task
+                        if file_info.file_name not in task_cached_file_name_list
                     )
-                    if (
-                        "request_success" in response_data
-                        and response_data["request_success"]
-                    ):
-                        # save file to local
-                        actual_download_file_name_list = []
-                        for file_info in actual_download_file_info_list:
-                            local_file_path = (
-                                layer_request_interface.setting.local_file_dir
-                                + file_info.file_name
-                            )
-                            # find downloaded file in response
-                            downloaded_file_list = response_data.get("request_data", [])
-                            downloaded_file = next(
-                                (
-                                    file
-                                    for file in downloaded_file_list
-                                    if file["file_name"] == file_info.file_name
-                                ),
-                                None,
-                            )
-                            if downloaded_file is None:
-                                raise RuntimeError(
-                                    f"Downloaded file '{file_info.file_name}' not found in response."
-                                )
-
-                            # because json cannot serialize bytes, here the file is transferred as to base64 code, then ascii string
-                            # so need to decode it to bytes
-                            file_bytes_base64 = downloaded_file["file_data"].encode(
-                                "ascii"
-                            )
-                            file_bytes = base64.b64decode(file_bytes_base64)
+                except Exception as e:
+                    file_names = ", ".join(f"'{file_info.file_name}'" for file_info in task)
+                    error_message = f"Failed to upload {file_names}: {str(e)}"
+                    error_message_list.append(error_message)
 
-                            self.local_file_backend.save_file(
-                                local_file_path, file_bytes
-                            )
-                            actual_download_file_name_list.append(file_info.file_name)
-                        return FileDownloadResult(
-                            download_success=True,
-                            downloaded_file_name_list=actual_download_file_name_list,
-                        )
-                    else:
-                        return FileDownloadResult(
-                            download_success=False,
-                            error_message=f"Failed to download files from server: {response_data.get('error_message', 'Unknown error')}",
+                if progress_callback is None:
+                    finished_file_count += len(task)
+                    continue
+                for file_info in task:
+                    finished_file_count += 1
+                    progress_callback(
+                        FileTransferProgress(
+                            file_name=file_info.file_name,
+                            transfer_success=error_message is None,
+                            error_message=error_message,
+                            finished_file_count=finished_file_count,
+                            total_file_count=len(file_info_list),
                         )
-                else:
-                    # try to handle common http error
-                    error_message = handle_common_http_error(
-                        response.http_response.status_code
                     )
-                    if error_message is None:
-                        error_message = "Unknown error"
-                    return FileDownloadResult(
-                        download_success=False,
-                        error_message="Failed to download files from server."
-                        + error_message,
-                    )
-            else:
+
+        return self._make_transfer_result(
+            FileUploadResult, uploaded_file_name_list, error_message_list, already_cached_file_name_list
+        )
+
+    def fetch_server_file_list(
+        self, layer_request_interface: FetchServerFileInterface
+    ) -> ServerFileList:
+        try:
+            request = self._build_file_list_request(
+                layer_request_interface.setting, layer_request_interface.current_session
+            )
+            response = self.http_client.handle_request(request)
+            return self._parse_file_list_response(response)
+        except Exception as e:
+            return ServerFileList(
+                valid_list=False,
+                error_message=f"Error fetching server file list: {str(e)}",
+            )
+
+    def fetch_server_file_page(
+        self, layer_request_interface: FetchServerFilePageInterface
+    ) -> ServerFileList:
+        """Fetch one page of the server file list, sorted and filtered on the server.
+
+        Pass the `next_page_token` of a page to get the one after it. The
+        cursor of the first page can be kept with the pages fetched after
+        it to refresh the whole list with `fetch_server_file_changes`.
+        """
+        try:
+            request = self._build_file_page_request(
+                layer_request_interface.setting,
+                layer_request_interface.current_session,
+                layer_request_interface,
+            )
+            response = self.http_client.handle_request(request)
+            return self._parse_file_page_response(response)
+        except Exception as e:
+            return ServerFileList(
+                valid_list=False,
+                error_message=f"Error fetching server file list page: {str(e)}",
+            )
+
+    def fetch_server_file_changes(
+        self, layer_request_interface: FetchServerFileChangesInterface
+    ) -> ServerFileListDelta:
+        """Fetch what changed on the server since the cached list and apply it.
+
+        Only the changed entries travel, so refreshing a large directory
+        costs bytes in proportion to the changes. Without a cached list, or
+        if the server can no longer tell the changes since its cursor, the
+        whole list comes back and the changes are computed from it.
+        """
+        cached_file_list = layer_request_interface.cached_file_list
+        if cached_file_list is not None and not cached_file_list.valid_list:
+            cached_file_list = None
+        try:
+            request = self._build_file_changes_request(
+                layer_request_interface.setting,
+                layer_request_interface.current_session,
+                None if cached_file_list is None else cached_file_list.cursor,
+            )
+            response = self.http_client.handle_request(request)
+            return self._parse_file_changes_response(response, cached_file_list)
+        except Exception as e:
+            return ServerFileListDelta(
+                valid_delta=False,
+                error_message=f"Error fetching server file changes: {str(e)}",
+            )
+
+    def stat_remote_files(
+        self, layer_request_interface: FileStatInterface
+    ) -> FileStatResult:
+        """Fetch the size, hash and modification time of server files.
+
+        One HEAD request per file, pipelined on one connection, so only the
+        requested files are looked at on the server.
+        """
+        try:
+            setting = layer_request_interface.setting
+            current_session = layer_request_interface.current_session
+            if setting is None or current_session is None:
+                raise RuntimeError("Setting or current session is None. Have you logged in?")
+            file_name_list = layer_request_interface.file_name_list or []
+            response_list = self.http_client.handle_requests([
+                self._build_stat_request(file_name, setting, current_session)
+                for file_name in file_name_list
+            ])
+            return FileStatResult(
+                stat_success=True,
+                file_stat_list=[
+                    self._parse_stat_response(file_name, response)
+                    for file_name, response in zip(file_name_list, response_list)
+                ],
+            )
+        except Exception as e:
+            return FileStatResult(error_message=f"Error fetching file metadata: {str(e)}")
+
+    def stat_remote_file(
+        self, file_name: str, current_session: Session, setting: Setting
+    ) -> FileStatResult:
+        """Fetch the metadata of a single server file, see `stat_remote_files`."""
+        return self.stat_remote_files(FileStatInterface(
+            file_name_list=[file_name], current_session=current_session, setting=setting
+        ))
+
+    def fetch_file_preview(
+        self, layer_request_interface: FilePreviewInterface
+    ) -> FilePreviewResult:
+        """Fetch the first bytes of a server file with a range request."""
+        try:
+            response = self.http_client.handle_request(
+                self._build_preview_request(
+                    layer_request_interface.file_name,
+                    layer_request_interface.setting,
+                    layer_request_interface.current_session,
+                )
+            )
+            return self._parse_preview_response(response, layer_request_interface.setting)
+        except Exception as e:
+            return FilePreviewResult(error_message=f"Error fetching file preview: {str(e)}")
+
+    def download_file_batch(
+        self, layer_request_interface: FileDownloadInterface
+    ) -> FileDownloadResult:
+        """Download single file or multiple files from the server."""
+        try:
+            # check if the file name list is empty
+            if not layer_request_interface.file_name_list:
                 return FileDownloadResult(
                     download_success=False,
-                    error_message="Invalid response from server."
-                    + response.error_message,
+                    error_message="No file selected. Nothing to download.",
                 )
+
+            # 1. cache mechanism: revalidate local copies with conditional requests
+            # a 304 means the local file is current and is skipped
+            # if the server has a different version, raise error
+            # TODO: more ways to handle file conflict
+            setting = layer_request_interface.setting
+            local_file_name_list, missing_file_name_list = self._split_download_files(
+                layer_request_interface.file_name_list, setting
+            )
+            self._revalidate_local_files(
+                local_file_name_list, setting, layer_request_interface.current_session
+            )
+            if not missing_file_name_list:
+                return FileDownloadResult(download_success=True, downloaded_file_name_list=[])
+
+            # 2. get the hashes of the missing files, from their metadata if there are few
+            # 3. match download file from server file list
+            # if not found, raise error
+            if len(missing_file_name_list) <= METADATA_LOOKUP_MAX_FILES:
+                server_file_list = self._file_stat_to_server_list(self.stat_remote_files(FileStatInterface(
+                    file_name_list=missing_file_name_list,
+                    current_session=layer_request_interface.current_session,
+                    setting=setting,
+                )))
+            else:
+                server_file_list = self.fetch_server_file_list(FetchServerFileInterface(
+                    current_session=layer_request_interface.current_session,
+                    setting=setting,
+                ))
+            actual_download_file_info_list = self._match_download_files(
+                missing_file_name_list, server_file_list
+            )
+
+            # 4. download files, one request per file over concurrent connections
+            return self._download_files_parallel(
+                actual_download_file_info_list, layer_request_interface
+            )
         except Exception as e:
             return FileDownloadResult(
                 download_success=False,
@@ -368,143 +1785,47 @@ class FileService:
 
             # 2. match upload file from local files
             # if not found, raise error
-            # turn the path to absolute path
-            file_path_or_file_dir_path = os.path.abspath(
+            file_path_dict, file_size_dict = self._collect_upload_files(
                 layer_request_interface.file_path_or_file_dir_path
             )
-            # first check if the input is a file or a directory
-            if os.path.isfile(file_path_or_file_dir_path):
-                # if it's a file, just add it to the list
-                file_path_list = [file_path_or_file_dir_path]
-            elif os.path.isdir(file_path_or_file_dir_path):
-                # if it's a directory, get all files in the directory
-                file_path_list = []
-                for root, dirs, files in os.walk(file_path_or_file_dir_path):
-                    for file in files:
-                        file_path_list.append(os.path.join(root, file))
-                if len(file_path_list) == 0:
-                    raise RuntimeError(
-                        f"No files found in directory: {file_path_or_file_dir_path}. Nothing to upload."
-                    )
-            else:
-                raise RuntimeError(
-                    f"Not a valid file or directory: {file_path_or_file_dir_path}"
-                )
-
-            request_upload_file_info_list: list[SingleFile] = []
-            for file_path in file_path_list:
-                if not os.path.exists(file_path):
-                    raise RuntimeError(f"File not found on local: {file_path}")
-                else:
-                    # base64 encode the file to ascii string
-                    file_bytes = self.local_file_backend.load_file(file_path)
-                    file_bytes_base64 = base64.b64encode(file_bytes)
-                    file_bytes_ascii = file_bytes_base64.decode("ascii")
-                    # get file name(without path and with extension)
-                    file_name = os.path.basename(file_path)
-                    request_upload_file_info_list.append(
-                        SingleFile(
-                            file_name=file_name,
-                            file_hash=self.local_file_backend.get_file_hash(file_path),
-                            file_data=file_bytes_ascii,
-                        )
-                    )
 
             # 3. cache mechanism: check server file & hash
             # if server file exists and hash matches, skip upload
             # if server file exists but hash doesn't match, raise error
+            # streamed files are hashed here, in parallel; files sent in JSON batches
+            # are hashed while they are encoded, so they are read only once
             # TODO: more ways to handle file conflict
-            actual_upload_file_info_list: list[SingleFile] = []
-            already_cached_file_name_list = []
-            for file_info in request_upload_file_info_list:
-                if any(
-                    file.file_name == file_info.file_name
-                    for file in current_server_file_list.file_list
-                ):
-                    server_file_info = next(
-                        file
-                        for file in current_server_file_list.file_list
-                        if file.file_name == file_info.file_name
-                    )
-                    if server_file_info.file_hash == file_info.file_hash:
-                        # skip upload
-                        already_cached_file_name_list.append(file_info.file_name)
-                        continue
-                    else:
-                        raise RuntimeError(
-                            f"Server file '{file_info.file_name}' exists but has hash mismatch."
-                        )
-                else:
-                    # add to upload list
-                    actual_upload_file_info_list.append(file_info)
+            setting = layer_request_interface.setting
+            server_file_hash_dict = {
+                file.file_name: file.file_hash for file in current_server_file_list.file_list
+            }
+            streamed_file_name_list = [
+                file_name
+                for file_name in file_path_dict
+                if self._is_streamed_upload(file_size_dict[file_name], setting)
+            ]
+            with ThreadPoolExecutor(max_workers=max(1, setting.upload_concurrency)) as executor:
+                streamed_file_hash_dict = dict(zip(
+                    streamed_file_name_list,
+                    executor.map(
+                        self.local_file_backend.get_file_hash,
+                        [file_path_dict[file_name] for file_name in streamed_file_name_list],
+                    ),
+                ))
+            actual_upload_file_info_list, already_cached_file_name_list = (
+                self._classify_upload_files(file_path_dict, streamed_file_hash_dict, server_file_hash_dict)
+            )
 
-            # 4. upload files
-            upload_request_body = FileServerRequestAPI(
-                request_type=FileServerRequestType.UPLOAD_FILE,
-                request_upload_file_list=actual_upload_file_info_list,
+            # 4. upload files: large files one by one, small files packed in batches
+            return self._upload_files_parallel(
+                actual_upload_file_info_list,
+                file_path_dict,
+                file_size_dict,
+                server_file_hash_dict,
+                layer_request_interface,
+                already_cached_file_name_list,
             )
-            # fetch http request template
-            setting = layer_request_interface.setting
-            current_session = replace(layer_request_interface.current_session)
-            http_request = replace(setting.http_request_template)
-            http_request.url = setting.file_service_url
-            http_request.method = "POST"
-            http_request.server_connection = current_session.session_server_info
-            http_request.cookie = current_session.session_token
-            http_request.payload_type = HTTPPayloadType.JSON
-            http_request.payload_bytes, http_request.content_length_before_encoding = (
-                encode_file_api_to_json(upload_request_body)
-            )
-            http_request.allow_redirects = True
-            http_request.maintain_session_during_redirects = True
-
-            # handle request
-            response = self.http_client.handle_request(http_request)
-            # Check response status
-            if response.vaild_response:
-                if response.http_response.status_code == 200:
-                    response_data = json.loads(
-                        response.http_response.payload_bytes.decode("utf-8")
-                    )
-                    if (
-                        "request_success" in response_data
-                        and response_data["request_success"]
-                    ):
-                        # get uploaded file name list
-                        uploaded_file_name_list = []
-                        for file_info in response_data.get("request_data", []):
-                            uploaded_file_name_list.append(file_info["file_name"])
-                        return FileUploadResult(
-                            upload_success=True,
-                            uploaded_file_name_list=uploaded_file_name_list,
-                            already_uploaded_file_name_list=already_cached_file_name_list,
-                        )
-                    else:
-                        return FileUploadResult(
-                            upload_success=False,
-                            error_message=f"Failed to upload files to server: {response_data.get('error_message', 'Unknown error')}",
-                        )
-                else:
-                    # try to handle common http error
-                    error_message = handle_common_http_error(
-                        response.http_response.status_code
-                    )
-                    if error_message is None:
-                        error_message = "Unknown error"
-                    return FileUploadResult(
-                        upload_success=False,
-                        error_message="Failed to upload files to server."
-                        + error_message,
-                    )
-            else:
-                return FileUploadResult(
-                    upload_success=False,
-                    error_message="Invalid response from server."
-                    + response.error_message,
-                )
         except Exception as e:
             return FileUploadResult(
                 upload_success=False, error_message=f"Error uploading files: {str(e)}"
             )
-    
-    
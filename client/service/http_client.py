@@ -1,16 +1,15 @@
-import gzip
 import json
+import logging
+import os
 import re
-import select
 import socket
-import time
 import urllib.parse
-import zlib
 from base64 import b64encode
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Generator, Iterator, Optional, Tuple
 
 from domain.http_model import (HTTPConnectionConfigurations,
-                               HTTPContentEncoding,
+                               HTTPConnectionPoolConfigurations,
+                               HTTPContentEncoding, HTTPFileSegment,
                                HTTPLayerDecodingModuleInterface,
                                HTTPLayerEncodingModuleInterface,
                                HTTPLayerInterfaceRequest,
@@ -18,6 +17,46 @@ from domain.http_model import (HTTPConnectionConfigurations,
                                HTTPLayerTransmissionModuleInterface,
                                HTTPMethod, HTTPPayloadType, HTTPResponse,
                                HTTPServerAddress, HTTPTransferEncoding)
+from service.chunked_codec import ChunkedEncoder, decode_chunked, encode_chunked
+from service.connection_pool import HTTPConnectionPool
+from service.content_codec import compress_content, decompress_content, get_content_codec
+from service.http_response_reader import HTTPResponseReader
+from service.http_trace import HTTPRequestTrace, HTTPTraceHooks
+
+logger = logging.getLogger(__name__)
+
+# streamed request bodies are read from disk in blocks of this size
+STREAM_READ_SIZE = 65536
+# small buffers of a streamed request are batched into one sendmsg call
+STREAM_SEND_BATCH_SIZE = 262144
+STREAM_SEND_MAX_BUFFERS = 512  # well below IOV_MAX
+# only idempotent requests without a streamed body are pipelined, so
+# sending one again after the server closed without answering is harmless
+PIPELINE_METHODS = (HTTPMethod.GET, HTTPMethod.HEAD)
+# at most this many pipelined requests are in flight, so they always fit in
+# the socket send buffer while the server is blocked writing responses
+PIPELINE_MAX_DEPTH = 32
+# files and large request buffers are sent in slices of this size, so transfer callbacks see progress
+STREAM_SEND_SLICE_SIZE = 4 * 1024 * 1024
+
+
+class TransferCancelled(Exception):
+    """Raised from a transfer callback to abort the request in flight."""
+
+
+def skip_request_head(send_callback: Callable[[int], None], head_size: int) -> Callable[[int], None]:
+    """Wrap a send callback so it only sees the bytes sent after the first `head_size`, the request body."""
+    if send_callback is None:
+        return None
+    head_left = head_size
+
+    def on_sent(size: int) -> None:
+        nonlocal head_left
+        skipped = min(size, head_left)
+        head_left -= skipped
+        if size > skipped:
+            send_callback(size - skipped)
+    return on_sent
 
 
 def handle_common_http_error(status_code: int) -> str:
@@ -63,6 +102,20 @@ def parse_http_url(url: str) -> str:
         raise ValueError("URL contains unsafe characters and already encoded characters, please check the URL")
     return result
 
+def parse_content_range(content_range: str) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Parse a `Content-Range: bytes first-last/total` header.
+
+    Total is None if unknown; first and last are None for `bytes */total`,
+    the form used by 416 responses.
+    """
+    match = re.fullmatch(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', (content_range or '').strip())
+    if match is None:
+        raise ValueError(f"Invalid Content-Range: {content_range}")
+    first, last, total = match.groups()
+    return (None if first is None else int(first),
+            None if last is None else int(last),
+            None if total == '*' else int(total))
+
 def get_http_main_content_type(content_type: str) -> str:
     """Get the main content type from the content type string."""
     if content_type:
@@ -112,156 +165,146 @@ def get_http_main_content_type(content_type: str) -> str:
 #         """Close the HTTP client."""
 #         await self.client.aclose()
 
-class HttpClientSocket:
-    """HTTP client with low-level implementation for socket communication."""
-    # TODO: HTTPS support
-    # TODO: Keep-alive support
-    # for now use stateless connection
-    
-    def __init__(self):
-        # support single connection keep-alive for now
-        # TODO: connection pool
-        self.persistent_socket = None
-        self.current_server: HTTPServerAddress = None
-        self.socket_timeout = 5  # seconds
-    
-    def handle_request(self, layer_request_interface: HTTPLayerInterfaceRequest) -> HTTPLayerInterfaceResponse:
-        """Handle the HTTP request and return the response, including redirection handling."""
-        try:
-            # get redirection demands
-            allow_redirects = layer_request_interface.allow_redirects
-            max_redirects = layer_request_interface.max_redirects
-            maintain_session_during_redirects = layer_request_interface.maintain_session_during_redirects
-            last_cookie = layer_request_interface.cookie
+class HTTPClientBase:
+    """Transport-independent part of the HTTP clients.
+
+    Encoding, decoding and the redirect logic do no I/O, so the blocking
+    socket client and the asyncio client share them and only differ in how
+    the bytes travel.
+    """
+
+    def _redirect_steps(self, layer_request_interface: HTTPLayerInterfaceRequest, trace: HTTPRequestTrace = None) -> Generator[HTTPLayerInterfaceRequest, HTTPLayerInterfaceResponse, HTTPLayerInterfaceResponse]:
+        """Drive a request through its redirects.
+
+        Yields each request to send and expects its response back via `send`.
+        The final response is the generator's return value.
+        """
+        # get redirection demands
+        allow_redirects = layer_request_interface.allow_redirects
+        max_redirects = layer_request_interface.max_redirects
+        maintain_session_during_redirects = layer_request_interface.maintain_session_during_redirects
+        last_cookie = layer_request_interface.cookie
 
-            # get the first response
-            response = self.handle_single_request(layer_request_interface)
+        # get the first response
+        response = yield layer_request_interface
 
+        # check if redirection is needed
+        if not response.vaild_response:
+            # if response is not valid, return the error message
+            return response
+        elif response.http_response.status_code not in [301, 302, 303, 307, 308]:
+            # no redirection needed
+            return response
+
+        # if redirection is needed, check if allowed
+        if not allow_redirects:
+            response.vaild_response = False
+            response.error_message = "Redirection is needed, but not allowed"
+            return response
+
+        # start redirection loop
+        redirect_count = 0
+        while redirect_count < max_redirects:
             # check if redirection is needed
-            if not response.vaild_response:
-                # if response is not valid, return the error message
-                return response
-            elif response.http_response.status_code not in [301, 302, 303, 307, 308]:
-                # no redirection needed
-                return response
+            if response.http_response.location:
+                # get the new URL
+                new_url = response.http_response.location
+                if trace is not None:
+                    trace.redirect(response.http_response.status_code, new_url)
+
+                # create a new request interface
+                layer_request_interface.url = new_url
+                
+                # if maintain_session_during redirects is enabled, copy the session cookies
+                if maintain_session_during_redirects:
+                    # if the response has set-cookie header, update the cookies
+                    if response.http_response.set_cookie != None:
+                        logger.debug("Updating cookies during redirection")
+                        last_cookie = response.http_response.set_cookie
+                        layer_request_interface.cookie = last_cookie
 
-            # if redirection is needed, check if allowed
-            if not allow_redirects:
-                response.vaild_response = False
-                response.error_message = "Redirection is needed, but not allowed"
-                return response
+                # handle the new request
+                response = yield layer_request_interface
 
-            # start redirection loop
-            redirect_count = 0
-            while redirect_count < max_redirects:
                 # check if redirection is needed
-                if response.http_response.location:
-                    # get the new URL
-                    new_url = response.http_response.location
-                    print(f"Redirecting to: {new_url}")
-
-                    # create a new request interface
-                    layer_request_interface.url = new_url
-                    
-                    # if maintain_session_during redirects is enabled, copy the session cookies
-                    if maintain_session_during_redirects:
-                        # if the response has set-cookie header, update the cookies
-                        if response.http_response.set_cookie != None:
-                            print(f"Updating cookies: {response.http_response.set_cookie}")
-                            last_cookie = response.http_response.set_cookie
-                            layer_request_interface.cookie = last_cookie
-
-                    # handle the new request
-                    response = self.handle_single_request(layer_request_interface)
-
-                    # check if redirection is needed
-                    if not response.vaild_response:
-                        response.error_message = f"Error during redirection: {response.error_message}"
-                        return response
-
-                    redirect_count += 1
-                else:
-                    # this guarantees that the response is 1. valid and 2. not a redirection
-                    # but before returning, apply the last cookie
-                    if (not response.http_response.set_cookie) and (last_cookie is not None) and (layer_request_interface.maintain_session_during_redirects):
-                        print(f"Applying last cookie: {last_cookie}")
-                        response.http_response.set_cookie = last_cookie
-                    
-                    # return the response
+                if not response.vaild_response:
+                    response.error_message = f"Error during redirection: {response.error_message}"
                     return response
 
-            # if max redirects reached, return the response
-            response.vaild_response = False
-            response.error_message = f"Max redirect count reached: {max_redirects}"
-            return response
-        except Exception as e:
-            print(f"Error handling request: {e}")
-            return HTTPLayerInterfaceResponse(
-                http_response=None,
-                vaild_response=False,
-                error_message="Error handling request: " + str(e)
-            )
-        
-    def handle_single_request(self, layer_request_interface: HTTPLayerInterfaceRequest) -> HTTPLayerInterfaceResponse:
-        """Handle a single HTTP request and return the response without performing redirection."""
-        # Encode the request
-        try:
-            request_interface = HTTPLayerEncodingModuleInterface(
-                url=layer_request_interface.url,
-                method=layer_request_interface.method,
-                host=layer_request_interface.server_connection.host_ip,
-                version=layer_request_interface.version,
-                connection_keep_alive=layer_request_interface.connection_keep_alive,
-                cookie=layer_request_interface.cookie,
-                user_agent=layer_request_interface.user_agent,
-                accept=layer_request_interface.accept,
-                accept_encoding=layer_request_interface.accept_encoding,
-                content_encoding=layer_request_interface.content_encoding,
-                content_length_before_encoding=layer_request_interface.content_length_before_encoding,
-                transfer_encoding=layer_request_interface.transfer_encoding,
-                transfer_encoding_chunk_size=layer_request_interface.transfer_encoding_chunk_size,
-                payload_type=layer_request_interface.payload_type,
-                payload_bytes=layer_request_interface.payload_bytes,
-            )
+                redirect_count += 1
+            else:
+                # this guarantees that the response is 1. valid and 2. not a redirection
+                # but before returning, apply the last cookie
+                if (not response.http_response.set_cookie) and (last_cookie is not None) and (layer_request_interface.maintain_session_during_redirects):
+                    logger.debug("Applying the last cookie of the redirection")
+                    response.http_response.set_cookie = last_cookie
+                
+                # return the response
+                return response
+
+        # if max redirects reached, return the response
+        response.vaild_response = False
+        response.error_message = f"Max redirect count reached: {max_redirects}"
+        return response
+
+    def _encode_layer_request(self, layer_request_interface: HTTPLayerInterfaceRequest) -> HTTPLayerTransmissionModuleInterface:
+        """Encode a request from the upper layer into what the transmission needs. Raises ValueError."""
+        request_interface = HTTPLayerEncodingModuleInterface(
+            url=layer_request_interface.url,
+            method=layer_request_interface.method,
+            host=layer_request_interface.server_connection.host_ip,
+            version=layer_request_interface.version,
+            connection_keep_alive=layer_request_interface.connection_keep_alive,
+            cookie=layer_request_interface.cookie,
+            user_agent=layer_request_interface.user_agent,
+            accept=layer_request_interface.accept,
+            accept_encoding=layer_request_interface.accept_encoding,
+            range=layer_request_interface.range,
+            if_range=layer_request_interface.if_range,
+            if_none_match=layer_request_interface.if_none_match,
+            if_modified_since=layer_request_interface.if_modified_since,
+            content_encoding=layer_request_interface.content_encoding,
+            content_encoding_level=layer_request_interface.content_encoding_level,
+            content_length_before_encoding=layer_request_interface.content_length_before_encoding,
+            transfer_encoding=layer_request_interface.transfer_encoding,
+            transfer_encoding_chunk_size=layer_request_interface.transfer_encoding_chunk_size,
+            payload_type=layer_request_interface.payload_type,
+            payload_bytes=layer_request_interface.payload_bytes,
+            payload_file_path=layer_request_interface.payload_file_path,
+        )
+        if request_interface.payload_file_path is not None:
+            # stream the payload from disk instead of building the request in memory
+            encoded_request = None
+            encoded_request_stream = self._encode_request_stream(request_interface)
+            # the head is the first buffer of the stream, taken before any file is opened
+            request_head_size = len(next(encoded_request_stream()))
+        else:
             encoded_request = self._encode_request(request_interface)
-        except ValueError as e:
-            print(f"Error encoding request: {e}")
-            return HTTPLayerInterfaceResponse(
-                http_response=None,
-                vaild_response=False,
-                error_message="Error encoding request:" + str(e)
-            )
+            encoded_request_stream = None
+            request_head_size = encoded_request.find(b'\r\n\r\n') + 4
+
+        return HTTPLayerTransmissionModuleInterface(
+            encoded_request=encoded_request,
+            encoded_request_stream=encoded_request_stream,
+            timeout=layer_request_interface.timeout,
+            max_retries=layer_request_interface.max_retries,
+            server=layer_request_interface.server_connection,
+            keep_alive=layer_request_interface.connection_keep_alive,
+            request_method=layer_request_interface.method,
+            request_head_size=request_head_size,
+            send_callback=layer_request_interface.send_callback,
+            receive_callback=layer_request_interface.receive_callback,
+            response_body_buffer=layer_request_interface.response_body_buffer,
+            response_body_sink=layer_request_interface.response_body_sink,
+            partial_response_only=layer_request_interface.partial_response_only,
+        )
 
-        # Create a transmission interface and send the request
+    def _decode_layer_response(self, response_interface: HTTPLayerDecodingModuleInterface) -> HTTPLayerInterfaceResponse:
+        """Decode a received response into the response for the upper layer."""
         try:
-            transmission_interface = HTTPLayerTransmissionModuleInterface(
-                encoded_request=encoded_request,
-                timeout=layer_request_interface.timeout,
-                max_retries=layer_request_interface.max_retries,
-                server=layer_request_interface.server_connection,
-            )
-            response = self._transmit_request(transmission_interface)
-        except TimeoutError as e:
-            print(f"Error sending request: {e}")
-            return HTTPLayerInterfaceResponse(
-                http_response=None,
-                vaild_response=False,
-                error_message="Error sending request: " + str(e)
-            )
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            return HTTPLayerInterfaceResponse(
-                http_response=None,
-                vaild_response=False,
-                error_message="Unexpected error: " + str(e)
-            )
-        
-        # Decode the response
-        try:
-            decoded_response = self._decode_response(HTTPLayerDecodingModuleInterface(
-                response_raw_data=response,))
+            decoded_response = self._decode_response(response_interface)
         except Exception as e:
-            print(f"Error decoding response: {e}")
+            logger.debug("Error decoding response: %s", e)
             return HTTPLayerInterfaceResponse(
                 http_response=None,
                 vaild_response=False,
@@ -272,20 +315,14 @@ class HttpClientSocket:
             vaild_response=True,
             error_message=None
         )
-    
-    def _encode_request(self, encoding_interface: HTTPLayerEncodingModuleInterface) -> bytes:
-        """Encode the HTTP request to bytes."""
+
+    def _encode_request_head(self, encoding_interface: HTTPLayerEncodingModuleInterface) -> tuple[str, str]:
+        """Encode the request line and the headers that do not depend on the payload."""
         # parse the URL
         parsed_url = parse_http_url(encoding_interface.url)
         
-        
         request_line = f"{encoding_interface.method} {parsed_url} {encoding_interface.version}\r\n"
         headers = f"Host: {encoding_interface.host}\r\n"
-        body_bytes_pretransfer = None # payload before applying transfer encoding
-        body_content_encoded = None # payload after applying content encoding
-        body_transfer_encoded = None # payload after applying transfer encoding
-        content_length = 0
-        has_payload = False
         
         if encoding_interface.connection_keep_alive:
             headers += "Connection: keep-alive\r\n"
@@ -304,6 +341,28 @@ class HttpClientSocket:
         if encoding_interface.accept_encoding:
             headers += f"Accept-Encoding: {encoding_interface.accept_encoding}\r\n"
 
+        if encoding_interface.range:
+            headers += f"Range: {encoding_interface.range}\r\n"
+            if encoding_interface.if_range:
+                headers += f"If-Range: {encoding_interface.if_range}\r\n"
+
+        if encoding_interface.if_none_match:
+            headers += f"If-None-Match: {encoding_interface.if_none_match}\r\n"
+
+        if encoding_interface.if_modified_since:
+            headers += f"If-Modified-Since: {encoding_interface.if_modified_since}\r\n"
+        
+        return request_line, headers
+    
+    def _encode_request(self, encoding_interface: HTTPLayerEncodingModuleInterface) -> bytes:
+        """Encode the HTTP request to bytes."""
+        request_line, headers = self._encode_request_head(encoding_interface)
+        body_bytes_pretransfer = None # payload before applying transfer encoding
+        body_content_encoded = None # payload after applying content encoding
+        body_transfer_encoded = None # payload after applying transfer encoding
+        content_length = 0
+        has_payload = False
+
         if encoding_interface.payload_type != None:
             has_payload = True
             headers += f"Content-Type: {encoding_interface.payload_type}\r\n"
@@ -331,19 +390,17 @@ class HttpClientSocket:
             # Apply content encoding
             if encoding_interface.content_encoding != None:
                 headers += f"Content-Encoding: {encoding_interface.content_encoding}\r\n"
-                match encoding_interface.content_encoding:
-                    case HTTPContentEncoding.GZIP:
-                        print("Applying content encoding: gzip")
-                        body_content_encoded = gzip.compress(body_bytes_pretransfer)
-                    case HTTPContentEncoding.DEFLATE:
-                        # TODO: deflate encoding
-                        raise NotImplementedError("Deflate encoding is not implemented yet")
-                    case HTTPContentEncoding.IDENTITY:
-                        print("Applying content encoding: identity")
-                        # No encoding applied
-                        body_content_encoded = body_bytes_pretransfer
-                    case _:
-                        raise ValueError(f"Unsupported content encoding: {encoding_interface.content_encoding}")
+                logger.debug("Applying content encoding: %s", encoding_interface.content_encoding)
+                if encoding_interface.content_encoding == HTTPContentEncoding.IDENTITY:
+                    # No encoding applied
+                    body_content_encoded = body_bytes_pretransfer
+                else:
+                    # raises ValueError for codings that are unknown or not installed
+                    body_content_encoded = compress_content(
+                        body_bytes_pretransfer,
+                        encoding_interface.content_encoding,
+                        encoding_interface.content_encoding_level,
+                    )
                 
                 # update content length
                 content_length = len(body_content_encoded)
@@ -353,7 +410,7 @@ class HttpClientSocket:
             
             # Apply transfer encoding
             if encoding_interface.transfer_encoding != None:
-                print(f"Applying transfer encoding: {encoding_interface.transfer_encoding}")
+                logger.debug("Applying transfer encoding: %s", encoding_interface.transfer_encoding)
                 
                 headers += f"Transfer-Encoding: {encoding_interface.transfer_encoding}\r\n"
                 
@@ -363,10 +420,9 @@ class HttpClientSocket:
                         body_transfer_encoded = body_content_encoded
                     case HTTPTransferEncoding.CHUNKED:
                         # Apply chunked transfer encoding
-                        body_transfer_encoded = self._apply_chunked_transfer_encoding(body_content_encoded, max_chunk_size=encoding_interface.transfer_encoding_chunk_size)
+                        body_transfer_encoded = encode_chunked(body_content_encoded, max_chunk_size=encoding_interface.transfer_encoding_chunk_size)
                     case _:
                         raise ValueError(f"Unsupported transfer encoding: {encoding_interface.transfer_encoding}")
-                    # TODO: at least add chunked
                 
                 # update content length
                 content_length = len(body_transfer_encoded)
@@ -383,10 +439,9 @@ class HttpClientSocket:
         # combine request line, headers and body
         request = request_line + headers
         
-        if body_bytes_pretransfer:
-            print(request+body_bytes_pretransfer.decode())
-        else:
-            print(request)
+        # headers may carry cookies and the payload may be large or binary, only log the request line
+        logger.debug("Encoded request: %s with %d bytes payload",
+                     request_line.strip(), len(body_bytes_pretransfer or b""))
         
         header_bytes = request.encode()
         if has_payload:
@@ -395,180 +450,77 @@ class HttpClientSocket:
             request_bytes = header_bytes
         return request_bytes
     
-    def _apply_chunked_transfer_encoding(self, data: bytes, max_chunk_size: int = 4096) -> bytes:
-        """Apply chunked transfer encoding to the data."""
+    def _encode_request_stream(self, encoding_interface: HTTPLayerEncodingModuleInterface) -> Callable[[], Iterator[bytes | memoryview | HTTPFileSegment]]:
+        """Encode an HTTP request whose payload is read from disk while it is sent.
         
-        # check chunk size and data length
-        if max_chunk_size <= 0:
-            raise ValueError("Chunk size must be greater than 0")
-        if len(data) == 0:
-            raise ValueError("Data length must be greater than 0")
+        Returns a factory producing the request as a stream of buffers, so a failed
+        send can be retried from the start. Only one read block (and its chunk framing)
+        is held in memory at a time, regardless of the file size.
+        """
+        file_path = encoding_interface.payload_file_path
+        if encoding_interface.payload_type == None:
+            raise ValueError("Payload type is required for a payload file")
+        if not os.path.isfile(file_path):
+            raise ValueError(f"Payload file not found: {file_path}")
+        file_size = os.path.getsize(file_path)
         
-        print(f"Applying chunked transfer encoding with max chunk size: {max_chunk_size}")
+        chunk_size = encoding_interface.transfer_encoding_chunk_size or STREAM_READ_SIZE
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be greater than 0")
         
-        # apply chunked transfer encoding
-        chunked_data = b''
-        data_length = len(data)
-        offset = 0
-        while offset < data_length:
-            chunk_size = min(max_chunk_size, data_length - offset)
-            chunk = data[offset:offset + chunk_size]
-            chunked_data += f"{chunk_size:x}\r\n".encode() + chunk + b"\r\n"
-            offset += chunk_size
+        request_line, headers = self._encode_request_head(encoding_interface)
+        headers += f"Content-Type: {encoding_interface.payload_type}\r\n"
         
-        # add the final chunk
-        chunked_data += b"0\r\n\r\n"
-        return chunked_data
-    
-    def _decode_chunked_transfer_encoding(self, data: bytes) -> bytes:
-        """Decode chunked transfer encoding."""
-        decoded_data = b''
-        offset = 0
-        while offset < len(data):
-            # Find the end of the chunk size line
-            end_of_chunk_size = data.find(b'\r\n', offset)
-            if end_of_chunk_size == -1:
-                raise ValueError("Invalid chunked data: missing chunk size end")
-            
-            # Get the chunk size
-            chunk_size_hex = data[offset:end_of_chunk_size]
-            chunk_size = int(chunk_size_hex, 16)
-            offset = end_of_chunk_size + 2
-            
-            # If chunk size is 0, break the loop
-            if chunk_size == 0:
-                break
-            
-            # Get the chunk data
-            chunk_data = data[offset:offset + chunk_size]
-            decoded_data += chunk_data
-            
-            # Move to the next chunk
-            offset += chunk_size + 2
+        content_encoding = encoding_interface.content_encoding
+        compress = content_encoding not in (None, HTTPContentEncoding.IDENTITY)
+        if compress:
+            # check the coding up front, a stream can only fail once it is being sent
+            content_codec = get_content_codec(content_encoding)
+            content_codec.compressor(encoding_interface.content_encoding_level)
+        if content_encoding != None:
+            headers += f"Content-Encoding: {content_encoding}\r\n"
         
-        return decoded_data
-    
-    def _check_persistent_socket(self, transmission_interface: HTTPLayerTransmissionModuleInterface) -> bool:
-        """Check if the persistent socket is still valid."""
-        if self.persistent_socket is None:
-            return False
-        elif self.current_server != transmission_interface.server:
-            return False
-
-        try:
-            self.persistent_socket.getpeername()
-            return True
-        except (socket.error, AttributeError):
-            return False
-    
-    def _send_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface) -> socket.socket:
-        """Send the HTTP request and return the socket."""
-        # if not using keep-alive, create a new socket connection
-        # TODO: error handling
-        max_retries = transmission_interface.max_retries
-        successful_transmission = False
-        current_retry = 0
-        last_error = "Please check max_retries"
-        while current_retry < max_retries and not successful_transmission:
-            try:
+        # the compressed length is only known at the end, so compressed bodies are always chunked;
+        # the server has to take chunked request bodies, i.e. mod_wsgi with WSGIChunkedRequest On
+        chunked = compress or encoding_interface.transfer_encoding == HTTPTransferEncoding.CHUNKED
+        if chunked:
+            headers += f"Transfer-Encoding: {HTTPTransferEncoding.CHUNKED}\r\n"
+        else:
+            headers += f"Content-Length: {file_size}\r\n"
         
-                if transmission_interface.keep_alive == False:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(self.socket_timeout)
-                    sock.connect((transmission_interface.server.host_ip, transmission_interface.server.port))  # Assuming HTTP on port 80
-                else:
-                    # check persistent socket
-                    if not self._check_persistent_socket(transmission_interface):
-                        # create a new socket connection
-                        self.persistent_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        self.persistent_socket.settimeout(self.socket_timeout)
-                        self.persistent_socket.connect((transmission_interface.server.host_ip, transmission_interface.server.port))
-                    sock = self.persistent_socket
-                    self.current_server = transmission_interface.server
+        head_bytes = (request_line + headers + "\r\n").encode()
+        logger.debug("Encoded request: %s with %d bytes streamed from %s", request_line.strip(), file_size, file_path)
         
-                # Send the encoded request
-                sock.sendall(transmission_interface.encoded_request)
-                successful_transmission = True
-            except Exception as e:
-                print(f"Error sending request: {e}")
-                last_error = str(e)
-                current_retry += 1
-                if sock:
-                    # socket policy: once failed, always reset the current socket
-                    sock.close()
-                    sock = None
-                    if transmission_interface.keep_alive:
-                        self.persistent_socket = None
-                        self.current_server = None
-        if not successful_transmission:
-            raise TimeoutError(f"Failed to send after {max_retries} retries, \n last error: {last_error}")
+        def stream() -> Iterator[bytes | memoryview | HTTPFileSegment]:
+            yield head_bytes
+            if not chunked:
+                # unmodified body, let the kernel copy it from the file
+                yield HTTPFileSegment(file_path=file_path, offset=0, count=file_size)
+                return
+            
+            compressor = content_codec.compressor(encoding_interface.content_encoding_level) if compress else None
+            chunked_encoder = ChunkedEncoder(chunk_size)
+            with open(file_path, "rb") as file:
+                while True:
+                    # a fresh block per read: the consumer may still hold views of the previous one
+                    block = file.read(max(chunk_size, STREAM_READ_SIZE))
+                    if not block:
+                        break
+                    if compressor:
+                        block = compressor.compress(block)
+                    yield from chunked_encoder.encode(block)
+            if compressor:
+                yield from chunked_encoder.encode(compressor.flush())
+            yield chunked_encoder.finish()
         
-        return sock
+        return stream
     
-    def _transmit_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface) -> bytes:
-        """Send the HTTP request and receive the response."""
-                
-        # send the request
-        sock = self._send_request(transmission_interface)
-        
-        # Receive the response
-        sock.setblocking(False)  # 非阻塞模式
-        data = b''
-        header_complete = False
-        content_length = 0
-        body_start_pos = 0
-
-        # 设置合理的总超时时间
-        total_timeout = transmission_interface.timeout
-        start_time = time.time()
-
-        while time.time() - start_time < total_timeout:
-            try:
-                # 使用很短的轮询间隔，不会显著延迟处理
-                ready = select.select([sock], [], [], 0.1)  # 100ms超时
-                if ready[0]:
-                    chunk = sock.recv(4096)
-                    if not chunk:  # 连接关闭
-                        # 如果已经接收到完整头部的GET请求，可以返回了
-                        if header_complete and b'GET' in data[:data.find(b'\r\n')]:
-                            return data
-                        break
-                    
-                    data += chunk
-
-                    # 如果还没解析头部，检查是否已经接收到完整头部
-                    if not header_complete and b'\r\n\r\n' in data:
-                        header_complete = True
-                        body_start_pos = data.find(b'\r\n\r\n') + 4
-
-                        # 解析Content-Length
-                        for line in data[:body_start_pos].split(b'\r\n'):
-                            if line.lower().startswith(b'content-length:'):
-                                content_length = int(line.split(b':', 1)[1].strip())
-                                break
-                            
-                        # 如果是GET请求且没有Content-Length，可能已经完成
-                        if b'GET' in data[:data.find(b'\r\n')] and content_length == 0:
-                            return data
-
-                    # 检查是否已经接收到全部数据
-                    if header_complete and len(data) - body_start_pos >= content_length:
-                        return data
-
-                # 如果没有更多数据但头部已完成，可以检查请求类型
-                elif header_complete:
-                    if b'GET' in data[:data.find(b'\r\n')] or len(data) - body_start_pos >=     content_length:
-                        return data
-
-            except BlockingIOError:
-                # 非阻塞模式下没有数据可读会抛出异常
-                pass
-
-        # 超时处理
-        raise TimeoutError("HTTP request reception timed out")
-
     def _decode_response(self, response_interface: HTTPLayerDecodingModuleInterface) -> HTTPResponse:
-        """Decode the HTTP response from bytes and produce a response object for the upper layer."""
+        """Decode the HTTP response from bytes and produce a response object for the upper layer.
+
+        The clients decode the body while it is received, then only the header
+        is parsed here; a raw response with its body is still decoded whole.
+        """
         raw_response = response_interface.response_raw_data
         decoded_response = HTTPResponse()
         body_after_transfer_decoded = None
@@ -598,12 +550,19 @@ class HttpClientSocket:
                 case 'Content-Length':
                     decoded_response.content_length = int(value)
                 case 'Set-Cookie':
-                    print(f"Cookie received: {value}")
                     decoded_response.set_cookie = value
                 case 'Last-Modified':
                     decoded_response.last_modified = value
+                case 'ETag':
+                    decoded_response.etag = value
                 case 'Location':
                     decoded_response.location = value
+                case 'Content-Range':
+                    decoded_response.content_range = value
+                case 'X-File-Size':
+                    decoded_response.file_size = int(value)
+                case 'X-File-Mtime':
+                    decoded_response.file_mtime = float(value)
                 case 'Content-Type':
                     decoded_response.content_type = get_http_main_content_type(value)
                 case 'Connection':
@@ -617,33 +576,33 @@ class HttpClientSocket:
         
         # step 3: decode body
         
-        if len(body) > 0:
+        if response_interface.body_buffer_size is not None or response_interface.body_sink_size is not None:
+            # the body went to the request's buffer or sink
+            decoded_response.payload_bytes = None
+        elif response_interface.decoded_body is not None:
+            # transfer and content codings were undone while receiving
+            decoded_response.payload_bytes = response_interface.decoded_body or None
+        elif len(body) > 0:
             # first decode transfer encoding
             if decoded_response.transfer_encoding != None:
                 match decoded_response.transfer_encoding:
                     case HTTPTransferEncoding.IDENTITY:
                         body_after_transfer_decoded = body
                     case HTTPTransferEncoding.CHUNKED:
-                        print("Decoding chunked transfer encoding")
-                        body_after_transfer_decoded = self._decode_chunked_transfer_encoding(body)
+                        logger.debug("Decoding chunked transfer encoding")
+                        body_after_transfer_decoded = decode_chunked(body)
                     case _:
                         raise ValueError(f"Unsupported transfer encoding: {decoded_response.transfer_encoding}")
-                    # TODO: add chunked transfer encoding support
             else:
                 body_after_transfer_decoded = body
             
             # then decode content encoding
             if decoded_response.content_encoding != None:
-                print(f"Decoding content with encoding: {decoded_response.content_encoding}")
-                match decoded_response.content_encoding:
-                    case 'gzip':
-                        body_after_content_decoded = gzip.decompress(body_after_transfer_decoded)
-                    case 'deflate':
-                        body_after_content_decoded = zlib.decompress(body_after_transfer_decoded)
-                    case 'identity':
-                        body_after_content_decoded = body_after_transfer_decoded
-                    case _:
-                        raise ValueError("Unsupported content encoding")
+                logger.debug("Decoding content with encoding: %s", decoded_response.content_encoding)
+                # the codings are undone in reverse order, slice by slice
+                body_after_content_decoded = decompress_content(
+                    body_after_transfer_decoded, decoded_response.content_encoding
+                )
             else:
                 body_after_content_decoded = body_after_transfer_decoded
                 
@@ -651,10 +610,389 @@ class HttpClientSocket:
                 
             # finally set the payload data
             decoded_response.payload_bytes = body_after_content_decoded
-            print("--"*10)
-            print(f"Decoded response payload: {decoded_response.payload_bytes.decode()}")
-            print("--"*10)
+            # the payload may be binary (i.e. raw file downloads), only log its size
+            logger.debug("Decoded response payload: %d bytes of %s",
+                         len(decoded_response.payload_bytes), decoded_response.content_type)
         else:
             decoded_response.payload_bytes = None
+        decoded_response.payload_buffer_size = response_interface.body_buffer_size
+        decoded_response.payload_sink_size = response_interface.body_sink_size
+
+        return decoded_response
+
+
+class HttpClientSocket(HTTPClientBase):
+    """HTTP client with low-level implementation for socket communication."""
+    # TODO: HTTPS support
+    
+    def __init__(self, pool_configurations: HTTPConnectionPoolConfigurations = None,
+                 trace_hooks: HTTPTraceHooks = None):
+        # keep-alive connections are pooled per server address
+        self.connection_pool = HTTPConnectionPool(pool_configurations)
+        self.socket_timeout = 5  # seconds
+        # phases of every request are reported here, None skips tracing altogether
+        self.trace_hooks = trace_hooks
+    
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.connection_pool.close_all()
+    
+    def handle_request(self, layer_request_interface: HTTPLayerInterfaceRequest) -> HTTPLayerInterfaceResponse:
+        """Handle the HTTP request and return the response, including redirection handling."""
+        trace = None if self.trace_hooks is None else HTTPRequestTrace(self.trace_hooks, layer_request_interface)
+        return self._follow_redirects(self._redirect_steps(layer_request_interface, trace), trace)
+
+    def handle_requests(self, layer_request_interfaces: list[HTTPLayerInterfaceRequest]) -> list[HTTPLayerInterfaceResponse]:
+        """Handle several requests and return their responses in the same order.
+
+        Consecutive keep-alive GET and HEAD requests to the same server are
+        pipelined: written back-to-back on one connection, with the responses
+        read in order, so a run of them costs about one round trip instead of
+        one each. Any other request is sent on its own. Redirects are followed
+        one request at a time once the batch is answered.
+        """
+        traces = [None if self.trace_hooks is None else HTTPRequestTrace(self.trace_hooks, request)
+                  for request in layer_request_interfaces]
+        redirect_steps_list = [self._redirect_steps(request, trace)
+                               for request, trace in zip(layer_request_interfaces, traces)]
+        first_requests = [next(redirect_steps) for redirect_steps in redirect_steps_list]
+
+        first_responses: list[HTTPLayerInterfaceResponse] = []
+        run_start = 0
+        while run_start < len(first_requests):
+            run_end = run_start + 1
+            if self._can_pipeline(first_requests[run_start]):
+                while (run_end < len(first_requests) and self._can_pipeline(first_requests[run_end])
+                       and first_requests[run_end].server_connection == first_requests[run_start].server_connection):
+                    run_end += 1
+            if run_end - run_start > 1:
+                first_responses += self._handle_pipeline(first_requests[run_start:run_end], traces[run_start:run_end])
+            else:
+                first_responses.append(self.handle_single_request(first_requests[run_start], traces[run_start]))
+            run_start = run_end
 
-        return decoded_response
\ No newline at end of file
+        return [self._follow_redirects(redirect_steps, trace, response)
+                for redirect_steps, trace, response in zip(redirect_steps_list, traces, first_responses)]
+
+    def _follow_redirects(self, redirect_steps: Generator[HTTPLayerInterfaceRequest, HTTPLayerInterfaceResponse, HTTPLayerInterfaceResponse],
+                          trace: HTTPRequestTrace = None, first_response: HTTPLayerInterfaceResponse = None) -> HTTPLayerInterfaceResponse:
+        """Run the redirect steps to the final response, sending the first request unless its response is given."""
+        try:
+            if first_response is None:
+                request = next(redirect_steps)
+            else:
+                request = redirect_steps.send(first_response)
+            while True:
+                request = redirect_steps.send(self.handle_single_request(request, trace))
+        except StopIteration as stop:
+            response = stop.value
+        except Exception as e:
+            logger.debug("Error handling request: %s", e)
+            response = HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Error handling request: " + str(e)
+            )
+        if trace is not None and not response.vaild_response:
+            trace.request_error(response.error_message)
+        return response
+
+    def handle_single_request(self, layer_request_interface: HTTPLayerInterfaceRequest,
+                              trace: HTTPRequestTrace = None) -> HTTPLayerInterfaceResponse:
+        """Handle a single HTTP request and return the response without performing redirection."""
+        # Encode the request
+        try:
+            transmission_interface = self._encode_layer_request(layer_request_interface)
+        except ValueError as e:
+            logger.debug("Error encoding request: %s", e)
+            return HTTPLayerInterfaceResponse(
+                http_response=None,
+                vaild_response=False,
+                error_message="Error encoding request:" + str(e)
+            )
+
+        # Send the request
+        try:
+            response = self._transmit_request(transmission_interface, trace)
+        except Exception as e:
+            return self._transmission_error_response(e)
+        
+        # Decode the response
+        return self._decode_layer_response(response)
+
+    def _transmission_error_response(self, error: Exception) -> HTTPLayerInterfaceResponse:
+        """Turn an error raised while sending or receiving into an invalid response."""
+        if isinstance(error, TransferCancelled):
+            error_message = "Transfer cancelled. " + str(error)
+        elif isinstance(error, TimeoutError):
+            logger.debug("Error sending request: %s", error)
+            error_message = "Error sending request: " + str(error)
+        else:
+            logger.debug("Unexpected error: %s", error)
+            error_message = "Unexpected error: " + str(error)
+        return HTTPLayerInterfaceResponse(
+            http_response=None,
+            vaild_response=False,
+            error_message=error_message
+        )
+
+    def _can_pipeline(self, layer_request_interface: HTTPLayerInterfaceRequest) -> bool:
+        """Whether a request may be pipelined, i.e. is safe to send again if the server closes without answering it."""
+        return (layer_request_interface.method in PIPELINE_METHODS
+                and layer_request_interface.connection_keep_alive
+                and layer_request_interface.payload_file_path is None)
+
+    def _handle_pipeline(self, layer_request_interfaces: list[HTTPLayerInterfaceRequest],
+                         traces: list[HTTPRequestTrace]) -> list[HTTPLayerInterfaceResponse]:
+        """Pipeline requests to one server and return their responses, without redirection.
+
+        A server that closes part way through (e.g. at its keep-alive request
+        limit) gets the unanswered requests again on a new connection. If that
+        twice makes no progress, the rest are sent one by one.
+        """
+        try:
+            transmission_interfaces = [self._encode_layer_request(request) for request in layer_request_interfaces]
+        except ValueError:
+            # handle_single_request reports the request that fails to encode
+            return [self.handle_single_request(request, trace) for request, trace in zip(layer_request_interfaces, traces)]
+
+        responses: list[HTTPLayerInterfaceResponse] = []
+        attempts_without_progress = 0
+        while len(responses) < len(transmission_interfaces) and attempts_without_progress < 2:
+            window = slice(len(responses), len(responses) + PIPELINE_MAX_DEPTH)
+            received: list[HTTPLayerInterfaceResponse] = []
+            try:
+                self._transmit_pipeline(transmission_interfaces[window], traces[window], received)
+            except Exception as e:
+                # the request at the head of the pipeline failed, the ones behind it are sent again
+                received.append(self._transmission_error_response(e))
+            attempts_without_progress = 0 if received else attempts_without_progress + 1
+            responses += received
+
+        for request, trace in zip(layer_request_interfaces[len(responses):], traces[len(responses):]):
+            responses.append(self.handle_single_request(request, trace))
+        return responses
+    
+    def _send_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface,
+                      trace: HTTPRequestTrace = None) -> tuple[socket.socket, bool]:
+        """Send the HTTP request on a pooled connection.
+
+        Returns the socket and whether it is an idle connection that was reused.
+        """
+        max_retries = transmission_interface.max_retries
+        server = transmission_interface.server
+        current_retry = 0
+        last_error = "Please check max_retries"
+        while current_retry < max_retries:
+            sock = None
+            # every attempt sends the head again, only the body after it is progress
+            transfer_callback = skip_request_head(transmission_interface.send_callback,
+                                                  transmission_interface.request_head_size)
+            if trace is not None:
+                transfer_callback = trace.wrap_send_callback(transfer_callback)
+            try:
+                sock, reused = self.connection_pool.checkout(server, self.socket_timeout)
+                if trace is not None:
+                    trace.connect()
+        
+                # Send the encoded request
+                if transmission_interface.encoded_request_stream is not None:
+                    self._send_request_stream(
+                        sock, transmission_interface.encoded_request_stream(), transfer_callback)
+                elif transfer_callback is not None:
+                    request_view = memoryview(transmission_interface.encoded_request)
+                    for offset in range(0, len(request_view), STREAM_SEND_SLICE_SIZE):
+                        request_slice = request_view[offset:offset + STREAM_SEND_SLICE_SIZE]
+                        sock.sendall(request_slice)
+                        transfer_callback(len(request_slice))
+                else:
+                    sock.sendall(transmission_interface.encoded_request)
+                return sock, reused
+            except TransferCancelled:
+                # cancelled by the caller, do not retry
+                if sock:
+                    self.connection_pool.discard(server, sock)
+                raise
+            except Exception as e:
+                logger.debug("Error sending request: %s", e)
+                last_error = str(e)
+                current_retry += 1
+                if trace is not None and current_retry < max_retries:
+                    trace.retry(current_retry, last_error)
+                if sock:
+                    # socket policy: once failed, never hand the socket back to the pool
+                    self.connection_pool.discard(server, sock)
+        
+        raise TimeoutError(f"Failed to send after {max_retries} retries, \n last error: {last_error}")
+    
+    def _send_request_stream(self, sock: socket.socket, request_stream: Iterator[bytes | memoryview | HTTPFileSegment],
+                             transfer_callback: Callable[[int], None] = None) -> None:
+        """Write a streamed request, batching small buffers into one sendmsg call."""
+        pending: list[memoryview] = []
+        pending_size = 0
+        for item in request_stream:
+            if isinstance(item, HTTPFileSegment):
+                self._send_buffers(sock, pending, pending_size, transfer_callback)
+                pending, pending_size = [], 0
+                with open(item.file_path, "rb") as file:
+                    self._send_file_segment(sock, file, item, transfer_callback)
+                continue
+
+            pending.append(memoryview(item))
+            pending_size += len(item)
+            if pending_size >= STREAM_SEND_BATCH_SIZE or len(pending) >= STREAM_SEND_MAX_BUFFERS:
+                self._send_buffers(sock, pending, pending_size, transfer_callback)
+                pending, pending_size = [], 0
+        self._send_buffers(sock, pending, pending_size, transfer_callback)
+
+    def _send_file_segment(self, sock: socket.socket, file, segment: HTTPFileSegment,
+                           transfer_callback: Callable[[int], None] = None) -> None:
+        """Send part of a file with sendfile, in slices if the caller follows the progress."""
+        if transfer_callback is None:
+            sock.sendfile(file, offset=segment.offset, count=segment.count)
+            return
+        offset = segment.offset
+        end = os.fstat(file.fileno()).st_size if segment.count is None else segment.offset + segment.count
+        while offset < end:
+            count = min(STREAM_SEND_SLICE_SIZE, end - offset)
+            sent = sock.sendfile(file, offset=offset, count=count)
+            if sent == 0:
+                raise ConnectionError("File ended before the announced length.")
+            offset += sent
+            transfer_callback(sent)
+    
+    def _send_buffers(self, sock: socket.socket, buffers: list[memoryview], total_size: int = 0,
+                      transfer_callback: Callable[[int], None] = None) -> None:
+        """Send a list of buffers with scatter/gather I/O, handling partial writes."""
+        buffers = [buffer for buffer in buffers if len(buffer) > 0]
+        if not hasattr(sock, "sendmsg"):
+            # i.e. Windows
+            for buffer in buffers:
+                sock.sendall(buffer)
+        else:
+            while buffers:
+                sent = sock.sendmsg(buffers)
+                # drop the buffers that went out completely, trim the partially sent one
+                while buffers and sent >= len(buffers[0]):
+                    sent -= len(buffers[0])
+                    buffers.pop(0)
+                if sent:
+                    buffers[0] = buffers[0][sent:]
+        if transfer_callback is not None and total_size:
+            transfer_callback(total_size)
+    
+    def _transmit_request(self, transmission_interface: HTTPLayerTransmissionModuleInterface,
+                          trace: HTTPRequestTrace = None) -> HTTPLayerDecodingModuleInterface:
+        """Send the HTTP request and receive the response."""
+        server = transmission_interface.server
+        # the trace counts every received byte, the caller only the body
+        receive_callback = trace.wrap_receive_callback() if trace is not None else None
+        # one extra attempt for a pooled connection that the server closed while idle
+        attempts_left = 2
+        while True:
+            attempts_left -= 1
+            
+            # send the request
+            sock, reused = self._send_request(transmission_interface, trace)
+            
+            # receive the response, the reader knows where it ends
+            reader = HTTPResponseReader(request_method=transmission_interface.request_method,
+                                        body_buffer=transmission_interface.response_body_buffer,
+                                        body_sink=transmission_interface.response_body_sink,
+                                        decode_body=True,
+                                        partial_only=transmission_interface.partial_response_only)
+            try:
+                data = reader.read_from(sock, transmission_interface.timeout, receive_callback,
+                                        transmission_interface.receive_callback)
+            except ConnectionResetError as e:
+                # a half-read connection can never be reused
+                self.connection_pool.discard(server, sock)
+                # only an idle connection the server closed before answering is safe to send on again:
+                # on a new one the server may have acted on the request, and received bytes cannot be taken back
+                if attempts_left > 0 and reused and reader.nothing_received:
+                    if trace is not None:
+                        trace.retry(1, str(e))
+                    continue
+                raise
+            except Exception:
+                self.connection_pool.discard(server, sock)
+                raise
+            
+            reusable = transmission_interface.keep_alive and reader.reusable and not reader.leftover
+            self.connection_pool.release(server, sock, reusable)
+            if trace is not None:
+                trace.body_complete(reader.status_code)
+            return HTTPLayerDecodingModuleInterface(
+                response_raw_data=data,
+                body_buffer_size=reader.body_buffer_size if reader.body_in_buffer else None,
+                body_sink_size=reader.body_sink_size if reader.body_in_sink else None,
+                decoded_body=reader.decoded_body,
+            )
+
+    def _transmit_pipeline(self, transmission_interfaces: list[HTTPLayerTransmissionModuleInterface],
+                           traces: list[HTTPRequestTrace], responses: list[HTTPLayerInterfaceResponse]) -> None:
+        """Write the requests back-to-back on one connection and read the responses in order.
+
+        Each response is appended to `responses` as soon as it is complete.
+        Returns early if the server closes before answering every request.
+        """
+        server = transmission_interfaces[0].server
+        sock = self.connection_pool.acquire(server, self.socket_timeout)
+        try:
+            for trace in traces:
+                if trace is not None:
+                    trace.connect()
+            self._send_buffers(sock, [memoryview(transmission_interface.encoded_request)
+                                      for transmission_interface in transmission_interfaces])
+        except OSError as e:
+            logger.debug("Error sending pipelined requests: %s", e)
+            self.connection_pool.discard(server, sock)
+            return
+        except BaseException:
+            self.connection_pool.discard(server, sock)
+            raise
+        for transmission_interface, trace in zip(transmission_interfaces, traces):
+            send_callback = skip_request_head(transmission_interface.send_callback,
+                                              transmission_interface.request_head_size)
+            if trace is not None:
+                send_callback = trace.wrap_send_callback(send_callback)
+            if send_callback is not None:
+                send_callback(len(transmission_interface.encoded_request))
+
+        leftover = b''
+        for transmission_interface, trace in zip(transmission_interfaces, traces):
+            receive_callback = trace.wrap_receive_callback() if trace is not None else None
+            reader = HTTPResponseReader(request_method=transmission_interface.request_method,
+                                        body_buffer=transmission_interface.response_body_buffer,
+                                        body_sink=transmission_interface.response_body_sink,
+                                        decode_body=True,
+                                        partial_only=transmission_interface.partial_response_only)
+            try:
+                # bytes received past the previous response belong to this one
+                if leftover:
+                    reader.feed(leftover)
+                data = reader.read_from(sock, transmission_interface.timeout, receive_callback,
+                                        transmission_interface.receive_callback)
+            except ConnectionResetError as e:
+                logger.debug("Connection closed during a pipeline after %d responses: %s", len(responses), e)
+                self.connection_pool.discard(server, sock)
+                return
+            except BaseException:
+                self.connection_pool.discard(server, sock)
+                raise
+
+            leftover = reader.leftover
+            if trace is not None:
+                trace.body_complete(reader.status_code)
+            responses.append(self._decode_layer_response(HTTPLayerDecodingModuleInterface(
+                response_raw_data=data,
+                body_buffer_size=reader.body_buffer_size if reader.body_in_buffer else None,
+                body_sink_size=reader.body_sink_size if reader.body_in_sink else None,
+                decoded_body=reader.decoded_body,
+            )))
+            if not reader.reusable:
+                # the server closes after this response, the requests behind it were not answered
+                self.connection_pool.discard(server, sock)
+                return
+
+        self.connection_pool.release(server, sock, not leftover)
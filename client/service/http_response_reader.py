@@ -0,0 +1,385 @@
+import socket
+import time
+from enum import StrEnum
+from typing import Callable
+
+from domain.http_model import HTTPResponseBodySink
+from service.chunked_codec import ChunkedDecoder
+from service.response_body_pipeline import (BufferBodySink, BytesBodySink,
+                                            LengthDecoder, ResponseBodyPipeline)
+
+
+class HTTPResponseFraming(StrEnum):
+    """How the end of a response body is determined (RFC 9112, section 6.3)."""
+    NO_BODY = "no_body"
+    CONTENT_LENGTH = "content_length"
+    CHUNKED = "chunked"
+    CONNECTION_CLOSE = "connection_close"
+
+
+class HTTPResponseReader:
+    """Incremental HTTP/1.1 response reader.
+
+    Bytes are accumulated in a single bytearray and the reader tracks the
+    framing of the response, so it knows the exact byte at which the response
+    ends instead of waiting for a timeout. Bytes received past the end of the
+    response are kept in `leftover`.
+
+    Given a `body_buffer`, i.e. a memoryview of a memory-mapped file, a
+    fitting body is received into it with recv_into and never copied.
+
+    With `decode_body` (implied by a `body_sink`) the body is not kept raw:
+    it runs through a ResponseBodyPipeline as it arrives and only the header
+    stays in the buffer. A 2xx body goes to the sink or the body buffer,
+    any other body is collected in `decoded_body`.
+    """
+
+    def __init__(self, request_method: str = None, receive_buffer_size: int = 65536,
+                 body_buffer: memoryview = None, body_sink: HTTPResponseBodySink = None,
+                 decode_body: bool = False, partial_only: bool = False):
+        self.request_method = request_method
+        # the request had a Range: a 2xx other than 206 is the whole resource and is left unread
+        self.partial_only = partial_only
+        self.receive_buffer_size = receive_buffer_size
+        # a 2xx body with a Content-Length that fits and no content coding is received straight into this
+        self.body_buffer = body_buffer
+        self.body_in_buffer = False
+        self.body_buffer_size = 0  # body bytes written to body_buffer so far
+        self.body_sink = body_sink
+        self.body_in_sink = False
+        self.body_sink_size = 0  # decoded body bytes written to body_sink
+        self.decode_body = decode_body or body_sink is not None
+        self.body_pipeline: ResponseBodyPipeline = None
+        self.decoded_body: bytes = None  # decoded body kept in memory, i.e. of an error response
+        self.headers: dict[str, str] = {}  # by lower case name
+
+        # body bytes go with recv_into straight to body_buffer, no decoding needed
+        self._receive_into_buffer = False
+
+        self.buffer = bytearray()
+        self.header_end = -1  # index of the first body byte
+        self.status_code: int = None
+        self.version: str = None
+        self.framing: HTTPResponseFraming = None
+        self.content_length: int = None
+        self.connection_close = False
+        self.response_end = -1  # index one past the last byte of the response
+        self.leftover = b''
+
+        # chunked framing scan position, relative to the buffer
+        self._chunk_scan_offset = 0
+        # bytes taken in so far, interim responses included, and the body part already reported
+        self._received_size = 0
+        self._interim_size = 0
+        self._reported_body_size = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.response_end != -1
+
+    @property
+    def nothing_received(self) -> bool:
+        """Whether not a single byte of the response arrived, so nothing reached a body buffer or sink."""
+        return self.header_end == -1 and len(self.buffer) == 0
+
+    @property
+    def body_received_size(self) -> int:
+        """Body bytes of this response received so far, as framed on the wire, without the header."""
+        if self.header_end == -1 or self.framing == HTTPResponseFraming.NO_BODY:
+            # an unread body, i.e. one too large for the body buffer, is not received
+            return 0
+        return max(0, self._received_size - len(self.leftover) - self._interim_size - self.header_end)
+
+    def report_body_progress(self, body_callback: Callable[[int], None]) -> None:
+        """Call `body_callback` with the body bytes received since the last report, if any."""
+        body_size = self.body_received_size
+        if body_size > self._reported_body_size:
+            progress = body_size - self._reported_body_size
+            self._reported_body_size = body_size
+            body_callback(progress)
+
+    @property
+    def reusable(self) -> bool:
+        """Whether the connection can carry another request after this response."""
+        return (self.complete
+                and self.framing != HTTPResponseFraming.CONNECTION_CLOSE
+                and not self.connection_close)
+
+    def read_from(self, sock: socket.socket, timeout: float, transfer_callback: Callable[[int], None] = None,
+                  body_callback: Callable[[int], None] = None) -> bytes:
+        """Receive from the socket until the response is complete and return its raw bytes.
+
+        `transfer_callback` is called with the size of each received block,
+        `body_callback` with the body bytes among them.
+        """
+        scratch = bytearray(self.receive_buffer_size)
+        scratch_view = memoryview(scratch)
+        deadline = time.monotonic() + timeout
+
+        while not self.complete:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("HTTP request reception timed out")
+            sock.settimeout(remaining)
+            if self._receive_into_buffer:
+                # never past the end of the body, the next response stays in the socket
+                received = sock.recv_into(self.body_buffer[self.body_buffer_size:self.content_length])
+                if received == 0:
+                    self.feed_eof()
+                self._received_size += received
+                self._advance_body_buffer(received)
+            else:
+                received = sock.recv_into(scratch_view)
+                if received == 0:
+                    self.feed_eof()
+                else:
+                    self.feed(scratch_view[:received])
+            if transfer_callback is not None and received:
+                transfer_callback(received)
+            if body_callback is not None:
+                self.report_body_progress(body_callback)
+
+        return self.get_response_bytes()
+
+    def feed(self, data: bytes) -> None:
+        """Append received bytes and advance the framing state."""
+        self._received_size += len(data)
+        if self.complete:
+            self.leftover += bytes(data)
+            return
+        if self._receive_into_buffer:
+            self._feed_body_buffer(data)
+            return
+        if self.body_pipeline is not None:
+            self._feed_body_pipeline(data)
+            return
+        self.buffer += data
+
+        if self.header_end == -1:
+            self._parse_header()
+            if self._receive_into_buffer or self.body_pipeline is not None:
+                # body bytes that came with the header move on, only the header stays
+                body_start = bytes(self.buffer[self.header_end:])
+                del self.buffer[self.header_end:]
+                if self._receive_into_buffer:
+                    self._feed_body_buffer(body_start)
+                else:
+                    self._feed_body_pipeline(body_start)
+                return
+        if self.header_end != -1:
+            self._check_body_complete()
+
+    def feed_eof(self) -> None:
+        """Handle the peer closing the connection."""
+        if self.complete:
+            return
+        if len(self.buffer) == 0:
+            # typical for a pooled connection the server already timed out
+            raise ConnectionResetError("Connection closed before any response data was received")
+        if self.framing == HTTPResponseFraming.CONNECTION_CLOSE:
+            if self.body_pipeline is not None:
+                self.body_pipeline.finish()
+                self._finish_body_pipeline()
+                return
+            self.response_end = len(self.buffer)
+            return
+        raise ValueError("Connection closed before the response was complete")
+
+    def get_response_bytes(self) -> bytes:
+        """Return the raw bytes of the complete response."""
+        return bytes(memoryview(self.buffer)[:self.response_end])
+
+    def _parse_header(self) -> None:
+        """Parse the status line and framing headers once the header block is in."""
+        while True:
+            header_end = self.buffer.find(b'\r\n\r\n')
+            if header_end == -1:
+                return
+            header_lines = bytes(self.buffer[:header_end]).split(b'\r\n')
+            status_parts = header_lines[0].decode('latin-1').split(' ')
+            status_code = int(status_parts[1])
+            if 100 <= status_code < 200 and status_code != 101:
+                # interim response (i.e. 100 Continue), the real one follows
+                self._interim_size += header_end + 4
+                del self.buffer[:header_end + 4]
+                continue
+            break
+
+        self.version = status_parts[0]
+        self.status_code = status_code
+        self.header_end = header_end + 4
+
+        transfer_encoding = None
+        content_length = None
+        connection = None
+        content_encoding = None
+        for line in header_lines[1:]:
+            key, _, value = line.decode('latin-1').partition(':')
+            self.headers[key.strip().lower()] = value.strip()
+            match key.strip().lower():
+                case 'transfer-encoding':
+                    transfer_encoding = value.strip().lower()
+                case 'content-length':
+                    content_length = int(value.strip())
+                case 'connection':
+                    connection = value.strip().lower()
+                case 'content-encoding':
+                    content_encoding = value.strip().lower()
+
+        if connection == 'close' or (self.version == 'HTTP/1.0' and connection != 'keep-alive'):
+            self.connection_close = True
+
+        if (self.request_method == 'HEAD' or status_code in (204, 304)):
+            self.framing = HTTPResponseFraming.NO_BODY
+        elif transfer_encoding is not None and transfer_encoding.endswith('chunked'):
+            self.framing = HTTPResponseFraming.CHUNKED
+            self._chunk_scan_offset = self.header_end
+        elif content_length is not None:
+            self.framing = HTTPResponseFraming.CONTENT_LENGTH
+            self.content_length = content_length
+        else:
+            self.framing = HTTPResponseFraming.CONNECTION_CLOSE
+
+        if (self.decode_body
+                and self.partial_only
+                and 200 <= status_code < 300
+                and status_code != 206
+                and self.framing != HTTPResponseFraming.NO_BODY):
+            # the whole resource sent for a range request, whatever its framing
+            self._skip_body()
+            return
+        if (self.decode_body
+                and self.body_buffer is not None
+                and self.body_sink is None
+                and 200 <= status_code < 300
+                and self.framing == HTTPResponseFraming.CONTENT_LENGTH
+                and content_length > len(self.body_buffer)):
+            # the body can never fit
+            self._skip_body()
+            return
+
+        self._receive_into_buffer = self.body_in_buffer = (
+            self.body_buffer is not None
+            and self.body_sink is None
+            and 200 <= status_code < 300
+            and self.framing == HTTPResponseFraming.CONTENT_LENGTH
+            and content_encoding in (None, 'identity')
+            and content_length <= len(self.body_buffer)
+        )
+        if self.decode_body and not self._receive_into_buffer and self.framing != HTTPResponseFraming.NO_BODY:
+            self._start_body_pipeline(content_encoding)
+
+    def _skip_body(self) -> None:
+        """Leave a 2xx body unread: the response ends with its header and closes the connection."""
+        self.framing = HTTPResponseFraming.NO_BODY
+        self.connection_close = True
+        del self.buffer[self.header_end:]
+        if self.body_sink is not None:
+            self.body_in_sink = True
+        elif self.body_buffer is not None:
+            self.body_in_buffer = True
+        else:
+            self.decoded_body = b''
+
+    def _start_body_pipeline(self, content_encoding: str) -> None:
+        """Pick the sink of the body and set up the decoding stages in front of it."""
+        if 200 <= self.status_code < 300 and self.body_sink is not None:
+            sink = self.body_sink
+            self.body_in_sink = True
+        elif 200 <= self.status_code < 300 and self.body_buffer is not None:
+            # i.e. chunked or compressed, decoded into the buffer instead of received into it
+            sink = BufferBodySink(self.body_buffer)
+            self.body_in_buffer = True
+        else:
+            sink = BytesBodySink()
+        sink.begin(self.status_code, self.headers)
+
+        match self.framing:
+            case HTTPResponseFraming.CHUNKED:
+                transfer_decoder = ChunkedDecoder()
+            case HTTPResponseFraming.CONTENT_LENGTH:
+                transfer_decoder = LengthDecoder(self.content_length)
+            case _:
+                transfer_decoder = LengthDecoder()
+        self.body_pipeline = ResponseBodyPipeline(transfer_decoder, sink, content_encoding)
+
+    def _check_body_complete(self) -> None:
+        """Set the response end if the body framing is satisfied."""
+        match self.framing:
+            case HTTPResponseFraming.NO_BODY:
+                self._finish(self.header_end)
+            case HTTPResponseFraming.CONTENT_LENGTH:
+                if len(self.buffer) - self.header_end >= self.content_length:
+                    self._finish(self.header_end + self.content_length)
+            case HTTPResponseFraming.CHUNKED:
+                self._scan_chunks()
+            case HTTPResponseFraming.CONNECTION_CLOSE:
+                # only the peer closing the connection ends the body
+                pass
+
+    def _scan_chunks(self) -> None:
+        """Walk chunk headers without copying data, stopping at the last chunk and trailers."""
+        buffer = self.buffer
+        offset = self._chunk_scan_offset
+        while True:
+            size_line_end = buffer.find(b'\r\n', offset)
+            if size_line_end == -1:
+                break
+            # chunk extensions follow a ';' and are ignored for framing
+            size_field = bytes(buffer[offset:size_line_end]).split(b';', 1)[0].strip()
+            chunk_size = int(size_field, 16)
+
+            if chunk_size == 0:
+                # last chunk, followed by optional trailers and an empty line
+                if buffer[size_line_end + 2:size_line_end + 4] == b'\r\n':
+                    self._finish(size_line_end + 4)
+                else:
+                    trailer_end = buffer.find(b'\r\n\r\n', size_line_end + 2)
+                    if trailer_end != -1:
+                        self._finish(trailer_end + 4)
+                break
+
+            chunk_end = size_line_end + 2 + chunk_size + 2
+            if len(buffer) < chunk_end:
+                break
+            offset = chunk_end
+        self._chunk_scan_offset = offset
+
+    def _feed_body_buffer(self, data: bytes) -> None:
+        """Copy received body bytes into the body buffer, the rest belongs to the next response."""
+        body_size = min(len(data), self.content_length - self.body_buffer_size)
+        self.body_buffer[self.body_buffer_size:self.body_buffer_size + body_size] = data[:body_size]
+        self._advance_body_buffer(body_size)
+        if body_size < len(data):
+            self.leftover += bytes(data[body_size:])
+
+    def _advance_body_buffer(self, size: int) -> None:
+        """Count bytes received into the body buffer, the response ends with the last one."""
+        self.body_buffer_size += size
+        if self.body_buffer_size == self.content_length:
+            # only the header stays in the buffer
+            self.response_end = self.header_end
+
+    def _feed_body_pipeline(self, data: bytes) -> None:
+        """Run received body bytes through the pipeline, the response ends with the body."""
+        self.body_pipeline.feed(data)
+        if self.body_pipeline.complete:
+            self._finish_body_pipeline()
+
+    def _finish_body_pipeline(self) -> None:
+        """Mark the response complete, only the header stays in the buffer."""
+        pipeline = self.body_pipeline
+        if self.body_in_sink:
+            self.body_sink_size = pipeline.decoded_size
+        elif self.body_in_buffer:
+            self.body_buffer_size = pipeline.decoded_size
+        else:
+            self.decoded_body = bytes(pipeline.sink.data)
+        self.response_end = self.header_end
+        self.leftover += pipeline.unconsumed
+
+    def _finish(self, response_end: int) -> None:
+        """Mark the response complete and keep any bytes past its end."""
+        self.response_end = response_end
+        if len(self.buffer) > response_end:
+            self.leftover = bytes(self.buffer[response_end:])
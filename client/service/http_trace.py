@@ -0,0 +1,163 @@
+import itertools
+import logging
+import time
+from dataclasses import asdict
+from typing import Callable
+
+from domain.http_model import (HTTPLayerInterfaceRequest, HTTPTraceEvent,
+                               HTTPTracePhase)
+
+# request ids are unique within the process
+_request_id_counter = itertools.count(1)
+
+
+class HTTPTraceHooks:
+    """Receiver of the phases of every request a client sends.
+
+    Every hook defaults to doing nothing, override the ones of interest.
+    Hooks run on the thread (or event loop) of the request, so they should
+    return quickly; raising from one aborts the request.
+    """
+
+    def request_start(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def connect(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def first_byte(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def body_complete(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def redirect(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def retry(self, event: HTTPTraceEvent) -> None:
+        pass
+
+    def request_error(self, event: HTTPTraceEvent) -> None:
+        pass
+
+
+class LoggingTraceHooks(HTTPTraceHooks):
+    """Write every phase to a logger as one key=value line.
+
+    The event is also attached to the record as `http_trace`, so a JSON
+    formatter can emit it as structured data.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("http.trace")
+        self.level = level
+
+    def request_start(self, event: HTTPTraceEvent) -> None:
+        self._log(logging.DEBUG, event)
+
+    def connect(self, event: HTTPTraceEvent) -> None:
+        self._log(logging.DEBUG, event)
+
+    def first_byte(self, event: HTTPTraceEvent) -> None:
+        self._log(logging.DEBUG, event)
+
+    def body_complete(self, event: HTTPTraceEvent) -> None:
+        self._log(self.level, event)
+
+    def redirect(self, event: HTTPTraceEvent) -> None:
+        self._log(self.level, event)
+
+    def retry(self, event: HTTPTraceEvent) -> None:
+        self._log(logging.WARNING, event)
+
+    def request_error(self, event: HTTPTraceEvent) -> None:
+        self._log(logging.WARNING, event)
+
+    def _log(self, level: int, event: HTTPTraceEvent) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        fields = " ".join(
+            f"{name}={value}" for name, value in (
+                ("status", event.status_code),
+                ("attempt", event.attempt),
+                ("location", event.location),
+                ("error", event.error),
+            ) if value is not None
+        )
+        self.logger.log(
+            level,
+            "http %s id=%d %s %s elapsed_ms=%.1f sent=%d received=%d %s",
+            event.phase, event.request_id, event.method, event.url,
+            event.elapsed * 1000, event.bytes_sent, event.bytes_received, fields,
+            extra={"http_trace": asdict(event)},
+        )
+
+
+class HTTPRequestTrace:
+    """Timing and byte counts of one request, redirects included, reported to the hooks.
+
+    Only created when a client has hooks, a client without them pays
+    nothing but a None check per phase.
+    """
+
+    def __init__(self, hooks: HTTPTraceHooks, layer_request_interface: HTTPLayerInterfaceRequest):
+        self.hooks = hooks
+        self.request_id = next(_request_id_counter)
+        self.method = layer_request_interface.method
+        self.url = layer_request_interface.url
+        self.server = layer_request_interface.server_connection
+        self.start_time = time.monotonic()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._awaiting_first_byte = False
+        hooks.request_start(self._event(HTTPTracePhase.REQUEST_START))
+
+    def connect(self) -> None:
+        self._awaiting_first_byte = True
+        self.hooks.connect(self._event(HTTPTracePhase.CONNECT))
+
+    def body_complete(self, status_code: int) -> None:
+        self.hooks.body_complete(self._event(HTTPTracePhase.BODY_COMPLETE, status_code=status_code))
+
+    def redirect(self, status_code: int, location: str) -> None:
+        self.hooks.redirect(self._event(HTTPTracePhase.REDIRECT, status_code=status_code, location=location))
+        # the next hop has its own url and may go to another server
+        self.url = location
+
+    def retry(self, attempt: int, error: str) -> None:
+        self.hooks.retry(self._event(HTTPTracePhase.RETRY, attempt=attempt, error=error))
+
+    def request_error(self, error: str) -> None:
+        self.hooks.request_error(self._event(HTTPTracePhase.REQUEST_ERROR, error=error))
+
+    def wrap_send_callback(self, transfer_callback: Callable[[int], None] = None) -> Callable[[int], None]:
+        """Count sent bytes in front of the caller's transfer callback."""
+        def on_sent(size: int) -> None:
+            self.bytes_sent += size
+            if transfer_callback is not None:
+                transfer_callback(size)
+        return on_sent
+
+    def wrap_receive_callback(self, transfer_callback: Callable[[int], None] = None) -> Callable[[int], None]:
+        """Count received bytes in front of the caller's transfer callback, reporting the first one."""
+        def on_received(size: int) -> None:
+            self.bytes_received += size
+            if self._awaiting_first_byte:
+                self._awaiting_first_byte = False
+                self.hooks.first_byte(self._event(HTTPTracePhase.FIRST_BYTE))
+            if transfer_callback is not None:
+                transfer_callback(size)
+        return on_received
+
+    def _event(self, phase: HTTPTracePhase, **fields) -> HTTPTraceEvent:
+        return HTTPTraceEvent(
+            phase=phase,
+            request_id=self.request_id,
+            method=self.method,
+            url=self.url,
+            server=self.server,
+            elapsed=time.monotonic() - self.start_time,
+            bytes_sent=self.bytes_sent,
+            bytes_received=self.bytes_received,
+            **fields,
+        )
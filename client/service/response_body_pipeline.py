@@ -0,0 +1,155 @@
+import os
+from typing import Callable
+
+from domain.http_model import HTTPResponseBodySink
+from service.chunked_codec import ChunkedDecoder
+from service.content_codec import ContentDecoder
+
+
+class LengthDecoder:
+    """Transfer decoder for bodies delimited by Content-Length or by the connection closing.
+
+    Same interface as ChunkedDecoder: `feed` returns the body bytes of a
+    slice, bytes past the end of the body are kept in `unconsumed`.
+    """
+
+    def __init__(self, content_length: int = None):
+        # None reads until the peer closes the connection
+        self.remaining = content_length
+        self.unconsumed = b''
+
+    @property
+    def complete(self) -> bool:
+        return self.remaining == 0
+
+    def feed(self, data: bytes | memoryview) -> bytes | memoryview:
+        """Return the part of `data` that belongs to the body, without copying it."""
+        if self.remaining is None:
+            return data
+        body_size = min(len(data), self.remaining)
+        self.remaining -= body_size
+        if body_size < len(data):
+            self.unconsumed += bytes(data[body_size:])
+        return data[:body_size]
+
+
+class ResponseBodyPipeline:
+    """Body stages of a response: transfer decoder -> content decoder -> sink.
+
+    Fed with the raw body as it is received. Each piece is de-chunked,
+    decompressed and handed to the sink before the next one is taken, so
+    only one received block and its decoded output are held at a time.
+    """
+
+    def __init__(self, transfer_decoder: ChunkedDecoder | LengthDecoder, sink: HTTPResponseBodySink,
+                 content_encoding: str = None):
+        self.transfer_decoder = transfer_decoder
+        self.sink = sink
+        # raises ValueError for a coding that is unknown or not installed
+        self.content_decoder = ContentDecoder(content_encoding) if content_encoding else None
+        self.decoded_size = 0  # bytes handed to the sink
+        self.finished = False
+
+    @property
+    def complete(self) -> bool:
+        return self.finished
+
+    @property
+    def unconsumed(self) -> bytes:
+        """Bytes received past the end of the body."""
+        return self.transfer_decoder.unconsumed
+
+    def feed(self, data: bytes | memoryview) -> None:
+        """Decode the next received slice of the body into the sink."""
+        self._write(self.transfer_decoder.feed(data))
+        if self.transfer_decoder.complete:
+            self.finish()
+
+    def finish(self) -> None:
+        """End of the body, flush the content decoder. Raises ValueError if the body was cut off."""
+        if self.finished:
+            return
+        self.finished = True
+        if self.content_decoder is not None:
+            tail = self.content_decoder.finish()
+            if tail:
+                self.sink.write(tail)
+                self.decoded_size += len(tail)
+
+    def _write(self, body: bytes | memoryview) -> None:
+        if self.content_decoder is not None and body:
+            body = self.content_decoder.decode(body)
+        if body:
+            self.sink.write(body)
+            self.decoded_size += len(body)
+
+
+class BytesBodySink:
+    """Collect the body in memory, for small bodies such as JSON answers."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        del self.data[:]
+
+    def write(self, data: bytes | memoryview) -> None:
+        self.data += data
+
+
+class CallbackBodySink:
+    """Hand each decoded piece of the body to a callback.
+
+    Pieces handed on cannot be taken back, so once the callback got any,
+    the sink refuses to start over with another response.
+    """
+
+    def __init__(self, callback: Callable[[bytes], None]):
+        self.callback = callback
+        self.size = 0  # bytes handed to the callback
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        if self.size:
+            raise ValueError("Response body was already handed to the callback")
+
+    def write(self, data: bytes | memoryview) -> None:
+        # the piece may be a view of the receive buffer, which is reused
+        self.callback(bytes(data))
+        self.size += len(data)
+
+
+class BufferBodySink:
+    """Write the body into a fixed buffer, i.e. a slice of a memory-mapped file."""
+
+    def __init__(self, buffer: memoryview):
+        self.buffer = buffer
+        self.size = 0
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        self.size = 0
+
+    def write(self, data: bytes | memoryview) -> None:
+        end = self.size + len(data)
+        if end > len(self.buffer):
+            raise ValueError("Response body is larger than its buffer")
+        self.buffer[self.size:end] = data
+        self.size = end
+
+
+class FileBodySink:
+    """Write the body to an open file descriptor with pwrite, starting at `offset`."""
+
+    def __init__(self, fd: int, offset: int = 0):
+        self.fd = fd
+        self.offset = offset
+        self.size = 0  # bytes written from offset on
+
+    def begin(self, status_code: int, headers: dict[str, str]) -> None:
+        self.size = 0
+
+    def write(self, data: bytes | memoryview) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.offset + self.size)
+            self.size += written
+            view = view[written:]
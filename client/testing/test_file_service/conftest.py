@@ -0,0 +1,37 @@
+import os
+
+import pytest
+from benchmark.loopback_server import LoopbackFileServer
+from domain.authentication_model import Session
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE, Setting
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+
+@pytest.fixture
+def loopback_server():
+    with LoopbackFileServer() as server:
+        yield server
+
+
+@pytest.fixture
+def loopback_session(loopback_server):
+    return Session(session_token=None,
+                   session_server_info=HTTPServerAddress(host_ip=loopback_server.host, port=loopback_server.port))
+
+
+@pytest.fixture
+def loopback_setting(loopback_server, tmp_path):
+    """Default setting against the loopback server, with local files under tmp_path."""
+    setting = Setting()
+    setting.http_request_template = DEFAULT_HTTP_REQUEST_TEMPLATE
+    setting.file_service_url = loopback_server.file_service_url
+    setting.local_file_dir = str(tmp_path / "local_files") + os.sep
+    os.makedirs(setting.local_file_dir)
+    return setting
+
+
+@pytest.fixture
+def file_service(tmp_path):
+    return FileService(HttpClientSocket(), LocalFileBackend(str(tmp_path / "hash_cache.sqlite3")))
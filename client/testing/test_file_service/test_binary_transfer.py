@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+from benchmark.loopback_server import synthetic_body
+from domain.file_model import FileDownloadInterface, FileUploadInterface
+from domain.setting_model import FileTransferMode, Setting
+
+
+def test_binary_mode_is_the_default():
+    assert Setting().file_transfer_mode == FileTransferMode.BINARY
+
+
+def test_upload_and_download_round_trip(loopback_server, loopback_session, loopback_setting, file_service, tmp_path):
+    """Large files go up as raw PUTs and come back in ranges, small ones share a JSON batch."""
+    loopback_setting.upload_small_file_size = 64 * 1024
+    loopback_setting.download_range_size = 100 * 1024
+    upload_dir = tmp_path / "upload"
+    upload_dir.mkdir()
+    file_data_dict = {
+        "large.bin": synthetic_body(300 * 1024 + 7),
+        "large.csv": synthetic_body(200 * 1024, compressible=True),
+        "small_1.txt": b"small file\n" * 10,
+        "small_2.txt": b"",
+    }
+    for file_name, data in file_data_dict.items():
+        (upload_dir / file_name).write_bytes(data)
+
+    upload_result = file_service.upload_file_batch(FileUploadInterface(
+        file_path_or_file_dir_path=str(upload_dir),
+        current_session=loopback_session,
+        setting=loopback_setting,
+    ))
+    assert upload_result.upload_success, upload_result.error_message
+    assert sorted(upload_result.uploaded_file_name_list) == sorted(file_data_dict)
+    assert loopback_server.file_hash_dict == {
+        file_name: hashlib.md5(data).hexdigest() for file_name, data in file_data_dict.items()}
+    put_paths = sorted(path for method, path, _ in loopback_server.request_log if method == "PUT")
+    assert put_paths == ["/file_service/files/large.bin", "/file_service/files/large.csv"]
+
+    loopback_server.request_log.clear()
+    download_result = file_service.download_file_batch(FileDownloadInterface(
+        file_name_list=list(file_data_dict),
+        current_session=loopback_session,
+        setting=loopback_setting,
+    ))
+    assert download_result.download_success, download_result.error_message
+    for file_name, data in file_data_dict.items():
+        with open(loopback_setting.local_file_dir + file_name, "rb") as f:
+            assert f.read() == data
+    assert not [name for name in os.listdir(loopback_setting.local_file_dir) if name.endswith(".part")]
+    large_ranges = [range_header for method, path, range_header in loopback_server.request_log
+                    if method == "GET" and path == "/file_service/files/large.bin"]
+    assert sorted(large_ranges) == ["bytes=0-102399", "bytes=102400-204799", "bytes=204800-307199",
+                                    "bytes=307200-307206"]
+
+
+def test_byte_progress_counts_only_the_file_bodies(loopback_session, loopback_setting, file_service, tmp_path):
+    """Uploads count the sent bodies and downloads the received ones, headers and replies aside."""
+    loopback_setting.upload_small_file_size = 64 * 1024
+    loopback_setting.upload_content_encoding = None
+    loopback_setting.download_range_size = 100 * 1024
+    upload_dir = tmp_path / "upload"
+    upload_dir.mkdir()
+    file_data_dict = {"first.bin": synthetic_body(250 * 1024 + 3), "second.bin": synthetic_body(150 * 1024)}
+    for file_name, data in file_data_dict.items():
+        (upload_dir / file_name).write_bytes(data)
+    total_size = sum(len(data) for data in file_data_dict.values())
+
+    upload_progress = []
+    upload_result = file_service.upload_file_batch(FileUploadInterface(
+        file_path_or_file_dir_path=str(upload_dir),
+        current_session=loopback_session,
+        setting=loopback_setting,
+        byte_progress_callback=lambda transferred, total: upload_progress.append((transferred, total)),
+    ))
+    assert upload_result.upload_success, upload_result.error_message
+    assert max(upload_progress) == (total_size, total_size)
+
+    download_progress = []
+    download_result = file_service.download_file_batch(FileDownloadInterface(
+        file_name_list=list(file_data_dict),
+        current_session=loopback_session,
+        setting=loopback_setting,
+        byte_progress_callback=lambda transferred, total: download_progress.append((transferred, total)),
+    ))
+    assert download_result.download_success, download_result.error_message
+    assert max(transferred for transferred, _ in download_progress) == total_size
+    assert max(total for _, total in download_progress if total is not None) == total_size
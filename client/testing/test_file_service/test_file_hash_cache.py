@@ -0,0 +1,94 @@
+import base64
+import hashlib
+import os
+
+from service.file_hash_cache import FileHashCache
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+
+def test_cache_survives_restart_and_detects_changes(tmp_path):
+    """Digests are persisted, and a changed stat makes an entry stale."""
+    file_path = tmp_path / "a.txt"
+    file_path.write_bytes(b"hello")
+    cache = FileHashCache(str(tmp_path / "cache.sqlite3"))
+    cache.put(str(file_path), os.stat(file_path), "cached")
+    cache.close()
+
+    cache = FileHashCache(str(tmp_path / "cache.sqlite3"), memory_capacity=1)
+    assert cache.get(str(file_path), os.stat(file_path)) == "cached"
+
+    file_path.write_bytes(b"hello world")
+    assert cache.get(str(file_path), os.stat(file_path)) is None
+
+
+def test_corrupt_cache_starts_over(tmp_path):
+    """A damaged database only loses entries."""
+    cache_path = tmp_path / "cache.sqlite3"
+    cache_path.write_bytes(b"not a database" * 100)
+    file_path = tmp_path / "a.txt"
+    file_path.write_bytes(b"hello")
+
+    cache = FileHashCache(str(cache_path))
+    assert cache.get(str(file_path), os.stat(file_path)) is None
+    cache.put(str(file_path), os.stat(file_path), "cached")
+    assert FileHashCache(str(cache_path)).get(str(file_path), os.stat(file_path)) == "cached"
+
+
+def test_backend_serves_hash_from_cache(tmp_path):
+    """Saved and moved files are hashed without reading them again."""
+    backend = LocalFileBackend(str(tmp_path / "cache.sqlite3"))
+    part_path = str(tmp_path / "b.txt.part")
+    backend.save_file(part_path, b"data")
+    backend.replace_file(part_path, str(tmp_path / "b.txt"))
+
+    assert backend.hash_cache.get(str(tmp_path / "b.txt"), os.stat(tmp_path / "b.txt")) == hashlib.md5(b"data").hexdigest()
+    assert backend.get_file_hash(str(tmp_path / "b.txt")) == hashlib.md5(b"data").hexdigest()
+
+
+def test_ingest_hashes_and_encodes_in_one_pass(tmp_path):
+    """Blocks are encoded without carries, so the output equals a one-shot base64."""
+    data = os.urandom(3 * 256 * 1024 * 2 + 5)
+    file_path = tmp_path / "c.bin"
+    file_path.write_bytes(data)
+    backend = LocalFileBackend(str(tmp_path / "cache.sqlite3"))
+
+    base64_output = bytearray(b"prefix")
+    assert backend.ingest_file(str(file_path), base64_output) == hashlib.md5(data).hexdigest()
+    assert base64_output == b"prefix" + base64.b64encode(data)
+    assert backend.get_cached_file_hash(str(file_path)) == hashlib.md5(data).hexdigest()
+
+
+def test_backend_keeps_its_cache_in_the_local_file_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    local_file_dir = tmp_path / "local_files"
+    local_file_dir.mkdir()
+    (local_file_dir / "a.txt").write_bytes(b"hello")
+    backend = LocalFileBackend(local_file_dir=str(local_file_dir) + os.sep)
+    backend.get_file_hash(str(local_file_dir / "a.txt"))
+    backend.hash_cache.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["local_files"]
+    assert ".hash_cache.sqlite3" in os.listdir(local_file_dir)
+    # found again by the next run
+    backend = LocalFileBackend(local_file_dir=str(local_file_dir))
+    assert backend.get_cached_file_hash(str(local_file_dir / "a.txt")) == hashlib.md5(b"hello").hexdigest()
+
+
+def test_backend_without_a_directory_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_bytes(b"hello")
+    backend = LocalFileBackend()
+    backend.get_file_hash("a.txt")
+
+    assert backend.get_cached_file_hash("a.txt") == hashlib.md5(b"hello").hexdigest()
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_cache_is_not_uploaded_with_its_directory(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"hello")
+    backend = LocalFileBackend(local_file_dir=str(tmp_path))
+    backend.get_file_hash(str(tmp_path / "a.txt"))
+
+    file_path_dict, _ = FileService(HttpClientSocket(), backend)._collect_upload_files(str(tmp_path))
+    assert list(file_path_dict) == ["a.txt"]
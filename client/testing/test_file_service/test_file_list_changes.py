@@ -0,0 +1,54 @@
+import json
+
+from domain.file_model import ServerFileList, SingleFile
+from domain.http_model import HTTPLayerInterfaceResponse, HTTPResponse
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+
+def build_changes_response(changed_file_list, removed_file_list, full_list=False, cursor="journal.7"):
+    payload = {
+        "request_success": True,
+        "request_data": [{"file_name": name, "file_hash": file_hash} for name, file_hash in changed_file_list],
+        "removed_file_list": removed_file_list,
+        "full_list": full_list,
+        "cursor": cursor,
+    }
+    return HTTPLayerInterfaceResponse(
+        http_response=HTTPResponse(status_code=200, payload_bytes=json.dumps(payload).encode("utf-8")))
+
+
+def build_cached_file_list():
+    return ServerFileList(valid_list=True, cursor="journal.3", file_list=[
+        SingleFile(file_name="a.txt", file_hash="1"),
+        SingleFile(file_name="b.txt", file_hash="2"),
+        SingleFile(file_name="c.txt", file_hash="3"),
+    ])
+
+
+def test_delta_is_applied_to_the_cached_list(tmp_path):
+    file_service = FileService(HttpClientSocket(), LocalFileBackend(local_file_dir=str(tmp_path)))
+    response = build_changes_response([("b.txt", "20"), ("d.txt", "4"), ("c.txt", "3")], ["a.txt", "gone.txt"])
+    delta = file_service._parse_file_changes_response(response, build_cached_file_list())
+
+    assert delta.valid_delta and not delta.full_list
+    assert [file.file_name for file in delta.added_file_list] == ["d.txt"]
+    assert [file.file_name for file in delta.modified_file_list] == ["b.txt"]
+    # files the cache never had are not reported as removed
+    assert delta.removed_file_name_list == ["a.txt"]
+    # the cached order is kept, new files go to the end
+    assert [(file.file_name, file.file_hash) for file in delta.server_file_list.file_list] == [
+        ("b.txt", "20"), ("c.txt", "3"), ("d.txt", "4")]
+    assert delta.server_file_list.cursor == "journal.7"
+
+
+def test_full_list_is_diffed_against_the_cached_list(tmp_path):
+    file_service = FileService(HttpClientSocket(), LocalFileBackend(local_file_dir=str(tmp_path)))
+    response = build_changes_response([("c.txt", "3"), ("e.txt", "5"), ("a.txt", "10")], [], full_list=True)
+    delta = file_service._parse_file_changes_response(response, build_cached_file_list())
+
+    assert delta.full_list
+    assert delta.removed_file_name_list == ["b.txt"]
+    assert [file.file_name for file in delta.added_file_list] == ["e.txt"]
+    assert [file.file_name for file in delta.modified_file_list] == ["a.txt"]
+    assert [file.file_name for file in delta.server_file_list.file_list] == ["a.txt", "c.txt", "e.txt"]
@@ -0,0 +1,95 @@
+import json
+import socketserver
+import threading
+
+import pytest
+from domain.authentication_model import Session
+from domain.file_model import FetchServerFilePageInterface, FileListSortKey
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE, Setting
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+SERVER_FILE_NAMES = [f"file_{index:02d}.txt" for index in range(5)]
+
+
+class FilePageHandler(socketserver.StreamRequestHandler):
+    """Answer list_files requests with pages of SERVER_FILE_NAMES, logging the requests."""
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            content_length = 0
+            while (header_line := self.rfile.readline()) not in (b"\r\n", b""):
+                name, _, value = header_line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            request_data = json.loads(self.rfile.read(content_length))
+            self.server.request_log.append(request_data)
+
+            page_token = request_data["page_token"]
+            start = 0 if page_token is None else SERVER_FILE_NAMES.index(json.loads(page_token)[0]) + 1
+            page_file_names = SERVER_FILE_NAMES[start:start + request_data["page_size"]]
+            response_data = {
+                "request_success": True,
+                "request_data": [{"file_name": file_name, "file_hash": file_name.upper(), "file_size": index,
+                                  "file_mtime": 1748944800.5} for index, file_name in enumerate(page_file_names)],
+                "cursor": "journal.4",
+            }
+            if start + len(page_file_names) < len(SERVER_FILE_NAMES):
+                response_data["next_page_token"] = json.dumps([page_file_names[-1]])
+            if page_token is None:
+                response_data["total_count"] = len(SERVER_FILE_NAMES)
+            body = json.dumps(response_data).encode("utf-8")
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                             % (len(body), body))
+
+
+@pytest.fixture
+def page_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FilePageHandler)
+    server.daemon_threads = True
+    server.request_log = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_pages_follow_the_page_token(page_server, tmp_path):
+    setting = Setting()
+    setting.http_request_template = DEFAULT_HTTP_REQUEST_TEMPLATE
+    setting.file_service_url = "/file_service"
+    page_interface = FetchServerFilePageInterface(
+        current_session=Session(session_token=None,
+                                session_server_info=HTTPServerAddress(host_ip="127.0.0.1",
+                                                                      port=page_server.server_address[1])),
+        setting=setting,
+        page_size=2,
+        name_pattern="file_*.txt",
+        sort_by=FileListSortKey.SIZE,
+        descending=True,
+    )
+    file_service = FileService(HttpClientSocket(), LocalFileBackend(local_file_dir=str(tmp_path)))
+
+    pages = []
+    while True:
+        page = file_service.fetch_server_file_page(page_interface)
+        assert page.valid_list, page.error_message
+        pages.append(page)
+        if page.next_page_token is None:
+            break
+        page_interface.page_token = page.next_page_token
+
+    assert [[file.file_name for file in page.file_list] for page in pages] == [
+        SERVER_FILE_NAMES[0:2], SERVER_FILE_NAMES[2:4], SERVER_FILE_NAMES[4:]]
+    # the total is only counted for the first page
+    assert [page.total_count for page in pages] == [5, None, None]
+    assert pages[0].cursor == "journal.4"
+    assert pages[0].file_list[1].file_size == 1 and pages[0].file_list[1].file_mtime == 1748944800.5
+    first_request = page_server.request_log[0]
+    assert first_request["request_type"] == "list_files"
+    assert (first_request["page_size"], first_request["name_pattern"], first_request["sort_by"],
+            first_request["descending"]) == (2, "file_*.txt", "size", True)
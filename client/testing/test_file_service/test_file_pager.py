@@ -0,0 +1,36 @@
+from service import file_pager
+from service.file_pager import MappedTextFile, decode_utf8_prefix
+
+
+def test_lines_are_paged_across_index_steps(tmp_path, monkeypatch):
+    """Windows of lines match the file, whatever the index step boundaries cut."""
+    monkeypatch.setattr(file_pager, "LINE_INDEX_STEP_SIZE", 7)
+    lines = [f"行 {index} ünïcode" for index in range(200)]
+    file_path = tmp_path / "a.log"
+    file_path.write_bytes(("\r\n".join(lines) + "\n").encode("utf-8"))
+
+    with MappedTextFile(str(file_path)) as mapped_file:
+        assert mapped_file.wait_for_index(5)
+        assert mapped_file.line_count == 200
+        assert mapped_file.read_lines(0, 3) == lines[:3]
+        assert mapped_file.read_lines(198, 10) == lines[198:]
+        assert mapped_file.read_lines(200, 10) == []
+
+
+def test_windows_start_at_character_boundaries(tmp_path):
+    """A byte window or prefix never starts or ends in the middle of a character."""
+    file_path = tmp_path / "b.txt"
+    file_path.write_bytes("äöü".encode("utf-8"))
+
+    with MappedTextFile(str(file_path)) as mapped_file:
+        assert mapped_file.read_window(1, 100) == "öü"
+    assert decode_utf8_prefix("äöü".encode("utf-8")[:3]) == "ä"
+
+
+def test_empty_file(tmp_path):
+    file_path = tmp_path / "c.txt"
+    file_path.write_bytes(b"")
+
+    with MappedTextFile(str(file_path)) as mapped_file:
+        assert mapped_file.wait_for_index(5)
+        assert mapped_file.read_lines(0, 10) == []
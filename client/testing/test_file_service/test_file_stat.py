@@ -0,0 +1,100 @@
+import asyncio
+import socketserver
+import threading
+
+import pytest
+from domain.authentication_model import Session
+from domain.file_model import FileStatInterface
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE, Setting
+from service.async_file_service import AsyncFileService
+from service.async_http_client import AsyncHttpClient
+from service.file_service import FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+SERVER_FILES = {
+    b"/file_service/metadata/a.txt": (b'"0cc175b9c0f1b6a831c399e269772661"', 1),
+    b"/file_service/metadata/b%20c.bin": (b'"92eb5ffee6ae2fec3ad71c777531578f"', 123456789),
+}
+
+
+class MetadataHandler(socketserver.StreamRequestHandler):
+    """Answer metadata requests from SERVER_FILES, counting connections and requests."""
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connection_count += 1
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            while self.rfile.readline() not in (b"\r\n", b""):
+                pass
+            method, path = request_line.split()[:2]
+            with self.server.lock:
+                self.server.request_log.append((method, path))
+            if path in SERVER_FILES:
+                etag, size = SERVER_FILES[path]
+                self.wfile.write(b"HTTP/1.1 204 No Content\r\nETag: %s\r\nLast-Modified: Tue, 03 Jun 2025 10:00:00 GMT\r\n"
+                                 b"X-File-Size: %d\r\nX-File-Mtime: 1748944800.250000\r\n\r\n" % (etag, size))
+            else:
+                # a HEAD answer has the headers of the GET answer, but no body
+                body = b"" if method == b"HEAD" else b"not found"
+                self.wfile.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 9\r\n\r\n" + body)
+
+
+@pytest.fixture
+def metadata_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), MetadataHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connection_count = 0
+    server.request_log = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def build_stat_interface(server, file_name_list):
+    setting = Setting()
+    setting.http_request_template = DEFAULT_HTTP_REQUEST_TEMPLATE
+    setting.file_service_url = "/file_service"
+    return FileStatInterface(
+        file_name_list=file_name_list,
+        current_session=Session(session_token=None,
+                                session_server_info=HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])),
+        setting=setting,
+    )
+
+
+def check_file_stat_list(file_stat_list):
+    assert [file_stat.exists for file_stat in file_stat_list] == [True, False, True]
+    assert file_stat_list[0].file_hash == "0cc175b9c0f1b6a831c399e269772661"
+    assert file_stat_list[0].file_size == 1
+    assert file_stat_list[1].file_name == "missing.txt" and file_stat_list[1].file_hash is None
+    assert file_stat_list[2].file_size == 123456789
+    assert file_stat_list[2].mtime == 1748944800.25
+    assert file_stat_list[2].last_modified == "Tue, 03 Jun 2025 10:00:00 GMT"
+
+
+def test_stat_of_selected_files_is_pipelined(metadata_server, tmp_path):
+    file_service = FileService(HttpClientSocket(), LocalFileBackend(local_file_dir=str(tmp_path)))
+    result = file_service.stat_remote_files(build_stat_interface(metadata_server, ["a.txt", "missing.txt", "b c.bin"]))
+
+    assert result.stat_success, result.error_message
+    check_file_stat_list(result.file_stat_list)
+    # HEAD requests for only these files, all on one connection
+    assert [method for method, _ in metadata_server.request_log] == [b"HEAD"] * 3
+    assert metadata_server.connection_count == 1
+
+
+def test_async_stat_gives_the_same_result(metadata_server, tmp_path):
+    async def run():
+        file_service = AsyncFileService(AsyncHttpClient(), LocalFileBackend(local_file_dir=str(tmp_path)))
+        return await file_service.stat_remote_files(
+            build_stat_interface(metadata_server, ["a.txt", "missing.txt", "b c.bin"]))
+
+    result = asyncio.run(run())
+    assert result.stat_success, result.error_message
+    check_file_stat_list(result.file_stat_list)
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+from benchmark.loopback_server import LoopbackRequestHandler, synthetic_body
+from domain.file_model import FileUploadInterface, SingleFile
+from domain.setting_model import Setting
+from service.file_service import ByteBudget, FileService, LocalFileBackend
+from service.http_client import HttpClientSocket
+
+
+def test_budget_blocks_until_released():
+    budget = ByteBudget(100)
+    assert budget.acquire(60) == 60
+    acquired = threading.Event()
+
+    def acquire_rest():
+        budget.acquire(50)
+        acquired.set()
+
+    waiter = threading.Thread(target=acquire_rest)
+    waiter.start()
+    assert not acquired.wait(0.1)
+    budget.release(60)
+    assert acquired.wait(5)
+    waiter.join()
+    # 50 of 100 are still held
+    assert budget.acquire(50) == 50
+
+
+def test_oversized_request_runs_alone():
+    """More than the whole budget is clamped to it, so it waits for everything else to finish."""
+    budget = ByteBudget(100)
+    budget.acquire(1)
+    reserved = []
+    waiter = threading.Thread(target=lambda: reserved.append(budget.acquire(1000)))
+    waiter.start()
+    waiter.join(0.1)
+    assert reserved == []
+    budget.release(1)
+    waiter.join(5)
+    assert reserved == [100]
+    budget.release(100)
+    assert budget.acquire(100) == 100
+
+
+def plan(file_size_list, upload_small_file_size=100, upload_batch_size=250):
+    setting = Setting()
+    setting.upload_small_file_size = upload_small_file_size
+    setting.upload_batch_size = upload_batch_size
+    file_info_list = [SingleFile(file_name=f"f{index}") for index in range(len(file_size_list))]
+    file_size_dict = {file_info.file_name: size for file_info, size in zip(file_info_list, file_size_list)}
+    file_service = FileService(HttpClientSocket(), LocalFileBackend())
+    return [[file_info.file_name for file_info in task]
+            for task in file_service._plan_upload_tasks(file_info_list, file_size_dict, setting)]
+
+
+def test_large_files_get_a_task_each():
+    assert plan([100, 500, 99]) == [["f0"], ["f1"], ["f2"]]
+
+
+def test_small_files_are_batched_up_to_the_batch_size():
+    # 99 + 99 fit, a third would not; a batch may be exactly the batch size
+    assert plan([99, 99, 99, 52, 99, 0, 1]) == [["f0", "f1"], ["f2", "f3", "f4", "f5"], ["f6"]]
+    assert plan([50] * 5) == [["f0", "f1", "f2", "f3", "f4"]]
+    assert plan([50] * 6) == [["f0", "f1", "f2", "f3", "f4"], ["f5"]]
+
+
+def test_small_files_between_large_ones_share_batches():
+    assert plan([10, 200, 20, 300, 30]) == [["f1"], ["f3"], ["f0", "f2", "f4"]]
+    assert plan([]) == []
+
+
+@pytest.fixture
+def upload_setting(loopback_setting):
+    loopback_setting.upload_small_file_size = 64 * 1024
+    loopback_setting.upload_batch_size = 8 * 1024
+    # room for one batch at a time
+    loopback_setting.upload_memory_limit = 3 * 8 * 1024
+    return loopback_setting
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    upload_dir = tmp_path / "upload"
+    upload_dir.mkdir()
+    file_data_dict = {f"large_{index}.bin": synthetic_body(100 * 1024 + index) for index in range(4)}
+    file_data_dict.update({f"small_{index:02d}.txt": synthetic_body(1000 + index, compressible=True)
+                           for index in range(20)})
+    for file_name, data in file_data_dict.items():
+        (upload_dir / file_name).write_bytes(data)
+    return upload_dir
+
+
+def upload(file_service, session, setting, upload_dir, **kwargs):
+    return file_service.upload_file_batch(FileUploadInterface(
+        file_path_or_file_dir_path=str(upload_dir), current_session=session, setting=setting, **kwargs))
+
+
+def test_parallel_upload(loopback_server, loopback_session, upload_setting, file_service, upload_dir):
+    progress_list = []
+    result = upload(file_service, loopback_session, upload_setting, upload_dir, progress_callback=progress_list.append)
+    assert result.upload_success, result.error_message
+    assert sorted(result.uploaded_file_name_list) == sorted(path.name for path in upload_dir.iterdir())
+    for path in upload_dir.iterdir():
+        with open(f"{loopback_server.file_dir}/{path.name}", "rb") as f:
+            assert f.read() == path.read_bytes()
+    assert [progress.finished_file_count for progress in progress_list] == list(range(1, 25))
+    json_uploads = [path for method, path, _ in loopback_server.request_log if method == "POST"]
+    # one list request, 20 small files in batches of 7 files or fewer
+    assert len(json_uploads) == 1 + 3
+
+    # nothing changed, nothing is sent again
+    loopback_server.request_log.clear()
+    result = upload(file_service, loopback_session, upload_setting, upload_dir)
+    assert result.upload_success, result.error_message
+    assert result.uploaded_file_name_list == []
+    assert len(result.already_uploaded_file_name_list) == 24
+    assert [method for method, _, _ in loopback_server.request_log] == ["POST"]
+
+
+def test_failed_file_does_not_fail_the_others(loopback_server, loopback_session, upload_setting, file_service,
+                                              upload_dir, monkeypatch):
+    handle_raw_upload = LoopbackRequestHandler._handle_raw_upload
+
+    def failing_upload(self, file_name):
+        if file_name != "large_1.bin":
+            handle_raw_upload(self, file_name)
+            return
+        self._read_body()
+        self._send(500, b"Disk full", "text/plain")
+
+    monkeypatch.setattr(LoopbackRequestHandler, "_handle_raw_upload", failing_upload)
+    result = upload(file_service, loopback_session, upload_setting, upload_dir)
+    assert not result.upload_success
+    assert result.error_message.startswith("Failed to upload 'large_1.bin'")
+    assert "\n" not in result.error_message
+    assert len(result.uploaded_file_name_list) == 23
+    assert "large_1.bin" not in loopback_server.file_hash_dict
+
+
+def test_cancelled_upload_stops_starting_tasks(loopback_server, loopback_session, upload_setting, file_service,
+                                               upload_dir):
+    upload_setting.upload_concurrency = 1
+    cancel_event = threading.Event()
+    result = upload(file_service, loopback_session, upload_setting, upload_dir,
+                    progress_callback=lambda progress: cancel_event.set(), cancel_event=cancel_event)
+    assert not result.upload_success
+    assert "Transfer cancelled by user." in result.error_message
+    # the task running when the event was set may still reach the server, nothing after it starts
+    assert 1 <= len(result.uploaded_file_name_list) <= 2
+    assert set(result.uploaded_file_name_list) <= set(loopback_server.file_hash_dict)
+    assert len(loopback_server.file_hash_dict) <= 2
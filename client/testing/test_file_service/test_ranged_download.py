@@ -0,0 +1,301 @@
+import asyncio
+import gzip
+import re
+import threading
+import time
+
+import pytest
+from benchmark.loopback_server import LoopbackRequestHandler, synthetic_body
+from domain.file_model import FileDownloadInterface
+from service.async_file_service import AsyncFileService
+from service.async_http_client import AsyncHttpClient
+from service.file_service import LocalFileBackend
+
+RANGE_SIZE = 100 * 1024
+FILE_DATA = synthetic_body(450 * 1024 + 11)
+
+
+@pytest.fixture
+def range_setting(loopback_setting):
+    loopback_setting.download_range_size = RANGE_SIZE
+    loopback_setting.download_range_retries = 1
+    return loopback_setting
+
+
+def download(file_service, session, setting, file_name_list=("data.bin",)):
+    return file_service.download_file_batch(FileDownloadInterface(
+        file_name_list=list(file_name_list), current_session=session, setting=setting))
+
+
+def get_ranges(server, file_name="data.bin") -> list[str]:
+    return [range_header for method, path, range_header in server.request_log
+            if method == "GET" and path == f"/file_service/files/{file_name}"]
+
+
+def patch_raw_download(monkeypatch, before):
+    """Run before(handler) ahead of every raw download of the loopback server."""
+    handle_raw_download = LoopbackRequestHandler._handle_raw_download
+
+    def patched(self, file_name):
+        before(self)
+        handle_raw_download(self, file_name)
+
+    monkeypatch.setattr(LoopbackRequestHandler, "_handle_raw_download", patched)
+
+
+def test_resume_from_verified_prefix(loopback_server, loopback_session, range_setting, file_service):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    with open(range_setting.local_file_dir + "data.bin.part", "wb") as f:
+        f.write(FILE_DATA[:150 * 1024])
+
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    # nothing before the part's end travelled again
+    assert min(int(re.match(r"bytes=(\d+)", range_header).group(1))
+               for range_header in get_ranges(loopback_server)) == 150 * 1024
+
+
+def test_part_longer_than_the_file_starts_over(loopback_server, loopback_session, range_setting, file_service):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    with open(range_setting.local_file_dir + "data.bin.part", "wb") as f:
+        f.write(FILE_DATA + b"stale tail")
+
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(loopback_server)[:2] == [f"bytes={len(FILE_DATA) + 10}-{len(FILE_DATA) + 10 + RANGE_SIZE - 1}",
+                                               f"bytes=0-{RANGE_SIZE - 1}"]
+
+
+def test_corrupt_prefix_is_dropped(loopback_server, loopback_session, range_setting, file_service):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    with open(range_setting.local_file_dir + "data.bin.part", "wb") as f:
+        f.write(b"x" * 1024)
+
+    result = download(file_service, loopback_session, range_setting)
+    assert not result.download_success
+    assert "hash mismatch" in result.error_message
+    # useless for resuming, the next attempt starts from zero and succeeds
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+
+
+def test_whole_file_answer_to_the_first_range(loopback_server, loopback_session, range_setting, file_service,
+                                               monkeypatch):
+    """A server that ignores Range sends the whole file once, which is written from offset 0."""
+    loopback_server.add_file("data.bin", FILE_DATA)
+    with open(range_setting.local_file_dir + "data.bin.part", "wb") as f:
+        f.write(b"x" * 1024)
+    patch_raw_download(monkeypatch, lambda handler: handler.headers.replace_header("Range", "none"))
+
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(loopback_server) == [f"bytes=1024-{1024 + RANGE_SIZE - 1}"]
+
+
+def ignore_range_after_the_first_request(monkeypatch):
+    """Make the loopback server answer every request but the first with the whole file."""
+    request_count = 0
+
+    def ignore_range(handler):
+        nonlocal request_count
+        request_count += 1
+        if request_count > 1:
+            handler.headers.replace_header("Range", "none")
+
+    patch_raw_download(monkeypatch, ignore_range)
+
+
+def test_whole_file_answer_to_a_later_range_is_not_retried(loopback_server, loopback_session, range_setting,
+                                                            file_service, monkeypatch):
+    """Ranges are given up on after the first 200, the whole file is fetched once instead."""
+    loopback_server.add_file("data.bin", FILE_DATA)
+    range_setting.download_range_retries = 3
+    ignore_range_after_the_first_request(monkeypatch)
+
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    range_list = get_ranges(loopback_server)
+    assert range_list[0] == f"bytes=0-{RANGE_SIZE - 1}"
+    assert range_list[-1] == f"bytes=0-{len(FILE_DATA) - 1}"
+    # the worker may have picked up the next range before the first 200 was seen, but no range is asked twice
+    later_range_list = range_list[1:-1]
+    assert later_range_list[0] == f"bytes={RANGE_SIZE}-{2 * RANGE_SIZE - 1}"
+    assert len(later_range_list) <= 2 and len(set(later_range_list)) == len(later_range_list)
+
+
+def test_async_whole_file_answer_to_a_later_range_is_not_retried(loopback_server, loopback_session, range_setting,
+                                                                  monkeypatch, tmp_path):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    range_setting.download_range_retries = 3
+    ignore_range_after_the_first_request(monkeypatch)
+
+    async def run():
+        file_service = AsyncFileService(AsyncHttpClient(), LocalFileBackend(local_file_dir=str(tmp_path)))
+        return await file_service.download_file_batch(FileDownloadInterface(
+            file_name_list=["data.bin"], current_session=loopback_session, setting=range_setting))
+
+    result = asyncio.run(run())
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(loopback_server) == [f"bytes=0-{RANGE_SIZE - 1}", f"bytes={RANGE_SIZE}-{2 * RANGE_SIZE - 1}",
+                                           f"bytes=0-{len(FILE_DATA) - 1}"]
+
+
+def gzip_whole_file_after_the_first_request(monkeypatch) -> list[str]:
+    """Make the loopback server answer every request but the first with the whole file, gzipped and chunked.
+
+    Returns the list the Accept-Encoding header of every request is logged to.
+    """
+    handle_raw_download = LoopbackRequestHandler._handle_raw_download
+    accept_encoding_list = []
+
+    def gzip_after_the_first_request(handler, file_name):
+        accept_encoding_list.append(handler.headers.get("Accept-Encoding"))
+        if len(accept_encoding_list) == 1:
+            handle_raw_download(handler, file_name)
+            return
+        handler._read_body()
+        body = gzip.compress(FILE_DATA)
+        handler.send_response(200)
+        handler.send_header("Content-Encoding", "gzip")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        for offset in range(0, len(body), 65536):
+            chunk = body[offset:offset + 65536]
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        handler.wfile.write(b"0\r\n\r\n")
+
+    monkeypatch.setattr(LoopbackRequestHandler, "_handle_raw_download", gzip_after_the_first_request)
+    return accept_encoding_list
+
+
+def test_gzipped_whole_file_answer_to_a_later_range_is_not_retried(loopback_server, loopback_session, range_setting,
+                                                                    file_service, monkeypatch):
+    """A whole-file answer is recognized before its body is read, also when it is gzipped and chunked."""
+    loopback_server.add_file("data.bin", FILE_DATA)
+    range_setting.download_range_retries = 3
+    accept_encoding_list = gzip_whole_file_after_the_first_request(monkeypatch)
+
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    range_list = get_ranges(loopback_server)
+    assert range_list[-1] == f"bytes=0-{len(FILE_DATA) - 1}"
+    later_range_list = range_list[1:-1]
+    assert len(later_range_list) <= 2 and len(set(later_range_list)) == len(later_range_list)
+    assert set(accept_encoding_list) == {"identity"}
+
+
+def test_async_gzipped_whole_file_answer_to_a_later_range_is_not_retried(loopback_server, loopback_session,
+                                                                          range_setting, monkeypatch, tmp_path):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    range_setting.download_range_retries = 3
+    gzip_whole_file_after_the_first_request(monkeypatch)
+    # no body is held in memory, each one is written to the part file while it arrives
+    sink_list = []
+    handle_request = AsyncHttpClient.handle_request
+
+    async def record_sink(client, request):
+        if request.range is not None:
+            sink_list.append(request.response_body_sink)
+        return await handle_request(client, request)
+
+    monkeypatch.setattr(AsyncHttpClient, "handle_request", record_sink)
+
+    async def run():
+        file_service = AsyncFileService(AsyncHttpClient(), LocalFileBackend(local_file_dir=str(tmp_path)))
+        return await file_service.download_file_batch(FileDownloadInterface(
+            file_name_list=["data.bin"], current_session=loopback_session, setting=range_setting))
+
+    result = asyncio.run(run())
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(loopback_server) == [f"bytes=0-{RANGE_SIZE - 1}", f"bytes={RANGE_SIZE}-{2 * RANGE_SIZE - 1}",
+                                           f"bytes=0-{len(FILE_DATA) - 1}"]
+    assert len(sink_list) == 3 and None not in sink_list
+
+
+def test_mismatched_content_range_is_rejected(loopback_server, loopback_session, range_setting, file_service,
+                                              monkeypatch):
+    """A partial answer for other bytes than requested is never written, the verified prefix is kept."""
+    loopback_server.add_file("data.bin", FILE_DATA)
+
+    def shift_later_ranges(handler):
+        first, last = map(int, re.fullmatch(r"bytes=(\d+)-(\d+)", handler.headers["Range"]).groups())
+        if first > 0:
+            handler.headers.replace_header("Range", f"bytes={first + 1}-{last + 1}")
+
+    patch_raw_download(monkeypatch, shift_later_ranges)
+    result = download(file_service, loopback_session, range_setting)
+    assert not result.download_success
+    assert "does not match the requested range" in result.error_message
+    with open(range_setting.local_file_dir + "data.bin.part", "rb") as f:
+        assert f.read() == FILE_DATA[:RANGE_SIZE]
+
+    monkeypatch.undo()
+    loopback_server.request_log.clear()
+    result = download(file_service, loopback_session, range_setting)
+    assert result.download_success, result.error_message
+    with open(range_setting.local_file_dir + "data.bin", "rb") as f:
+        assert f.read() == FILE_DATA
+    assert get_ranges(loopback_server)[0] == f"bytes={RANGE_SIZE}-{2 * RANGE_SIZE - 1}"
+
+
+def test_mismatched_first_range_is_rejected(loopback_server, loopback_session, range_setting, file_service,
+                                            monkeypatch):
+    loopback_server.add_file("data.bin", FILE_DATA)
+    patch_raw_download(monkeypatch, lambda handler: handler.headers.replace_header("Range", f"bytes=1-{RANGE_SIZE}"))
+
+    result = download(file_service, loopback_session, range_setting)
+    assert not result.download_success
+    with open(range_setting.local_file_dir + "data.bin.part", "rb") as f:
+        assert f.read() == b""
+
+
+@pytest.mark.parametrize("file_count, range_concurrency", [(1, 4), (6, 2)])
+def test_concurrent_ranges_and_files(loopback_server, loopback_session, range_setting, file_service, monkeypatch,
+                                     file_count, range_concurrency):
+    file_data_dict = {f"data_{index}.bin": synthetic_body(250 * 1024 + index) + bytes([index])
+                      for index in range(file_count)}
+    for file_name, data in file_data_dict.items():
+        loopback_server.add_file(file_name, data)
+    range_setting.download_concurrency = 3
+    range_setting.download_range_concurrency = range_concurrency
+    active_lock = threading.Lock()
+    active_count = max_active_count = 0
+    handle_raw_download = LoopbackRequestHandler._handle_raw_download
+
+    def counted(self, file_name):
+        nonlocal active_count, max_active_count
+        with active_lock:
+            active_count += 1
+            max_active_count = max(max_active_count, active_count)
+        try:
+            # long enough for the other workers to get their requests in
+            time.sleep(0.05)
+            handle_raw_download(self, file_name)
+        finally:
+            with active_lock:
+                active_count -= 1
+
+    monkeypatch.setattr(LoopbackRequestHandler, "_handle_raw_download", counted)
+    result = download(file_service, loopback_session, range_setting, file_data_dict)
+    assert result.download_success, result.error_message
+    assert sorted(result.downloaded_file_name_list) == sorted(file_data_dict)
+    for file_name, data in file_data_dict.items():
+        with open(range_setting.local_file_dir + file_name, "rb") as f:
+            assert f.read() == data
+    assert max_active_count > 1
+    # each file has its own pool of range workers
+    assert max_active_count <= range_setting.download_concurrency * range_concurrency
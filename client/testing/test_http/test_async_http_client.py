@@ -0,0 +1,56 @@
+import asyncio
+import socketserver
+import threading
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.async_http_client import AsyncHttpClient
+
+
+class KeepAliveHandler(socketserver.StreamRequestHandler):
+    """Answer every request on a connection with its path, keeping the connection open."""
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            while self.rfile.readline() not in (b"\r\n", b""):
+                pass
+            body = request_line.split()[1]
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+
+
+@pytest.fixture
+def local_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), KeepAliveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_requests_share_the_pool(local_server):
+    """Requests run concurrently on one loop and reuse the connections afterwards."""
+
+    def build_request(path: str):
+        request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+        request.url = path
+        request.server_connection = local_server
+        return request
+
+    async def run():
+        client = AsyncHttpClient()
+        first_responses = await asyncio.gather(*(client.handle_request(build_request(f"/{i}")) for i in range(4)))
+        second_responses = await asyncio.gather(*(client.handle_request(build_request(f"/{i}")) for i in range(4)))
+        statistics = client.connection_pool.get_statistics()
+        client.close()
+        return first_responses + second_responses, statistics
+
+    responses, statistics = asyncio.run(run())
+    assert [response.http_response.payload_bytes for response in responses] == [f"/{i}".encode() for i in range(4)] * 2
+    assert statistics.misses == 4
+    assert statistics.hits == 4
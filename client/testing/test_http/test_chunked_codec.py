@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from service.chunked_codec import (ChunkedDecoder, ChunkedEncoder,
+                                   decode_chunked, encode_chunked)
+
+
+@pytest.mark.parametrize("max_chunk_size", [1, 10, 1024, 65536])
+def test_chunked_round_trip(max_chunk_size):
+    """Encoding then decoding returns the original payload."""
+    payload = os.urandom(100_000)
+    assert decode_chunked(encode_chunked(payload, max_chunk_size)) == payload
+
+
+@pytest.mark.parametrize("slice_size", [1, 2, 5, 4096])
+def test_chunked_decoder_arbitrary_slices(slice_size):
+    """The decoder copes with chunk lines and CRLFs split across slices."""
+    encoder = ChunkedEncoder(max_chunk_size=7, chunk_extensions={"signature": "abc", "last": None})
+    payload = b"The quick brown fox jumps over the lazy dog"
+    encoded = b"".join(encoder.encode(payload)) + encoder.finish({"Content-MD5": "d41d8cd9"})
+
+    decoder = ChunkedDecoder()
+    decoded = b"".join(decoder.feed(encoded[offset:offset + slice_size])
+                       for offset in range(0, len(encoded), slice_size))
+
+    assert decoded == payload
+    assert decoder.complete
+    assert decoder.trailers == {"Content-MD5": "d41d8cd9"}
+    assert decoder.chunk_extensions[0] == {"signature": "abc", "last": None}
+
+
+def test_chunked_decoder_keeps_unconsumed_bytes():
+    """Bytes after the last chunk belong to the next message."""
+    decoder = ChunkedDecoder()
+    assert decoder.feed(b"3\r\nabc\r\n0\r\n\r\nHTTP/1.1 200 OK") == b"abc"
+    assert decoder.unconsumed == b"HTTP/1.1 200 OK"
+
+
+def test_chunked_decoder_rejects_invalid_data():
+    """Malformed sizes, missing CRLFs and missing last chunks are errors."""
+    with pytest.raises(ValueError):
+        ChunkedDecoder().feed(b"zz\r\n")
+    with pytest.raises(ValueError):
+        ChunkedDecoder().feed(b"3\r\nabcd\r\n")
+    with pytest.raises(ValueError):
+        decode_chunked(b"3\r\nabc\r\n")
+    with pytest.raises(ValueError):
+        encode_chunked(b"")
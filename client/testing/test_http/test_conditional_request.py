@@ -0,0 +1,29 @@
+from domain.http_model import HTTPLayerDecodingModuleInterface, HTTPLayerEncodingModuleInterface
+from service.http_client import HttpClientSocket
+
+
+def test_encode_conditional_headers():
+    """Validators of a cached copy are sent as If-None-Match and If-Modified-Since."""
+    client = HttpClientSocket()
+    request_bytes = client._encode_request(HTTPLayerEncodingModuleInterface(
+        url="/files/a.txt",
+        method="HEAD",
+        host="localhost",
+        if_none_match='"0123abcd"',
+        if_modified_since="Sat, 17 Oct 2026 16:00:00 GMT",
+    ))
+    assert b'If-None-Match: "0123abcd"\r\n' in request_bytes
+    assert b"If-Modified-Since: Sat, 17 Oct 2026 16:00:00 GMT\r\n" in request_bytes
+
+
+def test_decode_not_modified():
+    """A 304 has no body but carries the validators."""
+    client = HttpClientSocket()
+    response = client._decode_response(HTTPLayerDecodingModuleInterface(
+        response_raw_data=(b'HTTP/1.1 304 NOT MODIFIED\r\nETag: "0123abcd"\r\n'
+                           b"Last-Modified: Sat, 17 Oct 2026 16:00:00 GMT\r\n\r\n"),
+    ))
+    assert response.status_code == 304
+    assert response.etag == '"0123abcd"'
+    assert response.last_modified == "Sat, 17 Oct 2026 16:00:00 GMT"
+    assert response.payload_bytes is None
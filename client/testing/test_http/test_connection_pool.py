@@ -0,0 +1,81 @@
+import socket
+import socketserver
+import threading
+
+import pytest
+from domain.http_model import (HTTPConnectionPoolConfigurations,
+                               HTTPServerAddress)
+from service.connection_pool import HTTPConnectionPool, is_connection_alive
+
+
+class IdleHandler(socketserver.BaseRequestHandler):
+    """Accept a connection and keep it open until the client closes it."""
+
+    def handle(self):
+        while self.request.recv(1024):
+            pass
+
+
+@pytest.fixture
+def local_servers():
+    """Start two local servers so the pool sees two different hosts."""
+    servers = []
+    for _ in range(2):
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), IdleHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield [HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1]) for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_pool_reuses_connections_per_host(local_servers):
+    """Alternating between two hosts should not reconnect."""
+    pool = HTTPConnectionPool()
+    server_a, server_b = local_servers
+
+    for _ in range(3):
+        for server in (server_a, server_b):
+            sock = pool.acquire(server, socket_timeout=1)
+            pool.release(server, sock, reusable=True)
+
+    statistics = pool.get_statistics()
+    assert statistics.misses == 2
+    assert statistics.hits == 4
+    pool.close_all()
+
+
+def test_pool_discards_stale_and_expired_connections(local_servers):
+    """Closed and idle-expired connections are never handed out."""
+    pool = HTTPConnectionPool(HTTPConnectionPoolConfigurations(idle_timeout=0))
+    server = local_servers[0]
+
+    sock = pool.acquire(server, socket_timeout=1)
+    pool.release(server, sock, reusable=True)
+    new_sock = pool.acquire(server, socket_timeout=1)
+    assert new_sock is not sock
+    assert pool.get_statistics().idle_expired == 1
+
+    new_sock.close()
+    assert not is_connection_alive(new_sock)
+
+
+def test_pool_per_host_limit(local_servers):
+    """A host at its connection limit makes acquire time out."""
+    pool = HTTPConnectionPool(HTTPConnectionPoolConfigurations(
+        max_connections_per_host=1, acquire_timeout=0.1))
+    server_a, server_b = local_servers
+
+    sock = pool.acquire(server_a, socket_timeout=1)
+    with pytest.raises(TimeoutError):
+        pool.acquire(server_a, socket_timeout=1)
+
+    # other hosts are not affected by the limit
+    other_sock = pool.acquire(server_b, socket_timeout=1)
+    pool.discard(server_b, other_sock)
+
+    pool.release(server_a, sock, reusable=False)
+    sock = pool.acquire(server_a, socket_timeout=1)
+    pool.discard(server_a, sock)
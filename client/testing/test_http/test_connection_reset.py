@@ -0,0 +1,146 @@
+import asyncio
+import socket
+import socketserver
+import struct
+import threading
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPPayloadType, HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.async_http_client import AsyncHttpClient
+from service.http_client import HttpClientSocket
+from service.response_body_pipeline import CallbackBodySink
+
+RESPONSE_BODY = b"0123456789" * 1000
+
+
+class ScriptedHandler(socketserver.StreamRequestHandler):
+    """Answer the n-th request on a connection as server.script(connection_index, n) says, logging requests.
+
+    - "answer": the whole response, the connection stays open
+    - "close": close without answering
+    - "partial_reset": the header and part of the body, then a TCP reset
+    """
+
+    def handle(self):
+        with self.server.lock:
+            connection_index = self.server.connection_count
+            self.server.connection_count += 1
+        request_index = 0
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            content_length = 0
+            while (header_line := self.rfile.readline()) not in (b"\r\n", b""):
+                name, _, value = header_line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            self.rfile.read(content_length)
+            self.server.request_log.append((connection_index, request_line.split()[0].decode()))
+
+            action = self.server.script(connection_index, request_index)
+            request_index += 1
+            header = b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(RESPONSE_BODY)
+            if action == "answer":
+                self.wfile.write(header + RESPONSE_BODY)
+                continue
+            if action == "partial_reset":
+                self.wfile.write(header + RESPONSE_BODY[:len(RESPONSE_BODY) // 2])
+                self.wfile.flush()
+                # linger 0: close sends RST instead of FIN
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.connection.close()
+            return
+
+
+@pytest.fixture
+def scripted_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connection_count = 0
+    server.request_log = []
+    server.script = lambda connection_index, request_index: "answer"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def build_request(server, method="GET", **kwargs):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE, method=method, url="/data", **kwargs)
+    request.server_connection = HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    if method in ("POST", "PUT"):
+        request.payload_type = HTTPPayloadType.JSON
+        request.payload_bytes = b'{"request_type": "upload_file"}'
+        request.content_length_before_encoding = len(request.payload_bytes)
+    return request
+
+
+def test_idle_connection_closed_before_answering_is_retried(scripted_server):
+    # the first connection is closed when its second request arrives
+    scripted_server.script = lambda connection_index, request_index: (
+        "close" if (connection_index, request_index) == (0, 1) else "answer")
+    client = HttpClientSocket()
+    for _ in range(2):
+        response = client.handle_request(build_request(scripted_server, "POST"))
+        assert response.vaild_response, response.error_message
+        assert response.http_response.payload_bytes == RESPONSE_BODY
+    assert scripted_server.request_log == [(0, "POST"), (0, "POST"), (1, "POST")]
+
+
+@pytest.mark.parametrize("method", ["GET", "POST", "PUT"])
+def test_new_connection_closed_before_answering_is_not_resent(scripted_server, method):
+    """The server may have acted on the request, only the caller can tell whether sending it again is safe."""
+    scripted_server.script = lambda connection_index, request_index: "close"
+    response = HttpClientSocket().handle_request(build_request(scripted_server, method))
+    assert not response.vaild_response
+    assert scripted_server.request_log == [(0, method)]
+
+
+def test_reset_after_part_of_the_body_is_not_retried(scripted_server):
+    """Received pieces cannot be taken back, so the request fails instead of handing the body on twice."""
+    scripted_server.script = lambda connection_index, request_index: (
+        "partial_reset" if request_index == 1 else "answer")
+    client = HttpClientSocket()
+    assert client.handle_request(build_request(scripted_server)).vaild_response
+
+    piece_list = []
+    response = client.handle_request(build_request(
+        scripted_server, response_body_sink=CallbackBodySink(piece_list.append)))
+    assert not response.vaild_response
+    assert scripted_server.request_log == [(0, "GET"), (0, "GET")]
+    received = b"".join(piece_list)
+    assert len(received) <= len(RESPONSE_BODY) // 2
+    assert RESPONSE_BODY.startswith(received)
+
+
+def test_callback_sink_does_not_start_over():
+    piece_list = []
+    sink = CallbackBodySink(piece_list.append)
+    sink.begin(200, {})
+    sink.begin(200, {})
+    sink.write(b"abc")
+    with pytest.raises(ValueError):
+        sink.begin(200, {})
+    assert piece_list == [b"abc"]
+
+
+def test_async_client_retries_only_idle_connections(scripted_server):
+    scripted_server.script = lambda connection_index, request_index: (
+        "close" if (connection_index, request_index) in ((0, 1), (1, 0)) else "answer")
+
+    async def run():
+        client = AsyncHttpClient()
+        response_list = [await client.handle_request(build_request(scripted_server, "POST")) for _ in range(3)]
+        client.close()
+        return response_list
+
+    first_response, second_response, third_response = asyncio.run(run())
+    assert first_response.vaild_response
+    # closed on the idle connection, sent again on a new one which is closed too, no third try
+    assert not second_response.vaild_response
+    assert third_response.vaild_response
+    assert scripted_server.request_log == [(0, "POST"), (0, "POST"), (1, "POST"), (2, "POST")]
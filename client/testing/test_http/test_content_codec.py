@@ -0,0 +1,93 @@
+import gzip
+import os
+import zlib
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPContentEncoding, HTTPPayloadType, HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.chunked_codec import decode_chunked
+from service.content_codec import (CONTENT_CODEC_REGISTRY, compress_content,
+                                   decompress_content, get_content_codec,
+                                   iter_compressed_content)
+from service.http_client import HttpClientSocket
+
+PAYLOAD = b"".join(b"%d,%d,compressible row\n" % (index, index * 7) for index in range(50000))
+
+
+def build_request(**changes):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE, **changes)
+    request.url = "/upload"
+    request.method = "PUT"
+    request.server_connection = HTTPServerAddress(host_ip="127.0.0.1", port=80)
+    request.payload_type = HTTPPayloadType.OCTET_STREAM
+    return request
+
+
+def get_body(encoded_request: bytes) -> bytes:
+    head, _, body = encoded_request.partition(b"\r\n\r\n")
+    return decode_chunked(body) if b"Transfer-Encoding: chunked" in head else body
+
+
+@pytest.mark.parametrize("content_encoding", sorted(CONTENT_CODEC_REGISTRY))
+def test_streamed_compression_round_trip(content_encoding):
+    """Blocks compressed one by one decode to the original, at every registered coding."""
+    blocks = [PAYLOAD[offset:offset + 1000] for offset in range(0, len(PAYLOAD), 1000)]
+    compressed = b"".join(iter_compressed_content(blocks, content_encoding))
+
+    assert len(compressed) < len(PAYLOAD) // 2
+    assert decompress_content(compressed, content_encoding) == PAYLOAD
+
+
+def test_stacked_codings_are_undone_in_reverse_order():
+    """"deflate, gzip" means deflate was applied first."""
+    body = gzip.compress(zlib.compress(PAYLOAD))
+    assert decompress_content(body, "deflate, gzip") == PAYLOAD
+
+
+def test_unknown_coding_and_level_are_rejected():
+    with pytest.raises(ValueError):
+        get_content_codec("compress")
+    with pytest.raises(ValueError):
+        compress_content(PAYLOAD, "gzip", level=10)
+
+
+@pytest.mark.parametrize("content_encoding", [HTTPContentEncoding.GZIP, HTTPContentEncoding.DEFLATE])
+def test_request_body_is_compressed_at_the_requested_level(content_encoding):
+    """In memory bodies are compressed with the coding and level of the request."""
+    client = HttpClientSocket()
+    fast = client._encode_layer_request(build_request(
+        payload_bytes=PAYLOAD, content_encoding=content_encoding, content_encoding_level=1))
+    best = client._encode_layer_request(build_request(
+        payload_bytes=PAYLOAD, content_encoding=content_encoding, content_encoding_level=9))
+
+    for transmission in (fast, best):
+        assert f"Content-Encoding: {content_encoding}".encode() in transmission.encoded_request
+        assert decompress_content(get_body(transmission.encoded_request), content_encoding) == PAYLOAD
+    assert len(best.encoded_request) < len(fast.encoded_request)
+
+
+def test_streamed_request_body_is_compressed(tmp_path):
+    """A payload file is compressed while it is read, and sent chunked."""
+    file_path = tmp_path / "payload.csv"
+    file_path.write_bytes(PAYLOAD)
+    client = HttpClientSocket()
+    transmission = client._encode_layer_request(build_request(
+        payload_file_path=str(file_path), content_encoding=HTTPContentEncoding.DEFLATE))
+
+    encoded_request = b"".join(bytes(item) for item in transmission.encoded_request_stream())
+    assert b"Content-Encoding: deflate" in encoded_request
+    assert zlib.decompress(get_body(encoded_request)) == PAYLOAD
+
+
+def test_uninstalled_coding_fails_before_sending(tmp_path):
+    """Requesting a coding whose package is missing raises while the request is encoded."""
+    missing = [coding for coding in (HTTPContentEncoding.ZSTD, HTTPContentEncoding.BROTLI)
+               if coding not in CONTENT_CODEC_REGISTRY]
+    if not missing:
+        pytest.skip("zstandard and brotli are both installed")
+    file_path = tmp_path / "payload.bin"
+    file_path.write_bytes(os.urandom(100))
+    with pytest.raises(ValueError):
+        HttpClientSocket()._encode_layer_request(build_request(
+            payload_file_path=str(file_path), content_encoding=missing[0]))
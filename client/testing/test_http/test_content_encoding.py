@@ -0,0 +1,79 @@
+import socketserver
+import threading
+import zlib
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.chunked_codec import encode_chunked
+from service.http_client import HttpClientSocket
+
+TEXT_BODY = b"".join(b"line %d of a compressible text file\n" % index for index in range(20000))
+
+
+class CompressingHandler(socketserver.StreamRequestHandler):
+    """Answer like the file service: gzip streamed in chunks, deflate with a length, or plain."""
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            accept_encoding = None
+            while (line := self.rfile.readline()) not in (b"\r\n", b""):
+                key, _, value = line.decode("latin-1").partition(":")
+                if key.strip().lower() == "accept-encoding":
+                    accept_encoding = value.strip()
+
+            path = request_line.split(b" ")[1]
+            if accept_encoding is None:
+                head, body = b"Content-Length: %d\r\n" % len(TEXT_BODY), TEXT_BODY
+            elif path == b"/gzip":
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                compressed = compressor.compress(TEXT_BODY) + compressor.flush()
+                head, body = b"Content-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n", encode_chunked(compressed, 8192)
+            else:
+                compressed = zlib.compress(TEXT_BODY)
+                head, body = b"Content-Encoding: deflate\r\nContent-Length: %d\r\n" % len(compressed), compressed
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nVary: Accept-Encoding\r\n" + head + b"\r\n" + body)
+
+
+@pytest.fixture
+def local_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), CompressingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(server: HTTPServerAddress, url: str, accept_encoding: str = None):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+    request.url = url
+    request.server_connection = server
+    if accept_encoding is not None:
+        request.accept_encoding = accept_encoding
+    client = HttpClientSocket()
+    response = client.handle_request(request)
+    client.close()
+    return response
+
+
+@pytest.mark.parametrize("url, content_encoding", [("/gzip", "gzip"), ("/deflate", "deflate")])
+def test_default_template_accepts_compressed_responses(local_server, url, content_encoding):
+    """The default request opts in, and compressed bodies arrive decoded."""
+    response = fetch(local_server, url)
+
+    assert response.vaild_response
+    assert response.http_response.content_encoding == content_encoding
+    assert response.http_response.payload_bytes == TEXT_BODY
+
+
+def test_opting_out_gets_the_plain_body(local_server):
+    """An empty Accept-Encoding sends no header, the server answers uncompressed."""
+    response = fetch(local_server, "/gzip", accept_encoding="")
+
+    assert response.http_response.content_encoding is None
+    assert response.http_response.payload_bytes == TEXT_BODY
@@ -0,0 +1,11 @@
+import pytest
+from service.http_client import parse_content_range
+
+
+def test_parse_content_range():
+    """Partial and unsatisfiable ranges are both understood."""
+    assert parse_content_range("bytes 0-1023/4096") == (0, 1023, 4096)
+    assert parse_content_range("bytes 10-19/*") == (10, 19, None)
+    assert parse_content_range("bytes */4096") == (None, None, 4096)
+    with pytest.raises(ValueError):
+        parse_content_range("items 0-1/2")
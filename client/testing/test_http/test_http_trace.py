@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import socketserver
+import threading
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPServerAddress, HTTPTracePhase
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.async_http_client import AsyncHttpClient
+from service.http_client import HttpClientSocket
+from service.http_trace import HTTPTraceHooks, LoggingTraceHooks
+
+BODY = b"y" * 50000
+
+
+class RedirectingHandler(socketserver.StreamRequestHandler):
+    """Redirect /old to /new, answer /new with a body."""
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            while self.rfile.readline() not in (b"\r\n", b""):
+                pass
+            if request_line.split()[1] == b"/old":
+                self.wfile.write(b"HTTP/1.1 301 Moved Permanently\r\nLocation: /new\r\nContent-Length: 0\r\n\r\n")
+            else:
+                self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY)
+
+
+class RecordingTraceHooks(HTTPTraceHooks):
+    def __init__(self):
+        self.events = []
+
+    def request_start(self, event):
+        self.events.append(event)
+
+    def connect(self, event):
+        self.events.append(event)
+
+    def first_byte(self, event):
+        self.events.append(event)
+
+    def body_complete(self, event):
+        self.events.append(event)
+
+    def redirect(self, event):
+        self.events.append(event)
+
+    def request_error(self, event):
+        self.events.append(event)
+
+
+@pytest.fixture
+def local_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RedirectingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def build_request(server: HTTPServerAddress):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+    request.url = "/old"
+    request.server_connection = server
+    request.allow_redirects = True
+    return request
+
+
+EXPECTED_PHASES = [
+    HTTPTracePhase.REQUEST_START,
+    HTTPTracePhase.CONNECT, HTTPTracePhase.FIRST_BYTE, HTTPTracePhase.BODY_COMPLETE,
+    HTTPTracePhase.REDIRECT,
+    HTTPTracePhase.CONNECT, HTTPTracePhase.FIRST_BYTE, HTTPTracePhase.BODY_COMPLETE,
+]
+
+
+def check_events(events):
+    assert [event.phase for event in events] == EXPECTED_PHASES
+    assert len({event.request_id for event in events}) == 1
+    # time and bytes only grow
+    assert [event.elapsed for event in events] == sorted(event.elapsed for event in events)
+    assert events[-1].bytes_received > len(BODY)
+    assert events[-1].bytes_sent > 0
+    assert events[4].status_code == 301 and events[4].location == "/new"
+    assert events[-1].status_code == 200 and events[-1].url == "/new"
+
+
+def test_phases_of_a_redirected_request(local_server):
+    hooks = RecordingTraceHooks()
+    client = HttpClientSocket(trace_hooks=hooks)
+    response = client.handle_request(build_request(local_server))
+    client.close()
+
+    assert response.http_response.payload_bytes == BODY
+    check_events(hooks.events)
+
+
+def test_async_client_reports_the_same_phases(local_server):
+    hooks = RecordingTraceHooks()
+
+    async def run():
+        client = AsyncHttpClient(trace_hooks=hooks)
+        response = await client.handle_request(build_request(local_server))
+        client.close()
+        return response
+
+    assert asyncio.run(run()).http_response.payload_bytes == BODY
+    check_events(hooks.events)
+
+
+def test_failed_request_is_reported():
+    hooks = RecordingTraceHooks()
+    request = build_request(HTTPServerAddress(host_ip="127.0.0.1", port=1))
+    request.max_retries = 1
+    response = HttpClientSocket(trace_hooks=hooks).handle_request(request)
+
+    assert not response.vaild_response
+    assert [event.phase for event in hooks.events] == [HTTPTracePhase.REQUEST_START, HTTPTracePhase.REQUEST_ERROR]
+    assert hooks.events[-1].error == response.error_message
+
+
+def test_logging_adapter_writes_structured_records(local_server, caplog):
+    client = HttpClientSocket(trace_hooks=LoggingTraceHooks(logging.getLogger("test.http")))
+    with caplog.at_level(logging.INFO, logger="test.http"):
+        client.handle_request(build_request(local_server))
+    client.close()
+
+    # connect and first byte are debug records, filtered out at INFO
+    phases = [record.http_trace["phase"] for record in caplog.records]
+    assert phases == [HTTPTracePhase.BODY_COMPLETE, HTTPTracePhase.REDIRECT, HTTPTracePhase.BODY_COMPLETE]
+    assert "status=200" in caplog.records[-1].getMessage()
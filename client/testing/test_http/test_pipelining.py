@@ -0,0 +1,117 @@
+import socketserver
+import threading
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPMethod, HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.http_client import HttpClientSocket
+
+
+class PipelineHandler(socketserver.StreamRequestHandler):
+    """Answer each request with its path.
+
+    Before the first answer to a /wait/ request it reads `batch_size`
+    requests, which only a pipelining client has sent by then. The server
+    closes a connection after `max_requests` responses, like a keep-alive
+    request limit.
+    """
+
+    def read_request(self):
+        request_line = self.rfile.readline()
+        if not request_line:
+            return None
+        while self.rfile.readline() not in (b"\r\n", b""):
+            pass
+        method, path = request_line.split()[:2]
+        with self.server.lock:
+            self.server.request_log.append((method, path))
+        return method, path
+
+    def handle(self):
+        self.connection.settimeout(2)
+        pending = []
+        answered = 0
+        while answered < self.server.max_requests:
+            if not pending:
+                request = self.read_request()
+                if request is None:
+                    return
+                pending.append(request)
+                if answered == 0 and request[1].startswith(b"/wait/"):
+                    while len(pending) < self.server.batch_size:
+                        pending.append(self.read_request())
+                    self.server.received_before_first_answer = len(pending)
+            method, path = pending.pop(0)
+            if path.startswith(b"/moved"):
+                self.wfile.write(b"HTTP/1.1 302 Found\r\nLocation: /wait/target\r\nContent-Length: 0\r\n\r\n")
+            else:
+                body = b"" if method == b"HEAD" else path
+                self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(path), body))
+            answered += 1
+
+
+@pytest.fixture
+def pipeline_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), PipelineHandler)
+    server.daemon_threads = True
+    server.max_requests = 1000
+    server.batch_size = 1
+    server.request_log = []
+    server.lock = threading.Lock()
+    server.received_before_first_answer = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def build_request(server, url: str, method: HTTPMethod = HTTPMethod.GET):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+    request.url = url
+    request.method = method
+    request.server_connection = HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    request.allow_redirects = True
+    return request
+
+
+def test_batch_is_sent_before_the_first_response(pipeline_server):
+    pipeline_server.batch_size = 5
+    requests = [build_request(pipeline_server, f"/wait/{index}") for index in range(4)]
+    requests.append(build_request(pipeline_server, "/wait/head", HTTPMethod.HEAD))
+    client = HttpClientSocket()
+    responses = client.handle_requests(requests)
+    client.close()
+
+    assert pipeline_server.received_before_first_answer == 5
+    assert [response.http_response.payload_bytes for response in responses[:4]] == [
+        f"/wait/{index}".encode() for index in range(4)]
+    assert responses[4].vaild_response and responses[4].http_response.content_length == len("/wait/head")
+    # one connection carried the whole batch
+    assert client.connection_pool.statistics.misses == 1
+
+
+def test_unanswered_requests_are_sent_again_after_a_close(pipeline_server):
+    """The server answers two requests per connection, the rest go out again on a new one."""
+    pipeline_server.max_requests = 2
+    requests = [build_request(pipeline_server, f"/file/{index}") for index in range(7)]
+    responses = HttpClientSocket().handle_requests(requests)
+
+    assert [response.http_response.payload_bytes for response in responses] == [
+        f"/file/{index}".encode() for index in range(7)]
+
+
+def test_other_requests_and_redirects_keep_their_order(pipeline_server):
+    requests = [
+        build_request(pipeline_server, "/a"),
+        build_request(pipeline_server, "/moved"),
+        build_request(pipeline_server, "/post", HTTPMethod.POST),
+        build_request(pipeline_server, "/b"),
+    ]
+    responses = HttpClientSocket().handle_requests(requests)
+
+    assert [response.http_response.payload_bytes for response in responses] == [
+        b"/a", b"/wait/target", b"/post", b"/b"]
+    # the POST went after the pipelined run, the redirect was followed after the batch
+    assert [path for _, path in pipeline_server.request_log] == [
+        b"/a", b"/moved", b"/post", b"/b", b"/wait/target"]
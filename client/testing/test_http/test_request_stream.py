@@ -0,0 +1,154 @@
+import gzip
+import os
+import socket
+import threading
+
+import pytest
+from domain.http_model import (HTTPContentEncoding, HTTPFileSegment, HTTPLayerEncodingModuleInterface,
+                               HTTPPayloadType, HTTPTransferEncoding)
+from service.chunked_codec import decode_chunked
+from service.http_client import HttpClientSocket
+
+
+def capture_sent_bytes(send) -> bytes:
+    """Call send(sock) on one end of a socket pair, returning everything that came out of the other end."""
+    send_sock, receive_sock = socket.socketpair()
+    received = bytearray()
+
+    def receive():
+        while data := receive_sock.recv(65536):
+            received.extend(data)
+
+    # read on another thread, a large send would fill the socket buffers and block
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    try:
+        send(send_sock)
+    finally:
+        send_sock.close()
+        receiver.join()
+        receive_sock.close()
+    return bytes(received)
+
+
+def build_upload_interface(file_path, **kwargs) -> HTTPLayerEncodingModuleInterface:
+    return HTTPLayerEncodingModuleInterface(
+        url="/files/a.bin",
+        method="PUT",
+        host="localhost",
+        payload_type=HTTPPayloadType.OCTET_STREAM,
+        payload_file_path=str(file_path),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def payload_file(tmp_path):
+    file_path = tmp_path / "a.bin"
+    file_path.write_bytes(os.urandom(300 * 1024))
+    return file_path
+
+
+def test_content_length_body_on_the_wire(payload_file):
+    """An unencoded body is announced with Content-Length and sent from the file as it is."""
+    client = HttpClientSocket()
+    stream = client._encode_request_stream(build_upload_interface(payload_file))
+    head_bytes, segment = list(stream())
+    assert segment == HTTPFileSegment(file_path=str(payload_file), offset=0, count=payload_file.stat().st_size)
+
+    progress = []
+    sent_bytes = capture_sent_bytes(lambda sock: client._send_request_stream(sock, stream(), progress.append))
+    assert sent_bytes == (b"PUT /files/a.bin HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n"
+                          b"Content-Type: application/octet-stream\r\n"
+                          b"Content-Length: %d\r\n\r\n" % payload_file.stat().st_size) + payload_file.read_bytes()
+    assert head_bytes == sent_bytes[:len(head_bytes)]
+    assert sum(progress) == len(sent_bytes)
+
+
+def test_chunked_body_on_the_wire(tmp_path):
+    file_path = tmp_path / "a.bin"
+    file_path.write_bytes(b"abcdefghij")
+    client = HttpClientSocket()
+    stream = client._encode_request_stream(build_upload_interface(
+        file_path, transfer_encoding=HTTPTransferEncoding.CHUNKED, transfer_encoding_chunk_size=4))
+
+    sent_bytes = capture_sent_bytes(lambda sock: client._send_request_stream(sock, stream()))
+    assert sent_bytes == (b"PUT /files/a.bin HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n"
+                          b"Content-Type: application/octet-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+                          b"4\r\nabcd\r\n4\r\nefgh\r\n2\r\nij\r\n0\r\n\r\n")
+
+
+def test_compressed_body_is_always_chunked(payload_file):
+    """The compressed length is unknown up front, so no Content-Length even without asking for chunks."""
+    client = HttpClientSocket()
+    stream = client._encode_request_stream(build_upload_interface(
+        payload_file, content_encoding=HTTPContentEncoding.GZIP, content_encoding_level=1))
+
+    sent_bytes = capture_sent_bytes(lambda sock: client._send_request_stream(sock, stream()))
+    head, _, body = sent_bytes.partition(b"\r\n\r\n")
+    assert b"Content-Encoding: gzip\r\n" in head + b"\r\n"
+    assert head.endswith(b"Transfer-Encoding: chunked")
+    assert b"Content-Length" not in head
+    assert gzip.decompress(decode_chunked(body)) == payload_file.read_bytes()
+    # the factory starts over, so a failed send can be repeated
+    assert capture_sent_bytes(lambda sock: client._send_request_stream(sock, stream())) == sent_bytes
+
+
+@pytest.mark.parametrize("with_progress", [False, True])
+def test_file_segment_offset_and_length(payload_file, with_progress):
+    client = HttpClientSocket()
+    progress = [] if with_progress else None
+    segment = HTTPFileSegment(file_path=str(payload_file), offset=1000, count=200 * 1024)
+
+    def send(sock):
+        with open(payload_file, "rb") as file:
+            client._send_file_segment(sock, file, segment, progress.append if with_progress else None)
+
+    assert capture_sent_bytes(send) == payload_file.read_bytes()[1000:1000 + 200 * 1024]
+    if with_progress:
+        assert sum(progress) == 200 * 1024
+
+
+def test_file_segment_to_the_end_of_the_file(payload_file):
+    client = HttpClientSocket()
+    segment = HTTPFileSegment(file_path=str(payload_file), offset=5000)
+    progress = []
+
+    def send(sock):
+        with open(payload_file, "rb") as file:
+            client._send_file_segment(sock, file, segment, progress.append)
+
+    assert capture_sent_bytes(send) == payload_file.read_bytes()[5000:]
+    assert sum(progress) == payload_file.stat().st_size - 5000
+
+
+def test_file_segment_longer_than_the_file(payload_file):
+    client = HttpClientSocket()
+    segment = HTTPFileSegment(file_path=str(payload_file), offset=0, count=payload_file.stat().st_size + 1)
+
+    def send(sock):
+        with open(payload_file, "rb") as file:
+            client._send_file_segment(sock, file, segment, lambda size: None)
+
+    with pytest.raises(ConnectionError):
+        capture_sent_bytes(send)
+
+
+def test_buffers_survive_partial_writes():
+    """More than the socket buffers hold goes out in order, empty buffers are skipped."""
+    client = HttpClientSocket()
+    buffers = [memoryview(os.urandom(size)) for size in (0, 1, 100 * 1024, 0, 3, 2 * 1024 * 1024, 17)]
+    progress = []
+    sent_bytes = capture_sent_bytes(
+        lambda sock: client._send_buffers(sock, list(buffers), sum(map(len, buffers)), progress.append))
+    assert sent_bytes == b"".join(buffers)
+    assert progress == [len(sent_bytes)]
+
+
+def test_stream_keeps_buffers_and_segments_in_order(payload_file):
+    client = HttpClientSocket()
+    data = payload_file.read_bytes()
+    items = [b"head;", memoryview(b"small;"), HTTPFileSegment(file_path=str(payload_file), offset=10, count=20),
+             b";tail" * 1000, HTTPFileSegment(file_path=str(payload_file), offset=0, count=5), b"end"]
+    sent_bytes = capture_sent_bytes(lambda sock: client._send_request_stream(sock, iter(items)))
+    assert sent_bytes == b"head;small;" + data[10:30] + b";tail" * 1000 + data[:5] + b"end"
@@ -0,0 +1,107 @@
+import mmap
+import os
+import socket
+import threading
+
+import pytest
+from service.http_response_reader import HTTPResponseReader
+
+BODY = os.urandom(300_000)
+RESPONSE = b"HTTP/1.1 206 Partial Content\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY
+NEXT_RESPONSE = b"HTTP/1.1 204 No Content\r\n\r\n"
+
+
+def serve_bytes(data: bytes) -> socket.socket:
+    """Return a socket the peer writes `data` to, in small pieces."""
+    client_sock, server_sock = socket.socketpair()
+
+    def write():
+        for offset in range(0, len(data), 7000):
+            server_sock.sendall(data[offset:offset + 7000])
+        server_sock.close()
+
+    threading.Thread(target=write, daemon=True).start()
+    return client_sock
+
+
+def test_body_is_received_into_a_mapped_file(tmp_path):
+    """A fitting body lands in the mapping and stays out of the response bytes."""
+    file_path = tmp_path / "part"
+    file_path.write_bytes(b"\0" * (len(BODY) + 100))
+    sock = serve_bytes(RESPONSE + NEXT_RESPONSE)
+    with open(file_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as file_map:
+        with memoryview(file_map) as file_view:
+            reader = HTTPResponseReader(body_buffer=file_view[100:])
+            header = reader.read_from(sock, timeout=5)
+            reader.body_buffer.release()
+            assert file_map[100:] == BODY
+
+    assert reader.body_in_buffer
+    assert reader.body_buffer_size == len(BODY)
+    assert header == RESPONSE[:RESPONSE.index(b"\r\n\r\n") + 4]
+    # the reader stopped at the end of the body, the next response is still in the socket
+    assert reader.leftover == b""
+    assert sock.recv(100) == NEXT_RESPONSE
+    sock.close()
+
+
+def test_body_arriving_with_the_header_is_moved_to_the_buffer():
+    """Bytes fed together with the header and past the body end up in the right places."""
+    buffer = bytearray(len(BODY))
+    reader = HTTPResponseReader(body_buffer=memoryview(buffer))
+    reader.feed(RESPONSE[:1000])
+    reader.feed(RESPONSE[1000:] + NEXT_RESPONSE)
+
+    assert reader.complete
+    assert bytes(buffer) == BODY
+    assert reader.leftover == NEXT_RESPONSE
+
+
+@pytest.mark.parametrize("response", [
+    # too large for the buffer
+    b"HTTP/1.1 200 OK\r\nContent-Length: 20\r\n\r\n" + b"x" * 20,
+    # compressed bodies need decoding first
+    b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nContent-Length: 5\r\n\r\n" + b"x" * 5,
+    # error pages are not file data
+    b"HTTP/1.1 404 Not Found\r\nContent-Length: 5\r\n\r\n" + b"x" * 5,
+])
+def test_other_bodies_stay_in_the_response(response):
+    buffer = bytearray(10)
+    reader = HTTPResponseReader(body_buffer=memoryview(buffer))
+    reader.feed(response)
+
+    assert reader.complete
+    assert not reader.body_in_buffer
+    assert reader.get_response_bytes() == response
+    assert buffer == bytearray(10)
+
+
+def test_body_too_large_for_the_buffer_is_left_unread():
+    """Decoding it could only fail part way, i.e. the whole file sent for a range, so it is not read at all."""
+    buffer = bytearray(10)
+    reader = HTTPResponseReader(body_buffer=memoryview(buffer), decode_body=True)
+    reader.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 20\r\n\r\n" + b"x" * 15)
+
+    assert reader.complete
+    assert reader.status_code == 200
+    assert reader.body_in_buffer and reader.body_buffer_size == 0
+    assert reader.leftover == b""
+    # the rest of the body is still on its way, the connection is done
+    assert not reader.reusable
+    assert buffer == bytearray(10)
+
+
+@pytest.mark.parametrize("response", [
+    b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+    b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nxxxxx\r\n",
+])
+def test_whole_resource_for_a_range_is_left_unread(response):
+    """Any 2xx other than 206 to a range request is skipped after its header, whatever the framing."""
+    buffer = bytearray(10)
+    reader = HTTPResponseReader(body_buffer=memoryview(buffer), decode_body=True, partial_only=True)
+    reader.feed(response)
+
+    assert reader.complete
+    assert reader.body_in_buffer and reader.body_buffer_size == 0
+    assert not reader.reusable
+    assert buffer == bytearray(10)
@@ -0,0 +1,83 @@
+import gzip
+import os
+
+import pytest
+from domain.http_model import HTTPLayerDecodingModuleInterface
+from service.chunked_codec import encode_chunked
+from service.http_client import HttpClientSocket
+from service.http_response_reader import HTTPResponseReader
+from service.response_body_pipeline import CallbackBodySink, FileBodySink
+
+PAYLOAD = b"".join(b"%d,%d,row\n" % (index, index * 3) for index in range(100000))
+GZIP_CHUNKED_RESPONSE = (b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n\r\n"
+                         + encode_chunked(gzip.compress(PAYLOAD), max_chunk_size=4000))
+NEXT_RESPONSE = b"HTTP/1.1 204 No Content\r\n\r\n"
+
+
+def feed_in_pieces(reader: HTTPResponseReader, data: bytes, piece_size: int) -> None:
+    for offset in range(0, len(data), piece_size):
+        reader.feed(memoryview(data)[offset:offset + piece_size])
+
+
+def test_chunked_gzip_body_is_decoded_into_a_file(tmp_path):
+    """The body is de-chunked and decompressed piece by piece, only the header stays."""
+    file_path = tmp_path / "download"
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT)
+    try:
+        sink = FileBodySink(fd, offset=10)
+        reader = HTTPResponseReader(body_sink=sink)
+        feed_in_pieces(reader, GZIP_CHUNKED_RESPONSE + NEXT_RESPONSE, 1000)
+    finally:
+        os.close(fd)
+
+    assert reader.complete
+    assert reader.body_in_sink
+    assert reader.body_sink_size == sink.size == len(PAYLOAD)
+    assert file_path.read_bytes()[10:] == PAYLOAD
+    assert reader.get_response_bytes() == GZIP_CHUNKED_RESPONSE[:GZIP_CHUNKED_RESPONSE.index(b"\r\n\r\n") + 4]
+    assert reader.leftover == NEXT_RESPONSE
+
+
+def test_body_until_close_is_handed_to_a_callback():
+    """Without framing headers the body ends with the connection."""
+    piece_list = []
+    reader = HTTPResponseReader(body_sink=CallbackBodySink(piece_list.append))
+    feed_in_pieces(reader, b"HTTP/1.1 200 OK\r\n\r\n" + PAYLOAD, 5000)
+    assert not reader.complete
+    reader.feed_eof()
+
+    assert reader.complete
+    assert b"".join(piece_list) == PAYLOAD
+    assert not reader.reusable
+
+
+def test_error_body_is_kept_in_memory():
+    """Only 2xx bodies go to the sink, an error page stays readable."""
+    piece_list = []
+    reader = HTTPResponseReader(body_sink=CallbackBodySink(piece_list.append))
+    reader.feed(b"HTTP/1.1 404 Not Found\r\nContent-Length: 9\r\n\r\nnot found")
+
+    assert reader.complete
+    assert not reader.body_in_sink
+    assert piece_list == []
+    assert reader.decoded_body == b"not found"
+
+
+def test_cut_off_compressed_body_is_rejected():
+    compressed = gzip.compress(PAYLOAD)[:-100]
+    reader = HTTPResponseReader(decode_body=True)
+    with pytest.raises(ValueError):
+        reader.feed(b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nContent-Length: %d\r\n\r\n" % len(compressed)
+                    + compressed)
+
+
+def test_decoded_body_is_the_payload():
+    """_decode_response only parses the header of a body decoded while it was received."""
+    reader = HTTPResponseReader(decode_body=True)
+    feed_in_pieces(reader, GZIP_CHUNKED_RESPONSE, 777)
+    response = HttpClientSocket()._decode_response(HTTPLayerDecodingModuleInterface(
+        response_raw_data=reader.get_response_bytes(), decoded_body=reader.decoded_body))
+
+    assert response.status_code == 200
+    assert response.content_encoding == "gzip"
+    assert response.payload_bytes == PAYLOAD
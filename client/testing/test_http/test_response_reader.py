@@ -0,0 +1,59 @@
+import pytest
+from service.http_response_reader import HTTPResponseFraming, HTTPResponseReader
+
+
+def feed_in_pieces(reader: HTTPResponseReader, data: bytes, piece_size: int) -> None:
+    """Feed the reader like a socket would, a few bytes at a time."""
+    for offset in range(0, len(data), piece_size):
+        reader.feed(data[offset:offset + piece_size])
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 4096])
+def test_reader_content_length(piece_size):
+    """The response ends exactly after Content-Length bytes."""
+    response = b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello"
+    reader = HTTPResponseReader(request_method="GET")
+    feed_in_pieces(reader, response + b"HTTP/1.1", piece_size)
+
+    assert reader.framing == HTTPResponseFraming.CONTENT_LENGTH
+    assert reader.get_response_bytes() == response
+    assert reader.leftover == b"HTTP/1.1"
+
+
+@pytest.mark.parametrize("piece_size", [1, 3, 4096])
+def test_reader_chunked_with_extensions_and_trailers(piece_size):
+    """The response ends on the last chunk and its trailers, not on a timeout."""
+    response = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nExpires: never\r\n\r\n")
+    reader = HTTPResponseReader(request_method="POST")
+    feed_in_pieces(reader, response[:-1], piece_size)
+    assert not reader.complete
+
+    reader.feed(response[-1:])
+    assert reader.complete
+    assert reader.reusable
+    assert reader.get_response_bytes() == response
+
+
+def test_reader_no_body_and_interim_responses():
+    """HEAD responses carry no body and 100 Continue is skipped."""
+    reader = HTTPResponseReader(request_method="HEAD")
+    reader.feed(b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 1024\r\n\r\n")
+    assert reader.complete
+    assert reader.status_code == 200
+    assert reader.framing == HTTPResponseFraming.NO_BODY
+
+
+def test_reader_connection_close():
+    """A body without framing ends when the server closes the connection."""
+    reader = HTTPResponseReader(request_method="GET")
+    reader.feed(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\npartial")
+    assert not reader.complete
+
+    reader.feed_eof()
+    assert reader.complete
+    assert not reader.reusable
+    assert reader.get_response_bytes().endswith(b"partial")
+
+    with pytest.raises(ConnectionResetError):
+        HTTPResponseReader().feed_eof()
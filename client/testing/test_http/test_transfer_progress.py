@@ -0,0 +1,139 @@
+import asyncio
+import socketserver
+import threading
+from dataclasses import replace
+
+import pytest
+from domain.http_model import HTTPPayloadType, HTTPServerAddress
+from domain.setting_model import DEFAULT_HTTP_REQUEST_TEMPLATE
+from service.async_http_client import AsyncHttpClient
+from service.file_service import TransferMeter
+from service.http_client import HttpClientSocket, TransferCancelled
+from service.http_trace import HTTPTraceHooks
+
+
+class FixedResponseHandler(socketserver.StreamRequestHandler):
+    """Answer every request with a 100 kB body, after reading the request body."""
+
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline()
+            if not request_line:
+                return
+            content_length = 0
+            while (header_line := self.rfile.readline()) not in (b"\r\n", b""):
+                name, _, value = header_line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            self.rfile.read(content_length)
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n" + b"x" * 100000)
+
+
+@pytest.fixture
+def local_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FixedResponseHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield HTTPServerAddress(host_ip="127.0.0.1", port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def build_request(server: HTTPServerAddress, send_callback=None, receive_callback=None):
+    request = replace(DEFAULT_HTTP_REQUEST_TEMPLATE)
+    request.url = "/"
+    request.server_connection = server
+    request.send_callback = send_callback
+    request.receive_callback = receive_callback
+    return request
+
+
+def test_receive_callback_counts_the_response_body(local_server):
+    """The header is not counted, and a request without a body sends nothing to count."""
+    sent, received = [], []
+    client = HttpClientSocket()
+    response = client.handle_request(build_request(local_server, sent.append, received.append))
+    client.close()
+
+    assert len(response.http_response.payload_bytes) == 100000
+    assert sum(received) == 100000
+    assert sent == []
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_send_callback_counts_the_request_body(local_server, tmp_path, streamed):
+    """Only the body of the request is counted, from memory or streamed from a file."""
+    payload = bytes(range(256)) * 1000
+    sent = []
+    request = build_request(local_server, sent.append)
+    request.method = "PUT"
+    request.payload_type = HTTPPayloadType.OCTET_STREAM
+    if streamed:
+        payload_file = tmp_path / "payload.bin"
+        payload_file.write_bytes(payload)
+        request.payload_file_path = str(payload_file)
+    else:
+        request.payload_bytes, request.content_length_before_encoding = payload, len(payload)
+    client = HttpClientSocket()
+    response = client.handle_request(request)
+    client.close()
+
+    assert response.vaild_response, response.error_message
+    assert sum(sent) == len(payload)
+
+
+def test_async_callbacks_count_only_the_bodies(local_server):
+    payload = b"y" * 70000
+    sent, received = [], []
+    request = build_request(local_server, sent.append, received.append)
+    request.method = "PUT"
+    request.payload_type = HTTPPayloadType.OCTET_STREAM
+    request.payload_bytes, request.content_length_before_encoding = payload, len(payload)
+
+    async def run():
+        client = AsyncHttpClient()
+        response = await client.handle_request(request)
+        client.close()
+        return response
+
+    response = asyncio.run(run())
+    assert response.vaild_response, response.error_message
+    assert sum(sent) == len(payload)
+    assert sum(received) == 100000
+
+
+class BodyCompleteHooks(HTTPTraceHooks):
+    def __init__(self):
+        self.events = []
+
+    def body_complete(self, event):
+        self.events.append(event)
+
+
+def test_trace_still_counts_every_byte(local_server):
+    """The trace sees the headers the transfer callbacks leave out."""
+    hooks = BodyCompleteHooks()
+    client = HttpClientSocket(trace_hooks=hooks)
+    received = []
+    client.handle_request(build_request(local_server, receive_callback=received.append))
+    client.close()
+
+    response_size = len(b"HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n") + 100000
+    assert sum(received) == 100000
+    assert hooks.events[0].bytes_received == response_size
+    assert hooks.events[0].bytes_sent == len(client._encode_layer_request(build_request(local_server)).encoded_request)
+
+
+def test_cancelled_transfer_is_not_retried(local_server):
+    """Cancelling aborts the request at the next block instead of retrying it."""
+    cancel_event = threading.Event()
+    cancel_event.set()
+    meter = TransferMeter(cancel_event=cancel_event)
+    client = HttpClientSocket()
+    response = client.handle_request(build_request(local_server, receive_callback=meter.on_bytes))
+    client.close()
+
+    assert not response.vaild_response
+    assert "cancelled" in response.error_message
+    with pytest.raises(TransferCancelled):
+        meter.check_cancelled()
@@ -0,0 +1,579 @@
+#!/usr/local/bin/python3.12
+import bisect
+import contextlib
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+HASH_BLOCK_SIZE = 1024 * 1024
+# files that are still being written by an upload, never listed
+UPLOADING_SUFFIX = ".uploading"
+# removals remembered for change listings, older ones fall off the journal
+MAX_REMOVED_ENTRIES = 10000
+# listing pages are served from the index, a rescan for changes made outside the service runs
+# in the background once the last one is older than this
+LIST_PAGE_RESCAN_INTERVAL = 10.0  # seconds
+# sort orders of listing pages, each kept as a sorted list of keys once it was asked for
+LIST_SORT_KEYS = ("name", "size", "mtime")
+# how long to wait for another process that writes to the index, which may be hashing a large file
+DATABASE_TIMEOUT = 60.0  # seconds
+
+
+@dataclass
+class FileHashIndexEntry:
+    """Cached digest of a file, valid as long as the stat key still matches."""
+    file_size: int
+    mtime_ns: int
+    inode: int
+    file_hash: str
+    # journal generation at which the file was added or its content changed
+    generation: int = 0
+
+
+@dataclass
+class FileChanges:
+    """What changed in the directory since a cursor.
+
+    With `full_list` the cursor could not be served (unknown, from another
+    journal or older than the journal reaches back) and `changed` is every
+    file.
+    """
+    cursor: str
+    full_list: bool
+    # (file name, MD5) of files added or modified since the cursor
+    changed: list[tuple[str, str]] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+
+@dataclass
+class FileListPage:
+    """One page of the sorted and filtered file listing."""
+    # where the change journal stood, the same as a list_changes cursor
+    cursor: str
+    # (file name, MD5, size, mtime in seconds)
+    files: list[tuple[str, str, int, float]] = field(default_factory=list)
+    # passed back for the page after this one, None on the last page
+    next_page_token: Optional[str] = None
+    # files that match the filter, only counted for the first page
+    total_count: Optional[int] = None
+
+
+def hash_file(file_path: str) -> str:
+    """MD5 a file block by block."""
+    md5_hash = hashlib.md5()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            md5_hash.update(block)
+    return md5_hash.hexdigest()
+
+
+class FileHashIndex:
+    """Persistent MD5 index of the files in a directory.
+
+    Entries are keyed by file name and validated with (size, mtime_ns, inode)
+    from `os.scandir`, so listing an unchanged directory costs one stat per
+    file and no content reads. The index is stored in a SQLite database next
+    to the directory. Changes are written row by row and committed once per
+    call, so recording an upload costs the same in a directory of 100k files
+    as in one of ten.
+
+    The index doubles as a change journal: every addition or content change
+    stamps the entry with the next generation number, every removal leaves
+    a tombstone with one, so `list_changes` can answer with only what
+    changed after a cursor. A cursor is the journal id and a generation;
+    the id is new whenever the journal starts over, which invalidates all
+    cursors handed out before.
+
+    For paged listings the index keeps the keys of its entries sorted by
+    name, size or mtime, built when an order is first asked for and then
+    updated with every change, so a page costs a bisect and its own
+    entries. Pages continue after the key of the last file of the previous
+    page (keyset pagination), so files added or removed meanwhile do not
+    shift the pages.
+
+    Several processes can share the index. The database is the authority:
+    every write runs in a transaction that first loads the rows other
+    processes committed after the generation in memory, so the generation
+    counts up across all of them and a cursor from one process is served
+    by every other.
+    """
+
+    def __init__(self, file_dir: str, index_path: str = None):
+        self.file_dir = file_dir
+        self.index_path = index_path or os.path.normpath(file_dir) + ".hash_index.sqlite3"
+        # the JSON index written before the database, imported once
+        self.legacy_index_path = os.path.splitext(self.index_path)[0] + ".json"
+        self._connection: Optional[sqlite3.Connection] = None
+        self._entries: dict[str, FileHashIndexEntry] = {}
+        self._journal_id = uuid.uuid4().hex
+        self._generation = 0
+        # file name -> generation of its removal
+        self._removed: dict[str, int] = {}
+        # generation of the oldest removal that fell off, cursors before it cannot be served
+        self._journal_start = 0
+        # sort key name -> sorted keys of every entry, see _sort_key
+        self._sorted_keys: dict[str, list[tuple]] = {}
+        self._last_scan_time: Optional[float] = None
+        self._scan_thread: Optional[threading.Thread] = None
+        # PRAGMA data_version when the entries were last brought up to date, changes on other processes' commits
+        self._data_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def list_files(self) -> list[tuple[str, str]]:
+        """Return (file name, MD5) of every file in the directory, hashing only changed files."""
+        with self._lock, self._write_transaction():
+            self._scan()
+            return [(file_name, index_entry.file_hash) for file_name, index_entry in self._entries.items()]
+
+    def list_changes(self, cursor: Optional[str] = None) -> FileChanges:
+        """Return the files added, modified and removed since a cursor, and the cursor for next time.
+
+        The directory is scanned first, so changes made behind the index's
+        back are found too. Without a usable cursor every file is returned.
+        """
+        with self._lock, self._write_transaction():
+            self._scan()
+            new_cursor = f"{self._journal_id}.{self._generation}"
+            since = self._parse_cursor(cursor)
+            if since is None:
+                return FileChanges(
+                    cursor=new_cursor,
+                    full_list=True,
+                    changed=[(file_name, index_entry.file_hash) for file_name, index_entry in self._entries.items()],
+                )
+            return FileChanges(
+                cursor=new_cursor,
+                full_list=False,
+                changed=[
+                    (file_name, index_entry.file_hash)
+                    for file_name, index_entry in self._entries.items()
+                    if index_entry.generation > since
+                ],
+                removed=[file_name for file_name, generation in self._removed.items() if generation > since],
+            )
+
+    def list_page(self, limit: int, page_token: Optional[str] = None, name_pattern: Optional[str] = None,
+                  sort_by: str = "name", descending: bool = False) -> FileListPage:
+        """Return up to `limit` files in the given order, after the file the page token points at.
+
+        `name_pattern` is a glob on the file name, a prefix is "prefix*".
+        Pages are answered from the index without scanning the directory;
+        files changed outside the service show up once the background
+        rescan has run.
+        """
+        if sort_by not in LIST_SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort_by}'")
+        if limit <= 0:
+            raise ValueError("The page size must be positive")
+        after_key = self._parse_page_token(page_token, sort_by)
+        name_match = re.compile(fnmatch.translate(name_pattern)).match if name_pattern else None
+
+        with self._lock:
+            self._refresh()
+            if self._last_scan_time is None and not self._entries:
+                # nothing indexed yet, an empty first page would be wrong rather than stale
+                with self._write_transaction():
+                    self._scan()
+            self._start_background_scan()
+            sorted_keys = self._get_sorted_keys(sort_by)
+
+            if descending:
+                start = len(sorted_keys) if after_key is None else bisect.bisect_left(sorted_keys, after_key)
+                key_indices = range(start - 1, -1, -1)
+            else:
+                start = 0 if after_key is None else bisect.bisect_right(sorted_keys, after_key)
+                key_indices = range(start, len(sorted_keys))
+
+            page_keys = []
+            for key_index in key_indices:
+                key = sorted_keys[key_index]
+                if name_match is not None and not name_match(key[-1]):
+                    continue
+                if len(page_keys) == limit:
+                    # one more match exists, so there is a next page
+                    next_page_token = json.dumps(list(page_keys[-1]))
+                    break
+                page_keys.append(key)
+            else:
+                next_page_token = None
+
+            total_count = None
+            if page_token is None:
+                total_count = len(sorted_keys) if name_match is None else sum(
+                    1 for file_name in self._entries if name_match(file_name))
+
+            files = []
+            for key in page_keys:
+                index_entry = self._entries[key[-1]]
+                files.append((key[-1], index_entry.file_hash, index_entry.file_size, index_entry.mtime_ns / 1e9))
+            return FileListPage(
+                cursor=f"{self._journal_id}.{self._generation}",
+                files=files,
+                next_page_token=next_page_token,
+                total_count=total_count,
+            )
+
+    def _parse_page_token(self, page_token: Optional[str], sort_by: str) -> Optional[tuple]:
+        """Sort key a page token points at, raising ValueError on tokens not made for this order."""
+        if page_token is None:
+            return None
+        try:
+            after_key = json.loads(page_token)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid page token")
+        if not isinstance(after_key, list):
+            raise ValueError("Invalid page token")
+        after_key = tuple(after_key)
+        expected_types = (str,) if sort_by == "name" else (int, str)
+        if len(after_key) != len(expected_types) or not all(
+                type(value) is value_type for value, value_type in zip(after_key, expected_types)):
+            raise ValueError("Invalid page token")
+        return after_key
+
+    def _sort_key(self, sort_by: str, file_name: str, index_entry: FileHashIndexEntry) -> tuple:
+        """Key of an entry in a sort order, the file name comes last to make it unique."""
+        if sort_by == "size":
+            return index_entry.file_size, file_name
+        if sort_by == "mtime":
+            return index_entry.mtime_ns, file_name
+        return (file_name,)
+
+    def _get_sorted_keys(self, sort_by: str) -> list[tuple]:
+        """The sorted keys of an order, built on first use. Caller holds the lock."""
+        sorted_keys = self._sorted_keys.get(sort_by)
+        if sorted_keys is None:
+            sorted_keys = sorted(
+                self._sort_key(sort_by, file_name, index_entry) for file_name, index_entry in self._entries.items())
+            self._sorted_keys[sort_by] = sorted_keys
+        return sorted_keys
+
+    def _update_sorted_keys(self, file_name: str, previous_entry: Optional[FileHashIndexEntry],
+                            index_entry: Optional[FileHashIndexEntry]) -> None:
+        """Move a changed entry in every built order, None for an entry that is new or removed."""
+        for sort_by, sorted_keys in self._sorted_keys.items():
+            previous_key = None if previous_entry is None else self._sort_key(sort_by, file_name, previous_entry)
+            key = None if index_entry is None else self._sort_key(sort_by, file_name, index_entry)
+            if previous_key == key:
+                continue
+            if previous_key is not None:
+                del sorted_keys[bisect.bisect_left(sorted_keys, previous_key)]
+            if key is not None:
+                bisect.insort(sorted_keys, key)
+
+    def _start_background_scan(self) -> None:
+        """Rescan on a thread if the last scan is too old and none is running. Caller holds the lock."""
+        if self._scan_thread is not None and self._scan_thread.is_alive():
+            return
+        if self._last_scan_time is not None and time.monotonic() - self._last_scan_time < LIST_PAGE_RESCAN_INTERVAL:
+            return
+        self._scan_thread = threading.Thread(target=self._background_scan, daemon=True)
+        self._scan_thread.start()
+
+    def _background_scan(self) -> None:
+        # the directory is read without the lock, so pages are served meanwhile
+        directory_stats = self._stat_directory()
+        with self._lock, self._write_transaction():
+            self._apply_scan(directory_stats, recheck=True)
+
+    def _parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """Generation of a cursor of this journal that can still be served, else None. Caller holds the lock."""
+        if not cursor:
+            return None
+        journal_id, _, generation = cursor.partition(".")
+        if journal_id != self._journal_id or not generation.isdigit():
+            return None
+        generation = int(generation)
+        if generation < self._journal_start or generation > self._generation:
+            return None
+        return generation
+
+    def _scan(self) -> None:
+        """Bring the entries in line with the directory, hashing only changed files. Caller holds the lock."""
+        self._apply_scan(self._stat_directory(), recheck=False)
+
+    def _stat_directory(self) -> dict[str, os.stat_result]:
+        """Stat of every listable file in the directory, by file name."""
+        directory_stats = {}
+        with os.scandir(self.file_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith(UPLOADING_SUFFIX):
+                    continue
+                directory_stats[entry.name] = entry.stat()
+        return directory_stats
+
+    def _apply_scan(self, directory_stats: dict[str, os.stat_result], recheck: bool) -> None:
+        """Update the entries from a directory scan. Caller holds the lock and a write transaction.
+
+        With `recheck` the scan was made without the lock and may be older
+        than the entries, so a file is stat'ed again before it counts as
+        changed or removed.
+        """
+        for file_name, stat_result in directory_stats.items():
+            index_entry = self._entries.get(file_name)
+            if index_entry is not None and self._matches(index_entry, stat_result):
+                continue
+            file_path = os.path.join(self.file_dir, file_name)
+            if recheck:
+                try:
+                    stat_result = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                if index_entry is not None and self._matches(index_entry, stat_result):
+                    continue
+            self._set_entry(file_name, stat_result, hash_file(file_path))
+
+        # forget files that were deleted behind our back
+        for file_name in list(self._entries):
+            if file_name not in directory_stats:
+                if recheck and os.path.exists(os.path.join(self.file_dir, file_name)):
+                    continue
+                self._remove_entry(file_name)
+
+        self._last_scan_time = time.monotonic()
+
+    def get_file_hash(self, file_name: str) -> Optional[str]:
+        """Return the MD5 of a single file, or None if it does not exist."""
+        file_path = os.path.join(self.file_dir, file_name)
+        with self._lock, self._write_transaction():
+            try:
+                stat_result = os.stat(file_path)
+            except FileNotFoundError:
+                if file_name in self._entries:
+                    self._remove_entry(file_name)
+                return None
+            index_entry = self._entries.get(file_name)
+            if index_entry is None or not self._matches(index_entry, stat_result):
+                index_entry = self._set_entry(file_name, stat_result, hash_file(file_path))
+            return index_entry.file_hash
+
+    def update_file(self, file_name: str, file_hash: str) -> None:
+        """Record the digest of a file that was just written, i.e. by an upload."""
+        self.update_files([(file_name, file_hash)])
+
+    def update_files(self, file_hash_list: list[tuple[str, str]]) -> None:
+        """Record the digests of files that were just written, in one commit."""
+        stat_results = [os.stat(os.path.join(self.file_dir, file_name)) for file_name, _ in file_hash_list]
+        with self._lock, self._write_transaction():
+            for (file_name, file_hash), stat_result in zip(file_hash_list, stat_results):
+                self._set_entry(file_name, stat_result, file_hash)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _matches(self, index_entry: FileHashIndexEntry, stat_result: os.stat_result) -> bool:
+        return (index_entry.file_size == stat_result.st_size
+                and index_entry.mtime_ns == stat_result.st_mtime_ns
+                and index_entry.inode == stat_result.st_ino)
+
+    def _set_entry(self, file_name: str, stat_result: os.stat_result, file_hash: str) -> FileHashIndexEntry:
+        """Record the current stat and hash of a file, journaling it if it is new or its content changed."""
+        previous_entry = self._entries.get(file_name)
+        if previous_entry is not None and previous_entry.file_hash == file_hash:
+            # touched or copied over with the same content, nothing for listings to report
+            generation = previous_entry.generation
+        else:
+            self._generation += 1
+            generation = self._generation
+        index_entry = FileHashIndexEntry(
+            file_size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+            inode=stat_result.st_ino,
+            file_hash=file_hash,
+            generation=generation,
+        )
+        self._entries[file_name] = index_entry
+        if self._removed.pop(file_name, None) is not None:
+            self._connection.execute("DELETE FROM removed WHERE file_name = ?", (file_name,))
+        self._connection.execute(
+            "INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?, ?)",
+            (file_name, index_entry.file_size, index_entry.mtime_ns, index_entry.inode,
+             index_entry.file_hash, index_entry.generation),
+        )
+        self._update_sorted_keys(file_name, previous_entry, index_entry)
+        return index_entry
+
+    def _remove_entry(self, file_name: str) -> None:
+        """Forget a file and journal its removal."""
+        self._update_sorted_keys(file_name, self._entries.pop(file_name), None)
+        self._generation += 1
+        self._removed[file_name] = self._generation
+        self._connection.execute("DELETE FROM entry WHERE file_name = ?", (file_name,))
+        self._connection.execute("INSERT OR REPLACE INTO removed VALUES (?, ?)", (file_name, self._generation))
+        if len(self._removed) > MAX_REMOVED_ENTRIES:
+            # dicts keep insertion order, the first removal is the oldest
+            oldest_file_name = next(iter(self._removed))
+            self._journal_start = self._removed.pop(oldest_file_name)
+            self._connection.execute("DELETE FROM removed WHERE file_name = ?", (oldest_file_name,))
+
+    def _load(self) -> None:
+        """Load the index from its database.
+
+        A corrupt database is dropped and the index starts empty, with a new
+        journal. Without a database, a JSON index from before is imported.
+        """
+        try:
+            self._open_database()
+        except sqlite3.DatabaseError:
+            self._connection = None
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.index_path + suffix)
+                except FileNotFoundError:
+                    pass
+            self._open_database()
+
+        # the first of several processes to start sets up the journal, the others find it
+        self._connection.execute("BEGIN IMMEDIATE")
+        if not self._connection.execute("SELECT 1 FROM journal").fetchone():
+            self._import_legacy_index()
+            self._commit()
+        else:
+            self._connection.commit()
+        self._load_rows()
+
+    def _load_rows(self) -> None:
+        """Replace the entries and the journal position with what the database holds. Caller holds the lock."""
+        self._data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        journal = dict(self._connection.execute("SELECT key, value FROM journal").fetchall())
+        self._journal_id = journal["journal_id"]
+        self._generation = int(journal["generation"])
+        self._journal_start = int(journal["journal_start"])
+        self._entries = {
+            file_name: FileHashIndexEntry(*row)
+            for file_name, *row in self._connection.execute(
+                "SELECT file_name, file_size, mtime_ns, inode, file_hash, generation FROM entry")
+        }
+        # oldest removal first, like the insertion order they were journaled in
+        self._removed = dict(self._connection.execute(
+            "SELECT file_name, generation FROM removed ORDER BY generation").fetchall())
+        self._sorted_keys = {}
+
+    def _refresh(self) -> None:
+        """Take over what other processes committed since the entries were last brought up to date.
+
+        Only the rows journaled after the generation in memory are read.
+        Caller holds the lock.
+        """
+        own_transaction = not self._connection.in_transaction
+        if own_transaction:
+            # one snapshot for the journal position and the rows
+            self._connection.execute("BEGIN")
+        try:
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            journal = dict(self._connection.execute("SELECT key, value FROM journal").fetchall())
+            if journal["journal_id"] != self._journal_id or int(journal["journal_start"]) > self._generation:
+                # the database was recreated, or removals newer than the entries fell off the journal
+                self._load_rows()
+                return
+            for file_name, *row in self._connection.execute(
+                    "SELECT file_name, file_size, mtime_ns, inode, file_hash, generation FROM entry "
+                    "WHERE generation > ?", (self._generation,)):
+                index_entry = FileHashIndexEntry(*row)
+                self._update_sorted_keys(file_name, self._entries.get(file_name), index_entry)
+                self._entries[file_name] = index_entry
+                self._removed.pop(file_name, None)
+            for file_name, generation in self._connection.execute(
+                    "SELECT file_name, generation FROM removed WHERE generation > ? ORDER BY generation",
+                    (self._generation,)):
+                if file_name in self._entries:
+                    self._update_sorted_keys(file_name, self._entries.pop(file_name), None)
+                self._removed.pop(file_name, None)
+                self._removed[file_name] = generation
+            self._generation = int(journal["generation"])
+            self._journal_start = int(journal["journal_start"])
+            # removals that fell off the journal in the other process
+            while self._removed and next(iter(self._removed.values())) <= self._journal_start:
+                del self._removed[next(iter(self._removed))]
+            self._data_version = data_version
+        finally:
+            if own_transaction:
+                self._connection.commit()
+
+    @contextlib.contextmanager
+    def _write_transaction(self):
+        """Hold the database's write lock, with the entries brought up to date first. Caller holds the lock.
+
+        The journal position is written with the changes, if there are any.
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._refresh()
+            total_changes = self._connection.total_changes
+            yield
+            if self._connection.total_changes != total_changes:
+                self._commit()
+            else:
+                self._connection.commit()
+        except BaseException:
+            self._connection.rollback()
+            # the entries may hold changes the database does not
+            self._load_rows()
+            raise
+
+    def _open_database(self) -> None:
+        connection = sqlite3.connect(self.index_path, timeout=DATABASE_TIMEOUT, check_same_thread=False)
+        try:
+            # requests and the background scan share one connection, serialized by the lock
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entry (file_name TEXT PRIMARY KEY, file_size INTEGER, "
+                "mtime_ns INTEGER, inode INTEGER, file_hash TEXT, generation INTEGER)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS removed (file_name TEXT PRIMARY KEY, generation INTEGER)")
+            connection.execute("CREATE TABLE IF NOT EXISTS journal (key TEXT PRIMARY KEY, value TEXT)")
+            # other processes' changes are read by generation
+            connection.execute("CREATE INDEX IF NOT EXISTS entry_generation ON entry (generation)")
+            connection.execute("CREATE INDEX IF NOT EXISTS removed_generation ON removed (generation)")
+            connection.commit()
+        except sqlite3.DatabaseError:
+            connection.close()
+            raise
+        self._connection = connection
+
+    def _import_legacy_index(self) -> None:
+        """Take over the entries of a JSON index, if one is there. Its journal starts over."""
+        try:
+            with open(self.legacy_index_path, "r") as f:
+                data = json.load(f)
+            # before the journal the file was the entries alone
+            entries = data.get("entries", data)
+            for file_name, entry in entries.items():
+                self._entries[file_name] = FileHashIndexEntry(
+                    file_size=entry["file_size"], mtime_ns=entry["mtime_ns"],
+                    inode=entry["inode"], file_hash=entry["file_hash"],
+                )
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            self._entries = {}
+            return
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_name, index_entry.file_size, index_entry.mtime_ns, index_entry.inode, index_entry.file_hash, 0)
+             for file_name, index_entry in self._entries.items()],
+        )
+        os.remove(self.legacy_index_path)
+
+    def _commit(self) -> None:
+        """Commit the open transaction with the journal position. Caller holds the lock."""
+        self._connection.executemany("INSERT OR REPLACE INTO journal VALUES (?, ?)", [
+            ("journal_id", self._journal_id),
+            ("generation", str(self._generation)),
+            ("journal_start", str(self._journal_start)),
+        ])
+        self._connection.commit()
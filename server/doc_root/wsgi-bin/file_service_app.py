@@ -1,22 +1,47 @@
 #!/usr/local/bin/python3.12
 import os
+import re
 import hashlib
+import email.utils
 from enum import Enum
 from typing import List, Optional, Dict, Any
 import json
 from dataclasses import dataclass, asdict
 from functools import partial
 import base64
+import io
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+from werkzeug.wsgi import LimitedStream
+
+from file_hash_index import FileHashIndex, UPLOADING_SUFFIX
+from response_compression import (COMPRESSION_LEVEL, COMPRESSION_MIN_SIZE,
+                                  COMPRESSION_SAMPLE_SIZE, STREAM_COMPRESSION_LEVEL, compress_body,
+                                  is_compressed_format, is_worth_compressing,
+                                  iter_compressed_blocks, negotiate_content_encoding,
+                                  prepend_block)
+from request_decompression import (DECOMPRESS_READ_SIZE, REQUEST_DECOMPRESSORS,
+                                   DecompressingStream, parse_content_encoding)
 
 app = Flask(__name__)
 
 FILE_DIR = os.path.join(os.path.dirname(__file__), "../test_file_service")
+# block size for streaming file bodies in and out of the raw transfer routes
+FILE_BLOCK_SIZE = 1024 * 1024
+
+# single byte range, i.e. "bytes=0-1023", "bytes=1024-" or "bytes=-512"
+BYTE_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# largest page a paged list_files answers with
+MAX_LIST_PAGE_SIZE = 1000
+
+# persistent MD5 index of FILE_DIR, created on first use
+_file_hash_index: Optional[FileHashIndex] = None
 
 # Keep your existing models
 class FileServerRequestType(str, Enum):
     LIST_FILES = "list_files"
+    LIST_FILE_CHANGES = "list_file_changes"
     DOWNLOAD_FILE = "download_file"
     UPLOAD_FILE = "upload_file"
 
@@ -26,6 +51,9 @@ class SingleFile:
     file_name: str = None
     file_hash: Optional[str] = None
     file_data: Optional[bytes] | Optional[str] = None
+    # paged list_files only
+    file_size: Optional[int] = None
+    file_mtime: Optional[float] = None
 
 
 @dataclass
@@ -40,6 +68,14 @@ class FileServerRequestAPI:
     request_type: FileServerRequestType = None
     request_download_file_list: Optional[list[SingleFile]] = None
     request_upload_file_list: Optional[list[SingleFile]] = None
+    # list_file_changes: the cursor of the previous answer, none for a full list
+    cursor: Optional[str] = None
+    # list_files: with a page size the list comes in pages, sorted and filtered
+    page_size: Optional[int] = None
+    page_token: Optional[str] = None
+    name_pattern: Optional[str] = None
+    sort_by: Optional[str] = None
+    descending: Optional[bool] = None
 
 
 @dataclass
@@ -47,6 +83,24 @@ class FileServerResponseAPI:
     request_success: bool = False
     request_data: Optional[List[SingleFile]] = None
     error_message: Optional[str] = None
+    # list_file_changes: request_data holds the added and modified files
+    cursor: Optional[str] = None
+    removed_file_list: Optional[List[str]] = None
+    full_list: Optional[bool] = None
+    # paged list_files: the cursor is for list_file_changes, as above
+    next_page_token: Optional[str] = None
+    total_count: Optional[int] = None
+
+
+def get_file_hash_index() -> FileHashIndex:
+    """Return the hash index of the upload directory, creating the directory if needed."""
+    global _file_hash_index
+    upload_dir = os.path.join(os.path.dirname(__file__), FILE_DIR)
+    if _file_hash_index is None or _file_hash_index.file_dir != upload_dir:
+        if not os.path.exists(upload_dir):
+            os.makedirs(upload_dir)
+        _file_hash_index = FileHashIndex(upload_dir)
+    return _file_hash_index
 
 
 # Helper function to filter None values when converting dataclasses to dict
@@ -58,6 +112,99 @@ def filter_none(obj):
     return obj
 
 
+@app.before_request
+def decompress_request_body():
+    """Undo the Content-Encoding of an upload before the route reads it.
+
+    A body without Content-Length, i.e. a chunked upload, is read until the
+    input ends. The body is decompressed while the route reads it, so request.get_json()
+    and request.stream see the plain bytes and a large upload is never held
+    whole. Codings the server cannot undo are refused with 415 and the list
+    of accepted ones (RFC 9110, section 15.5.16).
+    """
+    environ = request.environ
+    if not environ.get("CONTENT_LENGTH"):
+        # i.e. a chunked upload: mod_wsgi (WSGIChunkedRequest On) hands over the body
+        # without a length and ends the input where the body ends
+        environ["wsgi.input_terminated"] = True
+    content_encoding = request.headers.get("Content-Encoding")
+    if not content_encoding:
+        return None
+    try:
+        coding_list = parse_content_encoding(content_encoding)
+    except ValueError as e:
+        return Response(str(e), status=415, mimetype="text/plain",
+                        headers={"Accept-Encoding": ", ".join(REQUEST_DECOMPRESSORS)})
+    if not coding_list:
+        return None
+
+    source = environ["wsgi.input"]
+    if environ.get("CONTENT_LENGTH"):
+        source = LimitedStream(source, int(environ["CONTENT_LENGTH"]))
+    environ["wsgi.input"] = io.BufferedReader(DecompressingStream(source, coding_list), DECOMPRESS_READ_SIZE)
+    # the decompressed length is unknown, the body ends where the compressed one does
+    environ.pop("CONTENT_LENGTH", None)
+    environ.pop("HTTP_CONTENT_ENCODING", None)
+    environ["wsgi.input_terminated"] = True
+    return None
+
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """Compress the body with gzip or deflate if the client accepts it.
+
+    Only complete 200 bodies are compressed: a 206 carries bytes of the
+    uncompressed file, and HEAD answers keep the headers of the plain file.
+    Small bodies and already compressed data are sent as they are. Streamed
+    file bodies are compressed block by block, their compressed length is
+    not known up front so they go without Content-Length.
+    """
+    if "Content-Encoding" in response.headers:
+        return response
+    # caches must not hand a compressed body to a client that did not ask for it
+    response.vary.add("Accept-Encoding")
+    if request.method == "HEAD" or response.status_code != 200:
+        return response
+
+    content_encoding = negotiate_content_encoding(request.headers.get("Accept-Encoding"))
+    if content_encoding is None:
+        return response
+    file_name = (request.view_args or {}).get("file_name")
+    if is_compressed_format(file_name, response.mimetype):
+        return response
+    if response.content_length is not None and response.content_length < COMPRESSION_MIN_SIZE:
+        return response
+
+    if response.is_streamed:
+        if file_name is not None:
+            # sample the file itself, a body that stays uncompressed keeps its file wrapper and sendfile
+            with open(resolve_file_path(file_name), "rb") as f:
+                if not is_worth_compressing(f.read(COMPRESSION_SAMPLE_SIZE)):
+                    return response
+            blocks = response.response
+        else:
+            blocks = iter(response.response)
+            first_block = next(blocks, b"")
+            blocks = prepend_block(first_block, blocks)
+            if not is_worth_compressing(first_block):
+                response.response = blocks
+                return response
+        response.response = iter_compressed_blocks(blocks, content_encoding, STREAM_COMPRESSION_LEVEL)
+        response.headers.remove("Content-Length")
+    else:
+        body = response.get_data()
+        if not is_worth_compressing(body):
+            return response
+        response.set_data(compress_body(body, content_encoding, COMPRESSION_LEVEL))
+
+    response.headers["Content-Encoding"] = content_encoding
+    # the compressed bytes differ from the file, the ETag only stays valid as a weak one
+    etag, _ = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+
 @app.route("/", methods=["POST"])
 def file_service():
     try:
@@ -71,7 +218,17 @@ def file_service():
         request_type = request_data["request_type"]
 
         if request_type == FileServerRequestType.LIST_FILES:
+            if request_data.get("page_size") is not None:
+                return fetch_file_page(
+                    page_size=request_data["page_size"],
+                    page_token=request_data.get("page_token"),
+                    name_pattern=request_data.get("name_pattern"),
+                    sort_by=request_data.get("sort_by") or "name",
+                    descending=bool(request_data.get("descending")),
+                )
             return fetch_file_list()
+        elif request_type == FileServerRequestType.LIST_FILE_CHANGES:
+            return fetch_file_changes(cursor=request_data.get("cursor"))
         elif request_type == FileServerRequestType.DOWNLOAD_FILE:
             return download_file(
                 request_download_file_list=request_data.get("request_download_file_list", [])
@@ -103,13 +260,11 @@ def fetch_file_list():
             )
             return jsonify(filter_none(asdict(response)))
 
-        file_list = []
-        for file_name in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, file_name)
-            if os.path.isfile(file_path):
-                with open(file_path, "rb") as f:
-                    file_hash = hashlib.md5(f.read()).hexdigest()
-                file_list.append(SingleFile(file_name=file_name, file_hash=file_hash))
+        # hashes come from the persistent index, only changed files are read
+        file_list = [
+            SingleFile(file_name=file_name, file_hash=file_hash)
+            for file_name, file_hash in get_file_hash_index().list_files()
+        ]
 
         response = FileServerResponseAPI(
             request_success=True,
@@ -123,6 +278,89 @@ def fetch_file_list():
         )
         return jsonify(filter_none(asdict(response)))
 
+def fetch_file_page(page_size: int, page_token: Optional[str], name_pattern: Optional[str],
+                    sort_by: str, descending: bool):
+    """List one page of the files, sorted by name, size or mtime and filtered with a glob.
+
+    The page token of the answer asks for the next page. Pages come from
+    the hash index without scanning the directory, so the first page of a
+    large directory is quick.
+    """
+    try:
+        upload_dir = os.path.join(os.path.dirname(__file__), FILE_DIR)
+
+        if not os.path.exists(upload_dir):
+            response = FileServerResponseAPI(
+                request_success=False, error_message="Upload directory does not exist"
+            )
+            return jsonify(filter_none(asdict(response)))
+
+        file_page = get_file_hash_index().list_page(
+            limit=min(int(page_size), MAX_LIST_PAGE_SIZE),
+            page_token=page_token,
+            name_pattern=name_pattern,
+            sort_by=sort_by,
+            descending=descending,
+        )
+        response = FileServerResponseAPI(
+            request_success=True,
+            request_data=[
+                SingleFile(file_name=file_name, file_hash=file_hash, file_size=file_size, file_mtime=file_mtime)
+                for file_name, file_hash, file_size, file_mtime in file_page.files
+            ],
+            cursor=file_page.cursor,
+            next_page_token=file_page.next_page_token,
+            total_count=file_page.total_count,
+        )
+        return jsonify(filter_none(asdict(response)))
+
+    except (ValueError, TypeError) as e:
+        # a bad page size, sort key or page token
+        response = FileServerResponseAPI(
+            request_success=False, error_message=f"Invalid file list page request: {str(e)}"
+        )
+        return jsonify(filter_none(asdict(response))), 400
+
+    except Exception as e:
+        response = FileServerResponseAPI(
+            request_success=False, error_message=f"Error fetching file list page: {str(e)}"
+        )
+        return jsonify(filter_none(asdict(response)))
+
+def fetch_file_changes(cursor: Optional[str]):
+    """List the files added, modified and removed since a cursor, with the cursor for the next call.
+
+    The changes come from the journal of the hash index. A cursor that
+    cannot be served is answered with every file and `full_list` set.
+    """
+    try:
+        upload_dir = os.path.join(os.path.dirname(__file__), FILE_DIR)
+
+        if not os.path.exists(upload_dir):
+            response = FileServerResponseAPI(
+                request_success=False, error_message="Upload directory does not exist"
+            )
+            return jsonify(filter_none(asdict(response)))
+
+        file_changes = get_file_hash_index().list_changes(cursor)
+        response = FileServerResponseAPI(
+            request_success=True,
+            request_data=[
+                SingleFile(file_name=file_name, file_hash=file_hash)
+                for file_name, file_hash in file_changes.changed
+            ],
+            cursor=file_changes.cursor,
+            removed_file_list=file_changes.removed,
+            full_list=file_changes.full_list,
+        )
+        return jsonify(filter_none(asdict(response)))
+
+    except Exception as e:
+        response = FileServerResponseAPI(
+            request_success=False, error_message=f"Error fetching file changes: {str(e)}"
+        )
+        return jsonify(filter_none(asdict(response)))
+
 def download_file(request_download_file_list: List[dict]):
     try:
         # Define the upload directory
@@ -161,15 +399,22 @@ def upload_file(request_upload_file_list: List[dict]):
         if not os.path.exists(upload_dir):
             os.makedirs(upload_dir)
 
+        stored_file_list = []
         for file in request_upload_file_list:
             file_name = file['file_name']
             file_data = base64.b64decode(file['file_data'])
             with open(os.path.join(upload_dir, file_name), "wb") as f:
                 f.write(file_data)
+            file_hash = hashlib.md5(file_data).hexdigest()
+            # answer with the stored hashes instead of echoing the file data back
+            stored_file_list.append(SingleFile(file_name=file_name, file_hash=file_hash))
+        # one index commit for the whole batch
+        get_file_hash_index().update_files(
+            [(stored_file.file_name, stored_file.file_hash) for stored_file in stored_file_list])
 
         response = FileServerResponseAPI(
             request_success=True,
-            request_data=request_upload_file_list,
+            request_data=stored_file_list,
         )
         return jsonify(filter_none(asdict(response)))
 
@@ -179,5 +424,258 @@ def upload_file(request_upload_file_list: List[dict]):
         )
         return jsonify(filter_none(asdict(response)))
 
+def resolve_file_path(file_name: str) -> Optional[str]:
+    """Map a requested file name to a path in the upload directory, rejecting anything outside it."""
+    if not file_name or file_name in (".", "..") or "/" in file_name or "\\" in file_name:
+        return None
+    if file_name.endswith(UPLOADING_SUFFIX):
+        return None
+    return os.path.join(os.path.dirname(__file__), FILE_DIR, file_name)
+
+
+def iter_file_blocks(file_path: str, offset: int = 0, count: Optional[int] = None):
+    """Yield `count` bytes of a file from `offset` block by block, or the rest of it."""
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        remaining = count
+        while remaining is None or remaining > 0:
+            block_size = FILE_BLOCK_SIZE if remaining is None else min(FILE_BLOCK_SIZE, remaining)
+            block = f.read(block_size)
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+
+def server_limits_file_wrapper(environ: dict) -> bool:
+    """Whether the WSGI server stops sending a wrapped file after Content-Length bytes.
+
+    mod_wsgi and gunicorn do and start at the current file position, the
+    file wrappers of wsgiref and the werkzeug fallback send up to the end
+    of the file.
+    """
+    return "mod_wsgi.version" in environ or environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")
+
+
+def make_file_body(file_path: str, offset: int, count: int, file_size: int):
+    """Body for bytes offset..offset + count - 1 of a file.
+
+    The open file goes to the server's `wsgi.file_wrapper` where it can be
+    trusted with the range, so the server can send it with sendfile() and
+    the bytes never pass through Python. Otherwise the file is read block
+    by block.
+    """
+    environ = request.environ
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None and (offset + count == file_size or server_limits_file_wrapper(environ)):
+        file = open(file_path, "rb")
+        file.seek(offset)
+        return file_wrapper(file, FILE_BLOCK_SIZE)
+    return iter_file_blocks(file_path, offset, count)
+
+
+def format_etag(file_hash: str) -> str:
+    """The ETag of a file is its quoted MD5."""
+    return f'"{file_hash}"'
+
+
+def is_not_modified(etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match and If-Modified-Since for a GET or HEAD request.
+
+    If-None-Match takes precedence: If-Modified-Since is only looked at when
+    the client sent no entity tags (RFC 9110, section 13.2.2). A malformed
+    date is ignored.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # weak comparison, a W/ prefix does not matter for a 304
+        client_etag_list = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in client_etag_list
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is None:
+        return False
+    try:
+        client_timestamp = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a resolution of one second
+    return int(mtime) <= client_timestamp
+
+
+def parse_byte_range(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """Parse a Range header into (first byte, last byte).
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges, the whole file is sent then), raises ValueError when the range
+    cannot be satisfied.
+    """
+    match = BYTE_RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        suffix_length = int(last)
+        if suffix_length == 0 or file_size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, file_size - suffix_length), file_size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= file_size:
+        raise ValueError("Unsatisfiable range")
+    last = int(last) if last else file_size - 1
+    return first, min(last, file_size - 1)
+
+
+@app.route("/files/<file_name>", methods=["GET"])
+def download_file_raw(file_name: str):
+    """Send a single file as application/octet-stream, without base64 or JSON.
+
+    A single `Range` is honoured with 206 Partial Content so interrupted
+    downloads can resume. `If-Range` carrying the ETag (the quoted MD5)
+    makes sure the pieces come from the same version of the file.
+
+    `If-None-Match` and `If-Modified-Since` are answered with 304 Not
+    Modified so a client holding a copy can revalidate it without a body.
+
+    Bodies go out through the server's file wrapper where it is safe, see
+    `make_file_body`.
+    """
+    file_path = resolve_file_path(file_name)
+    if file_path is None:
+        return Response("Invalid file name", status=400, mimetype="text/plain")
+    if not os.path.isfile(file_path):
+        return Response(f"File '{file_name}' not found", status=404, mimetype="text/plain")
+
+    stat_result = os.stat(file_path)
+    file_size = stat_result.st_size
+    file_hash = get_file_hash_index().get_file_hash(file_name)
+    if file_hash is None:
+        # deleted in the meantime
+        return Response(f"File '{file_name}' not found", status=404, mimetype="text/plain")
+    etag = format_etag(file_hash)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+    # preconditions come before Range, a 304 carries the validators but no body
+    if is_not_modified(etag, stat_result.st_mtime):
+        return Response(status=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    # a stale If-Range means the client's pieces are outdated, send the whole file
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_byte_range(range_header, file_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response("Requested range not satisfiable", status=416,
+                            mimetype="text/plain", headers=headers)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(file_size)
+        return Response(
+            make_file_body(file_path, 0, file_size, file_size),
+            mimetype="application/octet-stream",
+            headers=headers,
+            direct_passthrough=True,
+        )
+
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{file_size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return Response(
+        make_file_body(file_path, first, last - first + 1, file_size),
+        status=206,
+        mimetype="application/octet-stream",
+        headers=headers,
+        direct_passthrough=True,
+    )
+
+
+@app.route("/metadata/<file_name>", methods=["GET", "HEAD"])
+def file_metadata(file_name: str):
+    """Answer with the size, ETag (the quoted MD5) and modification time of a file, but not its content.
+
+    Only this file is looked at, and its hash comes from the index unless
+    the file changed, so checking a few files does not hash the directory.
+    The size and the exact mtime go in `X-File-Size` and `X-File-Mtime`
+    (seconds since the epoch), the body is always empty. `If-None-Match`
+    is answered with 304 Not Modified.
+    """
+    file_path = resolve_file_path(file_name)
+    if file_path is None:
+        return Response("Invalid file name", status=400, mimetype="text/plain")
+    if not os.path.isfile(file_path):
+        return Response(f"File '{file_name}' not found", status=404, mimetype="text/plain")
+
+    stat_result = os.stat(file_path)
+    file_hash = get_file_hash_index().get_file_hash(file_name)
+    if file_hash is None:
+        # deleted in the meantime
+        return Response(f"File '{file_name}' not found", status=404, mimetype="text/plain")
+    etag = format_etag(file_hash)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(stat_result.st_mtime, usegmt=True),
+        "X-File-Size": str(stat_result.st_size),
+        "X-File-Mtime": f"{stat_result.st_mtime_ns / 1e9:.6f}",
+    }
+    if is_not_modified(etag, stat_result.st_mtime):
+        return Response(status=304, headers=headers)
+    return Response(status=204, headers=headers)
+
+
+@app.route("/files/<file_name>", methods=["PUT"])
+def upload_file_raw(file_name: str):
+    """Store a single file sent as a raw request body. The body is hashed while it is written."""
+    try:
+        file_path = resolve_file_path(file_name)
+        if file_path is None:
+            response = FileServerResponseAPI(
+                request_success=False, error_message="Invalid file name"
+            )
+            return jsonify(filter_none(asdict(response))), 400
+
+        upload_dir = os.path.dirname(file_path)
+        if not os.path.exists(upload_dir):
+            os.makedirs(upload_dir)
+
+        # write to a temporary file first so readers never see a half written file
+        temp_file_path = file_path + UPLOADING_SUFFIX
+        md5_hash = hashlib.md5()
+        with open(temp_file_path, "wb") as f:
+            while True:
+                block = request.stream.read(FILE_BLOCK_SIZE)
+                if not block:
+                    break
+                md5_hash.update(block)
+                f.write(block)
+        os.replace(temp_file_path, file_path)
+        get_file_hash_index().update_file(file_name, md5_hash.hexdigest())
+
+        response = FileServerResponseAPI(
+            request_success=True,
+            request_data=[SingleFile(file_name=file_name, file_hash=md5_hash.hexdigest())],
+        )
+        return jsonify(filter_none(asdict(response)))
+
+    except Exception as e:
+        response = FileServerResponseAPI(
+            request_success=False, error_message=f"Error uploading file: {str(e)}"
+        )
+        return jsonify(filter_none(asdict(response)))
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,106 @@
+import io
+import zlib
+from typing import BinaryIO, Callable
+
+# optional codings, accepted only when their package is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# compressed request bodies are read from the client in blocks of this size
+DECOMPRESS_READ_SIZE = 256 * 1024
+
+
+class BrotliDecompressor:
+    """Adapt brotli.Decompressor to the zlib decompressobj interface."""
+
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+        self.eof = False
+
+    def decompress(self, data: bytes) -> bytes:
+        output = self._decompressor.process(data)
+        self.eof = self._decompressor.is_finished()
+        return output
+
+    def flush(self) -> bytes:
+        return b""
+
+
+# decompressor factories by content coding, the same codings the client can send
+REQUEST_DECOMPRESSORS: dict[str, Callable[[], object]] = {
+    "gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    "deflate": lambda: zlib.decompressobj(zlib.MAX_WBITS),
+}
+if zstandard is not None:
+    REQUEST_DECOMPRESSORS["zstd"] = lambda: zstandard.ZstdDecompressor().decompressobj()
+if brotli is not None:
+    REQUEST_DECOMPRESSORS["br"] = BrotliDecompressor
+
+
+def parse_content_encoding(content_encoding: str) -> list[str]:
+    """Codings of a Content-Encoding header in the order they were applied, without identity.
+
+    Raises ValueError for a coding the server cannot undo.
+    """
+    coding_list = [
+        coding.strip().lower()
+        for coding in content_encoding.split(",")
+        if coding.strip() and coding.strip().lower() != "identity"
+    ]
+    for coding in coding_list:
+        if coding not in REQUEST_DECOMPRESSORS:
+            raise ValueError(f"Unsupported content encoding: {coding}")
+    return coding_list
+
+
+class DecompressingStream(io.RawIOBase):
+    """Read-only stream of a request body with its content codings undone.
+
+    The compressed body is read from `source` block by block, so neither
+    the compressed nor the decompressed body is ever held whole.
+    """
+
+    def __init__(self, source: BinaryIO, coding_list: list[str]):
+        self._source = source
+        # undone in the reverse order of the header
+        self._decompressor_list = [REQUEST_DECOMPRESSORS[coding]() for coding in reversed(coding_list)]
+        self._pending = b""
+        self._pending_offset = 0
+        self._source_done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._pending_offset >= len(self._pending):
+            if self._source_done:
+                return 0
+            self._pending = self._decompress_next_block()
+            self._pending_offset = 0
+        size = min(len(buffer), len(self._pending) - self._pending_offset)
+        buffer[:size] = self._pending[self._pending_offset:self._pending_offset + size]
+        self._pending_offset += size
+        return size
+
+    def _decompress_next_block(self) -> bytes:
+        block = self._source.read(DECOMPRESS_READ_SIZE)
+        if block:
+            for decompressor in self._decompressor_list:
+                block = decompressor.decompress(block)
+            return block
+
+        # end of the body, each decompressor's remaining output still passes through the ones after it
+        self._source_done = True
+        tail = b""
+        for decompressor in self._decompressor_list:
+            tail = decompressor.decompress(tail) + decompressor.flush()
+            # zlib does not complain about a cut off stream by itself
+            if getattr(decompressor, "eof", True) is False:
+                raise ValueError("Request body ended before the end of its compressed stream")
+        return tail
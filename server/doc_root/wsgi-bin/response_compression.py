@@ -0,0 +1,145 @@
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+# bodies smaller than this are sent as they are, the savings do not pay for the CPU time
+COMPRESSION_MIN_SIZE = 1024
+# zlib level for JSON bodies built in memory, 6 is the zlib default
+COMPRESSION_LEVEL = 6
+# zlib level for streamed file bodies, level 1 compresses several times faster for a few percent
+# more bytes on the wire, so large downloads stay network bound instead of CPU bound
+STREAM_COMPRESSION_LEVEL = 1
+# a sample that level 1 cannot shrink below this fraction of its size is not compressed at all
+INCOMPRESSIBLE_RATIO = 0.9
+# only this much of a body is compressed to decide whether it is worth it
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+
+# supported encodings in order of preference when the client ranks them equally
+SUPPORTED_CONTENT_ENCODINGS = ("gzip", "deflate")
+# zlib window bits selecting the container: gzip header or the zlib header HTTP calls deflate
+_CONTENT_ENCODING_WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+
+# files stored in these formats are already compressed, compressing them again only costs CPU
+COMPRESSED_FILE_EXTENSIONS = frozenset({
+    ".gz", ".tgz", ".zip", ".bz2", ".xz", ".zst", ".7z", ".rar", ".br",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".heic",
+    ".mp3", ".mp4", ".m4a", ".mkv", ".mov", ".webm", ".ogg", ".flac",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".jar", ".whl", ".apk",
+})
+COMPRESSED_CONTENT_TYPES = frozenset({
+    "application/gzip", "application/zip", "application/x-bzip2", "application/x-xz",
+    "application/zstd", "application/x-7z-compressed", "application/pdf",
+})
+COMPRESSED_CONTENT_TYPE_PREFIXES = ("image/", "audio/", "video/")
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q-value}, i.e. "gzip;q=0.8, br"."""
+    quality_dict = {}
+    for item in accept_encoding.split(","):
+        coding, *parameter_list = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parameter_list:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    # a malformed weight makes the coding unacceptable
+                    quality = 0.0
+        quality_dict[coding] = quality
+    return quality_dict
+
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Choose the content coding for a response (RFC 9110, section 12.5.3).
+
+    Returns "gzip" or "deflate", or None when the body should be sent as it
+    is: no Accept-Encoding header, no supported coding accepted, or identity
+    ranked strictly higher than the supported ones.
+    """
+    if not accept_encoding:
+        return None
+    quality_dict = parse_accept_encoding(accept_encoding)
+    # "*" stands for every coding not listed on its own
+    wildcard_quality = quality_dict.get("*", 0.0)
+
+    best_encoding = None
+    best_quality = 0.0
+    for content_encoding in SUPPORTED_CONTENT_ENCODINGS:
+        quality = quality_dict.get(content_encoding, wildcard_quality)
+        if quality > best_quality:
+            best_encoding, best_quality = content_encoding, quality
+
+    identity_quality = quality_dict.get("identity", 1.0 if "*" not in quality_dict else wildcard_quality)
+    if best_encoding is None or identity_quality > best_quality:
+        return None
+    return best_encoding
+
+
+def is_compressed_format(file_name: Optional[str] = None, content_type: Optional[str] = None) -> bool:
+    """Whether a body is stored in a compressed format, judged by file extension or media type."""
+    if file_name is not None and os.path.splitext(file_name)[1].lower() in COMPRESSED_FILE_EXTENSIONS:
+        return True
+    if content_type is not None:
+        content_type = content_type.lower()
+        return (content_type in COMPRESSED_CONTENT_TYPES
+                or content_type.startswith(COMPRESSED_CONTENT_TYPE_PREFIXES))
+    return False
+
+
+def is_worth_compressing(sample: bytes) -> bool:
+    """Compress the head of a body with the fastest level and see if it shrinks.
+
+    Catches random or encrypted data and compressed formats with unknown
+    extensions, which only grow when compressed.
+    """
+    sample = sample[:COMPRESSION_SAMPLE_SIZE]
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) <= len(sample) * INCOMPRESSIBLE_RATIO
+
+
+def compress_body(body: bytes, content_encoding: str, level: int = COMPRESSION_LEVEL) -> bytes:
+    """Compress a whole body with the negotiated coding."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _CONTENT_ENCODING_WBITS[content_encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+def iter_compressed_blocks(
+    blocks: Iterable[bytes], content_encoding: str, level: int = STREAM_COMPRESSION_LEVEL
+) -> Iterator[bytes]:
+    """Compress a streamed body block by block, only one block is held in memory.
+
+    The source is closed when the output is closed or exhausted, so open
+    files behind it are released even if the client disconnects.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _CONTENT_ENCODING_WBITS[content_encoding])
+    try:
+        for block in blocks:
+            compressed_block = compressor.compress(block)
+            # zlib buffers small inputs, only send what it has produced
+            if compressed_block:
+                yield compressed_block
+        yield compressor.flush()
+    finally:
+        close = getattr(blocks, "close", None)
+        if close is not None:
+            close()
+
+
+def prepend_block(first_block: bytes, blocks: Iterator[bytes]) -> Iterator[bytes]:
+    """Put a block taken off a stream back in front of it, closing the stream at the end."""
+    try:
+        yield first_block
+        yield from blocks
+    finally:
+        close = getattr(blocks, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,19 @@
+import file_service_app
+import pytest
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """An empty upload directory for the file service app, with its own hash index."""
+    upload_dir = tmp_path / "files"
+    upload_dir.mkdir()
+    monkeypatch.setattr(file_service_app, "FILE_DIR", str(upload_dir))
+    monkeypatch.setattr(file_service_app, "_file_hash_index", None)
+    yield upload_dir
+    if file_service_app._file_hash_index is not None:
+        file_service_app._file_hash_index.close()
+
+
+@pytest.fixture
+def client(upload_dir):
+    return file_service_app.app.test_client()
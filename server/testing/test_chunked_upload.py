@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import io
+import socket
+import threading
+
+import file_service_app
+import pytest
+from werkzeug.serving import make_server
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+FILE_DATA = bytes(range(256)) * 400
+
+
+def put_chunked(file_name: str, body: bytes, headers: dict = None):
+    """PUT a body the way mod_wsgi (WSGIChunkedRequest On) hands a chunked request to the app.
+
+    The body arrives dechunked, without CONTENT_LENGTH and without wsgi.input_terminated.
+    """
+    environ = EnvironBuilder(path=f"/files/{file_name}", method="PUT",
+                             headers={"Transfer-Encoding": "chunked", **(headers or {})}).get_environ()
+    environ.pop("CONTENT_LENGTH", None)
+    environ.pop("wsgi.input_terminated", None)
+    environ["wsgi.input"] = io.BytesIO(body)
+    app_iter, status, _ = run_wsgi_app(file_service_app.app, environ, buffered=True)
+    return status, b"".join(app_iter)
+
+
+@pytest.mark.parametrize("content_encoding, compress", [
+    (None, lambda data: data),
+    ("gzip", gzip.compress),
+])
+def test_chunked_put_stores_the_whole_body(upload_dir, content_encoding, compress):
+    headers = {"Content-Encoding": content_encoding} if content_encoding else {}
+    status, _ = put_chunked("data.bin", compress(FILE_DATA), headers)
+
+    assert status.startswith("200")
+    assert (upload_dir / "data.bin").read_bytes() == FILE_DATA
+    assert file_service_app.get_file_hash_index().get_file_hash("data.bin") == hashlib.md5(FILE_DATA).hexdigest()
+
+
+@pytest.fixture
+def app_server(upload_dir):
+    server = make_server("127.0.0.1", 0, file_service_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("content_encoding, compress", [
+    (None, lambda data: data),
+    ("gzip", gzip.compress),
+])
+def test_streamed_put_with_chunked_framing(app_server, upload_dir, content_encoding, compress):
+    """A streamed upload as the client sends it: chunked framing, odd chunk sizes, optionally gzipped."""
+    body = compress(FILE_DATA)
+    head = "PUT /files/streamed.bin HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/octet-stream\r\n"
+    if content_encoding:
+        head += f"Content-Encoding: {content_encoding}\r\n"
+    head += "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+    request_bytes = head.encode()
+    for offset in range(0, len(body), 10007):
+        chunk = body[offset:offset + 10007]
+        request_bytes += b"%x\r\n%s\r\n" % (len(chunk), chunk)
+    request_bytes += b"0\r\n\r\n"
+
+    with socket.create_connection(("127.0.0.1", app_server.server_port), timeout=10) as sock:
+        sock.sendall(request_bytes)
+        response = b""
+        while data := sock.recv(65536):
+            response += data
+
+    assert response.startswith(b"HTTP/1.1 200")
+    assert b'"request_success":true' in response.replace(b" ", b"")
+    assert (upload_dir / "streamed.bin").read_bytes() == FILE_DATA
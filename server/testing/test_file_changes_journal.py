@@ -0,0 +1,113 @@
+import hashlib
+
+import file_hash_index
+import pytest
+from file_hash_index import FileHashIndex
+
+
+@pytest.fixture
+def file_dir(tmp_path):
+    file_dir = tmp_path / "files"
+    file_dir.mkdir()
+    for file_name in ("a.txt", "b.txt", "c.txt"):
+        (file_dir / file_name).write_bytes(file_name.encode())
+    return file_dir
+
+
+def build_index(file_dir):
+    return FileHashIndex(str(file_dir), str(file_dir.parent / "index.sqlite3"))
+
+
+def test_changes_between_two_cursors(file_dir):
+    index = build_index(file_dir)
+    first_changes = index.list_changes(None)
+    assert first_changes.full_list
+    assert sorted(file_name for file_name, _ in first_changes.changed) == ["a.txt", "b.txt", "c.txt"]
+
+    (file_dir / "d.txt").write_bytes(b"new")
+    (file_dir / "a.txt").write_bytes(b"modified")
+    (file_dir / "b.txt").unlink()
+    changes = index.list_changes(first_changes.cursor)
+    assert not changes.full_list
+    assert sorted(changes.changed) == [("a.txt", hashlib.md5(b"modified").hexdigest()),
+                                       ("d.txt", hashlib.md5(b"new").hexdigest())]
+    assert changes.removed == ["b.txt"]
+
+    # nothing happened since, and a file that comes back is no longer removed
+    assert index.list_changes(changes.cursor).changed == []
+    (file_dir / "b.txt").write_bytes(b"back")
+    changes_after_return = index.list_changes(changes.cursor)
+    assert [file_name for file_name, _ in changes_after_return.changed] == ["b.txt"]
+    assert changes_after_return.removed == []
+
+
+@pytest.mark.parametrize("cursor", ["0123abcd.1", "not a cursor", "", None])
+def test_foreign_or_malformed_cursor_gets_a_full_list(file_dir, cursor):
+    changes = build_index(file_dir).list_changes(cursor)
+    assert changes.full_list
+    assert len(changes.changed) == 3
+
+
+def test_cursor_ahead_of_the_journal_gets_a_full_list(file_dir):
+    index = build_index(file_dir)
+    journal_id, _, generation = index.list_changes(None).cursor.partition(".")
+    assert index.list_changes(f"{journal_id}.{int(generation) + 1}").full_list
+
+
+def test_cursor_older_than_the_trimmed_journal_gets_a_full_list(file_dir, monkeypatch):
+    monkeypatch.setattr(file_hash_index, "MAX_REMOVED_ENTRIES", 2)
+    index = build_index(file_dir)
+    old_cursor = index.list_changes(None).cursor
+
+    (file_dir / "a.txt").unlink()
+    recent_cursor = index.list_changes(None).cursor
+    (file_dir / "b.txt").unlink()
+    (file_dir / "c.txt").unlink()
+
+    # the removal of a.txt fell off, a cursor from before it cannot tell it
+    changes = index.list_changes(old_cursor)
+    assert changes.full_list and changes.changed == []
+    # a cursor after it still gets a delta
+    changes = index.list_changes(recent_cursor)
+    assert not changes.full_list
+    assert sorted(changes.removed) == ["b.txt", "c.txt"]
+
+
+def test_cursor_survives_a_new_index_instance(file_dir):
+    index = build_index(file_dir)
+    cursor = index.list_changes(None).cursor
+    (file_dir / "c.txt").unlink()
+    index.list_files()
+    index.close()
+
+    changes = build_index(file_dir).list_changes(cursor)
+    assert not changes.full_list
+    assert changes.removed == ["c.txt"]
+
+
+def test_new_journal_invalidates_old_cursors(file_dir):
+    cursor = build_index(file_dir).list_changes(None).cursor
+    # another index file is another journal
+    other_index = FileHashIndex(str(file_dir), str(file_dir.parent / "other.sqlite3"))
+    assert other_index.list_changes(cursor).full_list
+
+
+def test_indexes_sharing_a_database_share_the_journal(file_dir):
+    # like two server processes, each with its own connection
+    index, other_index = build_index(file_dir), build_index(file_dir)
+    cursor = index.list_changes(None).cursor
+
+    (file_dir / "d.txt").write_bytes(b"from one")
+    index.update_file("d.txt", hashlib.md5(b"from one").hexdigest())
+    (file_dir / "e.txt").write_bytes(b"from the other")
+    other_index.update_file("e.txt", hashlib.md5(b"from the other").hexdigest())
+    (file_dir / "a.txt").unlink()
+    index.get_file_hash("a.txt")
+
+    # a cursor from one process is served by the other, with the changes of both
+    for changes in (other_index.list_changes(cursor), index.list_changes(cursor)):
+        assert not changes.full_list
+        assert sorted(file_name for file_name, _ in changes.changed) == ["d.txt", "e.txt"]
+        assert changes.removed == ["a.txt"]
+    assert index.list_changes(None).cursor == other_index.list_changes(None).cursor
+    assert [file_name for file_name, *_ in other_index.list_page(10).files] == ["b.txt", "c.txt", "d.txt", "e.txt"]
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import file_hash_index
+import pytest
+from file_hash_index import FileHashIndex
+
+
+@pytest.fixture
+def file_dir(tmp_path):
+    file_dir = tmp_path / "files"
+    file_dir.mkdir()
+    for file_name, data in (("a.txt", b"alpha"), ("b.txt", b"bravo")):
+        (file_dir / file_name).write_bytes(data)
+    return file_dir
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    """Count content reads, they all go through hash_file."""
+    calls = []
+    real_hash_file = file_hash_index.hash_file
+
+    def counting_hash_file(file_path):
+        calls.append(os.path.basename(file_path))
+        return real_hash_file(file_path)
+
+    monkeypatch.setattr(file_hash_index, "hash_file", counting_hash_file)
+    return calls
+
+
+def build_index(file_dir):
+    return FileHashIndex(str(file_dir), str(file_dir.parent / "index.sqlite3"))
+
+
+def test_unchanged_directory_is_revalidated_by_stat_alone(file_dir, hash_calls):
+    index = build_index(file_dir)
+    assert dict(index.list_files()) == {"a.txt": hashlib.md5(b"alpha").hexdigest(),
+                                        "b.txt": hashlib.md5(b"bravo").hexdigest()}
+    assert sorted(hash_calls) == ["a.txt", "b.txt"]
+
+    hash_calls.clear()
+    index.list_files()
+    assert index.get_file_hash("a.txt") == hashlib.md5(b"alpha").hexdigest()
+    assert hash_calls == []
+
+
+@pytest.mark.parametrize("change", ["size", "mtime_ns", "inode"])
+def test_changed_stat_key_triggers_a_rehash(file_dir, hash_calls, change):
+    index = build_index(file_dir)
+    index.list_files()
+    hash_calls.clear()
+
+    file_path = file_dir / "a.txt"
+    stat_result = os.stat(file_path)
+    if change == "size":
+        file_path.write_bytes(b"alpha, longer")
+        os.utime(file_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    elif change == "mtime_ns":
+        os.utime(file_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1000))
+    else:
+        # same size and mtime, but a new inode
+        (file_dir / "a.new").write_bytes(b"ALPHA")
+        os.utime(file_dir / "a.new", ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+        os.replace(file_dir / "a.new", file_path)
+
+    file_hashes = dict(index.list_files())
+    assert hash_calls == ["a.txt"]
+    assert file_hashes["a.txt"] == hashlib.md5(file_path.read_bytes()).hexdigest()
+
+
+def test_upload_is_recorded_without_a_rescan(file_dir, hash_calls):
+    index = build_index(file_dir)
+    index.list_files()
+    hash_calls.clear()
+
+    (file_dir / "c.txt").write_bytes(b"charlie")
+    index.update_files([("c.txt", "hash of the upload")])
+    assert index.get_file_hash("c.txt") == "hash of the upload"
+    assert dict(index.list_files())["c.txt"] == "hash of the upload"
+    assert hash_calls == []
+
+
+def test_index_survives_a_reload(file_dir, hash_calls):
+    index = build_index(file_dir)
+    index.list_files()
+    (file_dir / "c.txt").write_bytes(b"charlie")
+    index.update_file("c.txt", "hash of the upload")
+    index.close()
+    hash_calls.clear()
+
+    reloaded_index = build_index(file_dir)
+    assert dict(reloaded_index.list_files())["c.txt"] == "hash of the upload"
+    assert hash_calls == []
+
+
+def test_json_index_is_imported(file_dir, hash_calls):
+    index_path = file_dir.parent / "index.sqlite3"
+    stat_result = os.stat(file_dir / "a.txt")
+    (file_dir.parent / "index.json").write_text(
+        '{"a.txt": {"file_size": %d, "mtime_ns": %d, "inode": %d, "file_hash": "imported"}}'
+        % (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino))
+
+    index = FileHashIndex(str(file_dir), str(index_path))
+    assert dict(index.list_files())["a.txt"] == "imported"
+    assert hash_calls == ["b.txt"]
+    assert not (file_dir.parent / "index.json").exists()
@@ -0,0 +1,133 @@
+import json
+import os
+
+import file_service_app
+import pytest
+from file_hash_index import FileHashIndex
+
+FILE_COUNT = 23
+
+
+@pytest.fixture
+def file_dir(tmp_path):
+    """Files with repeated sizes and mtimes, so the orders need the name to break ties."""
+    file_dir = tmp_path / "files"
+    file_dir.mkdir()
+    for index in range(FILE_COUNT):
+        file_path = file_dir / f"f{index:02d}.txt"
+        file_path.write_bytes(b"x" * (index % 5))
+        os.utime(file_path, ns=(0, 1_000_000_000 * (index % 7)))
+    return file_dir
+
+
+def expected_order(file_dir, sort_by, descending, name_pattern_prefix=""):
+    def sort_key(file_name):
+        stat_result = os.stat(file_dir / file_name)
+        value = {"name": (), "size": (stat_result.st_size,), "mtime": (stat_result.st_mtime_ns,)}[sort_by]
+        return value + (file_name,)
+
+    file_names = [file_name for file_name in os.listdir(file_dir) if file_name.startswith(name_pattern_prefix)]
+    return sorted(file_names, key=sort_key, reverse=descending)
+
+
+def read_all_pages(index, page_size, **kwargs):
+    pages = []
+    page_token = None
+    while True:
+        page = index.list_page(page_size, page_token, **kwargs)
+        pages.append(page)
+        page_token = page.next_page_token
+        if page_token is None:
+            return pages
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("sort_by", ["name", "size", "mtime"])
+def test_pages_cover_every_file_once_in_order(file_dir, tmp_path, sort_by, descending):
+    index = FileHashIndex(str(file_dir), str(tmp_path / "index.sqlite3"))
+    pages = read_all_pages(index, 4, sort_by=sort_by, descending=descending)
+
+    file_names = [file[0] for page in pages for file in page.files]
+    assert file_names == expected_order(file_dir, sort_by, descending)
+    assert [len(page.files) for page in pages] == [4] * 5 + [3]
+    assert pages[0].total_count == FILE_COUNT
+    assert all(page.total_count is None for page in pages[1:])
+
+
+@pytest.mark.parametrize("sort_by", ["name", "size"])
+def test_name_filter_pages(file_dir, tmp_path, sort_by):
+    index = FileHashIndex(str(file_dir), str(tmp_path / "index.sqlite3"))
+    pages = read_all_pages(index, 3, sort_by=sort_by, name_pattern="f1*")
+
+    assert [file[0] for page in pages for file in page.files] == expected_order(file_dir, sort_by, False, "f1")
+    assert pages[0].total_count == 10
+    # the last page is full, but nothing matches after it
+    assert len(pages[-1].files) == 1
+
+
+def test_changes_between_pages_do_not_shift_them(file_dir, tmp_path):
+    index = FileHashIndex(str(file_dir), str(tmp_path / "index.sqlite3"))
+    first_page = index.list_page(5)
+    # remove a file that was listed and add one before the page boundary
+    (file_dir / "f00.txt").unlink()
+    index.list_files()
+    (file_dir / "f01a.txt").write_bytes(b"late")
+    index.update_file("f01a.txt", "late")
+
+    second_page = index.list_page(5, first_page.next_page_token)
+    assert [file[0] for file in second_page.files] == ["f05.txt", "f06.txt", "f07.txt", "f08.txt", "f09.txt"]
+
+
+@pytest.mark.parametrize("page_token, sort_by", [
+    ("not json", "name"),
+    ('{"a": 1}', "name"),
+    ('[1, "f00.txt"]', "name"),
+    ('["f00.txt"]', "size"),
+    ('["3", "f00.txt"]', "mtime"),
+])
+def test_bad_page_tokens_are_rejected(file_dir, tmp_path, page_token, sort_by):
+    index = FileHashIndex(str(file_dir), str(tmp_path / "index.sqlite3"))
+    with pytest.raises(ValueError):
+        index.list_page(5, page_token, sort_by=sort_by)
+
+
+def post_page_request(client, **page_request):
+    return client.post("/", json={"request_type": "list_files", **page_request})
+
+
+def test_page_route_answers_pages_with_sizes(client, upload_dir):
+    for file_name, data in (("a.txt", b"1"), ("b.txt", b"22"), ("c.txt", b"333")):
+        (upload_dir / file_name).write_bytes(data)
+
+    response = post_page_request(client, page_size=2, sort_by="size", descending=True)
+    assert response.status_code == 200
+    page = response.get_json()
+    assert [(file["file_name"], file["file_size"]) for file in page["request_data"]] == [("c.txt", 3), ("b.txt", 2)]
+    assert page["total_count"] == 3
+
+    response = post_page_request(client, page_size=2, sort_by="size", descending=True,
+                                 page_token=page["next_page_token"])
+    assert [file["file_name"] for file in response.get_json()["request_data"]] == ["a.txt"]
+    assert "next_page_token" not in response.get_json()
+
+
+def test_page_size_is_clamped(client, upload_dir, monkeypatch):
+    monkeypatch.setattr(file_service_app, "MAX_LIST_PAGE_SIZE", 2)
+    for index in range(5):
+        (upload_dir / f"{index}.txt").write_bytes(b"")
+
+    page = post_page_request(client, page_size=1000).get_json()
+    assert len(page["request_data"]) == 2
+    assert json.loads(page["next_page_token"]) == ["1.txt"]
+
+
+@pytest.mark.parametrize("page_request", [
+    {"page_size": 5, "page_token": "not json"},
+    {"page_size": 5, "sort_by": "color"},
+    {"page_size": 0},
+    {"page_size": "many"},
+])
+def test_bad_page_requests_get_400(client, page_request):
+    response = post_page_request(client, **page_request)
+    assert response.status_code == 400
+    assert response.get_json()["request_success"] is False
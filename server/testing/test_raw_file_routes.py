@@ -0,0 +1,125 @@
+import hashlib
+import os
+
+import file_service_app
+import pytest
+from file_service_app import resolve_file_path
+
+FILE_DATA = bytes(range(256)) * 40
+FILE_ETAG = f'"{hashlib.md5(FILE_DATA).hexdigest()}"'
+
+
+@pytest.fixture
+def stored_file(upload_dir):
+    (upload_dir / "data.bin").write_bytes(FILE_DATA)
+    return upload_dir / "data.bin"
+
+
+def test_get_sends_the_whole_file_with_validators(client, stored_file):
+    response = client.get("/files/data.bin")
+    assert response.status_code == 200
+    assert response.data == FILE_DATA
+    assert response.headers["ETag"] == FILE_ETAG
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(FILE_DATA))
+
+
+@pytest.mark.parametrize("range_header, first, last", [
+    ("bytes=100-199", 100, 199),
+    ("bytes=10000-", 10000, len(FILE_DATA) - 1),
+    ("bytes=-24", len(FILE_DATA) - 24, len(FILE_DATA) - 1),
+    ("bytes=5000-999999", 5000, len(FILE_DATA) - 1),
+])
+def test_range_gets_206(client, stored_file, range_header, first, last):
+    response = client.get("/files/data.bin", headers={"Range": range_header})
+    assert response.status_code == 206
+    assert response.data == FILE_DATA[first:last + 1]
+    assert response.headers["Content-Range"] == f"bytes {first}-{last}/{len(FILE_DATA)}"
+
+
+def test_unsatisfiable_range_gets_416(client, stored_file):
+    response = client.get("/files/data.bin", headers={"Range": f"bytes={len(FILE_DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(FILE_DATA)}"
+
+
+def test_if_range_sends_the_whole_file_once_it_changed(client, stored_file):
+    response = client.get("/files/data.bin", headers={"Range": "bytes=0-9", "If-Range": FILE_ETAG})
+    assert response.status_code == 206 and response.data == FILE_DATA[:10]
+
+    response = client.get("/files/data.bin", headers={"Range": "bytes=0-9", "If-Range": '"an older version"'})
+    assert response.status_code == 200 and response.data == FILE_DATA
+
+
+def test_revalidation_gets_304(client, stored_file):
+    response = client.get("/files/data.bin", headers={"If-None-Match": FILE_ETAG})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == FILE_ETAG
+    # a matching entity tag wins over a Range
+    assert client.get("/files/data.bin", headers={"If-None-Match": f'W/{FILE_ETAG}', "Range": "bytes=0-1"}
+                      ).status_code == 304
+    assert client.get("/files/data.bin", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    last_modified = client.get("/files/data.bin").headers["Last-Modified"]
+    assert client.get("/files/data.bin", headers={"If-Modified-Since": last_modified}).status_code == 304
+    os.utime(stored_file, (0, os.stat(stored_file).st_mtime + 10))
+    assert client.get("/files/data.bin", headers={"If-Modified-Since": last_modified}).status_code == 200
+
+
+def test_missing_file_gets_404(client, upload_dir):
+    assert client.get("/files/missing.bin").status_code == 404
+
+
+def test_file_deleted_before_its_hash_is_read_gets_404(client, stored_file, monkeypatch):
+    real_get_file_hash = file_service_app.FileHashIndex.get_file_hash
+
+    def delete_first(index, file_name):
+        os.remove(stored_file)
+        return real_get_file_hash(index, file_name)
+
+    monkeypatch.setattr(file_service_app.FileHashIndex, "get_file_hash", delete_first)
+    response = client.get("/files/data.bin")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+def test_put_stores_the_file_and_indexes_it(client, upload_dir):
+    response = client.put("/files/new.bin", data=FILE_DATA)
+    assert response.status_code == 200
+    assert response.get_json()["request_data"] == [{"file_name": "new.bin", "file_hash": FILE_ETAG.strip('"')}]
+    assert (upload_dir / "new.bin").read_bytes() == FILE_DATA
+    # the temporary file was renamed into place
+    assert os.listdir(upload_dir) == ["new.bin"]
+    assert client.get("/files/new.bin").headers["ETag"] == FILE_ETAG
+
+
+def test_put_replaces_a_file(client, stored_file):
+    client.put("/files/data.bin", data=b"replaced")
+    response = client.get("/files/data.bin")
+    assert response.data == b"replaced"
+    assert response.headers["ETag"] == f'"{hashlib.md5(b"replaced").hexdigest()}"'
+
+
+def test_unfinished_upload_is_never_served(client, upload_dir):
+    (upload_dir / "partial.bin.uploading").write_bytes(b"half")
+    assert client.get("/files/partial.bin.uploading").status_code == 400
+    assert client.put("/files/other.bin.uploading", data=b"x").status_code == 400
+    file_list = client.post("/", json={"request_type": "list_files"}).get_json()["request_data"]
+    assert file_list == []
+
+
+@pytest.mark.parametrize("file_name", ["", ".", "..", "a/b", "..\\b", "../data.bin", "a.uploading"])
+def test_file_names_outside_the_directory_are_rejected(upload_dir, file_name):
+    assert resolve_file_path(file_name) is None
+
+
+def test_plain_file_name_resolves_into_the_directory(upload_dir):
+    assert resolve_file_path("data.bin") == os.path.join(str(upload_dir), "data.bin")
+
+
+def test_dot_dot_url_is_rejected(client, stored_file):
+    assert client.get("/files/..").status_code in (400, 404)
+    assert client.put("/files/..", data=b"x").status_code in (400, 404)
+    assert client.get("/files/%2e%2e").status_code in (400, 404)
+    assert os.listdir(stored_file.parent) == ["data.bin"]